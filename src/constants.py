@@ -44,6 +44,16 @@ def get_eeprom_extension_database_file():
     return "/opt/openmotics/etc/eeprom_ext.db"
 
 
+def get_eeprom_shadow_file():
+    """ Get the filename of the file with the copy of the master eeprom. """
+    return "/opt/openmotics/etc/eeprom_shadow.bin"
+
+
+def get_eeprom_journal_file():
+    """ Get the filename of the file with the eeprom writes that are not on the master yet. """
+    return "/opt/openmotics/etc/eeprom_journal.bin"
+
+
 def get_ssl_certificate_file():
     """ Get the filename of the ssl certificate. """
     return "/opt/openmotics/etc/https.crt"
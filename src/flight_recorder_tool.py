@@ -0,0 +1,59 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tool to decode the output of the get_flight_recorder api call into readable text.
+"""
+
+import argparse
+import sys
+
+from serial_utils import FlightRecorder, decode_records, format_records
+
+
+def main():
+    """ The main function. """
+    parser = argparse.ArgumentParser(description='Tool to decode a flight recorder dump.')
+    parser.add_argument('dump', help='the file with the output of get_flight_recorder')
+    parser.add_argument('--master', dest='master', action='store_true',
+                        help='only show the traffic on the master serial port')
+    parser.add_argument('--power', dest='power', action='store_true',
+                        help='only show the traffic on the power serial port')
+    parser.add_argument('--cid', dest='cid', type=int,
+                        help='only show the traffic with this communication id')
+
+    args = parser.parse_args()
+
+    with open(args.dump, 'rb') as dump_file:
+        dump = dump_file.read()
+
+    try:
+        records = decode_records(dump)
+    except ValueError as error:
+        print "Could not decode %s: %s" % (args.dump, error)
+        sys.exit(1)
+
+    if args.master:
+        records = [record for record in records if record[1] == FlightRecorder.MASTER]
+    if args.power:
+        records = [record for record in records if record[1] == FlightRecorder.POWER]
+    if args.cid is not None:
+        records = [record for record in records if record[3] == args.cid]
+
+    for line in format_records(records):
+        print line
+
+
+if __name__ == '__main__':
+    main()
@@ -27,15 +27,22 @@ import sqlite3
 import constants
 import logging
 from threading import Timer
-from serial_utils import CommunicationTimedOutException
+from serial_utils import CommunicationTimedOutException, encode_records
+from task_scheduler import TaskScheduler
 import master.master_api as master_api
-from master.outputs import OutputStatus
+from master.device_state import DeviceStateStore
 from master.inputs import InputStatus
-from master.thermostats import ThermostatStatus
+from master.outputs import OutputReader
+from master.thermostats import ThermostatStatus, ThermostatStatusService
 from master.shutters import ShutterStatus
 from master.master_communicator import BackgroundConsumer
+from master.master_command import MasterCommandSpec
+from master.command_cache import CommandCache
 from master.eeprom_controller import EepromController, EepromFile
+from master.eeprom_shadow import EepromShadow
+from master.eeprom_journal import EepromJournal
 from master.eeprom_extension import EepromExtension
+from master.eeprom_warmup import EepromWarmup
 from master.eeprom_models import OutputConfiguration, InputConfiguration, ThermostatConfiguration, \
     SensorConfiguration, PumpGroupConfiguration, GroupActionConfiguration, \
     ScheduledActionConfiguration, PulseCounterConfiguration, StartupActionConfiguration, \
@@ -62,12 +69,66 @@ def check_basic_action(ret_dict):
 class GatewayApi(object):
     """ The GatewayApi combines master_api functions into high level functions. """
 
-    def __init__(self, master_communicator, power_communicator, power_controller):
+    # The number of seconds the output of the status commands is cached.
+    STATUS_MAX_AGES = {master_api.status().action: 1,
+                       master_api.sensor_temperature_list().action: 5,
+                       master_api.sensor_humidity_list().action: 5,
+                       master_api.sensor_brightness_list().action: 5,
+                       master_api.pulse_list().action: 1,
+                       master_api.error_list().action: 10}
+
+    # The models in the configuration export, with the name of the configuration.
+    CONFIGURATION_MODELS = [('output_configurations', OutputConfiguration),
+                            ('shutter_configurations', ShutterConfiguration),
+                            ('shutter_group_configurations', ShutterGroupConfiguration),
+                            ('input_configurations', InputConfiguration),
+                            ('thermostat_configurations', ThermostatConfiguration),
+                            ('sensor_configurations', SensorConfiguration),
+                            ('pump_group_configurations', PumpGroupConfiguration),
+                            ('cooling_configurations', CoolingConfiguration),
+                            ('cooling_pump_group_configurations', CoolingPumpGroupConfiguration),
+                            ('global_rtd10_configuration', GlobalRTD10Configuration),
+                            ('rtd10_heating_configurations', RTD10HeatingConfiguration),
+                            ('rtd10_cooling_configurations', RTD10CoolingConfiguration),
+                            ('group_action_configurations', GroupActionConfiguration),
+                            ('scheduled_action_configurations', ScheduledActionConfiguration),
+                            ('pulse_counter_configurations', PulseCounterConfiguration),
+                            ('startup_action_configuration', StartupActionConfiguration),
+                            ('dimmer_configuration', DimmerConfiguration),
+                            ('global_thermostat_configuration', GlobalThermostatConfiguration),
+                            ('can_led_configurations', CanLedConfiguration),
+                            ('room_configurations', RoomConfiguration)]
+
+    # The outputs are reconciled with the master when they were not reconciled for this number of
+    # seconds, the OL messages keep the status and the dimmer up to date in between.
+    OUTPUT_RECONCILE_PERIOD = 600
+
+    # The number of seconds between two refreshes of the thermostat status.
+    THERMOSTAT_REFRESH_PERIOD = 30
+
+    # The enum values of the shutter state in the DeviceStateStore.
+    SHUTTER_STATES = ['stopped', 'going_up', 'going_down', 'up', 'down']
+
+    # The banks of these models are prefetched by the eeprom warmup.
+    WARMUP_MODELS = [OutputConfiguration, InputConfiguration, ThermostatConfiguration,
+                     SensorConfiguration, ShutterConfiguration, PulseCounterConfiguration]
+
+    def __init__(self, master_communicator, power_communicator, power_controller,
+                 eeprom_write_behind=False, scheduler=None):
+        if scheduler is None:
+            scheduler = TaskScheduler(workers=1)
+            scheduler.start()
+        self.__scheduler = scheduler
         self.__master_communicator = master_communicator
+        self.__command_cache = CommandCache(master_communicator, GatewayApi.STATUS_MAX_AGES)
         self.__eeprom_controller = EepromController(
-            EepromFile(self.__master_communicator),
+            EepromFile(self.__master_communicator, self.__open_eeprom_shadow(),
+                       self.__open_eeprom_journal() if eeprom_write_behind else None,
+                       scheduler=self.__scheduler),
             EepromExtension(constants.get_eeprom_extension_database_file())
         )
+        self.__eeprom_warmup = EepromWarmup(self.__eeprom_controller, GatewayApi.WARMUP_MODELS,
+                                            self.__is_master_idle, scheduler=self.__scheduler)
         self.__power_communicator = power_communicator
         self.__power_controller = power_controller
         self.__plugin_controller = None
@@ -76,11 +137,25 @@ class GatewayApi(object):
         self.__maintenance_timeout_timer = None
 
         self.__discover_mode_timer = None
+        self.__restore_progress = None
+
+        self.__device_state = DeviceStateStore()
+        self.__device_state.register('output', [('status', 'B'), ('dimmer', 'B'), ('ctimer', 'H')])
+        self.__device_state.register('input', [('presses', 'L'), ('last_press', 'd'),
+                                               ('output', 'B')])
+        self.__device_state.register('shutter', [('state', GatewayApi.SHUTTER_STATES)])
+        self.__device_state.register('event', [('count', 'L'), ('last', 'd')], 256)
+        self.__output_reader = OutputReader(self.__master_communicator, self.__on_output_read,
+                                            self.__is_master_idle, scheduler=self.__scheduler)
+        self.__output_list_received = False
+        self.__known_outputs = set()
 
-        self.__output_status = None
         self.__input_status = InputStatus()
         self.__module_log = []
         self.__thermostat_status = None
+        self.__thermostat_service = ThermostatStatusService(self.__read_thermostat_status,
+                                                            self.__scheduler,
+                                                            GatewayApi.THERMOSTAT_REFRESH_PERIOD)
         self.__shutter_status = ShutterStatus()
 
         self.__master_communicator.register_consumer(
@@ -92,16 +167,68 @@ class GatewayApi(object):
 
         self.__init_shutter_status()
         self.__master_communicator.register_consumer(
-                BackgroundConsumer(master_api.shutter_status(), 0,
-                                   self.__shutter_status.handle_shutter_update)
+                BackgroundConsumer(master_api.shutter_status(), 0, self.__on_shutter_update)
         )
 
         self.__extend_method("set_shutter_configuration", self.__init_shutter_status)
         self.__extend_method("set_shutter_configurations", self.__init_shutter_status)
 
+        for method_name in ["set_thermostat_configuration", "set_thermostat_configurations",
+                            "set_cooling_configuration", "set_cooling_configurations"]:
+            self.__extend_method(method_name, self.__on_thermostat_configuration)
+
         self.__init_master()
         self.__load_thermostat_setpoints()
         self.__run_master_timer()
+        self.__scheduler.schedule('master_timer', self.__run_master_timer, 120, delay=120)
+        # Runs when maintenance mode is stopped, a job never overlaps with itself.
+        self.__revalidation_job = self.__scheduler.schedule('eeprom_revalidation',
+                                                            self.__revalidate_eeprom_cache,
+                                                            delay=None)
+
+    @staticmethod
+    def __open_eeprom_shadow():
+        """ Open the copy of the master eeprom, None if the file can not be opened: the eeprom
+        banks are only cached in memory in that case. """
+        try:
+            return EepromShadow(constants.get_eeprom_shadow_file())
+        except (IOError, OSError):
+            LOGGER.exception("Could not open the eeprom shadow, caching in memory only")
+            return None
+
+    @staticmethod
+    def __open_eeprom_journal():
+        """ Open the journal with the pending eeprom writes, None if the file can not be opened:
+        the eeprom writes go to the master directly in that case. """
+        try:
+            return EepromJournal(constants.get_eeprom_journal_file())
+        except (IOError, OSError):
+            LOGGER.exception("Could not open the eeprom journal, writing to the master directly")
+            return None
+
+    def __is_master_idle(self):
+        """ Check if the master is idle: not in maintenance mode and no interactive or
+        configuration commands are waiting. """
+        if self.__master_communicator.in_maintenance_mode():
+            return False
+        statistics = self.__master_communicator.get_scheduler_statistics()
+        return all([statistics[MasterCommandSpec.PRIORITIES[priority]]['queue_depth'] == 0
+                    for priority in [MasterCommandSpec.INTERACTIVE,
+                                     MasterCommandSpec.CONFIGURATION]])
+
+    def get_task_statistics(self):
+        """ Get the statistics of the periodic and one-shot jobs of the gateway, see
+        :meth`task_scheduler.TaskScheduler.get_statistics`. """
+        return self.__scheduler.get_statistics()
+
+    def start_eeprom_warmup(self):
+        """ Start prefetching the eeprom banks of the most used configurations in the background,
+        see :class`master.eeprom_warmup.EepromWarmup`. """
+        self.__eeprom_warmup.start()
+
+    def stop_eeprom_warmup(self):
+        """ Stop prefetching the eeprom banks. """
+        self.__eeprom_warmup.stop()
 
     def __extend_method(self, method_name, extension):
         """ Extend a method of the object to call the extension function after method execution.
@@ -196,7 +323,8 @@ class GatewayApi(object):
         from the gateway clock. """
 
         try:
-            status = self.__master_communicator.do_command(master_api.status())
+            status = self.__master_communicator.do_command(master_api.status(),
+                                                           priority=MasterCommandSpec.BACKGROUND)
 
             master_time = datetime.datetime(1, 1, 1, status['hours'], status['minutes'], status['seconds'])
 
@@ -219,8 +347,6 @@ class GatewayApi(object):
         except:
             LOGGER.error("Got error while setting the time on the master.")
             traceback.print_exc()
-        finally:
-            Timer(120, self.__run_master_timer).start()
 
     def sync_master_time(self):
         """ Set the time on the master. """
@@ -232,6 +358,7 @@ class GatewayApi(object):
              'weekday': now.isoweekday(), 'day': now.day, 'month': now.month,
              'year': now.year % 100}
         )
+        self.__command_cache.invalidate(master_api.status())
 
     def __init_shutter_status(self):
         """ Initialize the shutter status. """
@@ -248,10 +375,24 @@ class GatewayApi(object):
                                                                 {'module_nr': i})['status'])
 
         self.__shutter_status.init(configs, status)
+        self.__update_shutter_state()
+
+    def __on_shutter_update(self, update):
+        """ Update the ShutterStatus and the device state when a shutter status is received. """
+        self.__shutter_status.handle_shutter_update(update)
+        self.__update_shutter_state()
+
+    def __update_shutter_state(self):
+        """ Copy the states of the ShutterStatus to the device state. """
+        states = self.__shutter_status.get_status()
+        self.__device_state.resize('shutter', len(states))
+        self.__device_state.update_all('shutter', dict([(i, {'state': states[i]})
+                                                        for i in range(len(states))]))
 
     def __event_triggered(self, ev_output):
         """ Handle an event triggered by the master. """
         code = ev_output['code']
+        self.__device_state.increment('event', code, 'count', last=pytime.time())
 
         if self.__plugin_controller is not None:
             self.__plugin_controller.process_event(code)
@@ -267,7 +408,7 @@ class GatewayApi(object):
             msg = "Exception while setting status leds before maintenance mode:" + str(exception)
             LOGGER.warning(msg)
 
-        self.__eeprom_controller.invalidate_cache()  # Eeprom can be changed in maintenance mode.
+        self.__eeprom_controller.mark_stale()  # Eeprom can be changed in maintenance mode.
         self.__master_communicator.start_maintenance_mode()
 
         def check_maintenance_timeout():
@@ -305,11 +446,12 @@ class GatewayApi(object):
     def stop_maintenance_mode(self):
         """ Stop maintenance mode. """
         self.__master_communicator.stop_maintenance_mode()
-        if self.__output_status is not None:
-            self.__output_status.force_refresh()
+        self.__command_cache.invalidate()
+        # The outputs can be changed in maintenance mode without OL messages.
+        self.__output_list_received = False
+        self.__device_state.invalidate('output')
 
-        if self.__thermostat_status is not None:
-            self.__thermostat_status.force_refresh()
+        self.__on_thermostat_configuration()  # Can be changed in maintenance mode.
 
         if self.__maintenance_timeout_timer is not None:
             self.__maintenance_timeout_timer.cancel()
@@ -323,18 +465,36 @@ class GatewayApi(object):
             msg = "Exception while setting status leds after maintenance mode:" + str(exception)
             LOGGER.warning(msg)
 
+        self.__revalidation_job.run_now()
+
+    def __revalidate_eeprom_cache(self):
+        """ Revalidate the eeprom banks that were cached before maintenance mode. """
+        try:
+            changed = self.__eeprom_controller.revalidate_cache()
+            LOGGER.info("Revalidated the eeprom cache, %d banks were changed", changed)
+        except Exception:
+            LOGGER.exception("Could not revalidate the eeprom cache")
+
     def get_status(self):
         """ Get the status of the Master.
 
-        :returns: dict with 'time' (HH:MM), 'date' (DD:MM:YYYY), 'mode', 'version' (a.b.c)
-                  and 'hw_version' (hardware version)
+        :returns: dict with 'time' (HH:MM), 'date' (DD:MM:YYYY), 'mode', 'version' (a.b.c),
+                  'hw_version' (hardware version), 'commands_saved' (the number of identical
+                  read commands that were not sent to the master), 'eeprom_warmup' (the
+                  progress and the cache coverage of the eeprom warmup, see
+                  :meth`master.eeprom_warmup.EepromWarmup.get_progress`) and 'output_reader'
+                  (the background output reads, see
+                  :meth`master.outputs.OutputReader.get_statistics`)
         """
-        out_dict = self.__master_communicator.do_command(master_api.status())
+        out_dict = self.__command_cache.do_command(master_api.status())
         return {'time': '%02d:%02d' % (out_dict['hours'], out_dict['minutes']),
                 'date': '%02d/%02d/%d' % (out_dict['day'], out_dict['month'], out_dict['year']),
                 'mode': out_dict['mode'],
                 'version': "%d.%d.%d" % (out_dict['f1'], out_dict['f2'], out_dict['f3']),
-                'hw_version': out_dict['h']}
+                'hw_version': out_dict['h'],
+                'commands_saved': self.__master_communicator.get_commands_saved(),
+                'eeprom_warmup': self.__eeprom_warmup.get_progress(),
+                'output_reader': self.__output_reader.get_statistics()}
 
     def reset_master(self):
         """ Perform a cold reset on the master. Turns the power off, waits 5 seconds and
@@ -382,6 +542,7 @@ class GatewayApi(object):
         :returns: dict with 'status' ('OK').
         """
         ret = self.__master_communicator.do_command(master_api.module_discover_start())
+        self.__command_cache.invalidate(master_api.status())
 
         if self.__discover_mode_timer is not None:
             self.__discover_mode_timer.cancel()
@@ -399,6 +560,7 @@ class GatewayApi(object):
         :returns: dict with 'status' ('OK').
         """
         ret = self.__master_communicator.do_command(master_api.module_discover_stop())
+        self.__command_cache.invalidate(master_api.status())
 
         if self.__discover_mode_timer is not None:
             self.__discover_mode_timer.cancel()
@@ -470,46 +632,86 @@ class GatewayApi(object):
 
     # Output functions
 
-    def __read_outputs(self):
-        """ Read all output information from the MasterApi.
-
-        :returns: a list of dicts with all fields from master_api.read_output.
-        """
-        ret = self.__master_communicator.do_command(master_api.number_of_io_modules())
-        num_outputs = ret['out'] * 8
+    def start_output_reader(self):
+        """ Start reading the outputs in the background, so the first call to get_output_status
+        is served from the device state. """
+        self.__reconcile_outputs()
+
+    def __reconcile_outputs(self):
+        """ Reconcile the outputs with the master. The number of outputs is read from the (cached)
+        eeprom, the outputs are read in the background by the OutputReader: all outputs if no OL
+        was received, otherwise only the outputs that are on (the OL has the status and the
+        dimmer of all outputs, the outputs that are on can have a countdown timer). """
+        num_outputs = self.__eeprom_controller.get_max_id(OutputConfiguration)
+        self.__device_state.resize('output', num_outputs)
+        if self.__output_list_received:
+            self.__output_reader.request([output['id']
+                                          for output in self.__device_state.get_all('output')
+                                          if output['status'] == 1])
+        else:
+            self.__output_reader.request(range(num_outputs))
+        self.__device_state.reconciled('output')
 
-        outputs = []
-        for i in range(0, num_outputs):
-            outputs.append(self.__master_communicator.do_command(master_api.read_output(),
-                                                                 {'id': i}))
-        return outputs
+    def __on_output_read(self, output):
+        """ Update the device state with an output that was read from the master. """
+        self.__known_outputs.add(output['id'])
+        self.__device_state.update('output', output['id'], status=output['status'],
+                                   dimmer=output['dimmer'], ctimer=output['ctimer'])
 
     def on_outputs(self, ol_output):
-        """ Update the OutputStatus when an OL is received. """
+        """ Update the device state when an OL is received: the outputs in the OL are on, the
+        other outputs are off. The background reads of the outputs that are off are not
+        required anymore. """
         on_outputs = ol_output['outputs']
+        num_outputs = self.__device_state.get_size('output')
 
-        if self.__output_status is not None:
-            self.__output_status.partial_update(on_outputs)
+        updates = dict([(output_id, {'status': 0}) for output_id in range(num_outputs)])
+        for (output_id, dimmer) in on_outputs:
+            updates[output_id] = {'status': 1, 'dimmer': dimmer}
+        self.__device_state.update_all('output', updates)
+        self.__output_list_received = True
+        self.__known_outputs.update(updates.keys())
+        self.__output_reader.discard([output_id for output_id in range(num_outputs)
+                                      if updates[output_id]['status'] == 0])
 
         if self.__plugin_controller is not None:
             self.__plugin_controller.process_output_status(on_outputs)
 
     def get_output_status(self):
-        """ Get a list containing the status of the Outputs.
+        """ Get a list containing the status of the Outputs. The status is served from the
+        device state, the master is not queried: the outputs that were not in an OL and were
+        not read by the OutputReader yet are unknown.
 
         :returns: A list is a dicts containing the following keys: id, status, ctimer
-        and dimmer.
+        and dimmer. The status, dimmer and ctimer of an unknown output are None.
         """
-        if self.__output_status is None:
-            self.__output_status = OutputStatus(self.__read_outputs())
+        if self.__device_state.should_reconcile('output', GatewayApi.OUTPUT_RECONCILE_PERIOD):
+            self.__reconcile_outputs()
+
+        outputs = self.__device_state.get_all('output')
+        if not self.__output_list_received:
+            for output in outputs:
+                if output['id'] not in self.__known_outputs:
+                    output.update({'status': None, 'dimmer': None, 'ctimer': None})
+        return outputs
 
-        if self.__output_status.should_refresh():
-            self.__output_status.full_update(self.__read_outputs())
+    def get_device_state(self, since=None, kinds=None):
+        """ Get the state of the devices that changed since a version of the device state. The
+        state is kept up to date by the messages of the master, no commands are sent.
 
-        outputs = self.__output_status.get_outputs()
-        return [{'id': output['id'], 'status': output['status'],
-                 'ctimer': output['ctimer'], 'dimmer': output['dimmer']}
-                for output in outputs]
+        :param since: the version of the previous call, None to get all devices.
+        :type since: Integer
+        :param kinds: the kinds of devices to get ('output', 'input', 'shutter' and 'event'), \
+        None for all kinds.
+        :type kinds: list of str
+        :returns: dict with the current 'version' and the 'changes': a dict that maps the kind \
+        to the list of changed devices. An output has 'id', 'status', 'dimmer' and 'ctimer', an \
+        input has 'id', the number of 'presses' since the start of the gateway, the time of the \
+        'last_press' and the 'output' of the last press, a shutter has 'id' and 'state' and an \
+        event has 'id' (the code), the 'count' and the time of the 'last' event.
+        :raises: ValueError if kinds contains an unknown kind.
+        """
+        return self.__device_state.get_changes(since, kinds)
 
     def set_output(self, output_id, is_on, dimmer=None, timer=None):
         """ Set the status, dimmer and timer of an output.
@@ -663,7 +865,7 @@ class GatewayApi(object):
 
         :returns: A list is a dicts containing the following keys: id, status.
         """
-        return self.__shutter_status.get_status()
+        return [shutter['state'] for shutter in self.__device_state.get_all('shutter')]
 
     def do_shutter_down(self, shutter_id):
         """ Make a shutter go down. The shutter stops automatically when the down position is
@@ -777,6 +979,9 @@ class GatewayApi(object):
         """ Update the InputStatus with data from an IL message. """
         data_set = (api_data['input'], api_data['output'])
         self.__input_status.add_data(data_set)
+        self.__device_state.increment('input', api_data['input'], 'presses',
+                                      last_press=pytime.time(), output=api_data['output'])
+        self.__command_cache.invalidate(master_api.pulse_list())
         if self.__plugin_controller is not None:
             self.__plugin_controller.process_input_status(data_set)
 
@@ -813,23 +1018,59 @@ class GatewayApi(object):
 
         return thermostats
 
+    def start_thermostat_service(self):
+        """ Start refreshing the thermostat status in the background, see
+        :class`master.thermostats.ThermostatStatusService`. """
+        self.__thermostat_service.start()
+
     def get_thermostat_status(self):
         """ Get the status of the thermostats. Note that the automatic and setpoint field returned
-        in the main dict are deprecated and reflect the state of the first thermostat.
+        in the main dict are deprecated and reflect the state of the first thermostat. The status
+        is served from a snapshot that is refreshed every THERMOSTAT_REFRESH_PERIOD seconds and
+        after the thermostats are changed, the snapshot should not be modified.
 
         :returns: dict with global status information about the thermostats: 'thermostats_on',
         'automatic' (deprecated) and 'setpoint' (deprecated) and a list ('status') with status
         information for all thermostats, each element in the list is a dict with the following keys:
         'id', 'act', 'csetp', 'output0', 'output1', 'outside', 'mode', 'name', 'sensor_nr',
-        'automatic', 'setpoint'.
+        'automatic', 'setpoint'. The 'version' and the 'timestamp' of the snapshot tell when the
+        status was read from the master.
+        :raises: :class`master.thermostats.ThermostatStatusNotReadyException` if the status was \
+        not read yet.
+        """
+        return self.__thermostat_service.get_status()
+
+    def get_thermostat_changes(self, since=None):
+        """ Get the changes of the thermostat status since a version of the snapshot, see
+        :meth`master.thermostats.ThermostatStatusService.get_changes`.
+
+        :param since: the 'version' of the previous call, None to get the full status.
+        :type since: Integer
+        :returns: dict with the 'version' and the 'timestamp' of the snapshot, the global status \
+        information if it changed, the thermostats that changed ('status') and the ids of the \
+        thermostats that are not active anymore ('removed').
+        :raises: :class`master.thermostats.ThermostatStatusNotReadyException` if the status was \
+        not read yet.
         """
+        return self.__thermostat_service.get_changes(since)
+
+    def __on_thermostat_configuration(self):
+        """ Refresh the thermostat status after the thermostat configurations were changed. """
+        if self.__thermostat_status is not None:
+            self.__thermostat_status.force_refresh()
+        self.__thermostat_service.request_refresh()
+
+    def __read_thermostat_status(self):
+        """ Read the status of the thermostats from the master, see get_thermostat_status. """
         if self.__thermostat_status is None:
             self.__thermostat_status = ThermostatStatus(self.__get_all_thermostats(), 1800)
         elif self.__thermostat_status.should_refresh():
             self.__thermostat_status.update(self.__get_all_thermostats())
 
-        thermostat_info = self.__master_communicator.do_command(master_api.thermostat_list())
-        thermostat_mode = self.__master_communicator.do_command(master_api.thermostat_mode_list())
+        thermostat_info = self.__master_communicator.do_command(
+            master_api.thermostat_list(), priority=MasterCommandSpec.BACKGROUND)
+        thermostat_mode = self.__master_communicator.do_command(
+            master_api.thermostat_mode_list(), priority=MasterCommandSpec.BACKGROUND)
 
         mode = thermostat_info['mode']
         thermostats_on = bool(mode & 1 << 7)
@@ -846,7 +1087,8 @@ class GatewayApi(object):
 
         cached_thermostats = self.__thermostat_status.get_thermostats()['cooling' if cooling else 'heating']
 
-        aircos = self.__master_communicator.do_command(master_api.read_airco_status_bits())
+        aircos = self.__master_communicator.do_command(master_api.read_airco_status_bits(),
+                                                       priority=MasterCommandSpec.BACKGROUND)
 
         for thermostat_id in range(0, 32):
             if cached_thermostats[thermostat_id]['active'] is True:
@@ -903,6 +1145,7 @@ class GatewayApi(object):
                                               {'thermostat': thermostat,
                                                'config': 0,
                                                'temp': master_api.Svt.temp(temperature)})
+        self.__thermostat_service.request_refresh()
 
         return {'status': 'OK'}
 
@@ -933,6 +1176,7 @@ class GatewayApi(object):
             {'action_type': master_api.BA_THERMOSTAT_COOLING_HEATING,
              'action_number': cooling_mode})
         )
+        self.__thermostat_service.request_refresh()
 
         return {'status': 'OK'}
 
@@ -971,6 +1215,7 @@ class GatewayApi(object):
                 {'id': thermostat_id, 'automatic': automatic, 'setpoint': setpoint}
             )
         )
+        self.__thermostat_service.request_refresh()
 
         return {'status': 'OK'}
 
@@ -1001,45 +1246,55 @@ class GatewayApi(object):
             {'action_type': master_api.BA_THERMOSTAT_AIRCO_STATUS,
              'action_number': modifier + thermostat_id}
         ))
+        self.__thermostat_service.request_refresh()
 
         return {'status': 'OK'}
 
     # Sensor status
 
-    def get_sensor_temperature_status(self):
+    def get_sensor_temperature_status(self, priority=None):
         """ Get the current temperature of all sensors.
 
+        :param priority: the priority class of the master command, None for the default class.
+        :type priority: one of the priorities in MasterCommandSpec.PRIORITIES
         :returns: list with 32 temperatures, 1 for each sensor. None/null if not connected
         """
         output = []
 
-        sensor_list = self.__master_communicator.do_command(master_api.sensor_temperature_list())
+        sensor_list = self.__command_cache.do_command(master_api.sensor_temperature_list(),
+                                                      priority=priority)
         for i in range(32):
             output.append(sensor_list['tmp%d' % i].get_temperature())
 
         return output
 
-    def get_sensor_humidity_status(self):
+    def get_sensor_humidity_status(self, priority=None):
         """ Get the current humidity of all sensors.
 
+        :param priority: the priority class of the master command, None for the default class.
+        :type priority: one of the priorities in MasterCommandSpec.PRIORITIES
         :returns: list with 32 percentages, 1 for each sensor. None/null if not connected
         """
         output = []
 
-        sensor_list = self.__master_communicator.do_command(master_api.sensor_humidity_list())
+        sensor_list = self.__command_cache.do_command(master_api.sensor_humidity_list(),
+                                                      priority=priority)
         for i in range(32):
             output.append(sensor_list['hum%d' % i].get_humidity())
 
         return output
 
-    def get_sensor_brightness_status(self):
+    def get_sensor_brightness_status(self, priority=None):
         """ Get the current brightness of all sensors.
 
+        :param priority: the priority class of the master command, None for the default class.
+        :type priority: one of the priorities in MasterCommandSpec.PRIORITIES
         :returns: list with 32 percentages, 1 for each sensor. None/null if not connected
         """
         output = []
 
-        sensor_list = self.__master_communicator.do_command(master_api.sensor_brightness_list())
+        sensor_list = self.__command_cache.do_command(master_api.sensor_brightness_list(),
+                                                      priority=priority)
         for i in range(32):
             output.append(sensor_list['bri%d' % i].get_brightness())
 
@@ -1066,6 +1321,9 @@ class GatewayApi(object):
                                                'tmp': master_api.Svt.temp(temperature),
                                                'hum': master_api.Svt.humidity(humidity),
                                                'bri': master_api.Svt.brightness(brightness)})
+        self.__command_cache.invalidate(master_api.sensor_temperature_list(),
+                                        master_api.sensor_humidity_list(),
+                                        master_api.sensor_brightness_list())
 
         return {'status': 'OK'}
 
@@ -1203,65 +1461,220 @@ class GatewayApi(object):
             # Restart the Cherrypy server after 1 second. Lets the current request terminate.
             threading.Timer(1, lambda: os._exit(0)).start()
 
-    def get_master_backup(self):
-        """ Get a backup of the eeprom of the master.
+    def get_flight_recorder(self, seconds=None):
+        """ Get the recent traffic on the master and power serial ports, see
+        :class`serial_utils.FlightRecorder`.
+
+        :param seconds: only return the traffic of the last seconds, all recorded traffic if None.
+        :type seconds: float
+        :returns: String of bytes, decode with serial_utils.decode_records.
+        """
+        since = None if seconds is None else pytime.time() - seconds
+        records = self.__master_communicator.get_flight_records(since) + \
+            self.__power_communicator.get_flight_records(since)
+        return encode_records(sorted(records))
+
+    def get_eeprom_read_statistics(self):
+        """ Get the statistics of the eeprom read planner.
+
+        :returns: dict with 'read_cost' and 'list_cost' (measured seconds per read_eeprom and \
+        eeprom_list command), the number of banks that were 'cached', 'read' or 'list'-ed, the \
+        number of read_eeprom 'windows' and the estimated seconds 'saved' by the planner. The \
+        cache statistics are the number of banks taken from the cache ('hits'), that were not \
+        cached ('misses'), the number of stale banks (cached before maintenance mode) that were \
+        'revalidated' and 'changed', and the number of banks that are still 'stale'.
+        """
+        return self.__eeprom_controller.get_read_statistics()
+
+    def flush_eeprom(self):
+        """ Write the pending eeprom writes to the master and activate the eeprom, this only does
+        something if the eeprom writes are written behind.
+
+        :returns: the number of write_eeprom commands that were sent.
+        """
+        return self.__eeprom_controller.flush()
+
+    def export_configuration(self):
+        """ Get all configurations in one pass over the eeprom: the banks that are used by
+        several configurations are read once.
+
+        :returns: dict with, for every configuration in CONFIGURATION_MODELS, the list of \
+        configuration dicts (or one dict if the configuration has no id).
+        """
+        names = [name for (name, _) in GatewayApi.CONFIGURATION_MODELS]
+        models = self.__eeprom_controller.read_models(
+            [eeprom_model for (_, eeprom_model) in GatewayApi.CONFIGURATION_MODELS])
+
+        export = {}
+        for (name, model) in zip(names, models):
+            export[name] = [m.to_dict() for m in model] if isinstance(model, list) \
+                           else model.to_dict()
+        return export
+
+    def query_configurations(self, name, filters=None, fields=None, offset=0, limit=None):
+        """ Get the configurations that match a number of filters, sorted by id. Only the fields
+        of the configurations in the page are read. Like get_input_configurations, the input
+        configurations are filtered on module_type, unless a filter on module_type is provided.
+
+        :param name: the name of the configurations in CONFIGURATION_MODELS, eg. \
+        'output_configurations'.
+        :type name: str
+        :param filters: dict that maps a field name to a value or to a dict with an operator \
+        ('eq', 'ne', 'in', 'lt', 'le', 'gt', 'ge' or 'contains') and a value, eg. \
+        {'floor': 2, 'name': {'ne': ''}}.
+        :type filters: dict
+        :param fields: the fields of the configurations to get. (None gets all fields)
+        :type fields: List of strings
+        :param offset: the number of matching configurations to skip.
+        :type offset: Integer
+        :param limit: the maximum number of configurations to get. (None gets all)
+        :type limit: Integer
+        :returns: dict with the 'total' number of matching configurations and the list of \
+        configuration dicts in the page ('config').
+        :raises: ValueError if the configuration has no id, if a filter or a field is invalid, \
+        or if the offset or the limit is negative.
+        """
+        eeprom_model = dict(GatewayApi.CONFIGURATION_MODELS).get(name)
+        if eeprom_model is None or not eeprom_model.has_id():
+            raise ValueError("Unknown configurations: %s" % name)
+        if offset < 0 or (limit is not None and limit < 0):
+            raise ValueError("The offset and the limit should not be negative")
+
+        filters = dict(filters or {})
+        if name == 'input_configurations' and 'module_type' not in filters:
+            filters['module_type'] = {'in': ['i', 'I']}  # Only return "real" inputs
+
+        (total, models) = self.__eeprom_controller.query(eeprom_model, filters, fields,
+                                                         offset, limit)
+        return {'total': total, 'config': [m.to_dict() for m in models]}
+
+    def import_configuration(self, config):
+        """ Set a number of configurations at once. The configurations are compared with the
+        eeprom, only the changed bytes are written and the eeprom is activated once.
+
+        :param config: the configurations to set, in the format of export_configuration. The \
+        configurations that are not in the dict are not changed.
+        :type config: dict
+        :raises: ValueError if the dict contains an unknown configuration, or a configuration \
+        with unknown fields or without id.
+        """
+        if not isinstance(config, dict):
+            raise ValueError("The configuration should be a dict")
+        known = dict(GatewayApi.CONFIGURATION_MODELS)
+        for name in config:
+            if name not in known:
+                raise ValueError("Unknown configuration: %s" % name)
+
+        models = []
+        for (name, eeprom_model) in GatewayApi.CONFIGURATION_MODELS:
+            if name in config:
+                if eeprom_model.has_id():
+                    if not isinstance(config[name], list):
+                        raise ValueError("%s should be a list" % name)
+                    models.extend([GatewayApi.__model_from_dict(name, eeprom_model, c)
+                                   for c in config[name]])
+                else:
+                    models.append(GatewayApi.__model_from_dict(name, eeprom_model, config[name]))
+
+        self.__eeprom_controller.write_batch(models)
 
+        if 'shutter_configurations' in config:
+            self.__init_shutter_status()
+        if 'thermostat_configurations' in config or 'cooling_configurations' in config:
+            self.__on_thermostat_configuration()
+
+    @staticmethod
+    def __model_from_dict(name, eeprom_model, in_dict):
+        """ Create an EepromModel from a configuration dict of import_configuration.
+
+        :raises: ValueError if the dict has unknown fields or if the id is missing.
+        """
+        if not isinstance(in_dict, dict):
+            raise ValueError("The items of %s should be dicts" % name)
+        known = eeprom_model.get_field_dict(include_id=True, include_eeprom=True,
+                                            include_eext=True)
+        unknown = sorted([field for field in in_dict if field not in known])
+        if len(unknown) > 0:
+            raise ValueError("Fields %s are unknown for %s" % (", ".join(unknown), name))
+        id_field = eeprom_model.get_id_field()
+        if id_field is not None and id_field not in in_dict:
+            raise ValueError("The %s field is missing in %s" % (id_field, name))
+        return eeprom_model.from_dict(in_dict)
+
+    def get_master_backup(self, full=False):
+        """ Get a backup of the eeprom of the master. The banks in the eeprom cache are not read
+        again, unless a sample of the cached banks differs from the master.
+
+        :param full: read all banks from the master, even if they are cached.
+        :type full: boolean
         :returns: String of bytes (size = 64kb).
         """
-        output = ""
-        for bank in range(0, 256):
-            output += self.__master_communicator.do_command(
-                master_api.eeprom_list(),
-                {'bank': bank}
-            )['data']
-        return output
+        self.__eeprom_controller.flush()
+        if not full:
+            self.__eeprom_controller.verify_cache()
+        banks = self.__eeprom_controller.read_banks(range(0, 256), refresh=full)
+        return "".join([banks[bank] for bank in range(0, 256)])
 
     def master_restore(self, data):
-        """ Restore a backup of the eeprom of the master.
+        """ Restore a backup of the eeprom of the master. The backup is compared with the eeprom
+        cache, only the changed windows are written. The progress can be followed with
+        get_master_restore_progress.
 
         :param data: The eeprom backup to restore.
         :type data: string of bytes (size = 64 kb).
         :returns: dict with 'output' key (contains an array with the addresses that were written).
         """
         ret = []
-        (num_banks, bank_size, write_size) = (256, 256, 10)
-
-        for bank in range(0, num_banks):
-            read = self.__master_communicator.do_command(master_api.eeprom_list(),
-                                                         {'bank': bank})['data']
-            for addr in range(0, bank_size, write_size):
-                orig = read[addr:addr + write_size]
-                new = data[bank * bank_size + addr: bank * bank_size + addr + len(orig)]
-                if new != orig:
-                    ret.append("B" + str(bank) + "A" + str(addr))
+        (num_banks, bank_size) = (256, 256)
 
-                    self.__master_communicator.do_command(
-                        master_api.write_eeprom(),
-                        {'bank': bank, 'address': addr, 'data': new}
-                    )
+        self.__eeprom_controller.flush()  # The restore overwrites the pending writes.
+        self.__eeprom_controller.verify_cache()
 
-        self.__master_communicator.do_command(master_api.activate_eeprom(), {'eep': 0})
-        ret.append("Activated eeprom")
+        try:
+            for bank in range(0, num_banks):
+                self.__restore_progress = {'banks': bank, 'total': num_banks,
+                                           'windows': len(ret)}
+                for addr in self.__eeprom_controller.write_bank(
+                        bank, data[bank * bank_size:(bank + 1) * bank_size]):
+                    ret.append("B" + str(bank) + "A" + str(addr))
+
+            self.__eeprom_controller.flush()
+            self.__master_communicator.do_command(master_api.activate_eeprom(), {'eep': 0})
+            self.__command_cache.invalidate()
+            ret.append("Activated eeprom")
+        finally:
+            self.__restore_progress = None
 
         return {'output': ret}
 
+    def get_master_restore_progress(self):
+        """ Get the progress of the running master_restore.
+
+        :returns: dict with the number of 'banks' that were restored, the 'total' number of \
+        banks and the number of 'windows' that were written, None if no restore is running.
+        """
+        return self.__restore_progress
+
     def master_reset(self):
         """ Reset the master.
 
         :returns: emtpy dict.
         """
         self.__master_communicator.do_command(master_api.reset())
+        self.__command_cache.invalidate()
         return dict()
 
     # Error functions
 
-    def master_error_list(self):
+    def master_error_list(self, priority=None):
         """ Get the error list per module (input and output modules). The modules are identified by
         O1, O2, I1, I2, ...
 
+        :param priority: the priority class of the master command, None for the default class.
+        :type priority: one of the priorities in MasterCommandSpec.PRIORITIES
         :returns: dict with 'errors' key, it contains list of tuples (module, nr_errors).
         """
-        error_list = self.__master_communicator.do_command(master_api.error_list())
+        error_list = self.__command_cache.do_command(master_api.error_list(), priority=priority)
         return error_list["errors"]
 
     def master_last_success(self):
@@ -1281,6 +1694,7 @@ class GatewayApi(object):
         :returns: empty dict.
         """
         self.__master_communicator.do_command(master_api.clear_error_list())
+        self.__command_cache.invalidate(master_api.error_list())
         return dict()
 
     # Status led functions
@@ -1301,12 +1715,14 @@ class GatewayApi(object):
 
     # Pulse counter functions
 
-    def get_pulse_counter_status(self):
+    def get_pulse_counter_status(self, priority=None):
         """ Get the pulse counter values.
 
+        :param priority: the priority class of the master command, None for the default class.
+        :type priority: one of the priorities in MasterCommandSpec.PRIORITIES
         :returns: array with the 24 pulse counter values.
         """
-        out_dict = self.__master_communicator.do_command(master_api.pulse_list())
+        out_dict = self.__command_cache.do_command(master_api.pulse_list(), priority=priority)
         return [out_dict['pv0'], out_dict['pv1'], out_dict['pv2'], out_dict['pv3'],
                 out_dict['pv4'], out_dict['pv5'], out_dict['pv6'], out_dict['pv7'],
                 out_dict['pv8'], out_dict['pv9'], out_dict['pv10'], out_dict['pv11'],
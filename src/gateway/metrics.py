@@ -23,8 +23,8 @@ import copy
 import logging
 import requests
 import constants
-from threading import Thread
 from collections import deque
+from task_scheduler import TaskScheduler
 try:
     import json
 except ImportError:
@@ -38,7 +38,7 @@ class MetricsController(object):
     The Metrics Controller collects all metrics and pushses them to all subscribers
     """
 
-    def __init__(self, plugin_controller, metrics_collector, config_controller, gateway_uuid):
+    def __init__(self, plugin_controller, metrics_collector, config_controller, gateway_uuid, scheduler=None):
         """
         :param plugin_controller: Plugin Controller
         :type plugin_controller: plugins.base.PluginController
@@ -48,9 +48,10 @@ class MetricsController(object):
         :type config_controller: gateway.config.ConfigurationController
         :param gateway_uuid: Gateway UUID
         :type gateway_uuid: basestring
+        :param scheduler: runs the collector and distributor jobs, a TaskScheduler is created by start() if None
+        :type scheduler: task_scheduler.TaskScheduler
         """
-        self._thread = None
-        self._stopped = False
+        self._scheduler = scheduler
         self._plugin_controller = plugin_controller
         self._metrics_collector = metrics_collector
         self._config_controller = config_controller
@@ -88,25 +89,20 @@ class MetricsController(object):
             self.definitions.setdefault('OpenMotics', {})[definition['type']] = definition
 
     def start(self):
-        self._collector_plugins = Thread(target=self._collect_plugins)
-        self._collector_plugins.setName('Metrics Controller collector for plugins')
-        self._collector_plugins.daemon = True
-        self._collector_plugins.start()
-        self._collector_openmotics = Thread(target=self._collect_openmotics)
-        self._collector_openmotics.setName('Metrics Controller collector for OpenMotics')
-        self._collector_openmotics.daemon = True
-        self._collector_openmotics.start()
-        self._distributor_plugins = Thread(target=self._distribute_plugins)
-        self._distributor_plugins.setName('Metrics Controller distributor for plugins')
-        self._distributor_plugins.daemon = True
-        self._distributor_plugins.start()
-        self._distributor_openmotics = Thread(target=self._distribute_openmotics)
-        self._distributor_openmotics.setName('Metrics Controller distributor for OpenMotics')
-        self._distributor_openmotics.daemon = True
-        self._distributor_openmotics.start()
+        if self._scheduler is None:
+            self._scheduler = TaskScheduler()
+            self._scheduler.start()
+        # The distributors only run when metrics were put in their queue
+        self._distributor_plugins = self._scheduler.schedule('metrics_distributor_plugins', self._distribute_plugins, delay=None)
+        self._distributor_openmotics = self._scheduler.schedule('metrics_distributor_openmotics', self._distribute_openmotics, delay=None)
+        self._collector_plugins = self._scheduler.schedule('metrics_collector_plugins', self._collect_plugins, 1)
+        self._collector_openmotics = self._scheduler.schedule('metrics_collector_openmotics', self._collect_openmotics, 1)
 
     def stop(self):
-        self._stopped = True
+        for job in [self._collector_plugins, self._collector_openmotics,
+                    self._distributor_plugins, self._distributor_openmotics]:
+            if job is not None:
+                job.cancel()
 
     def set_cloud_interval(self, metric_type, interval):
         self.cloud_intervals[metric_type] = interval
@@ -312,6 +308,8 @@ class MetricsController(object):
         self.inbound_rates['total'] += 1
         self.metrics_queue_plugins.appendleft(copy.deepcopy(metric))
         self.metrics_queue_openmotics.appendleft(copy.deepcopy(metric))
+        self._distributor_plugins.run_now()
+        self._distributor_openmotics.run_now()
 
     def _collect_plugins(self):
         """
@@ -328,83 +326,75 @@ class MetricsController(object):
         >                            "id": 0},
         >                   "values": {"power": 1234}}
         """
-        while not self._stopped:
-            start = time.time()
-            for metric in self._plugin_controller.collect_metrics():
-                # Validation, part 1
-                source = metric['source']
-                log = self._plugin_controller.get_logger(source)
-                required_keys = {'type': str,
-                                 'timestamp': (float, int),
-                                 'values': dict,
-                                 'tags': dict}
-                metric_ok = True
-                for key, key_type in required_keys.iteritems():
-                    if key not in metric:
-                        log('Metric should contain keys {0}'.format(', '.join(required_keys.keys())))
-                        metric_ok = False
-                        break
-                    if not isinstance(metric[key], key_type):
-                        log('Metric key {0} should be of type {1}'.format(key, key_type))
-                        metric_ok = False
-                        break
-                if metric_ok is False:
-                    continue
-                # Get metric definition
-                definition = self.definitions.get(metric['source'], {}).get(metric['type'])
-                if definition is None:
-                    continue
-                # Validate metric based on definition
-                for tag in definition['tags']:
-                    if tag not in metric['tags'] or metric['tags'][tag] is None:
-                        log('Metric tag {0} should be defined'.format(tag))
-                        metric_ok = False
-                metric_values = set(metric['values'].keys())
-                if len(metric_values) == 0:
-                    log('Metric should have at least one value')
+        for metric in self._plugin_controller.collect_metrics():
+            # Validation, part 1
+            source = metric['source']
+            log = self._plugin_controller.get_logger(source)
+            required_keys = {'type': str,
+                             'timestamp': (float, int),
+                             'values': dict,
+                             'tags': dict}
+            metric_ok = True
+            for key, key_type in required_keys.iteritems():
+                if key not in metric:
+                    log('Metric should contain keys {0}'.format(', '.join(required_keys.keys())))
+                    metric_ok = False
+                    break
+                if not isinstance(metric[key], key_type):
+                    log('Metric key {0} should be of type {1}'.format(key, key_type))
                     metric_ok = False
-                unknown_metrics = metric_values - set([mdef['name'] for mdef in definition['metrics']])
-                if len(unknown_metrics) > 0:
-                    log('Metric contains unknown values: {0}'.format(', '.join(unknown_metrics)))
+                    break
+            if metric_ok is False:
+                continue
+            # Get metric definition
+            definition = self.definitions.get(metric['source'], {}).get(metric['type'])
+            if definition is None:
+                continue
+            # Validate metric based on definition
+            for tag in definition['tags']:
+                if tag not in metric['tags'] or metric['tags'][tag] is None:
+                    log('Metric tag {0} should be defined'.format(tag))
                     metric_ok = False
-                if metric_ok is False:
-                    continue
-                self._put(metric)
-            if not self._stopped:
-                time.sleep(max(0.1, 1 - (time.time() - start)))
+            metric_values = set(metric['values'].keys())
+            if len(metric_values) == 0:
+                log('Metric should have at least one value')
+                metric_ok = False
+            unknown_metrics = metric_values - set([mdef['name'] for mdef in definition['metrics']])
+            if len(unknown_metrics) > 0:
+                log('Metric contains unknown values: {0}'.format(', '.join(unknown_metrics)))
+                metric_ok = False
+            if metric_ok is False:
+                continue
+            self._put(metric)
 
     def _collect_openmotics(self):
-        while not self._stopped:
-            start = time.time()
-            for metric in self._metrics_collector.collect_metrics():
-                self._put(metric)
-            if not self._stopped:
-                time.sleep(max(0.1, 1 - (time.time() - start)))
+        for metric in self._metrics_collector.collect_metrics():
+            self._put(metric)
 
     def _distribute_plugins(self):
-        while not self._stopped:
+        while True:
             try:
                 metric = self.metrics_queue_plugins.pop()
-                delivery_count = self._plugin_controller.distribute_metric(metric)
-                if delivery_count > 0:
-                    rate_key = '{0}.{1}'.format(metric['source'].lower(), metric['type'].lower())
-                    if rate_key not in self.outbound_rates:
-                        self.outbound_rates[rate_key] = 0
-                    self.outbound_rates[rate_key] += delivery_count
-                    self.outbound_rates['total'] += delivery_count
             except IndexError:
-                time.sleep(0.1)
+                return  # The queue is empty
+            delivery_count = self._plugin_controller.distribute_metric(metric)
+            if delivery_count > 0:
+                rate_key = '{0}.{1}'.format(metric['source'].lower(), metric['type'].lower())
+                if rate_key not in self.outbound_rates:
+                    self.outbound_rates[rate_key] = 0
+                self.outbound_rates[rate_key] += delivery_count
+                self.outbound_rates['total'] += delivery_count
 
     def _distribute_openmotics(self):
-        while not self._stopped:
+        while True:
             try:
                 metric = self.metrics_queue_openmotics.pop()
-                for receiver in self._openmotics_receivers:
-                    receiver(metric)
-                    rate_key = '{0}.{1}'.format(metric['source'].lower(), metric['type'].lower())
-                    if rate_key not in self.outbound_rates:
-                        self.outbound_rates[rate_key] = 0
-                    self.outbound_rates[rate_key] += 1
-                    self.outbound_rates['total'] += 1
             except IndexError:
-                time.sleep(0.1)
+                return  # The queue is empty
+            for receiver in self._openmotics_receivers:
+                receiver(metric)
+                rate_key = '{0}.{1}'.format(metric['source'].lower(), metric['type'].lower())
+                if rate_key not in self.outbound_rates:
+                    self.outbound_rates[rate_key] = 0
+                self.outbound_rates[rate_key] += 1
+                self.outbound_rates['total'] += 1
@@ -18,9 +18,11 @@ This module collects OpenMotics metrics and makes them available to the MetricsC
 
 import time
 import logging
-from threading import Thread, Event
 from collections import deque
+from functools import partial
 from serial_utils import CommunicationTimedOutException
+from master.master_command import MasterCommandSpec
+from task_scheduler import TaskScheduler
 
 LOGGER = logging.getLogger("openmotics")
 
@@ -30,14 +32,17 @@ class MetricsCollector(object):
     The Metrics Collector collects OpenMotics metrics and makes them available.
     """
 
-    def __init__(self, gateway_api):
+    def __init__(self, gateway_api, scheduler=None):
         """
         :param gateway_api: Gateway API
         :type gateway_api: gateway.gateway_api.GatewayApi
+        :param scheduler: runs the collection jobs, a TaskScheduler is created by start() if None
+        :type scheduler: task_scheduler.TaskScheduler
         """
         self._start = time.time()
         self._last_service_uptime = 0
-        self._stopped = True
+        self._scheduler = scheduler
+        self._jobs = {}
         self._metrics_controller = None
         self._plugin_controller = None
         self._environment = {'inputs': {},
@@ -56,32 +61,30 @@ class MetricsCollector(object):
         self._plugin_intervals = {metric_type: [] for metric_type in self._min_intervals}
         self._websocket_intervals = {metric_type: {} for metric_type in self._min_intervals}
         self._cloud_intervals = {metric_type: 900 for metric_type in self._min_intervals}
-        self._sleepers = {metric_type: {'event': Event(),
-                                        'start': 0,
-                                        'end': 0} for metric_type in self._min_intervals}
 
         self._gateway_api = gateway_api
         self._metrics_queue = deque()
+        self._output_version = None
 
     def start(self):
         self._start = time.time()
-        self._stopped = False
-        MetricsCollector._start_thread(self._load_environment_configurations, 'load_configuration', 900)
-        MetricsCollector._start_thread(self._run_system, 'system')
-        MetricsCollector._start_thread(self._run_outputs, 'output')
-        MetricsCollector._start_thread(self._run_sensors, 'sensor')
-        MetricsCollector._start_thread(self._run_thermostats, 'thermostat')
-        MetricsCollector._start_thread(self._run_errors, 'error')
-        MetricsCollector._start_thread(self._run_pulsecounters, 'counter')
-        MetricsCollector._start_thread(self._run_power_openmotics, 'energy')
-        MetricsCollector._start_thread(self._run_power_openmotics_analytics, 'energy_analytics')
-        thread = Thread(target=self._sleep_manager)
-        thread.setName('Metric collector - Sleep manager')
-        thread.daemon = True
-        thread.start()
+        if self._scheduler is None:
+            self._scheduler = TaskScheduler()
+            self._scheduler.start()
+        self._schedule('load_configuration', self._load_environment_configurations, 900)
+        self._schedule('system', partial(self._run_system, 'system'))
+        self._schedule('output', partial(self._run_outputs, 'output'))
+        self._schedule('sensor', partial(self._run_sensors, 'sensor'))
+        self._schedule('thermostat', partial(self._run_thermostats, 'thermostat'))
+        self._schedule('error', partial(self._run_errors, 'error'))
+        self._schedule('counter', partial(self._run_pulsecounters, 'counter'))
+        self._schedule('energy', partial(self._run_power_openmotics, 'energy'))
+        self._schedule('energy_analytics', partial(self._run_power_openmotics_analytics, 'energy_analytics'))
 
     def stop(self):
-        self._stopped = True
+        for job in self._jobs.values():
+            job.cancel()
+        self._jobs = {}
 
     def collect_metrics(self):
         # Yield all metrics in the Queue
@@ -136,7 +139,9 @@ class MetricsCollector(object):
         if len(self._websocket_intervals[metric_type]) > 0:
             interval = min(interval, *[max(min_interval, i) for i in self._websocket_intervals[metric_type].values()])
         self.intervals[metric_type] = interval
-        self.maybe_wake_earlier(metric_type, interval)
+        if metric_type in self._jobs:
+            # A shorter interval moves the next collection forward
+            self._jobs[metric_type].set_interval(interval)
 
     def _enqueue_metrics(self, metric_type, values, tags, timestamp):
         """
@@ -151,79 +156,35 @@ class MetricsCollector(object):
                                         'tags': tags,
                                         'values': values})
 
-    def maybe_wake_earlier(self, metric_type, duration):
-        if metric_type in self._sleepers:
-            current_end = self._sleepers[metric_type]['end']
-            new_end = self._sleepers[metric_type]['start'] + duration
-            self._sleepers[metric_type]['end'] = min(current_end, new_end)
-
-    def _sleep_manager(self):
-        while True:
-            for sleep_data in self._sleepers.itervalues():
-                if not sleep_data['event'].is_set() and sleep_data['end'] < time.time():
-                    sleep_data['event'].set()
-            time.sleep(0.1)
-
-    @staticmethod
-    def _start_thread(workload, name, interval=None):
-        args = [name]
-        if interval is not None:
-            args.append(interval)
-        thread = Thread(target=workload, args=args)
-        thread.setName('Metric collector ({0})'.format(name))
-        thread.daemon = True
-        thread.start()
-        return thread
-
-    def _pause(self, start, metric_type, interval=None):
+    def _schedule(self, name, workload, interval=None):
         if interval is None:
-            interval = self.intervals[metric_type]
-        if metric_type in self._sleepers:
-            sleep_data = self._sleepers[metric_type]
-            sleep_data['start'] = start
-            sleep_data['end'] = start + interval
-            sleep_data['event'].clear()
-            sleep_data['event'].wait()
-        else:
-            elapsed = time.time() - start
-            sleep = max(0.1, interval - elapsed)
-            time.sleep(sleep)
+            interval = self.intervals[name]
+        self._jobs[name] = self._scheduler.schedule('metrics_{0}'.format(name), workload, interval)
 
-    def on_output(self, data):
+    def on_output(self, _):
+        # The OL was processed by the device state of the gateway api, only the changed outputs
+        # are processed.
         try:
-            on_outputs = {entry[0]: entry[1] for entry in data['outputs']}
-            outputs = self._environment['outputs']
-            changed_output_ids = []
-            for output_id in outputs:
-                status = outputs[output_id].get('status')
-                dimmer = outputs[output_id].get('dimmer')
-                if status is None or dimmer is None:
-                    continue
-                changed = False
-                if output_id in on_outputs:
-                    if status != 1:
-                        changed = True
-                        outputs[output_id]['status'] = 1
-                    if dimmer != on_outputs[output_id]:
-                        changed = True
-                        outputs[output_id]['dimmer'] = on_outputs[output_id]
-                elif status != 0:
-                    changed = True
-                    outputs[output_id]['status'] = 0
-                if changed is True:
-                    changed_output_ids.append(output_id)
-            self._process_outputs(changed_output_ids, 'output')
+            if self._output_version is None:
+                return  # The outputs are not known yet.
+            state = self._gateway_api.get_device_state(self._output_version, ['output'])
+            self._output_version = state['version']
+            changed = dict([(output['id'], output) for output in state['changes']['output']])
+            self._process_outputs(changed, 'output')
         except Exception as ex:
             MetricsCollector._log('Error processing outputs: {0}'.format(ex))
 
-    def _process_outputs(self, output_ids, metric_type):
+    def _process_outputs(self, output_states, metric_type):
+        # output_states maps the output id to the state of the output in the device state.
         try:
             now = time.time()
             outputs = self._environment['outputs']
-            for output_id in output_ids:
+            for (output_id, output_state) in output_states.iteritems():
+                if output_id not in outputs:
+                    continue
                 output_name = outputs[output_id].get('name')
-                status = outputs[output_id].get('status')
-                dimmer = outputs[output_id].get('dimmer')
+                status = output_state['status']
+                dimmer = output_state['dimmer']
                 if output_name != '' and status is not None and dimmer is not None:
                     if outputs[output_id]['module_type'] == 'output':
                         level = 100
@@ -241,7 +202,7 @@ class MetricsCollector(object):
                                           tags=tags,
                                           timestamp=now)
         except Exception as ex:
-            MetricsCollector._log('Error processing outputs {0}: {1}'.format(output_ids, ex))
+            MetricsCollector._log('Error processing outputs {0}: {1}'.format(output_states.keys(), ex))
 
     def on_input(self, data):
         self._process_input(data['input'])
@@ -265,429 +226,386 @@ class MetricsCollector(object):
             MetricsCollector._log('Error processing input: {0}'.format(ex))
 
     def _run_system(self, metric_type):
-        while not self._stopped:
-            start = time.time()
+        try:
+            now = time.time()
+            with open('/proc/uptime', 'r') as f:
+                system_uptime = float(f.readline().split()[0])
+            service_uptime = time.time() - self._start
+            if service_uptime > self._last_service_uptime + 3600:
+                self._start = time.time()
+                service_uptime = 0
+            self._last_service_uptime = service_uptime
+            self._enqueue_metrics(metric_type=metric_type,
+                                  values={'service_uptime': service_uptime,
+                                          'system_uptime': system_uptime},
+                                  tags={'name': 'gateway',
+                                        'section': 'main'},
+                                  timestamp=now)
+        except Exception as ex:
+            MetricsCollector._log('Error sending system data: {0}'.format(ex))
+        if self._metrics_controller is not None:
             try:
-                now = time.time()
-                with open('/proc/uptime', 'r') as f:
-                    system_uptime = float(f.readline().split()[0])
-                service_uptime = time.time() - self._start
-                if service_uptime > self._last_service_uptime + 3600:
-                    self._start = time.time()
-                    service_uptime = 0
-                self._last_service_uptime = service_uptime
                 self._enqueue_metrics(metric_type=metric_type,
-                                      values={'service_uptime': service_uptime,
-                                              'system_uptime': system_uptime},
                                       tags={'name': 'gateway',
-                                            'section': 'main'},
+                                            'section': 'plugins'},
+                                      values={'queue_length': len(self._metrics_controller.metrics_queue_plugins)},
                                       timestamp=now)
-            except Exception as ex:
-                MetricsCollector._log('Error sending system data: {0}'.format(ex))
-            if self._metrics_controller is not None:
-                try:
+                self._enqueue_metrics(metric_type=metric_type,
+                                      tags={'name': 'gateway',
+                                            'section': 'openmotics'},
+                                      values={'queue_length': len(self._metrics_controller.metrics_queue_openmotics)},
+                                      timestamp=now)
+                self._enqueue_metrics(metric_type=metric_type,
+                                      tags={'name': 'gateway',
+                                            'section': 'cloud'},
+                                      values={'cloud_queue_length': self._metrics_controller.cloud_stats['queue'],
+                                              'cloud_buffer_length': self._metrics_controller.cloud_stats['buffer'],
+                                              'cloud_time_ago_send': self._metrics_controller.cloud_stats['time_ago_send'],
+                                              'cloud_time_ago_try': self._metrics_controller.cloud_stats['time_ago_try']},
+                                      timestamp=now)
+                for plugin in self._plugin_controller.metric_receiver_queues.keys():
                     self._enqueue_metrics(metric_type=metric_type,
                                           tags={'name': 'gateway',
-                                                'section': 'plugins'},
-                                          values={'queue_length': len(self._metrics_controller.metrics_queue_plugins)},
+                                                'section': plugin},
+                                          values={'queue_length': len(self._plugin_controller.metric_receiver_queues[plugin])},
                                           timestamp=now)
+                for key in set(self._metrics_controller.inbound_rates.keys()) | set(self._metrics_controller.outbound_rates.keys()):
                     self._enqueue_metrics(metric_type=metric_type,
                                           tags={'name': 'gateway',
-                                                'section': 'openmotics'},
-                                          values={'queue_length': len(self._metrics_controller.metrics_queue_openmotics)},
+                                                'section': key},
+                                          values={'metrics_in': self._metrics_controller.inbound_rates.get(key, 0),
+                                                  'metrics_out': self._metrics_controller.outbound_rates.get(key, 0)},
                                           timestamp=now)
+                for mtype in self.intervals:
                     self._enqueue_metrics(metric_type=metric_type,
                                           tags={'name': 'gateway',
-                                                'section': 'cloud'},
-                                          values={'cloud_queue_length': self._metrics_controller.cloud_stats['queue'],
-                                                  'cloud_buffer_length': self._metrics_controller.cloud_stats['buffer'],
-                                                  'cloud_time_ago_send': self._metrics_controller.cloud_stats['time_ago_send'],
-                                                  'cloud_time_ago_try': self._metrics_controller.cloud_stats['time_ago_try']},
+                                                'section': mtype},
+                                          values={'metric_interval': self.intervals[mtype]},
                                           timestamp=now)
-                    for plugin in self._plugin_controller.metric_receiver_queues.keys():
-                        self._enqueue_metrics(metric_type=metric_type,
-                                              tags={'name': 'gateway',
-                                                    'section': plugin},
-                                              values={'queue_length': len(self._plugin_controller.metric_receiver_queues[plugin])},
-                                              timestamp=now)
-                    for key in set(self._metrics_controller.inbound_rates.keys()) | set(self._metrics_controller.outbound_rates.keys()):
-                        self._enqueue_metrics(metric_type=metric_type,
-                                              tags={'name': 'gateway',
-                                                    'section': key},
-                                              values={'metrics_in': self._metrics_controller.inbound_rates.get(key, 0),
-                                                      'metrics_out': self._metrics_controller.outbound_rates.get(key, 0)},
-                                              timestamp=now)
-                    for mtype in self.intervals:
-                        self._enqueue_metrics(metric_type=metric_type,
-                                              tags={'name': 'gateway',
-                                                    'section': mtype},
-                                              values={'metric_interval': self.intervals[mtype]},
-                                              timestamp=now)
-                except Exception as ex:
-                    LOGGER.error('Could not collect metric metrics: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+            except Exception as ex:
+                LOGGER.error('Could not collect metric metrics: {0}'.format(ex))
 
     def _run_outputs(self, metric_type):
-        while not self._stopped:
-            start = time.time()
-            try:
-                result = self._gateway_api.get_output_status()
-                for output in result:
-                    output_id = output['id']
-                    if output_id not in self._environment['outputs']:
-                        continue
-                    self._environment['outputs'][output_id]['status'] = output['status']
-                    self._environment['outputs'][output_id]['dimmer'] = output['dimmer']
-            except CommunicationTimedOutException:
-                LOGGER.error('Error getting output status: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error getting output status: {0}'.format(ex))
-            self._process_outputs(self._environment['outputs'].keys(), metric_type)
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+        output_states = {}
+        try:
+            # Reconciles the outputs if required, the unknown outputs are skipped
+            unknown = set([output['id'] for output in self._gateway_api.get_output_status()
+                           if output['status'] is None])
+            state = self._gateway_api.get_device_state(None, ['output'])
+            self._output_version = state['version']
+            output_states = dict([(output['id'], output)
+                                  for output in state['changes']['output']
+                                  if output['id'] not in unknown])
+        except CommunicationTimedOutException:
+            LOGGER.error('Error getting output status: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error getting output status: {0}'.format(ex))
+        self._process_outputs(output_states, metric_type)
 
     def _run_sensors(self, metric_type):
-        while not self._stopped:
-            start = time.time()
-            try:
-                now = time.time()
-                temperatures = self._gateway_api.get_sensor_temperature_status()
-                humidities = self._gateway_api.get_sensor_humidity_status()
-                brightnesses = self._gateway_api.get_sensor_brightness_status()
-                for sensor_id, sensor in self._environment['sensors'].iteritems():
-                    name = sensor['name']
-                    if name == '' or name == 'NOT_IN_USE':
-                        continue
-                    tags = {'id': sensor_id,
-                            'name': name}
-                    values = {}
-                    if temperatures[sensor_id] is not None:
-                        values['temp'] = temperatures[sensor_id]
-                    if humidities[sensor_id] is not None:
-                        values['hum'] = humidities[sensor_id]
-                    if brightnesses[sensor_id] is not None:
-                        values['bright'] = brightnesses[sensor_id]
-                    self._enqueue_metrics(metric_type=metric_type,
-                                          values=values,
-                                          tags=tags,
-                                          timestamp=now)
-            except CommunicationTimedOutException:
-                LOGGER.error('Error getting sensor status: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error getting sensor status: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+        try:
+            now = time.time()
+            temperatures = self._gateway_api.get_sensor_temperature_status(MasterCommandSpec.BACKGROUND)
+            humidities = self._gateway_api.get_sensor_humidity_status(MasterCommandSpec.BACKGROUND)
+            brightnesses = self._gateway_api.get_sensor_brightness_status(MasterCommandSpec.BACKGROUND)
+            for sensor_id, sensor in self._environment['sensors'].iteritems():
+                name = sensor['name']
+                if name == '' or name == 'NOT_IN_USE':
+                    continue
+                tags = {'id': sensor_id,
+                        'name': name}
+                values = {}
+                if temperatures[sensor_id] is not None:
+                    values['temp'] = temperatures[sensor_id]
+                if humidities[sensor_id] is not None:
+                    values['hum'] = humidities[sensor_id]
+                if brightnesses[sensor_id] is not None:
+                    values['bright'] = brightnesses[sensor_id]
+                self._enqueue_metrics(metric_type=metric_type,
+                                      values=values,
+                                      tags=tags,
+                                      timestamp=now)
+        except CommunicationTimedOutException:
+            LOGGER.error('Error getting sensor status: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error getting sensor status: {0}'.format(ex))
 
     def _run_thermostats(self, metric_type):
-        while not self._stopped:
-            start = time.time()
-            try:
-                now = time.time()
-                thermostats = self._gateway_api.get_thermostat_status()
+        try:
+            now = time.time()
+            thermostats = self._gateway_api.get_thermostat_status()
+            self._enqueue_metrics(metric_type=metric_type,
+                                  values={'on': thermostats['thermostats_on'],
+                                          'cooling': thermostats['cooling']},
+                                  tags={'id': 'G.0',
+                                        'name': 'Global configuration'},
+                                  timestamp=now)
+            for thermostat in thermostats['status']:
+                values = {'setpoint': int(thermostat['setpoint']),
+                          'output0': float(thermostat['output0']),
+                          'output1': float(thermostat['output1']),
+                          'mode': int(thermostat['mode']),
+                          'type': 'tbs' if thermostat['sensor_nr'] == 240 else 'normal',
+                          'automatic': thermostat['automatic'],
+                          'current_setpoint': thermostat['csetp']}
+                if thermostat['outside'] is not None:
+                    values['outside'] = thermostat['outside']
+                if thermostat['sensor_nr'] != 240 and thermostat['act'] is not None:
+                    values['temperature'] = thermostat['act']
                 self._enqueue_metrics(metric_type=metric_type,
-                                      values={'on': thermostats['thermostats_on'],
-                                              'cooling': thermostats['cooling']},
-                                      tags={'id': 'G.0',
-                                            'name': 'Global configuration'},
+                                      values=values,
+                                      tags={'id': '{0}.{1}'.format('C' if thermostats['cooling'] is True else 'H',
+                                                                   thermostat['id']),
+                                            'name': thermostat['name']},
                                       timestamp=now)
-                for thermostat in thermostats['status']:
-                    values = {'setpoint': int(thermostat['setpoint']),
-                              'output0': float(thermostat['output0']),
-                              'output1': float(thermostat['output1']),
-                              'mode': int(thermostat['mode']),
-                              'type': 'tbs' if thermostat['sensor_nr'] == 240 else 'normal',
-                              'automatic': thermostat['automatic'],
-                              'current_setpoint': thermostat['csetp']}
-                    if thermostat['outside'] is not None:
-                        values['outside'] = thermostat['outside']
-                    if thermostat['sensor_nr'] != 240 and thermostat['act'] is not None:
-                        values['temperature'] = thermostat['act']
-                    self._enqueue_metrics(metric_type=metric_type,
-                                          values=values,
-                                          tags={'id': '{0}.{1}'.format('C' if thermostats['cooling'] is True else 'H',
-                                                                       thermostat['id']),
-                                                'name': thermostat['name']},
-                                          timestamp=now)
-            except CommunicationTimedOutException:
-                LOGGER.error('Error getting thermostat status: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error getting thermostat status: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+        except CommunicationTimedOutException:
+            LOGGER.error('Error getting thermostat status: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error getting thermostat status: {0}'.format(ex))
 
     def _run_errors(self, metric_type):
-        while not self._stopped:
-            start = time.time()
-            try:
-                now = time.time()
-                errors = self._gateway_api.master_error_list()
-                for error in errors:
-                    om_module = error[0]
-                    count = error[1]
-                    types = {'i': 'Input',
-                             'I': 'Input',
-                             'T': 'Temperature',
-                             'o': 'Output',
-                             'O': 'Output',
-                             'd': 'Dimmer',
-                             'D': 'Dimmer',
-                             'R': 'Shutter',
-                             'C': 'CAN',
-                             'L': 'OLED'}
-                    self._enqueue_metrics(metric_type=metric_type,
-                                          values={'value': int(count)},
-                                          tags={'type': types[om_module[0]],
-                                                'id': om_module,
-                                                'name': '{0} {1}'.format(types[om_module[0]], om_module)},
-                                          timestamp=now)
-            except CommunicationTimedOutException:
-                LOGGER.error('Error getting module errors: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error getting module errors: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+        try:
+            now = time.time()
+            errors = self._gateway_api.master_error_list(MasterCommandSpec.BACKGROUND)
+            for error in errors:
+                om_module = error[0]
+                count = error[1]
+                types = {'i': 'Input',
+                         'I': 'Input',
+                         'T': 'Temperature',
+                         'o': 'Output',
+                         'O': 'Output',
+                         'd': 'Dimmer',
+                         'D': 'Dimmer',
+                         'R': 'Shutter',
+                         'C': 'CAN',
+                         'L': 'OLED'}
+                self._enqueue_metrics(metric_type=metric_type,
+                                      values={'value': int(count)},
+                                      tags={'type': types[om_module[0]],
+                                            'id': om_module,
+                                            'name': '{0} {1}'.format(types[om_module[0]], om_module)},
+                                      timestamp=now)
+        except CommunicationTimedOutException:
+            LOGGER.error('Error getting module errors: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error getting module errors: {0}'.format(ex))
 
     def _run_pulsecounters(self, metric_type):
-        while not self._stopped:
-            start = time.time()
-            now = time.time()
-            counters_data = {}
-            try:
-                for counter_id, counter in self._environment['pulse_counters'].iteritems():
-                    counters_data[counter_id] = {'name': counter['name'],
-                                                 'input': counter['input']}
-            except Exception as ex:
-                MetricsCollector._log('Error getting pulse counter configuration: {0}'.format(ex))
-            try:
-                result = self._gateway_api.get_pulse_counter_status()
-                counters = result
-                for counter_id in counters_data:
-                    if len(counters) > counter_id:
-                        counters_data[counter_id]['count'] = counters[counter_id]
-            except CommunicationTimedOutException:
-                LOGGER.error('Error getting pulse counter status: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error getting pulse counter status: {0}'.format(ex))
+        now = time.time()
+        counters_data = {}
+        try:
+            for counter_id, counter in self._environment['pulse_counters'].iteritems():
+                counters_data[counter_id] = {'name': counter['name'],
+                                             'input': counter['input']}
+        except Exception as ex:
+            MetricsCollector._log('Error getting pulse counter configuration: {0}'.format(ex))
+        try:
+            result = self._gateway_api.get_pulse_counter_status(MasterCommandSpec.BACKGROUND)
+            counters = result
             for counter_id in counters_data:
-                counter = counters_data[counter_id]
-                if counter['name'] != '':
+                if len(counters) > counter_id:
+                    counters_data[counter_id]['count'] = counters[counter_id]
+        except CommunicationTimedOutException:
+            LOGGER.error('Error getting pulse counter status: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error getting pulse counter status: {0}'.format(ex))
+        for counter_id in counters_data:
+            counter = counters_data[counter_id]
+            if counter['name'] != '':
+                self._enqueue_metrics(metric_type=metric_type,
+                                      values={'value': int(counter['count'])},
+                                      tags={'name': counter['name'],
+                                            'input': counter['input'],
+                                            'id': 'P{0}'.format(counter_id)},
+                                      timestamp=now)
+
+    def _run_power_openmotics(self, metric_type):
+        now = time.time()
+        mapping = {}
+        power_data = {}
+        try:
+            result = self._gateway_api.get_power_modules()
+            for power_module in result:
+                device_id = '{0}.{{0}}'.format(power_module['address'])
+                mapping[str(power_module['id'])] = device_id
+                if power_module['version'] in [8, 12]:
+                    for i in xrange(power_module['version']):
+                        power_data[device_id.format(i)] = {'name': power_module['input{0}'.format(i)]}
+        except CommunicationTimedOutException:
+            LOGGER.error('Error getting power modules: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error getting power modules: {0}'.format(ex))
+        try:
+            result = self._gateway_api.get_realtime_power()
+            for module_id, device_id in mapping.iteritems():
+                if module_id in result:
+                    for index, entry in enumerate(result[module_id]):
+                        if device_id.format(index) in power_data:
+                            usage = power_data[device_id.format(index)]
+                            usage.update({'voltage': entry[0],
+                                          'frequency': entry[1],
+                                          'current': entry[2],
+                                          'power': entry[3]})
+        except CommunicationTimedOutException:
+            LOGGER.error('Error getting realtime power: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error getting realtime power: {0}'.format(ex))
+        try:
+            result = self._gateway_api.get_total_energy()
+            for module_id, device_id in mapping.iteritems():
+                if module_id in result:
+                    for index, entry in enumerate(result[module_id]):
+                        if device_id.format(index) in power_data:
+                            usage = power_data[device_id.format(index)]
+                            usage.update({'counter': entry[0] + entry[1],
+                                          'counter_day': entry[0],
+                                          'counter_night': entry[1]})
+        except CommunicationTimedOutException:
+            LOGGER.error('Error getting total energy: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error getting total energy: {0}'.format(ex))
+        for device_id in power_data:
+            device = power_data[device_id]
+            if device['name'] != '':
+                try:
                     self._enqueue_metrics(metric_type=metric_type,
-                                          values={'value': int(counter['count'])},
-                                          tags={'name': counter['name'],
-                                                'input': counter['input'],
-                                                'id': 'P{0}'.format(counter_id)},
+                                          values={'voltage': device['voltage'],
+                                                  'current': device['current'],
+                                                  'frequency': device['frequency'],
+                                                  'power': device['power'],
+                                                  'counter': float(device['counter']),
+                                                  'counter_day': device['counter_day'],
+                                                  'counter_night': device['counter_night']},
+                                          tags={'type': 'openmotics',
+                                                'id': device_id,
+                                                'name': device['name']},
                                           timestamp=now)
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+                except Exception as ex:
+                    MetricsCollector._log('Error processing OpenMotics power device {0}: {1}'.format(device_id, ex))
 
-    def _run_power_openmotics(self, metric_type):
-        while not self._stopped:
-            start = time.time()
+    def _run_power_openmotics_analytics(self, metric_type):
+        try:
             now = time.time()
-            mapping = {}
-            power_data = {}
-            try:
-                result = self._gateway_api.get_power_modules()
-                for power_module in result:
-                    device_id = '{0}.{{0}}'.format(power_module['address'])
-                    mapping[str(power_module['id'])] = device_id
-                    if power_module['version'] in [8, 12]:
-                        for i in xrange(power_module['version']):
-                            power_data[device_id.format(i)] = {'name': power_module['input{0}'.format(i)]}
-            except CommunicationTimedOutException:
-                LOGGER.error('Error getting power modules: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error getting power modules: {0}'.format(ex))
-            try:
-                result = self._gateway_api.get_realtime_power()
-                for module_id, device_id in mapping.iteritems():
-                    if module_id in result:
-                        for index, entry in enumerate(result[module_id]):
-                            if device_id.format(index) in power_data:
-                                usage = power_data[device_id.format(index)]
-                                usage.update({'voltage': entry[0],
-                                              'frequency': entry[1],
-                                              'current': entry[2],
-                                              'power': entry[3]})
-            except CommunicationTimedOutException:
-                LOGGER.error('Error getting realtime power: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error getting realtime power: {0}'.format(ex))
-            try:
-                result = self._gateway_api.get_total_energy()
-                for module_id, device_id in mapping.iteritems():
-                    if module_id in result:
-                        for index, entry in enumerate(result[module_id]):
-                            if device_id.format(index) in power_data:
-                                usage = power_data[device_id.format(index)]
-                                usage.update({'counter': entry[0] + entry[1],
-                                              'counter_day': entry[0],
-                                              'counter_night': entry[1]})
-            except CommunicationTimedOutException:
-                LOGGER.error('Error getting total energy: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error getting total energy: {0}'.format(ex))
-            for device_id in power_data:
-                device = power_data[device_id]
-                if device['name'] != '':
-                    try:
+            result = self._gateway_api.get_power_modules()
+            for power_module in result:
+                device_id = '{0}.{{0}}'.format(power_module['address'])
+                if power_module['version'] != 12:
+                    continue
+                result = self._gateway_api.get_energy_time(power_module['id'])
+                abort = False
+                for i in xrange(12):
+                    if abort is True:
+                        break
+                    name = power_module['input{0}'.format(i)]
+                    if name == '':
+                        continue
+                    timestamp = now
+                    length = min(len(result[str(i)]['current']), len(result[str(i)]['voltage']))
+                    for j in xrange(length):
                         self._enqueue_metrics(metric_type=metric_type,
-                                              values={'voltage': device['voltage'],
-                                                      'current': device['current'],
-                                                      'frequency': device['frequency'],
-                                                      'power': device['power'],
-                                                      'counter': float(device['counter']),
-                                                      'counter_day': device['counter_day'],
-                                                      'counter_night': device['counter_night']},
-                                              tags={'type': 'openmotics',
-                                                    'id': device_id,
-                                                    'name': device['name']},
-                                              timestamp=now)
-                    except Exception as ex:
-                        MetricsCollector._log('Error processing OpenMotics power device {0}: {1}'.format(device_id, ex))
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
-
-    def _run_power_openmotics_analytics(self, metric_type):
-        while not self._stopped:
-            start = time.time()
-            try:
-                now = time.time()
-                result = self._gateway_api.get_power_modules()
-                for power_module in result:
-                    device_id = '{0}.{{0}}'.format(power_module['address'])
-                    if power_module['version'] != 12:
+                                              values={'current': result[str(i)]['current'][j],
+                                                      'voltage': result[str(i)]['voltage'][j]},
+                                              tags={'id': device_id.format(i),
+                                                    'name': name,
+                                                    'type': 'time'},
+                                              timestamp=timestamp)
+                        timestamp += 0.250  # Stretch actual data by 1000 for visualtisation purposes
+                result = self._gateway_api.get_energy_frequency(power_module['id'])
+                abort = False
+                for i in xrange(12):
+                    if abort is True:
+                        break
+                    name = power_module['input{0}'.format(i)]
+                    if name == '':
                         continue
-                    result = self._gateway_api.get_energy_time(power_module['id'])
-                    abort = False
-                    for i in xrange(12):
-                        if abort is True:
-                            break
-                        name = power_module['input{0}'.format(i)]
-                        if name == '':
-                            continue
-                        timestamp = now
-                        length = min(len(result[str(i)]['current']), len(result[str(i)]['voltage']))
-                        for j in xrange(length):
-                            self._enqueue_metrics(metric_type=metric_type,
-                                                  values={'current': result[str(i)]['current'][j],
-                                                          'voltage': result[str(i)]['voltage'][j]},
-                                                  tags={'id': device_id.format(i),
-                                                        'name': name,
-                                                        'type': 'time'},
-                                                  timestamp=timestamp)
-                            timestamp += 0.250  # Stretch actual data by 1000 for visualtisation purposes
-                    result = self._gateway_api.get_energy_frequency(power_module['id'])
-                    abort = False
-                    for i in xrange(12):
-                        if abort is True:
-                            break
-                        name = power_module['input{0}'.format(i)]
-                        if name == '':
-                            continue
-                        timestamp = now
-                        length = min(len(result[str(i)]['current'][0]), len(result[str(i)]['voltage'][0]))
-                        for j in xrange(length):
-                            self._enqueue_metrics(metric_type=metric_type,
-                                                  values={'current_harmonics': result[str(i)]['current'][0][j],
-                                                          'current_phase': result[str(i)]['current'][1][j],
-                                                          'voltage_harmonics': result[str(i)]['voltage'][0][j],
-                                                          'voltage_phase': result[str(i)]['voltage'][1][j]},
-                                                  tags={'id': device_id.format(i),
-                                                        'name': name,
-                                                        'type': 'frequency'},
-                                                  timestamp=timestamp)
-                            timestamp += 0.250  # Stretch actual data by 1000 for visualtisation purposes
-            except CommunicationTimedOutException:
-                LOGGER.error('Error getting power analytics: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error getting power analytics: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, metric_type)
+                    timestamp = now
+                    length = min(len(result[str(i)]['current'][0]), len(result[str(i)]['voltage'][0]))
+                    for j in xrange(length):
+                        self._enqueue_metrics(metric_type=metric_type,
+                                              values={'current_harmonics': result[str(i)]['current'][0][j],
+                                                      'current_phase': result[str(i)]['current'][1][j],
+                                                      'voltage_harmonics': result[str(i)]['voltage'][0][j],
+                                                      'voltage_phase': result[str(i)]['voltage'][1][j]},
+                                              tags={'id': device_id.format(i),
+                                                    'name': name,
+                                                    'type': 'frequency'},
+                                              timestamp=timestamp)
+                        timestamp += 0.250  # Stretch actual data by 1000 for visualtisation purposes
+        except CommunicationTimedOutException:
+            LOGGER.error('Error getting power analytics: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error getting power analytics: {0}'.format(ex))
 
-    def _load_environment_configurations(self, name, interval):
-        while not self._stopped:
-            start = time.time()
-            # Inputs
-            try:
-                result = self._gateway_api.get_input_configurations()
-                ids = []
-                for config in result:
-                    input_id = config['id']
-                    ids.append(input_id)
-                    self._environment['inputs'][input_id] = config
-                for input_id in self._environment['inputs'].keys():
-                    if input_id not in ids:
-                        del self._environment['inputs'][input_id]
-            except CommunicationTimedOutException:
-                MetricsCollector._log('Error while loading input configurations: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error while loading input configurations: {0}'.format(ex))
-            # Outputs
-            try:
-                result = self._gateway_api.get_output_configurations()
-                ids = []
-                for config in result:
-                    if config['module_type'] not in ['o', 'O', 'd', 'D']:
-                        continue
-                    output_id = config['id']
-                    ids.append(output_id)
-                    self._environment['outputs'][output_id] = {'name': config['name'],
-                                                               'module_type': {'o': 'output',
-                                                                               'O': 'output',
-                                                                               'd': 'dimmer',
-                                                                               'D': 'dimmer'}[config['module_type']],
-                                                               'floor': config['floor'],
-                                                               'type': 'relay' if config['type'] == 0 else 'light'}
-                for output_id in self._environment['outputs'].keys():
-                    if output_id not in ids:
-                        del self._environment['outputs'][output_id]
-            except CommunicationTimedOutException:
-                LOGGER.error('Error while loading output configurations: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error while loading output configurations: {0}'.format(ex))
-            # Sensors
-            try:
-                result = self._gateway_api.get_sensor_configurations()
-                ids = []
-                for config in result:
-                    input_id = config['id']
-                    ids.append(input_id)
-                    self._environment['sensors'][input_id] = config
-                for input_id in self._environment['sensors'].keys():
-                    if input_id not in ids:
-                        del self._environment['sensors'][input_id]
-            except CommunicationTimedOutException:
-                LOGGER.error('Error while loading sensor configurations: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error while loading sensor configurations: {0}'.format(ex))
-            # Pulse counters
-            try:
-                result = self._gateway_api.get_pulse_counter_configurations()
-                ids = []
-                for config in result:
-                    input_id = config['id']
-                    ids.append(input_id)
-                    self._environment['pulse_counters'][input_id] = config
-                for input_id in self._environment['pulse_counters'].keys():
-                    if input_id not in ids:
-                        del self._environment['pulse_counters'][input_id]
-            except CommunicationTimedOutException:
-                LOGGER.error('Error while loading pulse counter configurations: CommunicationTimedOutException')
-            except Exception as ex:
-                MetricsCollector._log('Error while loading pulse counter configurations: {0}'.format(ex))
-            if self._stopped:
-                return
-            self._pause(start, name, interval)
+    def _load_environment_configurations(self):
+        # Inputs
+        try:
+            result = self._gateway_api.get_input_configurations()
+            ids = []
+            for config in result:
+                input_id = config['id']
+                ids.append(input_id)
+                self._environment['inputs'][input_id] = config
+            for input_id in self._environment['inputs'].keys():
+                if input_id not in ids:
+                    del self._environment['inputs'][input_id]
+        except CommunicationTimedOutException:
+            MetricsCollector._log('Error while loading input configurations: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error while loading input configurations: {0}'.format(ex))
+        # Outputs
+        try:
+            result = self._gateway_api.get_output_configurations()
+            ids = []
+            for config in result:
+                if config['module_type'] not in ['o', 'O', 'd', 'D']:
+                    continue
+                output_id = config['id']
+                ids.append(output_id)
+                self._environment['outputs'][output_id] = {'name': config['name'],
+                                                           'module_type': {'o': 'output',
+                                                                           'O': 'output',
+                                                                           'd': 'dimmer',
+                                                                           'D': 'dimmer'}[config['module_type']],
+                                                           'floor': config['floor'],
+                                                           'type': 'relay' if config['type'] == 0 else 'light'}
+            for output_id in self._environment['outputs'].keys():
+                if output_id not in ids:
+                    del self._environment['outputs'][output_id]
+        except CommunicationTimedOutException:
+            LOGGER.error('Error while loading output configurations: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error while loading output configurations: {0}'.format(ex))
+        # Sensors
+        try:
+            result = self._gateway_api.get_sensor_configurations()
+            ids = []
+            for config in result:
+                input_id = config['id']
+                ids.append(input_id)
+                self._environment['sensors'][input_id] = config
+            for input_id in self._environment['sensors'].keys():
+                if input_id not in ids:
+                    del self._environment['sensors'][input_id]
+        except CommunicationTimedOutException:
+            LOGGER.error('Error while loading sensor configurations: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error while loading sensor configurations: {0}'.format(ex))
+        # Pulse counters
+        try:
+            result = self._gateway_api.get_pulse_counter_configurations()
+            ids = []
+            for config in result:
+                input_id = config['id']
+                ids.append(input_id)
+                self._environment['pulse_counters'][input_id] = config
+            for input_id in self._environment['pulse_counters'].keys():
+                if input_id not in ids:
+                    del self._environment['pulse_counters'][input_id]
+        except CommunicationTimedOutException:
+            LOGGER.error('Error while loading pulse counter configurations: CommunicationTimedOutException')
+        except Exception as ex:
+            MetricsCollector._log('Error while loading pulse counter configurations: {0}'.format(ex))
 
     def get_definitions(self):
         """
@@ -460,12 +460,30 @@ class WebInterface(object):
         :type token: str
         :param token: Authentication token
         :returns: 'time': hour and minutes (HH:MM), 'date': day, month, year (DD:MM:YYYY), \
-            'mode': Integer, 'version': a.b.c and 'hw_version': hardware version (Integer).
+            'mode': Integer, 'version': a.b.c, 'hw_version': hardware version (Integer), \
+            'commands_saved': number of identical read commands that were not sent (Integer) \
+            and 'eeprom_warmup': dict with 'running' (Boolean), the number of 'banks' that were \
+            checked, 'prefetched' from the master and the 'total' number of banks (Integer), \
+            and the 'coverage': the fraction of these banks that is cached (float).
         :rtype: dict
         """
         self.check_token(token)
         return self.__success(**self.__gateway_api.get_status())
 
+    @cherrypy.expose
+    def get_task_statistics(self, token):
+        """ Get the statistics of the periodic and one-shot jobs of the gateway.
+
+        :type token: str
+        :param token: Authentication token
+        :returns: 'tasks': dict that maps the name of a job to a dict with the 'interval', the \
+            number of 'runs', 'errors' and 'overruns', the 'last', 'max' and 'avg' 'run_time', \
+            the 'last' and 'max' 'lateness', the seconds until the 'next_run' and 'running'.
+        :rtype: dict
+        """
+        self.check_token(token)
+        return self.__success(tasks=self.__gateway_api.get_task_statistics())
+
     @cherrypy.expose
     def get_output_status(self, token):
         """ Get the status of the outputs.
@@ -473,7 +491,7 @@ class WebInterface(object):
         :type token: str
         :param token: Authentication token
         :returns: 'status': list of dictionaries with the following keys: id,\
-        status, dimmer and ctimer.
+        status, dimmer and ctimer (None if the state of the output is not known yet).
         """
         self.check_token(token)
         return self.__success(status=self.__gateway_api.get_output_status())
@@ -533,6 +551,32 @@ class WebInterface(object):
         self.check_token(token)
         return self.__wrap(lambda: self.__gateway_api.set_all_lights_floor_on(int(floor)))
 
+    @cherrypy.expose
+    def get_device_state(self, token, since=None, kinds=None):
+        """ Get the state of the devices that changed since a version, the state is kept up to
+        date by the messages of the master.
+
+        :param token: Authentication token
+        :type token: str
+        :param since: the 'version' returned by the previous call, None to get all devices.
+        :type since: str
+        :param kinds: json list with the kinds of devices ('output', 'input', 'shutter' and \
+            'event'), None for all kinds.
+        :type kinds: str
+        :returns: 'version': the current version (Integer), 'changes': dict that maps the kind \
+            to a list of dicts with the 'id' and the state of the changed devices. If since or \
+            kinds is invalid: 'success' False and the error in 'msg'.
+        :rtype: dict
+        """
+        self.check_token(token)
+        try:
+            since = None if since in [None, '', 'None', 'null'] else int(since)
+            kinds = None if kinds is None else json.loads(kinds)
+            result = self.__gateway_api.get_device_state(since, kinds)
+        except ValueError as exception:
+            return self.__error(str(exception))
+        return self.__success(**result)
+
     @cherrypy.expose
     def get_last_inputs(self, token):
         """ Get the 5 last pressed inputs during the last 5 minutes.
@@ -654,12 +698,31 @@ class WebInterface(object):
         :returns: global status information about the thermostats: 'thermostats_on', \
             'automatic' and 'setpoint' and 'status': a list with status information for all \
             thermostats, each element in the list is a dict with the following keys: \
-            'id', 'act', 'csetp', 'output0', 'output1', 'outside', 'mode'.
+            'id', 'act', 'csetp', 'output0', 'output1', 'outside', 'mode'. The 'version' and \
+            the 'timestamp' tell when the status was read from the master.
         :rtype: dict
         """
         self.check_token(token)
         return self.__wrap(self.__gateway_api.get_thermostat_status)
 
+    @cherrypy.expose
+    def get_thermostat_changes(self, token, since=None):
+        """ Get the changes of the thermostat status since a version.
+
+        :param token: Authentication token
+        :type token: str
+        :param since: the 'version' returned by the previous call (or by \
+            get_thermostat_status), None to get the full status.
+        :type since: str
+        :returns: the 'version' and the 'timestamp' of the status, the global status \
+            information if it changed, 'status': the thermostats that changed and 'removed': the \
+            ids of the thermostats that are not active anymore.
+        :rtype: dict
+        """
+        self.check_token(token)
+        since = None if since in [None, '', 'None', 'null'] else int(since)
+        return self.__wrap(lambda: self.__gateway_api.get_thermostat_changes(since))
+
     @cherrypy.expose
     def set_current_setpoint(self, token, thermostat, temperature):
         """ Set the current setpoint of a thermostat.
@@ -901,18 +964,149 @@ class WebInterface(object):
             return self.__wrap(lambda: self.__gateway_api.restore_full_backup(data))
 
     @cherrypy.expose
-    def get_master_backup(self, token):
-        """ Get a backup of the eeprom of the master.
+    def get_flight_recorder(self, token, seconds=None):
+        """ Get the recent raw traffic on the master and power serial ports.
+
+        :param token: Authentication token
+        :type token: str
+        :param seconds: Only return the traffic of the last seconds (optional)
+        :type seconds: float
+        :returns: This function does not return a dict, unlike all other API functions: it \
+            returns a string of bytes, use flight_recorder_tool.py to decode it.
+        :rtype: bytearray
+        """
+        self.check_token(token)
+        cherrypy.response.headers['Content-Type'] = 'application/octet-stream'
+        return self.__gateway_api.get_flight_recorder(
+            float(seconds) if seconds not in [None, '', 'None', 'null'] else None)
+
+    @cherrypy.expose
+    def get_eeprom_read_statistics(self, token):
+        """ Get the statistics of the eeprom read planner, used to tune the eeprom reads.
+
+        :param token: Authentication token
+        :type token: str
+        :returns: 'read_cost' and 'list_cost': the measured seconds per read_eeprom and \
+            eeprom_list command (float), 'cached', 'read' and 'list': the number of banks that \
+            were taken from the cache, read in windows or read at once (Integer), 'windows': \
+            the number of read_eeprom commands (Integer) and 'saved': the estimated number of \
+            seconds saved compared to the fixed read plan (float), 'hits' and 'misses': the \
+            number of banks that were or were not in the cache, 'revalidated' and 'changed': \
+            the number of stale banks that were listed after maintenance mode and how many of \
+            them changed, 'stale': the number of banks that are not revalidated yet (Integer).
+        :rtype: dict
+        """
+        self.check_token(token)
+        return self.__success(**self.__gateway_api.get_eeprom_read_statistics())
+
+    @cherrypy.expose
+    def flush_eeprom(self, token):
+        """ Write the pending eeprom writes to the master, only used if the gateway writes the
+        eeprom behind (eeprom_write_behind in openmotics.conf).
+
+        :param token: Authentication token
+        :type token: str
+        :returns: 'writes': the number of write_eeprom commands that were sent (Integer).
+        :rtype: dict
+        """
+        self.check_token(token)
+        return self.__success(writes=self.__gateway_api.flush_eeprom())
+
+    @cherrypy.expose
+    def export_configuration(self, token, format='json'):
+        """ Get all configurations in one call. The configurations are read in one pass over the
+        eeprom.
+
+        :param token: Authentication token
+        :type token: str
+        :param format: 'json' or 'msgpack'
+        :type format: str
+        :returns: 'config': dict with a list of configuration dicts (or one configuration dict) \
+            for every configuration: the keys are the names of the get_*_configuration(s) calls, \
+            eg. 'output_configurations' and 'dimmer_configuration'.
+        :rtype: dict
+        """
+        self.check_token(token)
+        config = self.__gateway_api.export_configuration()
+        if format == 'msgpack':
+            cherrypy.response.headers["Content-Type"] = "application/x-msgpack"
+            return msgpack.dumps({"success": True, "config": config})
+        return self.__success(config=config)
+
+    @cherrypy.expose
+    def query_configurations(self, token, name, filters=None, fields=None, offset=None,
+                             limit=None):
+        """ Get the configurations that match a number of filters. The filters are applied by
+        the gateway, only the requested fields of the configurations in the page are returned.
+
+        :param token: Authentication token
+        :type token: str
+        :param name: the name of the configurations, eg. 'output_configurations' or \
+            'input_configurations' (see export_configuration).
+        :type name: str
+        :param filters: json dict that maps a field name to a value or to a dict with an \
+            operator ('eq', 'ne', 'in', 'lt', 'le', 'gt', 'ge' or 'contains') and a value, eg. \
+            {"floor": 2, "name": {"ne": ""}}. (None gets all configurations)
+        :type filters: str
+        :param fields: The fields of the configurations to get. (None gets all fields)
+        :type fields: str
+        :param offset: the number of matching configurations to skip. (default 0)
+        :type offset: str
+        :param limit: the maximum number of configurations to get. (None gets all)
+        :type limit: str
+        :returns: 'total': the number of matching configurations (Integer), 'config': list of \
+            configuration dicts. If the name, a filter or a field is invalid: 'success' False \
+            and the error in 'msg'.
+        :rtype: dict
+        """
+        self.check_token(token)
+        try:
+            filters = None if filters is None else json.loads(filters)
+            fields = None if fields is None else json.loads(fields)
+            offset = 0 if offset in [None, ''] else int(offset)
+            limit = None if limit in [None, '', 'None', 'null'] else int(limit)
+            result = self.__gateway_api.query_configurations(name, filters, fields, offset, limit)
+        except ValueError as exception:
+            return self.__error(str(exception))
+        return self.__success(**result)
+
+    @cherrypy.expose
+    def import_configuration(self, token, config):
+        """ Set a number of configurations in one call. Only the changed bytes are written to the
+        eeprom and the eeprom is activated once.
 
         :param token: Authentication token
         :type token: str
+        :param config: dict in the format of export_configuration, the configurations that are \
+            not in the dict are not changed.
+        :type config: str
+        :returns: 'success' False and the error in 'msg' if a configuration in the dict is \
+            invalid.
+        :rtype: dict
+        """
+        self.check_token(token)
+        try:
+            self.__gateway_api.import_configuration(json.loads(config))
+        except ValueError as exception:
+            return self.__error(str(exception))
+        return self.__success()
+
+    @cherrypy.expose
+    def get_master_backup(self, token, full=None):
+        """ Get a backup of the eeprom of the master. The banks that are cached by the gateway
+        are not read from the master again, unless full is true.
+
+        :param token: Authentication token
+        :type token: str
+        :param full: read all banks from the master (true or false, default false).
+        :type full: str
         :returns: This function does not return a dict, unlike all other API functions: it \
             returns a string of bytes (size = 64kb).
         :rtype: bytearray
         """
         self.check_token(token)
         cherrypy.response.headers['Content-Type'] = 'application/octet-stream'
-        return self.__gateway_api.get_master_backup()
+        return self.__gateway_api.get_master_backup(full is not None and full.lower() == "true")
 
     @cherrypy.expose
     def master_restore(self, token, data):
@@ -929,6 +1123,20 @@ class WebInterface(object):
         data = data.file.read()
         return self.__wrap(lambda: self.__gateway_api.master_restore(data))
 
+    @cherrypy.expose
+    def get_master_restore_progress(self, token):
+        """ Get the progress of the running master restore.
+
+        :param token: Authentication token
+        :type token: str
+        :returns: 'progress': dict with the number of 'banks' that were restored, the 'total' \
+            number of banks and the number of 'windows' that were written, None if no restore \
+            is running.
+        :rtype: dict
+        """
+        self.check_token(token)
+        return self.__success(progress=self.__gateway_api.get_master_restore_progress())
+
     @cherrypy.expose
     def get_errors(self, token):
         """ Get the number of seconds since the last successul communication with the master and
@@ -0,0 +1,103 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+The command cache keeps the output of read-only master commands for a limited time, so polling
+the same status many times per second does not multiply the traffic on the serial link.
+"""
+
+import time
+from threading import Lock
+
+
+class CommandCache(object):
+    """ Caches the output of read-only master commands. Every cached command has its own maximum
+    age. The owner of the cache invalidates the commands that are affected by a write to the
+    master or by an async message, so the cache never returns output that is known to be stale.
+    """
+
+    def __init__(self, master_communicator, max_ages):
+        """ Create a CommandCache.
+
+        :param master_communicator: the communicator that executes the commands.
+        :type master_communicator: :class`master.master_communicator.MasterCommunicator`
+        :param max_ages: maps the action of the cached commands to the number of seconds the \
+        output stays fresh. Other commands are passed to the communicator without caching.
+        :type max_ages: dict
+        """
+        self.__master_communicator = master_communicator
+        self.__max_ages = max_ages
+
+        self.__lock = Lock()
+        self.__entries = {}  # maps (action, input of the command) to a tuple (time, output)
+        self.__generations = dict([(action, 0) for action in max_ages])
+        self.__hits = 0
+        self.__misses = 0
+
+    def do_command(self, cmd, fields=None, priority=None):
+        """ Get the output of a command from the cache if it is fresh, execute the command on
+        the master otherwise.
+
+        :param cmd: specification of the command to execute
+        :type cmd: :class`master.master_command.MasterCommandSpec`
+        :param fields: the input fields of the command.
+        :type fields: dict
+        :param priority: the priority class of the command, None to use the priority of the spec.
+        :type priority: one of the priorities in MasterCommandSpec.PRIORITIES
+        :returns: dict containing the output fields of the command
+        """
+        max_age = self.__max_ages.get(cmd.action)
+        if max_age is None:
+            return self.__master_communicator.do_command(cmd, fields, priority=priority)
+
+        key = (cmd.action, cmd.create_input(0, fields))
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None and time.time() - entry[0] < max_age:
+                self.__hits += 1
+                return dict(entry[1])
+            self.__misses += 1
+            generation = self.__generations[cmd.action]
+
+        start = time.time()
+        output = self.__master_communicator.do_command(cmd, fields, priority=priority)
+
+        with self.__lock:
+            # Don't store the output if the command was invalidated while it was in flight.
+            if generation == self.__generations[cmd.action]:
+                self.__entries[key] = (start, dict(output))
+
+        return output
+
+    def invalidate(self, *cmds):
+        """ Invalidate the cached output of commands, all commands if no command is given.
+
+        :param cmds: the specifications of the commands to invalidate.
+        :type cmds: :class`master.master_command.MasterCommandSpec`
+        """
+        actions = [cmd.action for cmd in cmds] if len(cmds) > 0 else self.__max_ages.keys()
+        with self.__lock:
+            for action in actions:
+                if action in self.__generations:
+                    self.__generations[action] += 1
+            self.__entries = dict([(key, entry) for (key, entry) in self.__entries.items()
+                                   if key[0] not in actions])
+
+    def get_statistics(self):
+        """ Get the number of cache hits and misses.
+
+        :returns: dict with 'hits' and 'misses'.
+        """
+        with self.__lock:
+            return {'hits': self.__hits, 'misses': self.__misses}
@@ -0,0 +1,225 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+The device state store keeps the current state of the devices on the master (outputs, inputs,
+shutters, ...) in memory. The store is updated by the async messages of the master, the readers
+get the state without sending commands to the master.
+"""
+
+import time
+from array import array
+from threading import Lock
+
+
+class DeviceStateStore(object):
+    """ Keeps the state of a number of kinds of devices. Every kind has a fixed set of fields,
+    the records of a kind are stored column-wise: one array per field, indexed by the id of the
+    device. A field is a number (with an array typecode) or an enum (a list of values, the index
+    of the value is stored).
+
+    Every change of a record increments the version of the store, the record remembers the
+    version of its last change: clients can get the records that changed since a version. The
+    slow-changing fields are reconciled with a full read of a kind, the store keeps the time of
+    the last reconciliation.
+    """
+
+    def __init__(self):
+        """ Create an empty DeviceStateStore, the kinds are added with register. """
+        self.__lock = Lock()
+        self.__version = 0
+        self.__kinds = {}
+
+    def register(self, kind, fields, size=0):
+        """ Add a kind of device.
+
+        :param kind: the name of the kind, eg. 'output'.
+        :type kind: str
+        :param fields: list of tuples with the name of the field and the typecode of the array \
+        (eg. 'B' or 'd') or the list of values of an enum.
+        :param size: the initial number of devices.
+        :type size: Integer
+        """
+        with self.__lock:
+            columns = {}
+            for (name, field_type) in fields:
+                typecode = 'B' if isinstance(field_type, list) else field_type
+                columns[name] = array(typecode, [0] * size)
+            self.__kinds[kind] = {'fields': fields,
+                                  'enums': dict([(name, field_type)
+                                                 for (name, field_type) in fields
+                                                 if isinstance(field_type, list)]),
+                                  'columns': columns,
+                                  'versions': array('L', [0] * size),
+                                  'reconciled': None}
+
+    def resize(self, kind, size):
+        """ Change the number of devices of a kind. The new devices have the default value (0 or
+        the first enum value) and are changed in the current version. """
+        with self.__lock:
+            state = self.__kinds[kind]
+            current = len(state['versions'])
+            if size < current:
+                for column in state['columns'].values():
+                    del column[size:]
+                del state['versions'][size:]
+            elif size > current:
+                self.__version += 1
+                for column in state['columns'].values():
+                    column.extend([0] * (size - current))
+                state['versions'].extend([self.__version] * (size - current))
+
+    def get_size(self, kind):
+        """ Get the number of devices of a kind. """
+        with self.__lock:
+            return len(self.__kinds[kind]['versions'])
+
+    def update(self, kind, id, **values):
+        """ Update the fields of a device. The version is only incremented if a value changed.
+
+        :param kind: the kind of the device.
+        :param id: the id of the device, the store grows if the id is not known.
+        :param values: the new values of the fields.
+        :returns: True if a value changed.
+        """
+        with self.__lock:
+            return self.__update(kind, id, values)
+
+    def update_all(self, kind, updates):
+        """ Update a number of devices at once, the changed records get the same version.
+
+        :param kind: the kind of the devices.
+        :param updates: dict that maps the id of a device to a dict with the new values.
+        :returns: the ids of the changed devices.
+        """
+        with self.__lock:
+            version = self.__version
+            changed = []
+            for (id, values) in sorted(updates.items()):
+                if self.__update(kind, id, values, version + 1):
+                    changed.append(id)
+            if len(changed) > 0:
+                self.__version = version + 1
+            return changed
+
+    def __update(self, kind, id, values, version=None):
+        """ Update the fields of a device without the lock. """
+        state = self.__kinds[kind]
+        versions = state['versions']
+        if id >= len(versions):
+            for column in state['columns'].values():
+                column.extend([0] * (id + 1 - len(versions)))
+            versions.extend([0] * (id + 1 - len(versions)))
+
+        changed = False
+        for (name, value) in values.items():
+            enum = state['enums'].get(name)
+            if enum is not None:
+                value = enum.index(value)
+            column = state['columns'][name]
+            if column[id] != value:
+                column[id] = value
+                changed = True
+
+        if changed:
+            if version is None:
+                self.__version += 1
+                version = self.__version
+            versions[id] = version
+        return changed
+
+    def increment(self, kind, id, field, **values):
+        """ Increment a counter field of a device and update the other fields. """
+        with self.__lock:
+            state = self.__kinds[kind]
+            count = state['columns'][field][id] if id < len(state['versions']) else 0
+            values[field] = count + 1
+            self.__update(kind, id, values)
+
+    def get(self, kind, id):
+        """ Get the record of a device.
+
+        :returns: dict with the 'id' and the fields of the device.
+        """
+        with self.__lock:
+            return self.__get(self.__kinds[kind], id)
+
+    def get_all(self, kind):
+        """ Get the records of all devices of a kind.
+
+        :returns: list of dicts, see get.
+        """
+        with self.__lock:
+            state = self.__kinds[kind]
+            return [self.__get(state, id) for id in range(len(state['versions']))]
+
+    @staticmethod
+    def __get(state, id):
+        """ Get the record of a device without the lock. """
+        record = {'id': id}
+        for (name, field_type) in state['fields']:
+            value = state['columns'][name][id]
+            record[name] = field_type[value] if isinstance(field_type, list) else value
+        return record
+
+    def get_version(self):
+        """ Get the current version of the store. """
+        with self.__lock:
+            return self.__version
+
+    def get_changes(self, since=None, kinds=None):
+        """ Get the records that changed after a version.
+
+        :param since: the version the client has, None to get all records.
+        :type since: Integer
+        :param kinds: the kinds of the records, None for all kinds.
+        :type kinds: list of str
+        :returns: dict with the current 'version' and the 'changes': a dict that maps the kind \
+        to the list of changed records.
+        :raises: ValueError if kinds is not a list of registered kinds.
+        """
+        if kinds is not None and not isinstance(kinds, (list, tuple)):
+            raise ValueError("The kinds should be a list")
+
+        with self.__lock:
+            if kinds is not None:
+                unknown = sorted(set([str(kind) for kind in kinds if not
+                                      isinstance(kind, basestring) or kind not in self.__kinds]))
+                if len(unknown) > 0:
+                    raise ValueError("Unknown kinds: %s" % ", ".join(unknown))
+
+            changes = {}
+            for kind in (sorted(self.__kinds) if kinds is None else kinds):
+                state = self.__kinds[kind]
+                versions = state['versions']
+                changes[kind] = [self.__get(state, id) for id in range(len(versions))
+                                 if since is None or versions[id] > since]
+            return {'version': self.__version, 'changes': changes}
+
+    def reconciled(self, kind):
+        """ Remember that all fields of a kind were read from the master. """
+        with self.__lock:
+            self.__kinds[kind]['reconciled'] = time.time()
+
+    def invalidate(self, kind):
+        """ Forget the last reconciliation of a kind, the next call to should_reconcile returns
+        True. """
+        with self.__lock:
+            self.__kinds[kind]['reconciled'] = None
+
+    def should_reconcile(self, kind, period):
+        """ Check if a kind was not reconciled in the last period seconds (or never). """
+        with self.__lock:
+            reconciled = self.__kinds[kind]['reconciled']
+            return reconciled is None or time.time() >= reconciled + period
@@ -18,16 +18,29 @@ Contains controller from reading and writing to the Master EEPROM.
 @author: fryckbos
 """
 
+import copy
 import inspect
+import logging
+import random
 import types
+from threading import Lock, RLock
 
+from task_scheduler import TaskScheduler
 from master_api import eeprom_list, read_eeprom, write_eeprom, activate_eeprom
+from master_command import MasterCommandSpec
 from eeprom_extension import EepromExtension
+from eeprom_planner import EepromReadPlanner
+from eeprom_query import EepromQuery, EepromIndex
+
+LOGGER = logging.getLogger("openmotics")
 
 
 class EepromController(object):
     """ The controller takes EepromModels and reads or writes them from and to an EepromFile. """
 
+    # The fields that are indexed for the queries, if the EepromModel has them.
+    INDEXED_FIELDS = ['floor', 'room', 'type', 'module_type']
+
     def __init__(self, eeprom_file, eeprom_extension):
         """ Constructor takes the eeprom_file (for reading and writes from the eeprom) and the
         eeprom_extension (for reading the extensions from sqlite).
@@ -37,10 +50,44 @@ class EepromController(object):
         """
         self.__eeprom_file = eeprom_file
         self.__eeprom_extension = eeprom_extension
+        self.__indexes = dict()  # EepromModel class -> tuple with the max id and the EepromIndex
+        self.__index_lock = Lock()
 
     def invalidate_cache(self):
-        """ Invalidate the cache, this should happen when maintenance mode was used. """
+        """ Invalidate the cache, see :meth`EepromFile.invalidate_cache`. """
         self.__eeprom_file.invalidate_cache()
+        self.__drop_indexes()
+
+    def mark_stale(self):
+        """ Mark the cached banks as stale, this should happen when maintenance mode is started,
+        see :meth`EepromFile.mark_stale`. """
+        self.__eeprom_file.mark_stale()
+        self.__drop_indexes()
+
+    def revalidate_cache(self):
+        """ Revalidate the stale banks in the background, see
+        :meth`EepromFile.revalidate_cache`. """
+        changed = self.__eeprom_file.revalidate_cache()
+        if changed > 0:
+            self.__drop_indexes()
+        return changed
+
+    def flush(self):
+        """ Write the pending writes of the EepromFile to the master, see
+        :meth`EepromFile.flush`. """
+        return self.__eeprom_file.flush()
+
+    def verify_cache(self):
+        """ Compare a number of cached banks with the master, see
+        :meth`EepromFile.verify_cache`. """
+        verified = self.__eeprom_file.verify_cache()
+        if not verified:
+            self.__drop_indexes()
+        return verified
+
+    def get_read_statistics(self):
+        """ Get the statistics of the read planner of the EepromFile. """
+        return self.__eeprom_file.get_read_statistics()
 
     def read(self, eeprom_model, id=None, fields=None):
         """ Create an instance of an EepromModel by reading it from the EepromFile. The id has to
@@ -56,7 +103,9 @@ class EepromController(object):
 
         field_dict = eeprom_model.from_eeprom_data(eeprom_data, id, fields)
         field_dict.update(self.__eeprom_extension.read_model(eeprom_model, id, fields))
-        return eeprom_model(**field_dict)
+        model = eeprom_model(**field_dict)
+        model.mark_clean()
+        return model
 
     def read_batch(self, eeprom_model, ids, fields=None):
         """ Create a list of instances of an EepromModel by reading it from the EepromFile.
@@ -64,24 +113,59 @@ class EepromController(object):
         :param eeprom_model: EepromModel class
         :param id: list of integers
         """
-        for id in ids:
-            eeprom_model.check_id(id)
+        return self.__read_batches([(eeprom_model, ids)], fields)[0]
+
+    def read_models(self, eeprom_models):
+        """ Read all instances of a number of EepromModels in one pass: the addresses of all
+        models are read with a single EepromFile.read, so the banks that are used by several
+        models are read once.
 
+        :param eeprom_models: list of EepromModel classes.
+        :returns: list with, for each EepromModel class, a list of instances if the model has \
+        an EepromId, an instance otherwise.
+        """
+        batches = [(eeprom_model, range(self.get_max_id(eeprom_model))
+                    if eeprom_model.has_id() else [None]) for eeprom_model in eeprom_models]
+        out = self.__read_batches(batches)
+        return [models if eeprom_model.has_id() else models[0]
+                for (eeprom_model, models) in zip(eeprom_models, out)]
+
+    def __read_batches(self, batches, fields=None):
+        """ Create instances of EepromModels by reading them from the EepromFile with a single
+        read.
+
+        :param batches: list of tuples with an EepromModel class and a list of ids.
+        :returns: list with a list of instances for every batch.
+        """
         addresses = []
-        for id in ids:
-            addresses.extend(eeprom_model.get_addresses(id, fields))
+        lengths = []
+        for (eeprom_model, ids) in batches:
+            for id in ids:
+                eeprom_model.check_id(id)
+                id_addresses = eeprom_model.get_addresses(id, fields)
+                addresses.extend(id_addresses)
+                lengths.append(len(id_addresses))
 
         eeprom_data = self.__eeprom_file.read(addresses)
 
         i = 0
+        lengths = iter(lengths)
         out = []
 
-        for id in ids:
-            length = len(eeprom_model.get_addresses(id, fields))
-            field_dict = eeprom_model.from_eeprom_data(eeprom_data[i:i + length], id, fields)
-            field_dict.update(self.__eeprom_extension.read_model(eeprom_model, id, fields))
-            out.append(eeprom_model(**field_dict))
-            i += length
+        for (eeprom_model, ids) in batches:
+            eext_dicts = self.__eeprom_extension.read_models(eeprom_model, ids, fields)
+            models = []
+
+            for (id, eext_dict) in zip(ids, eext_dicts):
+                length = next(lengths)
+                field_dict = eeprom_model.from_eeprom_data(eeprom_data[i:i + length], id, fields)
+                field_dict.update(eext_dict)
+                model = eeprom_model(**field_dict)
+                model.mark_clean()
+                models.append(model)
+                i += length
+
+            out.append(models)
 
         return out
 
@@ -93,6 +177,123 @@ class EepromController(object):
         """
         return self.read_batch(eeprom_model, range(self.get_max_id(eeprom_model)), fields)
 
+    def query(self, eeprom_model, filters=None, fields=None, offset=0, limit=None):
+        """ Get the instances of an EepromModel that match a number of filters, sorted by id. The
+        'eq' and 'in' conditions on the indexed fields (see INDEXED_FIELDS) are resolved using a
+        secondary index, the fields of the other conditions are read for the remaining ids only.
+        The requested fields are only read for the instances in the page.
+
+        :param eeprom_model: EepromModel class with an EepromId.
+        :param filters: dict that maps a field name to a condition, see \
+        :class`master.eeprom_query.EepromQuery`.
+        :param fields: the names of the fields to read, None reads all fields.
+        :param offset: the number of matching instances to skip.
+        :type offset: Integer
+        :param limit: the maximum number of instances to return, None returns all instances.
+        :type limit: Integer
+        :returns: tuple with the total number of matching instances and the list of instances \
+        in the page.
+        :raises: ValueError if a filter or a field is invalid.
+        """
+        query = EepromQuery(eeprom_model, filters)
+        if fields is not None:
+            if not isinstance(fields, (list, tuple)):
+                raise ValueError("The fields should be a list of field names")
+            known = eeprom_model.get_field_dict(include_id=True, include_eeprom=True,
+                                                include_eext=True)
+            unknown = sorted(set([str(field) for field in fields
+                                  if not isinstance(field, basestring) or field not in known]))
+            if len(unknown) > 0:
+                raise ValueError("Fields %s are unknown for %s"
+                                 % (", ".join(unknown), eeprom_model.get_name()))
+        max_id = self.get_max_id(eeprom_model)
+
+        index = self.__get_index(eeprom_model, max_id)
+        indexed_fields = index.get_fields()
+        ids = set(range(max_id))
+        for field in indexed_fields:
+            values = query.get_index_values(field)
+            if values is not None:
+                ids &= index.get_ids(field, values)
+        ids = sorted(ids)
+
+        residual_fields = query.get_residual_fields(indexed_fields)
+        if len(residual_fields) > 0:
+            ids = [model.get_id() for model in self.read_batch(eeprom_model, ids, residual_fields)
+                   if query.matches(model, residual_fields)]
+
+        page = ids[offset:] if limit is None else ids[offset:offset + limit]
+        return (len(ids), self.read_batch(eeprom_model, page, fields))
+
+    def __get_index(self, eeprom_model, max_id):
+        """ Get the EepromIndex of an EepromModel, the index is built when it is used for the first
+        time or when the maximum id of the model changed. The index is built from the full
+        models: the banks of the model are listed and cached, so the other fields of the query
+        are read from the cache. """
+        with self.__index_lock:
+            (index_max_id, index) = self.__indexes.get(eeprom_model, (None, None))
+            if index is None or index_max_id != max_id:
+                field_dict = eeprom_model.get_field_dict(include_eeprom=True, include_eext=True)
+                fields = [field for field in EepromController.INDEXED_FIELDS
+                          if field in field_dict]
+                models = self.read_batch(eeprom_model, range(max_id)) if len(fields) > 0 else []
+                index = EepromIndex(fields, models)
+                self.__indexes[eeprom_model] = (max_id, index)
+            return index
+
+    def __update_indexes(self, eeprom_models):
+        """ Update the built indexes with the dirty fields of written models. """
+        with self.__index_lock:
+            for eeprom_model in eeprom_models:
+                (_, index) = self.__indexes.get(eeprom_model.__class__, (None, None))
+                if index is not None:
+                    field_dict = eeprom_model.get_field_dict(include_eeprom=True, include_eext=True)
+                    index.update(eeprom_model, [field for field in eeprom_model.get_dirty_fields()
+                                                if field_dict[field].is_writable()])
+
+    def __drop_indexes(self):
+        """ Drop the indexes, they are rebuilt when they are used. This happens when the eeprom
+        can be changed without passing through write_batch. """
+        with self.__index_lock:
+            self.__indexes = dict()
+
+    def get_banks(self, eeprom_models):
+        """ Get the banks that contain the eeprom fields of all instances of a number of
+        EepromModels, including the banks that contain the maximum id of the models.
+
+        :param eeprom_models: list of EepromModel classes.
+        :returns: sorted list of banks (integers).
+        """
+        banks = set()
+        for eeprom_model in eeprom_models:
+            if eeprom_model.has_id():
+                eeprom_id = eeprom_model.__dict__[eeprom_model.get_id_field()]
+                if eeprom_id.has_address():
+                    banks.add(eeprom_id.get_address().bank)
+            ids = range(self.get_max_id(eeprom_model)) if eeprom_model.has_id() else [None]
+            for id in ids:
+                banks.update([address.bank for address in eeprom_model.get_addresses(id)])
+        return sorted(banks)
+
+    def prefetch(self, bank):
+        """ Put a bank in the cache using a background command, see
+        :meth`EepromFile.prefetch`. """
+        return self.__eeprom_file.prefetch(bank)
+
+    def is_cached(self, bank):
+        """ Check if a bank is cached, see :meth`EepromFile.is_cached`. """
+        return self.__eeprom_file.is_cached(bank)
+
+    def read_banks(self, banks, refresh=False):
+        """ Read a number of full banks from the EepromFile.
+
+        :param banks: a list of banks (integers).
+        :param refresh: read the banks from the master, even if they are cached.
+        :type refresh: boolean
+        :returns: a dict mapping the bank to the data.
+        """
+        return self.__eeprom_file.read_banks(banks, refresh)
+
     def write(self, eeprom_model):
         """ Write a given EepromModel to the EepromFile.
 
@@ -100,23 +301,55 @@ class EepromController(object):
         """
         return self.write_batch([eeprom_model])
 
+    def write_bank(self, bank, data):
+        """ Write the data of a full bank to the EepromFile, only the changed bytes are written.
+
+        :param bank: the bank (integer).
+        :param data: the data of the bank (string of 256 bytes).
+        :returns: the offsets of the written windows.
+        """
+        windows = self.__eeprom_file.write([EepromData(EepromAddress(bank, 0, len(data)), data)])
+        if len(windows) > 0:
+            self.__drop_indexes()
+        return [offset for (_, offset) in windows]
+
     def write_batch(self, eeprom_models):
-        """ Write a list of EepromModel instances to the EepromFile.
+        """ Write a list of EepromModel instances to the EepromFile. Only the dirty fields of the
+        models are written. The bytes in the eeprom are compared with the base of the models, the
+        base of the models that were not read from the EepromController is read for the written
+        fields only: the EepromFile does not have to read the full banks. The eeprom is only
+        activated if a byte changed.
 
         :param eeprom_models: list of EepromModel instances.
         """
         # Write to the eeprom
         eeprom_data = []
+        base_data = []
         for eeprom_model in eeprom_models:
-            eeprom_data.extend(eeprom_model.to_eeprom_data())
+            fields = eeprom_model.get_dirty_fields()
+            model_data = eeprom_model.to_eeprom_data(fields)
+            eeprom_data.extend(model_data)
 
-        if len(eeprom_data) > 0:
-            self.__eeprom_file.write(eeprom_data)
+            base = eeprom_model.get_base()
+            if base is not None and all([field in base.__dict__ for field in fields]):
+                base_data.extend(base.to_eeprom_data(fields))
+            else:
+                base_data.extend([None] * len(model_data))
+
+        unknown = [i for i in range(len(base_data)) if base_data[i] is None]
+        if len(unknown) > 0:
+            read = self.__eeprom_file.read([eeprom_data[i].address for i in unknown])
+            for (i, data) in zip(unknown, read):
+                base_data[i] = data
+
+        if len(eeprom_data) > 0 and len(self.__eeprom_file.write(eeprom_data, base_data)) > 0:
             self.__eeprom_file.activate()
 
         # Write the extensions
+        self.__eeprom_extension.write_models(eeprom_models)
+        self.__update_indexes(eeprom_models)
         for eeprom_model in eeprom_models:
-            self.__eeprom_extension.write_model(eeprom_model)
+            eeprom_model.mark_clean()
 
     def get_max_id(self, eeprom_model):
         """ Get the maximum id for an eeprom_model.
@@ -143,102 +376,420 @@ class EepromController(object):
 
 
 class EepromFile(object):
-    """ Reads from and writes to the Master EEPROM. """
+    """ Reads from and writes to the Master EEPROM.
+
+    If a journal is provided, the EepromFile writes behind: a write is stored in the journal
+    and in the cache, and is written to the master when no writes were done for quiet_period
+    seconds (or when flush is called). The writes are coalesced: every 10 bytes window is written
+    once, followed by a single activate_eeprom. The reads see the pending writes. The writes in
+    the journal of a previous run are pending when the EepromFile is created. The shadow only
+    keeps the bytes that were written to the master: a bank with pending writes is put in the
+    shadow when the writes are flushed.
+    """
 
     BATCH_SIZE = 10
+    SHADOW_SAMPLES = 4
 
-    def __init__(self, master_communicator):
+    def __init__(self, master_communicator, shadow=None, journal=None, quiet_period=2.0,
+                 scheduler=None):
         """ Create an EepromFile.
 
         :param master_communicator: communicates with the master.
         :type master_communicator: instance of MasterCommunicator.
+        :param shadow: keeps the banks that were read over a restart, None to keep them in \
+        memory only.
+        :type shadow: instance of :class`master.eeprom_shadow.EepromShadow`
+        :param journal: keeps the pending writes over a restart, None to write to the master \
+        directly.
+        :type journal: instance of :class`master.eeprom_journal.EepromJournal`
+        :param quiet_period: the number of seconds without writes before the pending writes \
+        are written to the master.
+        :type quiet_period: float
+        :param scheduler: runs the flush job of the write behind, a TaskScheduler is created if \
+        None and a journal is provided.
+        :type scheduler: :class`task_scheduler.TaskScheduler`
         """
         self.__master_communicator = master_communicator
         self.__bank_cache = dict()
+        self.__stale = set()
+        # A bank that is listed in the background is only cached if it was not written (or
+        # invalidated) while the eeprom_list was in flight, see __list_bank.
+        self.__cache_lock = RLock()
+        self.__epoch = 0  # incremented when the whole cache is invalidated or marked stale
+        self.__generations = dict()  # bank -> number of writes and invalidations of the bank
+        self.__cache_statistics = {'hits': 0, 'misses': 0, 'revalidated': 0, 'changed': 0}
+        self.__shadow = shadow
+        self.__shadow_lock = Lock()
+        self.__shadow_checked = shadow is None
+        self.__planner = EepromReadPlanner()
+
+        self.__journal = journal
+        self.__quiet_period = quiet_period
+        self.__pending = dict()  # bank -> dict with offset -> byte
+        self.__pending_lock = RLock()
+        self.__flush_job = None
+
+        if journal is not None:
+            if scheduler is None:
+                scheduler = TaskScheduler(workers=1)
+                scheduler.start()
+            self.__flush_job = scheduler.schedule('eeprom_flush', self.__background_flush,
+                                                  delay=None)
+            for (bank, offset, data) in journal.get_writes():
+                self.__add_pending(bank, offset, data)
+            if len(self.__pending) > 0:
+                self.__schedule_flush()
 
     def invalidate_cache(self):
-        """ Invalidate the cache, this should happen when maintenance mode was used. """
-        self.__bank_cache = dict()
+        """ Invalidate the whole cache. The pending writes are written to the master first. """
+        self.__flush_before_invalidate()
+
+        with self.__cache_lock:
+            self.__epoch += 1
+            self.__bank_cache = dict()
+            self.__stale = set()
+            if self.__shadow is not None:
+                self.__shadow.invalidate()
+
+    def mark_stale(self):
+        """ Mark all cached banks as stale, this should happen when maintenance mode is started:
+        the eeprom can be changed in maintenance mode. The stale banks are kept in memory, the
+        first time a stale bank is used it is listed from the master and compared with the
+        cached data (see revalidate_cache for doing this in the background). The shadow is
+        invalidated: a stale bank is only put back in the shadow when it is revalidated. The
+        pending writes are written to the master first.
+        """
+        self.__flush_before_invalidate()
+
+        if self.__shadow is not None:
+            with self.__shadow_lock:
+                if self.__shadow_checked:
+                    for bank in self.__shadow.get_banks():
+                        if bank not in self.__bank_cache:
+                            self.__bank_cache[bank] = self.__apply_pending(
+                                bank, self.__shadow.get(bank))
+                else:
+                    # The banks in the shadow were never checked: they are not used.
+                    self.__shadow_checked = True
+                self.__shadow.invalidate()
+
+        with self.__cache_lock:
+            self.__epoch += 1
+            self.__stale.update(self.__bank_cache.keys())
+
+    def __flush_before_invalidate(self):
+        """ Write the pending writes to the master, they remain pending if this fails. """
+        if len(self.__pending) > 0:
+            try:
+                self.flush()
+            except Exception:
+                LOGGER.exception("Could not flush the eeprom writes, they remain pending")
+
+    def __invalidate_banks(self, banks):
+        """ Remove a number of banks from the cache and the shadow. """
+        with self.__cache_lock:
+            for bank in banks:
+                self.__generations[bank] = self.__generations.get(bank, 0) + 1
+                self.__bank_cache.pop(bank, None)
+                self.__stale.discard(bank)
+                if self.__shadow is not None:
+                    self.__shadow.invalidate(bank)
+
+    def revalidate_cache(self, priority=MasterCommandSpec.BACKGROUND):
+        """ List the stale banks from the master and compare them with the cached data. This
+        is done with background priority, so the revalidation does not delay the interactive
+        commands.
+
+        :param priority: the priority of the eeprom_list commands.
+        :returns: the number of stale banks that were changed on the master.
+        """
+        with self.__cache_lock:
+            stale = sorted(self.__stale)
+        changed = 0
+        for bank in stale:
+            with self.__cache_lock:
+                data = self.__bank_cache.get(bank)
+                if data is None or bank not in self.__stale:
+                    continue  # The bank was invalidated or listed in the meantime.
+            if self.__revalidate(bank, data, priority) != data:
+                changed += 1
+        return changed
+
+    def __revalidate(self, bank, data, priority=None):
+        """ List a stale bank from the master and put it back in the cache.
+
+        :param bank: the number of the bank
+        :param data: the stale data of the bank.
+        :returns: string of 256 bytes, the current data of the bank.
+        """
+        new = self.__list_bank(bank, priority)
+        self.__cache_statistics['revalidated'] += 1
+        if new != data:
+            self.__cache_statistics['changed'] += 1
+        return new
+
+    def __check_shadow(self):
+        """ Check the shadow against the master before it is used for the first time: bank 0
+        and a number of random banks in the shadow are read from the master. If one of them
+        differs, the eeprom was changed while the gateway was not running and the whole shadow
+        is dropped. The banks that match are put in the cache. """
+        with self.__shadow_lock:
+            if self.__shadow_checked:
+                return
+
+            for bank in EepromFile.__get_samples(self.__shadow.get_banks()):
+                data = self.__master_communicator.do_command(eeprom_list(), {"bank" : bank})['data']
+                if data != self.__shadow.get(bank):
+                    self.__shadow.invalidate()
+                    self.__cache_bank(bank, self.__apply_pending(bank, data))
+                    break
+                self.__bank_cache[bank] = self.__apply_pending(bank, data)
+
+            self.__shadow_checked = True
+
+    @staticmethod
+    def __get_samples(banks):
+        """ Get bank 0 (if it is in banks) and a number of random other banks.
+
+        :returns: list of at most SHADOW_SAMPLES banks.
+        """
+        samples = [bank for bank in banks if bank == 0]
+        others = [bank for bank in banks if bank != 0]
+        return samples + random.sample(others, min(len(others),
+                                                   EepromFile.SHADOW_SAMPLES - len(samples)))
+
+    def verify_cache(self):
+        """ Compare bank 0 and a number of random cached banks with the master. The eeprom can
+        be changed without passing through the EepromFile (eg. by the passthrough). If one of
+        the banks differs, all cached banks are marked as stale.
+
+        :returns: True if the sampled banks matched the cache.
+        """
+        if not self.__shadow_checked:
+            self.__check_shadow()
+
+        banks = set(self.__bank_cache.keys())
+        if self.__shadow is not None:
+            banks.update(self.__shadow.get_banks())
+
+        for bank in EepromFile.__get_samples(sorted(banks)):
+            cached = self.__get_cached_bank(bank)
+            data = self.__master_communicator.do_command(eeprom_list(), {"bank" : bank})['data']
+            if self.__apply_pending(bank, data) != cached:
+                self.mark_stale()
+                self.__stale.discard(bank)
+                self.__cache_bank(bank, self.__apply_pending(bank, data))
+                return False
+
+        return True
+
+    def __get_cached_bank(self, bank):
+        """ Get a bank from the cache or from the shadow, None if the bank is in neither. A
+        stale bank is revalidated first. """
+        if not self.__shadow_checked:
+            self.__check_shadow()
+
+        data = self.__bank_cache.get(bank)
+        if data is None and self.__shadow is not None:
+            data = self.__shadow.get(bank)
+            if data is not None:
+                data = self.__apply_pending(bank, data)
+                self.__bank_cache[bank] = data
+
+        if data is None:
+            self.__cache_statistics['misses'] += 1
+        elif bank in self.__stale:
+            data = self.__revalidate(bank, data)
+        else:
+            self.__cache_statistics['hits'] += 1
+        return data
+
+    def __cache_bank(self, bank, data):
+        """ Put a bank in the cache and in the shadow. """
+        with self.__cache_lock:
+            self.__bank_cache[bank] = data
+            if self.__shadow is not None:
+                if bank in self.__pending:
+                    # The master doesn't have the pending bytes yet, see flush.
+                    self.__shadow.invalidate(bank)
+                else:
+                    self.__shadow.put(bank, data)
+
+    def __cache_written_bank(self, bank, data):
+        """ Put a bank that was written in the cache, the eeprom_lists of the bank that are in
+        flight are not cached. """
+        with self.__cache_lock:
+            self.__generations[bank] = self.__generations.get(bank, 0) + 1
+            self.__cache_bank(bank, data)
+
+    def __get_generation(self, bank):
+        """ Get the generation of a bank: it changes when the bank is written or invalidated. """
+        with self.__cache_lock:
+            return (self.__epoch, self.__generations.get(bank, 0))
 
     def activate(self):
         """ Activate a change in the Eeprom. The master will read the eeprom
-        and adjust the current settings.
+        and adjust the current settings. If there are pending writes, the eeprom is activated
+        when the writes are flushed.
         """
-        self.__master_communicator.do_command(activate_eeprom(), {'eep' : 0})
+        with self.__pending_lock:
+            if len(self.__pending) == 0:
+                self.__master_communicator.do_command(activate_eeprom(), {'eep' : 0})
 
     def read(self, addresses):
-        """ Read data from the Eeprom.
+        """ Read data from the Eeprom. The master_api provides two functions for reading from the
+        eeprom: master_api.eeprom_list() reads a full bank (256 bytes), master_api.read_eeprom()
+        reads 10 bytes. The EepromReadPlanner decides which one is used for each bank, based on
+        the measured duration of the commands. A bank that is in the cache or in the shadow is
+        not read, a bank that was read using eeprom_list is cached.
 
         :param addresses: the addresses to read.
         :type addresses: list of EepromAddress instances.
         :returns: a list of EepromData instances (in the same order as the provided addresses).
         """
-        ## Group the addresses per bank
-        per_bank = dict()
-        for addr in addresses:
-            if addr.bank not in per_bank:
-                per_bank[addr.bank] = []
-            per_bank[addr.bank].append(addr)
-
-        ## Read the bank data
+        ## Get the cached banks
         bank_data = dict()
-        for bank in per_bank:
-            bank_data[bank] = self.__read_bank(bank, per_bank[bank])
+        for bank in set([addr.bank for addr in addresses]):
+            data = self.__get_cached_bank(bank)
+            if data is not None:
+                bank_data[bank] = data
+
+        ## Read the other banks according to the plan
+        plan = self.__planner.plan(addresses, set(bank_data.keys()))
+        for (bank, bank_plan) in plan.items():
+            if bank_plan == EepromReadPlanner.LIST:
+                bank_data[bank] = self.__list_bank(bank)
+            elif bank_plan != EepromReadPlanner.CACHED:
+                bank_data[bank] = self.__read_windows(bank, bank_plan)
 
         ## Extract the required bytes from the bank data
         return [EepromData(a, bank_data[a.bank][a.offset : a.offset + a.length])
                 for a in addresses]
 
-    def __read_bank(self, bank, addresses):
-        """ Read a list of addresses from a bank, this returns a list of 256 bytes. Only the bytes
-        described in the addresses are valid, the other bytes might be dummies. The master_api
-        provides two function for reading from the eeprom: master_api.eeprom_list() and
-        master_api.read_eeprom(). The list reads a full bank (256 bytes), while the read can only
-        read 10 bytes at once. Due to communciation overhead the read function is about half the
-        speed (per byte) of the list function. Howver the list function is cached while the read
-        function is not. If more than 6 reads are required for 1 bank, the list function is used
-        to read the bank at once.
+    def __read_windows(self, bank, windows):
+        """ Read a number of windows from a bank using read_eeprom, this returns a string of 256
+        bytes. Only the bytes in the windows are valid, the other bytes are dummies.
 
         :param bank: the number of the bank
         :type bank: Integer
-        :param addresses: the addresses in the bank to read
-        :type addresses: a list of EepromAddress instances
-        :returns: list of 256 bytes.
+        :param windows: the start offsets of the windows.
+        :type windows: list of integers
+        :returns: string of 256 bytes.
         """
-        ## Mark the bytes that should be read
-        read_map = [False] * 256
-        for addr in addresses:
-            for i in range(addr.offset, addr.offset + addr.length):
-                read_map[i] = True
-
-        ## Find the start addresses of the reads
-        start_addresses = []
-        i = 0
-        while i < 256:
-            if read_map[i] is True:
-                if i > 256 - EepromFile.BATCH_SIZE:
-                    ## This is the last possible start address
-                    i = 256 - EepromFile.BATCH_SIZE
-                start_addresses.append(i)
-                i += EepromFile.BATCH_SIZE
-            else:
-                i += 1
+        bytes = ["\xff"] * 256
+
+        for addr in windows:
+            read = self.__master_communicator.do_command(
+                read_eeprom(), {"bank" : bank, "addr" : addr, "num" : EepromFile.BATCH_SIZE})
+            self.__measured(EepromReadPlanner.READ)
+
+            bytes[addr : addr + EepromFile.BATCH_SIZE] = read["data"]
 
-        ## Read from the start addresses
-        if len(start_addresses) > 6:
-            ## Too many reads, better read the whole bank at once using eeprom_list.
-            return self.__read_banks([bank])[bank]
+        return self.__apply_pending(bank, ''.join(bytes))
+
+    def __list_bank(self, bank, priority=None):
+        """ Read a full bank from the master using eeprom_list and cache it, the bank is not
+        stale anymore. If the bank was written or invalidated while the eeprom_list was in
+        flight, the listed data can be older than the write: the bank is listed again.
+
+        :param bank: the number of the bank
+        :type bank: Integer
+        :param priority: the priority of the command, None for the priority of eeprom_list.
+        :returns: string of 256 bytes.
+        """
+        while True:
+            generation = self.__get_generation(bank)
+            data = self.__eeprom_list(bank, priority)
+            with self.__cache_lock:
+                if self.__get_generation(bank) == generation:
+                    self.__stale.discard(bank)
+                    self.__cache_bank(bank, data)
+                    return data
+
+    def __eeprom_list(self, bank, priority=None):
+        """ Read a full bank from the master using eeprom_list, the pending writes are applied.
+
+        :param bank: the number of the bank
+        :param priority: the priority of the command, None for the priority of eeprom_list.
+        :returns: string of 256 bytes.
+        """
+        fields = {"bank" : bank}
+        if priority is None:
+            data = self.__master_communicator.do_command(eeprom_list(), fields)['data']
         else:
-            ## Fill the bytes with dummies and only read the required bytes from eeprom.
-            bytes = ["\xff"] * 256
+            data = self.__master_communicator.do_command(eeprom_list(), fields,
+                                                         priority=priority)['data']
+        self.__measured(EepromReadPlanner.LIST)
+        return self.__apply_pending(bank, data)
 
-            for addr in start_addresses:
-                read = self.__master_communicator.do_command(
-                    read_eeprom(), {"bank" : bank, "addr" : addr, "num" : EepromFile.BATCH_SIZE})
+    def __measured(self, command):
+        """ Pass the duration of the last command of the calling thread to the planner. The
+        duration does not include the wait for a slot in the pipeline window of the
+        MasterCommunicator, so the planner doesn't learn the queueing delay of the busy master.
 
-                bytes[addr : addr + EepromFile.BATCH_SIZE] = read["data"]
+        :param command: EepromReadPlanner.READ or EepromReadPlanner.LIST
+        """
+        duration = self.__master_communicator.get_last_duration()
+        if duration is not None:
+            self.__planner.measured(command, duration)
 
-            return ''.join(bytes)
+    def prefetch(self, bank, priority=MasterCommandSpec.BACKGROUND):
+        """ Put a bank in the cache: the bank is listed from the master if it is not cached, a
+        stale bank is revalidated. This does not change the hits and misses of the cache.
+
+        :param bank: the number of the bank
+        :param priority: the priority of the eeprom_list command.
+        :returns: True if the bank was read from the master.
+        """
+        if not self.__shadow_checked:
+            self.__check_shadow()
+
+        data = self.__bank_cache.get(bank)
+        if data is None and self.__shadow is not None:
+            data = self.__shadow.get(bank)
+            if data is not None:
+                data = self.__apply_pending(bank, data)
+                self.__bank_cache[bank] = data
+
+        if data is None:
+            self.__list_bank(bank, priority)
+        elif bank in self.__stale:
+            self.__revalidate(bank, data, priority)
+        else:
+            return False
+        return True
+
+    def is_cached(self, bank):
+        """ Check if a bank is in the cache (or in the shadow) and is not stale. """
+        if bank in self.__stale:
+            return False
+        return bank in self.__bank_cache or \
+               (self.__shadow_checked and self.__shadow is not None and
+                self.__shadow.get(bank) is not None)
+
+    def get_read_statistics(self):
+        """ Get the statistics of the read planner (see
+        :class`master.eeprom_planner.EepromReadPlanner`) and the cache: the number of banks
+        that were taken from the cache ('hits'), that were not cached ('misses'), the number
+        of stale banks that were 'revalidated' and how many of those were 'changed'.
+        """
+        statistics = self.__planner.get_statistics()
+        statistics.update(self.__cache_statistics)
+        statistics['stale'] = len(self.__stale)
+        return statistics
+
+    def read_banks(self, banks, refresh=False):
+        """ Read a number of full banks from the Eeprom.
+
+        :param banks: a list of banks (integers).
+        :param refresh: read the banks from the master, even if they are cached.
+        :type refresh: boolean
+        :returns: a dict mapping the bank to the data.
+        """
+        if refresh:
+            for bank in banks:
+                self.__list_bank(bank)
+        return self.__read_banks(banks)
 
     def __read_banks(self, banks):
         """ Read a number of banks from the Eeprom.
@@ -249,58 +800,211 @@ class EepromFile(object):
         ret = dict()
 
         for bank in banks:
-            if bank in self.__bank_cache:
-                data = self.__bank_cache[bank]
-            else:
-                output = self.__master_communicator.do_command(eeprom_list(), {"bank" : bank})
-                data = output['data']
-                self.__bank_cache[bank] = data
+            data = self.__get_cached_bank(bank)
+            if data is None:
+                data = self.__list_bank(bank)
 
             ret[bank] = data
 
         return ret
 
-    def write(self, data):
-        """ Write data to the Eeprom.
+    def write(self, data, base=None):
+        """ Write data to the Eeprom. If the EepromFile writes behind, the data is written to
+        the journal and the cache, the master is written after the quiet period.
 
         :param data: the data to write.
         :type data: list of EepromData instances.
+        :param base: the data that is in the eeprom at the addresses of data (in the same \
+        order), None if unknown. If the base is known, the banks that are not cached are not \
+        read: only the bytes that differ from the base are written.
+        :type base: list of EepromData instances.
+        :returns: list of tuples with the bank and the offset of the written windows, empty if \
+        the data did not change the eeprom.
         """
-        # Read the data in the banks that we are trying to write
-        bank_data = self.__read_banks(set([d.address.bank for d in data]))
-        new_bank_data = bank_data.copy()
-
-        for data_piece in data:
-            self.__patch(new_bank_data, data_piece)
+        if self.__journal is not None:
+            if not self.__shadow_checked:
+                self.__check_shadow()  # Takes the shadow lock, before the pending lock
+            with self.__pending_lock:
+                return self.__write_behind(data, base)
 
-        # Check what changed and write changes in batch
         try:
-            for bank in bank_data.keys():
-                old = bank_data[bank]
-                new = new_bank_data[bank]
-
-                i = 0
-                while i < len(bank_data[bank]):
-                    if old[i] != new[i]:
-                        length = 1
-                        j = 1
-                        while j < EepromFile.BATCH_SIZE and i + j < len(old):
-                            if old[i + j] != new[i + j]:
-                                length = j + 1
-                            j += 1
-
-                        self.__write(bank, i, new[i:i + length])
-                        i += EepromFile.BATCH_SIZE
-                    else:
-                        i += 1
+            (writes, new_bank_data) = self.__get_writes(data, base)
+
+            for (bank, offset, to_write) in writes:
+                self.__write(bank, offset, to_write)
+
+            for (bank, new) in new_bank_data.items():
+                self.__cache_written_bank(bank, new)
 
-                self.__bank_cache[bank] = new
+            return [(bank, offset) for (bank, offset, _) in writes]
         except Exception as exception:
-            ## The write failed at some point, we are not sure about the data in the cache,
-            ## so we invalidate it.
-            self.invalidate_cache()
+            ## The write failed at some point, we are not sure about the data in the written
+            ## banks, so we invalidate them.
+            self.__invalidate_banks(set([d.address.bank for d in data]))
             raise exception
 
+    def __write_behind(self, data, base):
+        """ Write data to the journal and the cache, and schedule a flush.
+
+        :param data: the data to write.
+        :type data: list of EepromData instances.
+        :param base: the data in the eeprom at the addresses of data, see write.
+        :type base: list of EepromData instances.
+        :returns: list of tuples with the bank and the offset of the journaled windows.
+        """
+        (writes, new_bank_data) = self.__get_writes(data, base)
+
+        if len(writes) == 0:
+            return []
+
+        # The journal is written first: if it fails, nothing changed.
+        self.__journal.append(writes)
+        for (bank, offset, to_write) in writes:
+            self.__add_pending(bank, offset, to_write)
+        for (bank, new) in new_bank_data.items():
+            self.__cache_written_bank(bank, new)
+
+        self.__schedule_flush()
+        return [(bank, offset) for (bank, offset, _) in writes]
+
+    def __get_writes(self, data, base):
+        """ Get the write_eeprom windows that write the changed bytes in data. The bytes are
+        compared with the cached banks. If the base is unknown, the banks that are not cached
+        are read. If the base is known, the bytes of the other banks are compared with the base.
+
+        :returns: tuple with a list of tuples (bank, offset, bytes) and a dict with the new \
+        data of the cached or read banks.
+        """
+        banks = set([d.address.bank for d in data])
+        if base is None:
+            bank_data = self.__read_banks(banks)
+        else:
+            bank_data = dict()
+            for bank in banks:
+                cached = self.__get_cached_bank(bank)
+                if cached is not None:
+                    bank_data[bank] = cached
+
+        new_bank_data = bank_data.copy()
+        old_bytes = dict()  # bank -> dict with offset -> byte, for the banks that are not cached
+        new_bytes = dict()
+
+        for i in range(len(data)):
+            address = data[i].address
+            if address.bank in bank_data:
+                self.__patch(new_bank_data, data[i])
+            else:
+                (old, new) = (old_bytes.setdefault(address.bank, dict()),
+                              new_bytes.setdefault(address.bank, dict()))
+                for j in range(address.length):
+                    old.setdefault(address.offset + j, base[i].bytes[j])
+                    new[address.offset + j] = data[i].bytes[j]
+
+        writes = []
+        for bank in sorted(bank_data.keys()):
+            (old, new) = (bank_data[bank], new_bank_data[bank])
+            for (offset, length) in self.__get_windows(
+                    [i for i in range(len(old)) if old[i] != new[i]]):
+                writes.append((bank, offset, new[offset:offset + length]))
+
+        for bank in sorted(new_bytes.keys()):
+            (old, new) = (old_bytes[bank], new_bytes[bank])
+            for (offset, length) in self.__get_windows(
+                    sorted([i for i in new if old[i] != new[i]]), new):
+                writes.append((bank, offset, ''.join([new[i]
+                                                      for i in range(offset, offset + length)])))
+
+        return (writes, new_bank_data)
+
+    @staticmethod
+    def __get_windows(offsets, known=None):
+        """ Cover a sorted list of offsets with write windows of at most 10 bytes, every window
+        starts at the first offset that is not covered yet.
+
+        :param known: the offsets of which the bytes are known, a window only covers known \
+        offsets. None if all bytes are known.
+        :returns: list of tuples with the offset and the length of the windows.
+        """
+        windows = []
+        for offset in offsets:
+            if len(windows) > 0 and offset < windows[-1][0] + EepromFile.BATCH_SIZE and \
+                    (known is None or all([i in known for i in range(sum(windows[-1]), offset)])):
+                windows[-1] = (windows[-1][0], offset - windows[-1][0] + 1)
+            else:
+                windows.append((offset, 1))
+        return windows
+
+    def __add_pending(self, bank, offset, data):
+        """ Add a write to the pending writes, a later write to the same byte replaces the
+        earlier one. """
+        with self.__pending_lock:
+            pending = self.__pending.setdefault(bank, dict())
+            for i in range(len(data)):
+                pending[offset + i] = data[i]
+
+    def __apply_pending(self, bank, data):
+        """ Apply the pending writes for a bank to the data read from the master.
+
+        :returns: string of 256 bytes.
+        """
+        with self.__pending_lock:
+            pending = self.__pending.get(bank)
+            if pending is None:
+                return data
+
+            bytes = list(data)
+            for (offset, byte) in pending.items():
+                bytes[offset] = byte
+            return ''.join(bytes)
+
+    def __schedule_flush(self):
+        """ Flush the pending writes after the quiet period, a flush that was scheduled before
+        is postponed. """
+        self.__flush_job.run_after(self.__quiet_period)
+
+    def __background_flush(self):
+        """ Flush the pending writes, the flush is retried after the quiet period if it fails. """
+        try:
+            self.flush()
+        except Exception:
+            LOGGER.exception("Could not flush the eeprom writes, retrying")
+            self.__schedule_flush()
+
+    def flush(self):
+        """ Write the pending writes to the master and activate the eeprom. The modified bytes
+        in every bank are covered with as few write_eeprom windows as possible. The pending
+        writes (and the journal) are only cleared when all windows are written.
+
+        :returns: the number of write_eeprom commands.
+        """
+        if not self.__shadow_checked:
+            self.__check_shadow()  # Takes the shadow lock, before the pending lock
+        with self.__pending_lock:
+            if len(self.__pending) == 0:
+                return 0
+
+            banks = self.__read_banks(self.__pending.keys())
+            writes = 0
+            for (bank, pending) in sorted(self.__pending.items()):
+                for (offset, length) in self.__get_windows(sorted(pending.keys())):
+                    self.__write(bank, offset, banks[bank][offset:offset + length])
+                    writes += 1
+
+            self.__master_communicator.do_command(activate_eeprom(), {'eep' : 0})
+
+            self.__journal.clear()
+            self.__pending = dict()
+            # The master has the written bytes, the flushed banks can be put in the shadow.
+            for bank in banks:
+                with self.__cache_lock:
+                    if self.__bank_cache.get(bank) == banks[bank]:
+                        self.__cache_bank(bank, banks[bank])
+            return writes
+
+    def has_pending_writes(self):
+        """ Check if there are writes that are not written to the master yet. """
+        return len(self.__pending) > 0
+
     def __patch(self, bank_data, eeprom_data):
         """ Patch a byte array with a eeprom_data.
 
@@ -369,9 +1073,7 @@ class EepromModel(object):
 
     def __init__(self, **kwargs):
         """ The arguments to the constructor are defined by the EepromDataType class fields. """
-        fields = [x[0] for x in self.__class__.get_fields(include_id=True,
-                                                          include_eeprom=True,
-                                                          include_eext=True)]
+        fields = self.__class__.__get_metadata()['names']
 
         for (field, value) in kwargs.items():
             if field in fields:
@@ -383,25 +1085,78 @@ class EepromModel(object):
         if id_field_name != None and id_field_name not in kwargs:
             raise TypeError("The id was missing for %s" % self.__class__.__name__)
 
+        self.__base = None
+
     def get_id(self):
         """ Create EepromData from the EepromModel. """
         id_field = self.__class__.get_id_field()
         return None if id_field is None else self.__dict__[id_field]
 
+    @classmethod
+    def __get_metadata(cls):
+        """ Get the fields of the EepromModel child. The class is only scanned for fields the
+        first time, the metadata is stored in the class itself (not in the parent class).
+
+        :returns: dict with the 'ids', 'eeprom' and 'eext' fields (lists of tuples (name, \
+        type), sorted by name), the 'names' of all fields and a cache for the 'fields' and \
+        'layouts'.
+        """
+        metadata = cls.__dict__.get('_eeprom_model_metadata')
+        if metadata is None:
+            members = inspect.getmembers(cls)
+            metadata = {
+                'ids': [(name, field) for (name, field) in members
+                        if isinstance(field, EepromId)],
+                'eeprom': [(name, field) for (name, field) in members
+                           if isinstance(field, EepromDataType) or
+                           isinstance(field, CompositeDataType)],
+                'eext': [(name, field) for (name, field) in members
+                         if isinstance(field, EextDataType)],
+                'fields': {},  # maps the include flags of get_fields to the fields
+                'layouts': {}  # maps the id to the addresses of the eeprom fields
+            }
+            metadata['names'] = set([name for (name, _) in metadata['ids'] + metadata['eeprom'] +
+                                     metadata['eext']])
+            cls._eeprom_model_metadata = metadata
+        return metadata
+
     @classmethod
     def get_fields(cls, include_id=False, include_eeprom=False, include_eext=False):
         """ Get the fields defined by an EepromModel child. """
-        def include(field):
-            if isinstance(field, EepromId) and include_id:
-                return True
-            elif (isinstance(field, EepromDataType) or isinstance(field, CompositeDataType)) and include_eeprom:
-                return True
-            elif isinstance(field, EextDataType) and include_eext:
-                return True
-            else:
-                return False
+        metadata = cls.__get_metadata()
+        key = (include_id, include_eeprom, include_eext)
+        fields = metadata['fields'].get(key)
+        if fields is None:
+            fields = sorted((metadata['ids'] if include_id else []) +
+                            (metadata['eeprom'] if include_eeprom else []) +
+                            (metadata['eext'] if include_eext else []))
+            metadata['fields'][key] = fields
+        return list(fields)
 
-        return inspect.getmembers(cls, include)
+    @classmethod
+    def __get_layout(cls, id):
+        """ Get the addresses of the eeprom fields for an id. The addresses are calculated once
+        per id.
+
+        :returns: tuple with a list of tuples (name, type, address or list of addresses for a \
+        CompositeDataType) and the list of all addresses.
+        """
+        layouts = cls.__get_metadata()['layouts']
+        layout = layouts.get(id)
+        if layout is None:
+            fields = []
+            addresses = []
+            for (field_name, field_type) in cls.get_fields(include_eeprom=True):
+                if isinstance(field_type, CompositeDataType):
+                    field_addresses = field_type.get_addresses(id)
+                    fields.append((field_name, field_type, field_addresses))
+                    addresses.extend(field_addresses)
+                else:
+                    address = field_type.get_address(id)
+                    fields.append((field_name, field_type, address))
+                    addresses.append(address)
+            layout = layouts[id] = (fields, addresses)
+        return layout
 
     @classmethod
     def get_field_dict(cls, include_id=False, include_eeprom=False, include_eext=False):
@@ -418,15 +1173,14 @@ class EepromModel(object):
     def get_id_field(cls):
         """ Get the name of the EepromId field. None if not included. """
         if cls.has_id():
-            ids = inspect.getmembers(cls, lambda x: isinstance(x, EepromId))
-            return ids[0][0]
+            return cls.__get_metadata()['ids'][0][0]
         else:
             return None
 
     @classmethod
     def has_id(cls):
         """ Check if the EepromModel has an id. """
-        ids = inspect.getmembers(cls, lambda x: isinstance(x, EepromId))
+        ids = cls.__get_metadata()['ids']
         if len(ids) == 0:
             return False
         elif len(ids) == 1:
@@ -449,8 +1203,7 @@ class EepromModel(object):
         elif id is not None and not has_id:
             raise TypeError("%s doesn't have an id, but id was given." % cls.__name__)
         elif id is not None:
-            id_type = inspect.getmembers(cls, lambda x: isinstance(x, EepromId))
-            max_id = id_type[0][1].get_max_id()
+            max_id = cls.__get_metadata()['ids'][0][1].get_max_id()
 
             if id > max_id:
                 raise TypeError("The maximum id for %s is %d, %d was provided." %
@@ -472,13 +1225,40 @@ class EepromModel(object):
         """ Create an EepromModel from a dict. """
         return cls(**in_dict)
 
-    def to_eeprom_data(self):
-        """ Create EepromData from the EepromModel. """
+    def mark_clean(self):
+        """ Remember the current values of the fields as the values in the eeprom (the base of
+        the model), the fields that are changed after this call are dirty. """
+        base = dict()
+        for (field_name, _) in self.__class__.get_fields(True, True, True):
+            if field_name in self.__dict__:
+                base[field_name] = copy.deepcopy(self.__dict__[field_name])
+        self.__base = base
+
+    def get_base(self):
+        """ Get an instance of the EepromModel with the values of the fields when mark_clean was
+        called, None if mark_clean was not called. """
+        return None if self.__base is None else self.__class__(**self.__base)
+
+    def get_dirty_fields(self):
+        """ Get the names of the fields that differ from the base of the model, all fields if
+        mark_clean was not called. The id field is never dirty. """
+        id_field = self.__class__.get_id_field()
+        return [field_name for (field_name, _) in self.__class__.get_fields(True, True, True)
+                if field_name in self.__dict__ and field_name != id_field and
+                (self.__base is None or field_name not in self.__base or
+                 self.__base[field_name] != self.__dict__[field_name])]
+
+    def to_eeprom_data(self, fields=None):
+        """ Create EepromData from the EepromModel.
+
+        :param fields: the names of the fields to include, None for all fields.
+        """
         data = []
         id = self.get_id()
 
         for (field_name, field_type) in self.__class__.get_fields(include_eeprom=True):
-            if field_name in self.__dict__ and field_type.is_writable():
+            if field_name in self.__dict__ and field_type.is_writable() and \
+                    (fields is None or field_name in fields):
                 if isinstance(field_type, CompositeDataType):
                     data.extend(field_type.to_eeprom_data(self.__dict__[field_name], id))
                 else:
@@ -502,20 +1282,19 @@ class EepromModel(object):
 
         if fields == None:
             # Add data for all fields.
-            for (field_name, field_type) in cls.get_fields(include_eeprom=True):
+            for (field_name, field_type, address) in cls.__get_layout(id)[0]:
                 if isinstance(field_type, CompositeDataType):
                     field_dict[field_name] = field_type.from_data_dict(data_dict, id)
                 else:
-                    address = field_type.get_address(id)
                     bytes = data_dict[address].bytes
                     field_dict[field_name] = field_type.from_bytes(bytes)
         else:
-            # Add data for given fields only.
-            class_field_dict = cls.get_field_dict(include_eeprom=True)
+            # Add data for given fields only, the eext fields are not in the eeprom.
+            class_field_dict = cls.get_field_dict(include_eeprom=True, include_eext=True)
             for field_name in fields:
                 if field_name not in class_field_dict:
                     raise TypeError("Field %s is unknown for %s" % (field_name, cls.__name__))
-                else:
+                elif not isinstance(class_field_dict[field_name], EextDataType):
                     field_type = class_field_dict[field_name]
                     if isinstance(field_type, CompositeDataType):
                         field_dict[field_name] = field_type.from_data_dict(data_dict, id)
@@ -537,20 +1316,16 @@ class EepromModel(object):
 
         if fields == None:
             # Add addresses for all fields.
-            for (_, field_type) in cls.get_fields(include_eeprom=True):
-                if isinstance(field_type, CompositeDataType):
-                    addresses.extend(field_type.get_addresses(id))
-                else:
-                    addresses.append(field_type.get_address(id))
+            addresses.extend(cls.__get_layout(id)[1])
 
         else:
-            # Add addresses for given fields only.
-            class_field_dict = cls.get_field_dict(include_eeprom=True)
+            # Add addresses for given fields only, the eext fields are not in the eeprom.
+            class_field_dict = cls.get_field_dict(include_eeprom=True, include_eext=True)
 
             for field in fields:
                 if field not in class_field_dict:
                     raise TypeError("Field %s is unknown for %s" % (field, cls.__name__))
-                else:
+                elif not isinstance(class_field_dict[field], EextDataType):
                     field_type = class_field_dict[field]
                     if isinstance(field_type, CompositeDataType):
                         addresses.extend(field_type.get_addresses(id))
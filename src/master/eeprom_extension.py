@@ -25,7 +25,8 @@ from threading import Lock
 
 class EepromExtension(object):
     """ Provides the interface for reading and writing EepromExtension objects to the sqlite
-    database. """
+    database. The extensions table is small: it is loaded in memory with a single query the first
+    time it is read, the writes go to the cache and the database. """
 
     def __init__(self, db_filename):
         self.__lock = Lock()
@@ -33,6 +34,7 @@ class EepromExtension(object):
         self.__connection = sqlite3.connect(db_filename, detect_types=sqlite3.PARSE_DECLTYPES,
                                             check_same_thread=False, isolation_level=None)
         self.__cursor = self.__connection.cursor()
+        self.__cache = None  # maps (model, model_id, field) to the encoded value
         if create_tables is True:
             self.__create_tables()
 
@@ -43,6 +45,17 @@ class EepromExtension(object):
                                   "model_id INTEGER, field TEXT, value TEXT, "
                                   "UNIQUE(model, model_id, field) ON CONFLICT REPLACE);")
 
+    def __get_cache(self):
+        """ Get the cache of the extensions table, the table is read if it is not cached yet.
+        The lock should be held when calling this method. """
+        if self.__cache is None:
+            cache = dict()
+            for (model, model_id, field, value) in self.__cursor.execute(
+                    "SELECT model, model_id, field, value FROM extensions"):
+                cache[(model, model_id, field)] = value
+            self.__cache = cache
+        return self.__cache
+
     def read_model(self, eeprom_model, model_id, fields=None):
         """ Read all eext data for the given eeprom model. Returns dict with all specified
         fields (if fields is None, all fields are returned).
@@ -51,51 +64,96 @@ class EepromExtension(object):
         :param model_id: The id for the EepromModel.
         :param fields: List containing the fields to return.
         """
-        eeprom_model_name = eeprom_model.get_name()
+        return self.read_models(eeprom_model, [model_id], fields)[0]
 
-        field_dict = {}
-        for (field_name, field_type) in eeprom_model.get_fields(include_eext=True):
-            if fields is None or field_name in fields:
-                field_value = self.read_extension_data(eeprom_model_name, model_id,
-                                                       field_type, field_name)
-                field_dict[field_name] = field_value
+    def read_models(self, eeprom_model, model_ids, fields=None):
+        """ Read all eext data for the given eeprom model and a list of ids. Returns a list with
+        a dict for each id, with all specified fields (if fields is None, all fields are
+        returned).
+
+        :param eeprom_model: EepromModel class.
+        :param model_ids: List with the ids for the EepromModel.
+        :param fields: List containing the fields to return.
+        """
+        eeprom_model_name = eeprom_model.get_name()
+        field_types = [(field_name, field_type)
+                       for (field_name, field_type) in eeprom_model.get_fields(include_eext=True)
+                       if fields is None or field_name in fields]
 
-        return field_dict
+        out = []
+        with self.__lock:
+            cache = self.__get_cache()
+            for model_id in model_ids:
+                model_id = 0 if model_id is None else model_id
+                field_dict = {}
+                for (field_name, field_type) in field_types:
+                    value = cache.get((eeprom_model_name, model_id, field_name))
+                    field_dict[field_name] = field_type.default_value() if value is None \
+                                             else field_type.decode(value)
+                out.append(field_dict)
+
+        return out
 
     def read_extension_data(self, eeprom_model_name, model_id, field_type, field_name):
         """ Read data for a specific eext field. """
         model_id = 0 if model_id is None else model_id
 
         with self.__lock:
-            for row in self.__cursor.execute("SELECT value FROM extensions WHERE "
-                                              "model=? AND model_id=? AND field=?",
-                                              (eeprom_model_name, model_id, field_name)):
-                return field_type.decode(row[0])
+            value = self.__get_cache().get((eeprom_model_name, model_id, field_name))
 
-        return field_type.default_value()
+        return field_type.default_value() if value is None else field_type.decode(value)
 
     def write_model(self, eeprom_model):
         """ Write all eext data for the given eeprom model.
 
         :param eeprom_model: an EepromModel instances.
         """
-        model_id = eeprom_model.get_id()
-        eeprom_model_name = eeprom_model.__class__.get_name()
+        self.write_models([eeprom_model])
 
-        for (field_name, field_type) in eeprom_model.__class__.get_fields(include_eext=True):
-            if field_name in eeprom_model.__dict__:
-                self.write_extension_data(eeprom_model_name, model_id, field_type, field_name,
-                                          eeprom_model.__dict__[field_name])
+    def write_models(self, eeprom_models):
+        """ Write all eext data for the given eeprom models in one transaction.
+
+        :param eeprom_models: list of EepromModel instances.
+        """
+        rows = []
+        for eeprom_model in eeprom_models:
+            model_id = eeprom_model.get_id()
+            model_id = 0 if model_id is None else model_id
+            eeprom_model_name = eeprom_model.__class__.get_name()
+
+            for (field_name, field_type) in eeprom_model.__class__.get_fields(include_eext=True):
+                if field_name in eeprom_model.__dict__:
+                    rows.append((eeprom_model_name, model_id, field_name,
+                                 field_type.encode(eeprom_model.__dict__[field_name])))
+
+        self.__write_rows(rows)
 
     def write_extension_data(self, eeprom_model_name, model_id, field_type, field_name, data):
         """ Write data for a specific eext field. """
         model_id = 0 if model_id is None else model_id
-        value = field_type.encode(data)
+        self.__write_rows([(eeprom_model_name, model_id, field_name, field_type.encode(data))])
+
+    def __write_rows(self, rows):
+        """ Write rows to the extensions table in one transaction and update the cache.
+
+        :param rows: list of tuples with the model, the model_id, the field and the value.
+        """
+        if len(rows) == 0:
+            return
 
         with self.__lock:
-            self.__cursor.execute("INSERT INTO extensions (model, model_id, field, value) "
-                                  "VALUES (?, ?, ?, ?)",
-                                  (eeprom_model_name, model_id, field_name, value))
+            self.__cursor.execute("BEGIN")
+            try:
+                self.__cursor.executemany("INSERT INTO extensions (model, model_id, field, value) "
+                                          "VALUES (?, ?, ?, ?)", rows)
+                self.__cursor.execute("COMMIT")
+            except Exception:
+                self.__cursor.execute("ROLLBACK")
+                raise
+
+            if self.__cache is not None:
+                for (model, model_id, field, value) in rows:
+                    self.__cache[(model, model_id, field)] = value
 
     def close(self):
         """ Commit the changes and close the database connection. """
@@ -0,0 +1,126 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+The eeprom journal keeps the eeprom writes that were not written to the master yet, so they are
+not lost when the gateway is restarted before the writes were flushed.
+"""
+
+import os
+import zlib
+import struct
+from threading import Lock
+
+
+class EepromJournal(object):
+    """ An append-only file with the eeprom writes that are not written to the master yet. The
+    writes are appended in batches, every batch has a header with the length and the crc32
+    checksum of the batch and is synced to disk before append returns. A batch that is not
+    complete or has a wrong checksum (eg. after a power failure during an append) is dropped,
+    together with everything after it.
+
+    A batch contains a number of writes, every write has a header with the bank, the offset and
+    the length, followed by the bytes of the write.
+    """
+
+    BATCH_HEADER = struct.Struct('<HI')  # length, crc32
+    WRITE_HEADER = struct.Struct('<BBB')  # bank, offset, length
+
+    def __init__(self, filename):
+        """ Open the journal file, the file is created if it does not exist.
+
+        :param filename: the name of the journal file.
+        :type filename: string
+        :raises: IOError or OSError if the file can not be opened.
+        """
+        self.__lock = Lock()
+        self.__fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0644)
+        self.__writes = []
+
+        with os.fdopen(os.dup(self.__fd), 'rb') as journal_file:
+            content = journal_file.read()
+
+        end = 0
+        while end + EepromJournal.BATCH_HEADER.size <= len(content):
+            (length, crc) = EepromJournal.BATCH_HEADER.unpack_from(content, end)
+            start = end + EepromJournal.BATCH_HEADER.size
+            batch = content[start:start + length]
+            if len(batch) != length or zlib.crc32(batch) & 0xffffffff != crc:
+                break
+            self.__writes.extend(EepromJournal.__decode(batch))
+            end = start + length
+
+        if end != len(content):
+            os.ftruncate(self.__fd, end)
+            os.fsync(self.__fd)
+        os.lseek(self.__fd, end, os.SEEK_SET)
+
+    @staticmethod
+    def __decode(batch):
+        """ Decode the writes in a batch.
+
+        :returns: list of tuples with the bank, the offset and the bytes.
+        """
+        writes = []
+        i = 0
+        while i < len(batch):
+            (bank, offset, length) = EepromJournal.WRITE_HEADER.unpack_from(batch, i)
+            i += EepromJournal.WRITE_HEADER.size
+            writes.append((bank, offset, batch[i:i + length]))
+            i += length
+        return writes
+
+    def get_writes(self):
+        """ Get the writes in the journal, in the order they were appended.
+
+        :returns: list of tuples with the bank, the offset and the bytes.
+        """
+        with self.__lock:
+            return list(self.__writes)
+
+    def append(self, writes):
+        """ Append a batch of writes to the journal. The batch is on disk when this returns.
+
+        :param writes: the writes.
+        :type writes: list of tuples with the bank, the offset and the bytes (at most 255).
+        :raises: IOError or OSError if the batch can not be written.
+        """
+        if len(writes) == 0:
+            return
+
+        batch = ''.join([EepromJournal.WRITE_HEADER.pack(bank, offset, len(data)) + data
+                         for (bank, offset, data) in writes])
+        if len(batch) > 0xffff:
+            raise ValueError("Batch of %d bytes is too large for the journal" % len(batch))
+
+        with self.__lock:
+            os.write(self.__fd, EepromJournal.BATCH_HEADER.pack(len(batch),
+                                                                zlib.crc32(batch) & 0xffffffff)
+                     + batch)
+            os.fsync(self.__fd)
+            self.__writes.extend(writes)
+
+    def clear(self):
+        """ Remove all writes from the journal, this should happen when the writes are on the
+        master. """
+        with self.__lock:
+            os.ftruncate(self.__fd, 0)
+            os.lseek(self.__fd, 0, os.SEEK_SET)
+            os.fsync(self.__fd)
+            self.__writes = []
+
+    def close(self):
+        """ Close the journal file. """
+        with self.__lock:
+            os.close(self.__fd)
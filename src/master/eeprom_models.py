@@ -357,7 +357,7 @@ class RTD10CoolingConfiguration(EepromModel):
     ventilation_speed_output = EepromByte(lambda mid: (218, mid))
     ventilation_speed_value = EepromByte(lambda mid: (218, 64 + mid))
     mode_output = EepromByte(lambda mid: (219, mid))
-    mode_value = EepromByte(lambda mid: (219, 264 + mid))
+    mode_value = EepromByte(lambda mid: (219, 64 + mid))
     on_off_output = EepromByte(lambda mid: (219, 100 + mid))
     poke_angle_output = EepromByte(lambda mid: (220, mid))
     poke_angle_value = EepromByte(lambda mid: (220, 64 + mid))
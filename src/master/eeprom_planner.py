@@ -0,0 +1,150 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+The read planner decides how the eeprom banks are read from the master: from the cache, with a
+number of read_eeprom commands or with one eeprom_list command.
+"""
+
+from threading import Lock
+
+
+class EepromReadPlanner(object):
+    """ Plans the reads for a set of eeprom addresses. A bank that is cached costs nothing. For
+    the other banks, the bytes that should be read are covered with as few read_eeprom windows
+    as possible, the cost of these reads is compared with the cost of reading the whole bank with
+    eeprom_list. The costs are the measured durations of the commands (exponentially smoothed),
+    eeprom_list is preferred when the costs are equal, because the bank is cached afterwards.
+    """
+
+    BANK_SIZE = 256
+    WINDOW_SIZE = 10
+    READ = 'read'
+    LIST = 'list'
+    CACHED = 'cached'
+
+    # The old planner read the whole bank if more than this number of reads was required.
+    FIXED_MAX_READS = 6
+
+    def __init__(self, read_cost=0.025, list_cost=0.15, smoothing=0.2):
+        """ Create an EepromReadPlanner.
+
+        :param read_cost: the initial duration of a read_eeprom command in seconds.
+        :type read_cost: float
+        :param list_cost: the initial duration of an eeprom_list command in seconds.
+        :type list_cost: float
+        :param smoothing: the weight of a new measurement in the smoothed costs.
+        :type smoothing: float
+        """
+        self.__lock = Lock()
+        self.__costs = {EepromReadPlanner.READ: read_cost, EepromReadPlanner.LIST: list_cost}
+        self.__smoothing = smoothing
+        self.__decisions = {'cached': 0, 'read': 0, 'list': 0}
+        self.__windows = 0
+        self.__saved = 0.0
+
+    @staticmethod
+    def get_windows(addresses):
+        """ Get the start offsets of the read_eeprom windows that cover the addresses in a bank.
+        The addresses are merged and covered from the start of the bank, every window starts at
+        the first byte that is not covered yet: this gives the minimal number of windows.
+
+        :param addresses: the addresses to read, all in the same bank.
+        :type addresses: list of EepromAddress instances
+        :returns: list of offsets.
+        """
+        read_map = [False] * EepromReadPlanner.BANK_SIZE
+        for addr in addresses:
+            for i in range(addr.offset, addr.offset + addr.length):
+                read_map[i] = True
+
+        windows = []
+        last_start = EepromReadPlanner.BANK_SIZE - EepromReadPlanner.WINDOW_SIZE
+        i = 0
+        while i < EepromReadPlanner.BANK_SIZE:
+            if read_map[i]:
+                windows.append(min(i, last_start))
+                i += EepromReadPlanner.WINDOW_SIZE
+            else:
+                i += 1
+        return windows
+
+    def plan(self, addresses, cached_banks):
+        """ Plan the reads for a set of addresses.
+
+        :param addresses: the addresses to read.
+        :type addresses: list of EepromAddress instances
+        :param cached_banks: the banks that are cached.
+        :type cached_banks: set of integers
+        :returns: dict that maps the bank to EepromReadPlanner.CACHED, EepromReadPlanner.LIST \
+        or a list of offsets for read_eeprom.
+        """
+        per_bank = dict()
+        for addr in addresses:
+            per_bank.setdefault(addr.bank, []).append(addr)
+
+        plan = dict()
+        with self.__lock:
+            (read_cost, list_cost) = (self.__costs[EepromReadPlanner.READ],
+                                     self.__costs[EepromReadPlanner.LIST])
+            for (bank, bank_addresses) in per_bank.items():
+                windows = EepromReadPlanner.get_windows(bank_addresses)
+
+                # The cost of the old, fixed plan
+                if len(windows) > EepromReadPlanner.FIXED_MAX_READS:
+                    fixed_cost = 0 if bank in cached_banks else list_cost
+                else:
+                    fixed_cost = len(windows) * read_cost
+
+                if bank in cached_banks:
+                    (plan[bank], cost) = (EepromReadPlanner.CACHED, 0)
+                    self.__decisions['cached'] += 1
+                elif list_cost <= len(windows) * read_cost:
+                    (plan[bank], cost) = (EepromReadPlanner.LIST, list_cost)
+                    self.__decisions['list'] += 1
+                else:
+                    (plan[bank], cost) = (windows, len(windows) * read_cost)
+                    self.__decisions['read'] += 1
+                    self.__windows += len(windows)
+
+                self.__saved += fixed_cost - cost
+        return plan
+
+    def measured(self, command, duration):
+        """ Update the cost of a command with a measured duration.
+
+        :param command: EepromReadPlanner.READ for read_eeprom or EepromReadPlanner.LIST for \
+        eeprom_list.
+        :param duration: the duration of the command in seconds.
+        :type duration: float
+        """
+        with self.__lock:
+            self.__costs[command] += self.__smoothing * (duration - self.__costs[command])
+
+    def get_statistics(self):
+        """ Get the statistics of the planner.
+
+        :returns: dict with the current 'read_cost' and 'list_cost' (seconds), the number of \
+        banks that were planned as 'cached', 'read' or 'list', the number of read_eeprom \
+        'windows' and the estimated seconds 'saved' compared to the fixed plan (reading the \
+        whole bank if more than 6 read_eeprom commands are required, reads are never taken \
+        from the cache).
+        """
+        with self.__lock:
+            statistics = dict(self.__decisions)
+            statistics.update({'read_cost': self.__costs[EepromReadPlanner.READ],
+                               'list_cost': self.__costs[EepromReadPlanner.LIST],
+                               'windows': self.__windows,
+                               'saved': self.__saved})
+            return statistics
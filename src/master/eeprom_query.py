@@ -0,0 +1,185 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Queries on EepromModels: the filters of a query and the secondary indexes that are used to find
+the ids that match a filter without reading all instances of a model.
+"""
+
+import operator
+
+
+class EepromQuery(object):
+    """ The filters of a query on an EepromModel. The filters are a dict that maps a field name
+    to a condition. A condition is a value (the field should be equal to the value) or a dict
+    with an operator ('eq', 'ne', 'in', 'lt', 'le', 'gt', 'ge' or 'contains') and a value, eg.
+    {'floor': 2, 'name': {'ne': ''}, 'room': {'in': [1, 2]}}. All conditions should match.
+    """
+
+    OPERATORS = {'eq': operator.eq,
+                 'ne': operator.ne,
+                 'in': lambda field, value: field in value,
+                 'lt': operator.lt,
+                 'le': operator.le,
+                 'gt': operator.gt,
+                 'ge': operator.ge,
+                 'contains': lambda field, value: value in field}
+
+    # The values of the conditions, except for 'contains', should be one of these types.
+    SCALAR_TYPES = (int, long, float, bool, basestring, type(None))
+
+    # The names of the data types (see get_name) that hold a string.
+    STRING_TYPES = ['String', 'Time', 'CSV', 'Actions', 'Enum']
+
+    def __init__(self, eeprom_model, filters=None):
+        """ Create an EepromQuery.
+
+        :param eeprom_model: EepromModel class
+        :param filters: dict that maps a field name to a condition, None matches all instances.
+        :raises: ValueError if a field or an operator is unknown, or if the value of a \
+        condition does not fit the operator or the field.
+        """
+        if filters is not None and not isinstance(filters, dict):
+            raise ValueError("The filters should be a dict that maps a field name to a condition")
+
+        fields = eeprom_model.get_field_dict(include_id=True, include_eeprom=True,
+                                             include_eext=True)
+        self.__conditions = []
+
+        for (field, condition) in sorted((filters or {}).items()):
+            if field not in fields:
+                raise ValueError("Field %s is unknown for %s" % (field, eeprom_model.get_name()))
+
+            if isinstance(condition, dict):
+                if len(condition) != 1 or condition.keys()[0] not in EepromQuery.OPERATORS:
+                    raise ValueError("Condition for field %s should have one of the operators %s"
+                                     % (field, ", ".join(sorted(EepromQuery.OPERATORS))))
+                (op, value) = condition.items()[0]
+            else:
+                (op, value) = ('eq', condition)
+
+            if op == 'in':
+                if not isinstance(value, (list, tuple, set)) or \
+                        not all([isinstance(item, EepromQuery.SCALAR_TYPES) for item in value]):
+                    raise ValueError("Condition 'in' for field %s requires a list of values"
+                                     % field)
+            elif op == 'contains':
+                EepromQuery.__check_contains(field, fields[field], value)
+            elif not isinstance(value, EepromQuery.SCALAR_TYPES):
+                raise ValueError("Condition '%s' for field %s requires a number or a string"
+                                 % (op, field))
+
+            self.__conditions.append((field, op, value))
+
+    @staticmethod
+    def __check_contains(field, field_type, value):
+        """ Check that 'contains' is used on a string field with a string, or on a composite
+        field (a list) with a number or a string.
+
+        :raises: ValueError if the field or the value do not fit.
+        """
+        name = field_type.get_name() if hasattr(field_type, 'get_name') else ''
+        if name.startswith('['):
+            valid = isinstance(value, EepromQuery.SCALAR_TYPES)
+        elif name.split('[')[0] in EepromQuery.STRING_TYPES:
+            valid = isinstance(value, basestring)
+        else:
+            raise ValueError("Condition 'contains' requires a string or a list field, %s is a %s"
+                             % (field, name))
+        if not valid:
+            raise ValueError("Condition 'contains' for field %s has a value of the wrong type: %s"
+                             % (field, value))
+
+    def get_fields(self):
+        """ Get the names of the fields that are used in the conditions. """
+        return sorted(set([field for (field, _, _) in self.__conditions]))
+
+    def get_index_values(self, field):
+        """ Get the values of a field that match the 'eq' and 'in' conditions on that field.
+
+        :returns: set of values, None if there is no 'eq' or 'in' condition on the field.
+        """
+        values = None
+        for (condition_field, op, value) in self.__conditions:
+            if condition_field == field and op in ['eq', 'in']:
+                condition_values = set([value]) if op == 'eq' else set(value)
+                values = condition_values if values is None else values & condition_values
+        return values
+
+    def get_residual_fields(self, indexed_fields):
+        """ Get the names of the fields that are used in the conditions that can not be resolved
+        using an index on indexed_fields. """
+        return sorted(set([field for (field, op, _) in self.__conditions
+                           if field not in indexed_fields or op not in ['eq', 'in']]))
+
+    def matches(self, model, fields=None):
+        """ Check if a model matches the conditions.
+
+        :param model: instance of the EepromModel.
+        :param fields: only check the conditions on these fields, None checks all conditions.
+        :returns: boolean
+        """
+        for (field, op, value) in self.__conditions:
+            if fields is None or field in fields:
+                if not EepromQuery.OPERATORS[op](model.__dict__[field], value):
+                    return False
+        return True
+
+
+class EepromIndex(object):
+    """ A secondary index on a number of fields of an EepromModel: maps the values of the fields
+    to the ids of the instances. The index is built from a list of instances and is kept up to
+    date using update when an instance is written.
+    """
+
+    def __init__(self, fields, models):
+        """ Build an EepromIndex.
+
+        :param fields: the names of the indexed fields.
+        :param models: all instances of the EepromModel, with the indexed fields.
+        """
+        self.__ids = dict([(field, {}) for field in fields])  # field -> value -> set of ids
+        self.__values = dict([(field, {}) for field in fields])  # field -> id -> value
+        for model in models:
+            self.update(model)
+
+    def get_fields(self):
+        """ Get the names of the indexed fields. """
+        return sorted(self.__ids.keys())
+
+    def get_ids(self, field, values):
+        """ Get the ids of the instances where the field has one of the values.
+
+        :returns: set of ids.
+        """
+        ids = set()
+        for value in values:
+            ids.update(self.__ids[field].get(value, ()))
+        return ids
+
+    def update(self, model, fields=None):
+        """ Update the index with the values of an instance.
+
+        :param model: instance of the EepromModel.
+        :param fields: only update these fields, None updates all indexed fields of the model.
+        """
+        id = model.get_id()
+        for field in self.__ids:
+            if field in model.__dict__ and (fields is None or field in fields):
+                value = model.__dict__[field]
+                if id in self.__values[field]:
+                    old_ids = self.__ids[field][self.__values[field][id]]
+                    old_ids.discard(id)
+                self.__ids[field].setdefault(value, set()).add(id)
+                self.__values[field][id] = value
@@ -0,0 +1,146 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+The eeprom shadow keeps a copy of the master eeprom banks in a memory-mapped file, so the banks
+that were read before a restart of the gateway don't have to be read from the master again.
+"""
+
+import os
+import mmap
+import zlib
+import struct
+from threading import Lock
+
+
+class EepromShadow(object):
+    """ A memory-mapped copy of the 256 banks of the master eeprom. Every bank has a flag that
+    indicates whether the bank is stored and a crc32 checksum of the bank, a bank with a wrong
+    checksum (eg. after a power failure during a write) is not used.
+
+    The file contains a header, the flags and checksums of the banks and the data of the banks.
+    A file with a wrong header or size is cleared.
+    """
+
+    MAGIC = 'OMES\x01\x00\x00\x00'
+    NUM_BANKS = 256
+    BANK_SIZE = 256
+    BANK_INFO = struct.Struct('<BxxxI')  # stored flag, crc32
+    DATA_OFFSET = len(MAGIC) + NUM_BANKS * BANK_INFO.size
+    FILE_SIZE = DATA_OFFSET + NUM_BANKS * BANK_SIZE
+
+    def __init__(self, filename):
+        """ Open the shadow file, the file is created if it does not exist.
+
+        :param filename: the name of the shadow file.
+        :type filename: string
+        :raises: IOError or OSError if the file can not be opened.
+        """
+        self.__lock = Lock()
+
+        fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0644)
+        try:
+            clear = os.fstat(fd).st_size != EepromShadow.FILE_SIZE
+            if clear:
+                os.ftruncate(fd, EepromShadow.FILE_SIZE)
+            self.__map = mmap.mmap(fd, EepromShadow.FILE_SIZE)
+        finally:
+            os.close(fd)
+
+        if clear or self.__map[:len(EepromShadow.MAGIC)] != EepromShadow.MAGIC:
+            self.__map[:EepromShadow.DATA_OFFSET] = \
+                EepromShadow.MAGIC + '\x00' * (EepromShadow.DATA_OFFSET - len(EepromShadow.MAGIC))
+            self.__map.flush()
+
+    @staticmethod
+    def __info_offset(bank):
+        """ Get the offset of the flag and the checksum of a bank. """
+        return len(EepromShadow.MAGIC) + bank * EepromShadow.BANK_INFO.size
+
+    @staticmethod
+    def __data_offset(bank):
+        """ Get the offset of the data of a bank. """
+        return EepromShadow.DATA_OFFSET + bank * EepromShadow.BANK_SIZE
+
+    def get(self, bank):
+        """ Get the data of a bank.
+
+        :param bank: the number of the bank.
+        :type bank: integer
+        :returns: string of 256 bytes, None if the bank is not stored or the checksum is wrong.
+        """
+        with self.__lock:
+            return self.__get(bank)
+
+    def __get(self, bank):
+        """ Get the data of a bank, without the lock. """
+        info_offset = self.__info_offset(bank)
+        (stored, crc) = EepromShadow.BANK_INFO.unpack(
+            self.__map[info_offset:info_offset + EepromShadow.BANK_INFO.size])
+        if not stored:
+            return None
+
+        data_offset = self.__data_offset(bank)
+        data = self.__map[data_offset:data_offset + EepromShadow.BANK_SIZE]
+        if zlib.crc32(data) & 0xffffffff != crc:
+            return None
+        return data
+
+    def get_banks(self):
+        """ Get the banks that are stored with a correct checksum.
+
+        :returns: list of integers.
+        """
+        with self.__lock:
+            return [bank for bank in range(EepromShadow.NUM_BANKS)
+                    if self.__get(bank) is not None]
+
+    def put(self, bank, data):
+        """ Store the data of a bank.
+
+        :param bank: the number of the bank.
+        :type bank: integer
+        :param data: the data of the bank.
+        :type data: string of 256 bytes
+        """
+        if len(data) != EepromShadow.BANK_SIZE:
+            raise ValueError("Bank %d should contain %d bytes, got %d" %
+                             (bank, EepromShadow.BANK_SIZE, len(data)))
+
+        with self.__lock:
+            info_offset = self.__info_offset(bank)
+            data_offset = self.__data_offset(bank)
+            self.__map[data_offset:data_offset + EepromShadow.BANK_SIZE] = data
+            self.__map[info_offset:info_offset + EepromShadow.BANK_INFO.size] = \
+                EepromShadow.BANK_INFO.pack(1, zlib.crc32(data) & 0xffffffff)
+            self.__map.flush()
+
+    def invalidate(self, bank=None):
+        """ Remove a bank from the shadow.
+
+        :param bank: the number of the bank, None to remove all banks.
+        :type bank: integer
+        """
+        banks = range(EepromShadow.NUM_BANKS) if bank is None else [bank]
+        with self.__lock:
+            for bank in banks:
+                info_offset = self.__info_offset(bank)
+                self.__map[info_offset:info_offset + EepromShadow.BANK_INFO.size] = \
+                    EepromShadow.BANK_INFO.pack(0, 0)
+            self.__map.flush()
+
+    def close(self):
+        """ Close the shadow file. """
+        with self.__lock:
+            self.__map.close()
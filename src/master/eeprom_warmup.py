@@ -0,0 +1,145 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+The eeprom warmup prefetches the banks of the most used EepromModels in the background, so the
+first configuration reads after a restart are served from the cache.
+"""
+
+import logging
+from threading import Lock
+
+from task_scheduler import TaskScheduler
+
+LOGGER = logging.getLogger("openmotics")
+
+
+class EepromWarmup(object):
+    """ Prefetches the banks of a number of EepromModels in a job of the TaskScheduler, every run
+    of the job prefetches one bank. A bank is only prefetched when the master is idle, the
+    prefetches are done with background priority and at most one bank is prefetched every
+    interval. The banks that are cached are skipped. The warmup can be stopped at any time.
+    """
+
+    def __init__(self, eeprom_controller, eeprom_models, is_idle=None, interval=0.2,
+                 idle_wait=1.0, scheduler=None):
+        """ Create an EepromWarmup.
+
+        :param eeprom_controller: the EepromController that caches the banks.
+        :param eeprom_models: list of EepromModel classes, the banks of these models are \
+        prefetched in this order.
+        :param is_idle: function without arguments that returns True if the master is idle, \
+        None if the master is always idle.
+        :param interval: the minimum number of seconds between two prefetches.
+        :type interval: float
+        :param idle_wait: the number of seconds to wait before checking again if the master \
+        is idle.
+        :type idle_wait: float
+        :param scheduler: runs the warmup job, a TaskScheduler is created by start() if None.
+        :type scheduler: :class`task_scheduler.TaskScheduler`
+        """
+        self.__eeprom_controller = eeprom_controller
+        self.__eeprom_models = eeprom_models
+        self.__is_idle = is_idle
+        self.__interval = interval
+        self.__idle_wait = idle_wait
+
+        self.__scheduler = scheduler
+        self.__lock = Lock()
+        self.__job = None
+        self.__running = False
+        self.__banks = None
+        self.__done = 0
+        self.__prefetched = 0
+
+    def start(self):
+        """ Start the warmup in the background, does nothing if the warmup is running. """
+        with self.__lock:
+            if self.__running:
+                return
+            if self.__job is None:
+                if self.__scheduler is None:
+                    self.__scheduler = TaskScheduler(workers=1)
+                    self.__scheduler.start()
+                self.__job = self.__scheduler.schedule('eeprom_warmup', self.__run, delay=None)
+            self.__running = True
+            self.__banks = None
+        self.__job.run_now()
+
+    def stop(self):
+        """ Stop the warmup, the bank that is being prefetched is finished. """
+        with self.__lock:
+            self.__running = False
+
+    def is_running(self):
+        """ Check if the warmup is running. """
+        return self.__running
+
+    def __run(self):
+        """ Prefetch the next bank, this runs in the warmup job. """
+        try:
+            with self.__lock:
+                if not self.__running:
+                    return
+                if self.__banks is None:
+                    self.__banks = self.__eeprom_controller.get_banks(self.__eeprom_models)
+                    self.__done = 0
+                banks = self.__banks
+
+            if self.__done < len(banks):
+                if self.__is_idle is not None and not self.__is_idle():
+                    self.__job.run_after(self.__idle_wait)
+                    return
+                prefetched = self.__eeprom_controller.prefetch(banks[self.__done])
+            else:
+                prefetched = False
+
+            with self.__lock:
+                if not self.__running or self.__banks is not banks:
+                    return  # Stopped or restarted while prefetching.
+                if self.__done < len(banks):
+                    self.__done += 1
+                if prefetched:
+                    self.__prefetched += 1
+                if self.__done == len(banks):
+                    self.__running = False
+                    LOGGER.info("Eeprom warmup done, prefetched %d banks", self.__prefetched)
+                    return
+            if prefetched:
+                self.__job.run_after(self.__interval)
+            else:
+                self.__job.run_now()
+        except Exception:
+            LOGGER.exception("Eeprom warmup failed")
+            with self.__lock:
+                self.__running = False
+
+    def get_progress(self):
+        """ Get the progress of the warmup.
+
+        :returns: dict with 'running' (boolean), the number of 'banks' that were checked, the \
+        number of banks that were 'prefetched' from the master, the 'total' number of banks \
+        and the 'coverage': the fraction of the banks that is cached (None if the banks are not \
+        known yet).
+        """
+        banks = self.__banks
+        coverage = None
+        if banks is not None and len(banks) > 0:
+            coverage = float(len([bank for bank in banks
+                                  if self.__eeprom_controller.is_cached(bank)])) / len(banks)
+        return {'running': self.is_running(),
+                'banks': self.__done,
+                'prefetched': self.__prefetched,
+                'total': None if banks is None else len(banks),
+                'coverage': coverage}
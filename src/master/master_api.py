@@ -19,6 +19,8 @@ Requires Firmware 3.137.17 -- Caution on update: status api changed (used in upd
 @author: fryckbos
 """
 
+from functools import wraps
+
 from master_command import MasterCommandSpec, Field, OutputFieldType, DimmerFieldType, \
                            ErrorListFieldType
 
@@ -106,18 +108,37 @@ BA_LIGHT_ON_TIMER_2220_NO_OVERRULE = 205
 BA_LIGHT_ON_TIMER_3120_NO_OVERRULE = 206
 
 
+def cached_spec(spec_function):
+    """ Decorator for the functions that build a MasterCommandSpec. The spec is built (and its
+    output layout compiled) on the first call, the next calls return the same instance.
+    """
+    cache = []
+
+    @wraps(spec_function)
+    def get_spec():
+        """ Get the cached spec, build it if required. """
+        if len(cache) == 0:
+            cache.append(spec_function())
+        return cache[0]
+
+    return get_spec
+
+@cached_spec
 def basic_action():
     """ Basic actions. """
     return MasterCommandSpec("BA",
         [Field.byte("action_type"), Field.byte("action_number"), Field.padding(11)],
         [Field.str("resp", 2), Field.padding(11), Field.lit("\r\n")])
 
+@cached_spec
 def reset():
     """ Reset the gateway, used for firmware updates. """
     return MasterCommandSpec("re",
         [Field.padding(13)],
-        [Field.str("resp", 2), Field.padding(11), Field.lit("\r\n")])
+        [Field.str("resp", 2), Field.padding(11), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def status():
     """ Get the status of the master. """
     return MasterCommandSpec("ST",
@@ -125,8 +146,10 @@ def status():
         [Field.byte('seconds'), Field.byte('minutes'), Field.byte('hours'), Field.byte('weekday'),
          Field.byte('day'), Field.byte('month'), Field.byte('year'), Field.lit('\x00'),
          Field.byte('mode'), Field.byte('f1'), Field.byte('f2'), Field.byte('f3'),
-         Field.byte('h'), Field.lit('\r\n')])
+         Field.byte('h'), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def set_time():
     """ Set the time on the master. """
     return MasterCommandSpec("st",
@@ -134,39 +157,51 @@ def set_time():
          Field.byte('day'), Field.byte('month'), Field.byte('year'), Field.padding(6)],
         [Field.byte('sec'), Field.byte('min'), Field.byte('hours'), Field.byte('weekday'),
          Field.byte('day'), Field.byte('month'), Field.byte('year'), Field.padding(6),
-         Field.lit("\r\n")])
+         Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def eeprom_list():
     """ List all bytes from a certain eeprom bank """
     return MasterCommandSpec("EL",
         [Field.byte("bank"), Field.padding(12)],
-        [Field.byte("bank"), Field.str("data", 256), Field.lit("\r\n")])
+        [Field.byte("bank"), Field.str("data", 256), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION, read_only=True)
 
+@cached_spec
 def read_eeprom():
     """ Read a number (1-10) of bytes from a certain eeprom bank and address. """
     return MasterCommandSpec("RE",
         [Field.byte('bank'), Field.byte('addr'), Field.byte('num'), Field.padding(10)],
-        [Field.byte('bank'), Field.byte('addr'), Field.varstr('data', 10), Field.lit('\r\n')])
+        [Field.byte('bank'), Field.byte('addr'), Field.varstr('data', 10), Field.lit('\r\n')],
+        priority=MasterCommandSpec.CONFIGURATION, read_only=True)
 
+@cached_spec
 def write_eeprom():
     """ Write data bytes to the addr in the specified eeprom bank """
     return MasterCommandSpec("WE",
         [Field.byte("bank"), Field.byte("address"), Field.varstr("data", 10)],
-        [Field.byte("bank"), Field.byte("address"), Field.varstr("data", 10), Field.lit('\r\n')])
+        [Field.byte("bank"), Field.byte("address"), Field.varstr("data", 10), Field.lit('\r\n')],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def activate_eeprom():
     """ Activate eeprom after write """
     return MasterCommandSpec("AE",
         [Field.byte("eep"), Field.padding(12)],
-        [Field.byte("eep"), Field.str("resp", 2), Field.padding(10), Field.lit('\r\n')])
+        [Field.byte("eep"), Field.str("resp", 2), Field.padding(10), Field.lit('\r\n')],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def number_of_io_modules():
     """ Read the number of input and output modules """
     return MasterCommandSpec("rn",
         [Field.padding(13)],
         [Field.byte("in"), Field.byte("out"), Field.byte("shutter"), Field.padding(10),
-         Field.lit('\r\n')])
+         Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def read_output():
     """ Read the information about an output """
     return MasterCommandSpec("ro",
@@ -175,21 +210,27 @@ def read_output():
          Field.int('ctimer'), Field.byte('status'), Field.dimmer('dimmer'),
          Field.byte('controller_out'), Field.byte('max_power'), Field.byte('floor_level'),
          Field.bytes('menu_position', 3), Field.str('name', 16), Field.crc(),
-         Field.lit('\r\n')])
+         Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def read_input():
     """ Read the information about an input """
     return MasterCommandSpec("ri",
         [Field.byte("input_nr"), Field.padding(12)],
         [Field.byte('input_nr'), Field.byte('output_action'), Field.bytes('output_list', 30),
-         Field.str('input_name', 8), Field.crc(), Field.lit('\r\n')])
+         Field.str('input_name', 8), Field.crc(), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def shutter_status():
     """ Read the status of a shutter module. """
     return MasterCommandSpec("SO",
         [Field.byte("module_nr"), Field.padding(12)],
-        [Field.byte("module_nr"), Field.padding(3), Field.byte("status"), Field.lit('\r\n')])
+        [Field.byte("module_nr"), Field.padding(3), Field.byte("status"), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def temperature_list():
     """ Read the temperature thermostat sensor list for a series of 12 sensors """
     return MasterCommandSpec("TL",
@@ -197,8 +238,10 @@ def temperature_list():
         [Field.byte("series"), Field.svt('tmp0'), Field.svt('tmp1'), Field.svt('tmp2'),
          Field.svt('tmp3'), Field.svt('tmp4'), Field.svt('tmp5'), Field.svt('tmp6'),
          Field.svt('tmp7'), Field.svt('tmp8'), Field.svt('tmp9'), Field.svt('tmp10'),
-         Field.svt('tmp11'), Field.lit('\r\n')])
+         Field.svt('tmp11'), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def setpoint_list():
     """ Read the current setpoint of the thermostats in series of 12 """
     return MasterCommandSpec("SL",
@@ -206,14 +249,18 @@ def setpoint_list():
         [Field.byte("series"), Field.svt('tmp0'), Field.svt('tmp1'), Field.svt('tmp2'),
          Field.svt('tmp3'), Field.svt('tmp4'), Field.svt('tmp5'), Field.svt('tmp6'),
          Field.svt('tmp7'), Field.svt('tmp8'), Field.svt('tmp9'), Field.svt('tmp10'),
-         Field.svt('tmp11'), Field.lit('\r\n')])
+         Field.svt('tmp11'), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def thermostat_mode():
     """ Read the current thermostat mode """
     return MasterCommandSpec("TM",
         [Field.padding(13)],
-        [Field.byte('mode'), Field.padding(12), Field.lit('\r\n')])
+        [Field.byte('mode'), Field.padding(12), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def read_setpoint():
     """ Read the programmed setpoint of a thermostat """
     return MasterCommandSpec("rs",
@@ -242,8 +289,10 @@ def read_setpoint():
          Field.svt('sat_temp_d2'), Field.svt('sun_temp_d2'), Field.svt('mon_temp_n'),
          Field.svt('tue_temp_n'), Field.svt('wed_temp_n'), Field.svt('thu_temp_n'),
          Field.svt('fri_temp_n'), Field.svt('sat_temp_n'), Field.svt('sun_temp_n'),
-         Field.crc(), Field.lit('\r\n')])
+         Field.crc(), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def write_setpoint():
     """ Write a setpoints of a thermostats """
     return MasterCommandSpec("ws",
@@ -251,6 +300,7 @@ def write_setpoint():
         [Field.byte("thermostat"), Field.byte("config"), Field.svt("temp"), Field.padding(10),
          Field.lit('\r\n')])
 
+@cached_spec
 def permanent_manual_thermostat_list():
     """ Read the permanent manual bytes, 1 per thermostat. """
     return MasterCommandSpec("pL",
@@ -264,8 +314,10 @@ def permanent_manual_thermostat_list():
          Field.byte('pmt20'), Field.byte('pmt21'), Field.byte('pmt22'), Field.byte('pmt23'),
          Field.byte('pmt24'), Field.byte('pmt25'), Field.byte('pmt26'), Field.byte('pmt27'),
          Field.byte('pmt28'), Field.byte('pmt29'), Field.byte('pmt30'), Field.byte('pmt31'),
-         Field.crc(), Field.lit('\r\n')])
+         Field.crc(), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def thermostat_list():
     """ Read the thermostat mode, the outside temperature, the temperature of each thermostat,
     as well as the setpoint.
@@ -289,8 +341,10 @@ def thermostat_list():
          Field.svt('setp20'), Field.svt('setp21'), Field.svt('setp22'), Field.svt('setp23'),
          Field.svt('setp24'), Field.svt('setp25'), Field.svt('setp26'), Field.svt('setp27'),
          Field.svt('setp28'), Field.svt('setp29'), Field.svt('setp30'), Field.svt('setp31'),
-         Field.crc(), Field.lit('\r\n')])
+         Field.crc(), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def thermostat_mode_list():
     """ Read the thermostat mode for each thermostat. """
     return MasterCommandSpec("ml",
@@ -303,8 +357,10 @@ def thermostat_mode_list():
          Field.byte('mode20'), Field.byte('mode21'), Field.byte('mode22'), Field.byte('mode23'),
          Field.byte('mode24'), Field.byte('mode25'), Field.byte('mode26'), Field.byte('mode27'),
          Field.byte('mode28'), Field.byte('mode29'), Field.byte('mode30'), Field.byte('mode31'),
-         Field.crc(), Field.lit('\r\n')])
+         Field.crc(), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def sensor_humidity_list():
     """ Reads the list humidity values of the 32 (0-31) sensors. """
     return MasterCommandSpec("hl",
@@ -317,8 +373,10 @@ def sensor_humidity_list():
          Field.svt('hum20'), Field.svt('hum21'), Field.svt('hum22'), Field.svt('hum23'),
          Field.svt('hum24'), Field.svt('hum25'), Field.svt('hum26'), Field.svt('hum27'),
          Field.svt('hum28'), Field.svt('hum29'), Field.svt('hum30'), Field.svt('hum31'),
-         Field.crc(), Field.lit('\r\n')])
+         Field.crc(), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def sensor_temperature_list():
     """ Reads the list temperature values of the 32 (0-31) sensors. """
     return MasterCommandSpec("cl",
@@ -331,8 +389,10 @@ def sensor_temperature_list():
          Field.svt('tmp20'), Field.svt('tmp21'), Field.svt('tmp22'), Field.svt('tmp23'),
          Field.svt('tmp24'), Field.svt('tmp25'), Field.svt('tmp26'), Field.svt('tmp27'),
          Field.svt('tmp28'), Field.svt('tmp29'), Field.svt('tmp30'), Field.svt('tmp31'),
-         Field.crc(), Field.lit('\r\n')])
+         Field.crc(), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def sensor_brightness_list():
     """ Reads the list brightness values of the 32 (0-31) sensors. """
     return MasterCommandSpec("bl",
@@ -345,8 +405,10 @@ def sensor_brightness_list():
          Field.svt('bri20'), Field.svt('bri21'), Field.svt('bri22'), Field.svt('bri23'),
          Field.svt('bri24'), Field.svt('bri25'), Field.svt('bri26'), Field.svt('bri27'),
          Field.svt('bri28'), Field.svt('bri29'), Field.svt('bri30'), Field.svt('bri31'),
-         Field.crc(), Field.lit('\r\n')])
+         Field.crc(), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def virtual_sensor_list():
     """ Read the list with virtual settings of the 32 (0-31) sensors. """
     return MasterCommandSpec("VL",
@@ -359,8 +421,10 @@ def virtual_sensor_list():
          Field.byte('vir20'), Field.byte('vir21'), Field.byte('vir22'), Field.byte('vir23'),
          Field.byte('vir24'), Field.byte('vir25'), Field.byte('vir26'), Field.byte('vir27'),
          Field.byte('vir28'), Field.byte('vir29'), Field.byte('vir30'), Field.byte('vir31'),
-         Field.crc(), Field.lit('\r\n')])
+         Field.crc(), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def set_virtual_sensor():
     """ Set the values (temperature, humidity, brightness) of a virtual sensor. """
     return MasterCommandSpec("VS",
@@ -369,6 +433,7 @@ def set_virtual_sensor():
         [Field.byte('sensor'), Field.svt('tmp'), Field.svt('hum'), Field.svt('bri'),
          Field.padding(9), Field.lit('\r\n')])
 
+@cached_spec
 def pulse_list():
     """ List the pulse counter values. """
     return MasterCommandSpec("PL",
@@ -379,20 +444,26 @@ def pulse_list():
          Field.int('pv12'), Field.int('pv13'), Field.int('pv14'), Field.int('pv15'),
          Field.int('pv16'), Field.int('pv17'), Field.int('pv18'), Field.int('pv19'),
          Field.int('pv20'), Field.int('pv21'), Field.int('pv22'), Field.int('pv23'),
-         Field.crc(), Field.lit('\r\n')])
+         Field.crc(), Field.lit('\r\n')],
+        read_only=True)
 
+@cached_spec
 def error_list():
     """ Get the number of errors for each input and output module. """
     return MasterCommandSpec("el",
         [Field.padding(13)],
-        [Field("errors", ErrorListFieldType()), Field.crc(), Field.lit("\r\n")])
+        [Field("errors", ErrorListFieldType()), Field.crc(), Field.lit("\r\n")],
+        read_only=True)
 
+@cached_spec
 def clear_error_list():
     """ Clear the number of errors. """
     return MasterCommandSpec("ec",
         [Field.padding(13)],
-        [Field.str("resp", 2), Field.padding(11), Field.lit("\r\n")])
+        [Field.str("resp", 2), Field.padding(11), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def write_airco_status_bit():
     """ Write the airco status bit. """
     return MasterCommandSpec("AW",
@@ -407,6 +478,7 @@ def write_airco_status_bit():
          Field.byte("ASB28"), Field.byte("ASB29"), Field.byte("ASB30"), Field.byte("ASB31"),
          Field.lit("\r\n")])
 
+@cached_spec
 def read_airco_status_bits():
     """ Read the airco status bits. """
     return MasterCommandSpec("AR",
@@ -419,26 +491,34 @@ def read_airco_status_bits():
          Field.byte("ASB20"), Field.byte("ASB21"), Field.byte("ASB22"), Field.byte("ASB23"),
          Field.byte("ASB24"), Field.byte("ASB25"), Field.byte("ASB26"), Field.byte("ASB27"),
          Field.byte("ASB28"), Field.byte("ASB29"), Field.byte("ASB30"), Field.byte("ASB31"),
-         Field.lit("\r\n")])
+         Field.lit("\r\n")],
+        read_only=True)
 
+@cached_spec
 def to_cli_mode():
     """ Go to CLI mode """
     return MasterCommandSpec("CM",
         [Field.padding(13)],
-        None)
+        None,
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def module_discover_start():
     """ Put the master in module discovery mode. """
     return MasterCommandSpec("DA",
         [Field.padding(13)],
-        [Field.str("resp", 2), Field.padding(11), Field.lit("\r\n")])
+        [Field.str("resp", 2), Field.padding(11), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def module_discover_stop():
     """ Put the master into the normal working state. """
     return MasterCommandSpec("DO",
         [Field.padding(13)],
-        [Field.str("resp", 2), Field.padding(11), Field.lit("\r\n")])
+        [Field.str("resp", 2), Field.padding(11), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def indicate():
     """ Flash the led for a given output/input/sensor. """
     return MasterCommandSpec("IN",
@@ -447,18 +527,21 @@ def indicate():
 
 ### Below are the asynchronous messages, sent by the master to the gateway
 
+@cached_spec
 def output_list():
     """ The message sent by the master whenever the outputs change. """
     return MasterCommandSpec("OL",
         [],
         [Field("outputs", OutputFieldType()), Field.lit("\r\n")])
 
+@cached_spec
 def input_list():
     """ The message sent by the master whenever an input is enabled. """
     return MasterCommandSpec("IL",
         [],
         [Field.byte('input'), Field.byte('output'), Field.lit("\r\n")])
 
+@cached_spec
 def module_initialize():
     """ The message sent by the master whenever a module is initialized in module discovery mode.
     """
@@ -467,6 +550,7 @@ def module_initialize():
         [Field.str('id', 4), Field.str('instr', 1), Field.byte('module_nr'), Field.byte('data'),
          Field.byte('io_type'), Field.padding(5), Field.lit('\r\n')])
 
+@cached_spec
 def event_triggered():
     """ The message sent by the master to trigger an event. This event is triggered by basic
     action 60. """
@@ -476,22 +560,27 @@ def event_triggered():
 
 ### Below are the function to update the firmware of the modules (input/output/dimmer/thermostat)
 
+@cached_spec
 def modules_goto_bootloader():
     """ Reset the module to go to the bootloader. """
     return MasterCommandSpec("FR",
         [Field.str('addr', 4), Field.byte('sec'), Field.lit('C'), Field.byte('crc0'),
          Field.byte('crc1'), Field.padding(5)],
         [Field.str('addr', 4), Field.byte("error_code"), Field.lit('C'), Field.byte('crc0'),
-         Field.byte('crc1'), Field.padding(5), Field.lit("\r\n")])
+         Field.byte('crc1'), Field.padding(5), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def modules_new_firmware_version():
     """ Preprare the slave module for a new version. """
     return MasterCommandSpec("FN",
         [Field.str('addr', 4), Field.byte("f1n"), Field.byte("f2n"), Field.byte("f3n"),
          Field.lit('C'), Field.byte('crc0'), Field.byte('crc1'), Field.padding(3)],
         [Field.str('addr', 4), Field.byte("error_code"), Field.lit('C'), Field.byte('crc0'),
-         Field.byte('crc1'), Field.padding(5), Field.lit("\r\n")])
+         Field.byte('crc1'), Field.padding(5), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def modules_new_crc():
     """ Write the new crc code to the bootloaded module. """
     return MasterCommandSpec("FC",
@@ -499,28 +588,36 @@ def modules_new_crc():
          Field.byte("ccrc3"), Field.lit('C'), Field.byte('crc0'), Field.byte('crc1'),
          Field.padding(2)],
         [Field.str('addr', 4), Field.byte("error_code"), Field.lit('C'), Field.byte('crc0'),
-         Field.byte('crc1'), Field.padding(5), Field.lit("\r\n")])
+         Field.byte('crc1'), Field.padding(5), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def change_communication_mode_to_long():
     """ Change the number of bytes used to communicate with the master to 75. """
     return MasterCommandSpec("cm",
         [Field.lit('\x4d'), Field.lit('\x01'), Field.padding(11)],
-        [Field.lit('\x4d'), Field.lit('\x01'), Field.padding(11), Field.lit("\r\n")])
+        [Field.lit('\x4d'), Field.lit('\x01'), Field.padding(11), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def change_communication_mode_to_short():
     """ Change the number of bytes used to communicate with the master to 18. """
     return MasterCommandSpec("cm",
         [Field.lit('\x12'), Field.lit('\x01'), Field.padding(71)],
-        [Field.lit('\x12'), Field.lit('\x01'), Field.padding(11), Field.lit("\r\n")])
+        [Field.lit('\x12'), Field.lit('\x01'), Field.padding(11), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def modules_update_firmware_block():
     """ Upload 1 block of 64 bytes to the module. """
     return MasterCommandSpec("FD",
         [Field.str('addr', 4), Field.int("block"), Field.str("bytes", 64),
          Field.lit('C'), Field.byte('crc0'), Field.byte('crc1')],
         [Field.str('addr', 4), Field.byte("error_code"), Field.lit('C'), Field.byte('crc0'),
-         Field.byte('crc1'), Field.lit("\r\n")])
+         Field.byte('crc1'), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def modules_get_version():
     """ Get the version of the module. """
     return MasterCommandSpec("FV",
@@ -528,23 +625,28 @@ def modules_get_version():
          Field.padding(6)],
         [Field.str('addr', 4), Field.byte("error_code"), Field.byte("hw_version"),
          Field.byte("f1"), Field.byte("f2"), Field.byte("f3"), Field.byte("status"),
-         Field.lit('C'), Field.byte('crc0'), Field.byte('crc1'), Field.lit("\r\n")])
+         Field.lit('C'), Field.byte('crc0'), Field.byte('crc1'), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def modules_integrity_check():
     """ Check the integrity of the new code. """
     return MasterCommandSpec("FE",
         [Field.str('addr', 4), Field.lit('C'), Field.byte('crc0'), Field.byte('crc1'),
          Field.padding(6)],
         [Field.str('addr', 4), Field.byte("error_code"), Field.lit('C'), Field.byte('crc0'),
-         Field.byte('crc1'), Field.padding(5), Field.lit("\r\n")])
+         Field.byte('crc1'), Field.padding(5), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
+@cached_spec
 def modules_goto_application():
     """ Let the module go to application. """
     return MasterCommandSpec("FG",
         [Field.str('addr', 4), Field.lit('C'), Field.byte('crc0'), Field.byte('crc1'),
          Field.padding(6)],
         [Field.str('addr', 4), Field.byte("error_code"), Field.lit('C'), Field.byte('crc0'),
-         Field.byte('crc1'), Field.padding(5), Field.lit("\r\n")])
+         Field.byte('crc1'), Field.padding(5), Field.lit("\r\n")],
+        priority=MasterCommandSpec.CONFIGURATION)
 
 
 ### Below are helpers for the Svt (System value type).
@@ -20,6 +20,7 @@ Provides a function for each API call.
 """
 
 import math
+import struct
 
 import master_api
 from serial_utils import printable
@@ -32,8 +33,20 @@ class MasterCommandSpec(object):
     The output looks like this:
     [Action (2 bytes)] [cid] [fields]
     The total length depends on the action.
+
+    The priority class of a command decides the order in which the MasterCommunicator sends
+    waiting commands: interactive commands go first, background polling last. The read commands
+    are interactive by default, the pollers pass the background class to do_command.
     """
-    def __init__(self, action, input_fields, output_fields):
+    INTERACTIVE = 0
+    CONFIGURATION = 1
+    BACKGROUND = 2
+
+    PRIORITIES = {INTERACTIVE: 'interactive', CONFIGURATION: 'configuration',
+                  BACKGROUND: 'background'}
+
+    def __init__(self, action, input_fields, output_fields, priority=INTERACTIVE,
+                 read_only=False):
         """ Create a MasterCommandSpec.
 
         :param action: name of the action as described in the Master api.
@@ -42,10 +55,48 @@ class MasterCommandSpec(object):
         :type input_fields: array of :class`Field`
         :param output_fields: Fields in the output from the master
         :type output_fields: array of :class`Field`
+        :param priority: the default priority class of the command.
+        :type priority: one of INTERACTIVE, CONFIGURATION or BACKGROUND
+        :param read_only: whether the command only reads from the master. Identical read-only \
+        commands that are in flight at the same time are sent only once.
+        :type read_only: boolean
         """
         self.action = action
         self.input_fields = input_fields
         self.output_fields = output_fields
+        self.priority = priority
+        self.read_only = read_only
+
+        # The padding and literal input fields don't depend on the values, encode them once.
+        self.__input_constants = [field.encode(None) if isinstance(field.field_type,
+                                                                   (PaddingFieldType,
+                                                                    LiteralFieldType))
+                                  else None for field in input_fields]
+
+        # Maps the index of the first field to decode to the FixedLayout for the fields starting
+        # at that index. The layout for a complete output is compiled here, layouts to resume a
+        # partial output are compiled when they are needed.
+        self.__layouts = {}
+        self.__has_crc = False
+        self.__crc_suffix_length = None
+        if output_fields is not None:
+            self.__get_layout(0)
+            for (index, field) in enumerate(output_fields):
+                if Field.is_crc(field):
+                    self.__has_crc = True
+                    suffix = FixedLayout.compile(output_fields[index + 1:])
+                    if suffix is None and index + 1 == len(output_fields):
+                        self.__crc_suffix_length = 0
+                    elif suffix is not None and suffix.num_fields == len(output_fields) - index - 1:
+                        self.__crc_suffix_length = suffix.length
+                    break
+
+    def __get_layout(self, field_index):
+        """ Get the FixedLayout for the output fields starting at field_index, None if the field
+        at that index does not have a fixed width. """
+        if field_index not in self.__layouts:
+            self.__layouts[field_index] = FixedLayout.compile(self.output_fields[field_index:])
+        return self.__layouts[field_index]
 
     def create_input(self, cid, fields=None):
         """ Create an input command for the master using this spec and the provided fields.
@@ -59,22 +110,20 @@ class MasterCommandSpec(object):
         if fields is None:
             fields = dict()
 
-        start = "STR" + self.action + chr(cid)
-        encoded_fields = ""
-        for field in self.input_fields:
-            if Field.is_crc(field):
-                encoded_fields += self.__calc_crc(encoded_fields)
+        encoded_fields = []
+        for (field, constant) in zip(self.input_fields, self.__input_constants):
+            if constant is not None:
+                encoded_fields.append(constant)
+            elif Field.is_crc(field):
+                encoded_fields.append(self.__calc_crc("".join(encoded_fields)))
             else:
-                encoded_fields += field.encode(fields.get(field.name))
+                encoded_fields.append(field.encode(fields.get(field.name)))
 
-        return start + encoded_fields + "\r\n"
+        return "STR" + self.action + chr(cid) + "".join(encoded_fields) + "\r\n"
 
     def __calc_crc(self, encoded_string):
         """ Calculate the crc of an string. """
-        crc = 0
-        for byte in encoded_string:
-            crc += ord(byte)
-
+        crc = sum(bytearray(encoded_string))
         return 'C' + chr(crc / 256) + chr(crc % 256)
 
     def create_output(self, cid, fields):
@@ -127,11 +176,19 @@ class MasterCommandSpec(object):
                     index += num_bytes
                     return index
             else:
+                partial_result.actual_bytes += byte_str[:index]
                 partial_result.pending_bytes += byte_str[index:]
                 return (len(byte_str) - from_pending, partial_result, False)
 
-        # Found beginning, start decoding
+        # Found beginning, start decoding: if all bytes for the fixed-width fields are there,
+        # they are decoded at once. The other fields are decoded one by one.
         index = 0
+        layout = self.__get_layout(partial_result.field_index)
+        if layout is not None and layout.length <= len(byte_str):
+            layout.decode(byte_str, partial_result.fields)
+            partial_result.field_index += layout.num_fields
+            index = layout.length
+
         for field in self.output_fields[partial_result.field_index:]:
             index = decode_field(index, byte_str, field, field.get_min_decode_bytes())
             if type(index) != int:
@@ -139,16 +196,33 @@ class MasterCommandSpec(object):
                 return index
 
         partial_result.complete = True
-        partial_result.actual_bytes = byte_str[:index]
+        partial_result.actual_bytes += byte_str[:index]
         return (index - from_pending, partial_result, True)
 
     def output_has_crc(self):
         """ Check if the MasterCommandSpec output contains a crc field. """
-        for field in self.output_fields:
-            if Field.is_crc(field):
-                return True
+        return self.__has_crc
+
+    def check_crc(self, result):
+        """ Check the crc of a complete result. The crc is the sum of the bytes of the fields
+        before the crc field.
+
+        :param result: the result of consume_output, contains a crc field.
+        :type result: :class`Result`
+        :returns: boolean
+        """
+        if self.__crc_suffix_length is not None:
+            crc_start = len(result.actual_bytes) - self.__crc_suffix_length - 3
+            crc = sum(bytearray(result.actual_bytes[:crc_start]))
+        else:
+            crc = 0
+            for field in self.output_fields:
+                if Field.is_crc(field):
+                    break
+                else:
+                    crc += sum(bytearray(field.encode(result[field.name])))
 
-        return False
+        return result['crc'] == [67, (crc / 256), (crc % 256)]
 
     def __eq__(self, other):
         """ Only used for testing, equals by name. """
@@ -175,6 +249,69 @@ class Result(object):
         self.fields[key] = value
 
 
+class FixedLayout(object):
+    """ A run of fixed-width fields, compiled into a struct. The values of all fields in the run
+    are unpacked by one struct call, only the fields that need conversion (svt, dimmer, literal,
+    ...) are passed through the decode method of their type.
+    """
+
+    @staticmethod
+    def compile(fields):
+        """ Compile the fixed-width fields at the start of a list of fields.
+
+        :param fields: the fields to compile.
+        :type fields: array of :class`Field`
+        :returns: a FixedLayout, None if the first field does not have a fixed width.
+        """
+        formats = []
+        for field in fields:
+            struct_format = field.get_struct_format()
+            if struct_format is None:
+                break
+            formats.append((field, struct_format))
+
+        return FixedLayout(formats) if len(formats) > 0 else None
+
+    def __init__(self, formats):
+        """ Create a FixedLayout.
+
+        :param formats: the fields and their struct formats.
+        :type formats: array of tuples (:class`Field`, string)
+        """
+        self.num_fields = len(formats)
+        self.__decoders = []  # tuples (name, index in the unpacked values, decode function)
+
+        index = 0
+        for (field, struct_format) in formats:
+            if isinstance(field.field_type, PaddingFieldType):
+                self.__decoders.append((field.name, None, None))
+            else:
+                decode = None if isinstance(field.field_type, FieldType) \
+                         else field.field_type.decode
+                self.__decoders.append((field.name, index, decode))
+                index += 1
+
+        self.__struct = struct.Struct('>' + ''.join([fmt for (_, fmt) in formats]))
+        self.length = self.__struct.size
+
+    def decode(self, byte_str, fields):
+        """ Decode the fields from the start of byte_str, byte_str contains at least length bytes.
+
+        :param byte_str: the bytes to decode.
+        :type byte_str: string
+        :param fields: dict in which the decoded fields are stored.
+        :type fields: dict
+        """
+        values = self.__struct.unpack_from(byte_str)
+        for (name, index, decode) in self.__decoders:
+            if index is None:
+                fields[name] = ""
+            elif decode is None:
+                fields[name] = values[index]
+            else:
+                fields[name] = decode(values[index])
+
+
 class Field(object):
     """ Field of a master command has a name, type.
     """
@@ -268,6 +405,10 @@ class Field(object):
         """
         return self.field_type.decode(byte_str)
 
+    def get_struct_format(self):
+        """ Get the struct format of the encoded field, None if the field has no fixed width. """
+        return self.field_type.get_struct_format()
+
 class NeedMoreBytesException(Exception):
     """ Throw in case a decode requires more bytes then provided. """
     def __init__(self, bytes_required):
@@ -335,6 +476,13 @@ class FieldType(object):
             elif self.python_type == str:
                 return byte_str
 
+    def get_struct_format(self):
+        """ Get the struct format of the encoded field. """
+        if self.python_type == int:
+            return 'B' if self.length == 1 else 'H'
+        else:
+            return '%ds' % self.length
+
 class PaddingFieldType(object):
     """ Empty field. """
     def __init__(self, length):
@@ -356,6 +504,10 @@ class PaddingFieldType(object):
         else:
             return ""
 
+    def get_struct_format(self):
+        """ Get the struct format of the encoded field. """
+        return '%dx' % self.length
+
 class BytesFieldType(object):
     """ Type for an array of bytes. """
     def __init__(self, length):
@@ -373,6 +525,10 @@ class BytesFieldType(object):
         """ Generates an array of bytes. """
         return [ord(x) for x in byte_str]
 
+    def get_struct_format(self):
+        """ Get the struct format of the encoded field. """
+        return '%ds' % self.length
+
 class LiteralFieldType(object):
     """ Literal string field. """
     def __init__(self, literal):
@@ -394,6 +550,10 @@ class LiteralFieldType(object):
         else:
             return ""
 
+    def get_struct_format(self):
+        """ Get the struct format of the encoded field. """
+        return '%ds' % len(self.literal)
+
 class SvtFieldType(object):
     """ The System Value Type is one byte. This types encodes and decodes into
     a float (degrees Celsius).
@@ -413,6 +573,9 @@ class SvtFieldType(object):
         """ Decode a svt byte string into a instance of the Svt class. """
         return master_api.Svt.from_byte(byte_str[0])
 
+    def get_struct_format(self):
+        """ Get the struct format of the encoded field. """
+        return 'c'
 
 class VarStringFieldType(object):
     """ The VarString uses 1 byte for the length, the total length of the string is fixed.
@@ -441,6 +604,9 @@ class VarStringFieldType(object):
         length = ord(byte_str[0])
         return byte_str[1:1+length]
 
+    def get_struct_format(self):
+        """ Get the struct format of the encoded field. """
+        return '%ds' % (self.total_data_length + 1)
 
 class DimmerFieldType(object):
     """ The dimmer value is a byte in [0, 63], this is converted to an integer in [0, 100] to
@@ -469,6 +635,10 @@ class DimmerFieldType(object):
         """ The dimmer type is always 1 byte. """
         return 1
 
+    def get_struct_format(self):
+        """ Get the struct format of the encoded field. """
+        return 'c'
+
 class OutputFieldType(object):
     """ Field type for OL. """
     def __init__(self):
@@ -496,6 +666,10 @@ class OutputFieldType(object):
                 out.append((id, dimmer))
             return out
 
+    def get_struct_format(self):
+        """ The output list has a variable length. """
+        return None
+
 class ErrorListFieldType(object):
     """ Field type for el. """
     def __init__(self):
@@ -535,3 +709,7 @@ class ErrorListFieldType(object):
                 out.append((id, nr_errors))
 
             return out
+
+    def get_struct_format(self):
+        """ The error list has a variable length. """
+        return None
@@ -24,12 +24,14 @@ LOGGER = logging.getLogger("openmotics")
 import os
 import sys
 import time
-from threading import Thread, Lock, Event
+from threading import Thread, Lock, Event, Condition, local
 from Queue import Queue, Empty
+from collections import deque
 
 import master_api
-from master_command import Field, printable
-from serial_utils import CommunicationTimedOutException
+from master_command import MasterCommandSpec, printable
+from serial_utils import CommunicationTimedOutException, SerialReader, FlightRecorder, \
+    format_records
 
 class MasterCommunicator(object):
     """ Uses a serial port to communicate with the master and updates the output state.
@@ -38,9 +40,23 @@ class MasterCommunicator(object):
     communication is not working properly and watchdog callback is called.
     """
 
+    # The serial reader hands the received bytes to the consumers in chunks of this size.
+    CONSUME_CHUNK_SIZE = 512
+
+    # When a command times out, its consumer stays registered for this number of seconds to
+    # catch a late reply. The cid is not reused in the meantime.
+    LATE_REPLY_TIMEOUT = 10.0
+
+    # The number of seconds between two sweeps of the expired consumers by the watchdog thread.
+    CONSUMER_SWEEP_PERIOD = 1.0
+
+    # The number of seconds of serial traffic that is written to stderr when the watchdog fires.
+    WATCHDOG_DUMP_SECONDS = 30
+
     def __init__(self, serial, init_master=True, verbose=False,
                  watchdog_period=150, watchdog_callback=lambda: os._exit(1),
-                 passthrough_timeout=0.2):
+                 passthrough_timeout=0.2, pipeline_window=1, starvation_timeout=1.0,
+                 serial_reader=None):
         """ Default constructor.
 
         :param serial: Serial port to communicate with
@@ -58,23 +74,47 @@ class MasterCommunicator(object):
         :param passthrough_timeout: The time to wait for an answer on a passthrough message \
         (in sec)
         :type passthrough_timeout: float.
+        :param pipeline_window: The maximum number of commands that can wait for an answer from \
+        the master at the same time. The answers are matched on their cid, so they can arrive in \
+        any order. A window of 1 sends a command only after the previous one was answered.
+        :type pipeline_window: integer.
+        :param starvation_timeout: Commands wait for a slot in the pipeline window by priority \
+        class, a command that waited longer than this number of seconds goes first.
+        :type starvation_timeout: float.
+        :param serial_reader: Reads from the serial port, can be shared with the other serial \
+        ports. A SerialReader is created for the master if None.
+        :type serial_reader: :class`serial_utils.SerialReader`
         """
         self.__init_master = init_master
         self.__verbose = verbose
 
         self.__serial = serial
+        self.__serial_reader = serial_reader
+        self.__own_serial_reader = False
         self.__serial_write_lock = Lock()
-        self.__command_lock = Lock()
+        self.__command_window = CommandWindow(pipeline_window, starvation_timeout)
         self.__serial_bytes_written = 0
         self.__serial_bytes_read = 0
+        self.__flight_recorder = FlightRecorder(FlightRecorder.MASTER)
         self.__timeouts = 0
 
         self.__cid = 1
+        self.__cid_lock = Lock()
+        self.__cids_in_use = set()
+
+        self.__flights = {} # maps the input of the read-only commands in flight to a Flight
+        self.__flights_lock = Lock()
+        self.__commands_saved = 0
+        self.__local = local() # the duration of the last command sent by each thread
 
         self.__maintenance_mode = False
         self.__maintenance_queue = Queue()
 
-        self.__consumers = []
+        self.__consumers = {} # maps the 3-byte prefix to a list of consumers
+        self.__start_bytes = {} # maps the first byte of the prefixes to the number of consumers
+        self.__consumers_lock = Lock()
+        self.__late_replies = 0
+        self.__swept_consumers = 0
 
         self.__passthrough_mode = False
         self.__passthrough_timeout = passthrough_timeout
@@ -84,9 +124,10 @@ class MasterCommunicator(object):
         self.__last_success = 0
 
         self.__stop = False
+        self.__stop_event = Event()
 
-        self.__read_thread = Thread(target=self.__read, name="MasterCommunicator read thread")
-        self.__read_thread.daemon = True
+        self.__read_state = ReadState(self.__consumer_done)
+        self.__read_data = bytearray()
 
         self.__watchdog_period = watchdog_period
         self.__watchdog_callback = watchdog_callback
@@ -95,7 +136,7 @@ class MasterCommunicator(object):
         self.__watchdog_thread.daemon = True
 
     def start(self):
-        """ Start the MasterComunicator, this starts the background read thread. """
+        """ Start the MasterComunicator, this starts reading from the serial port. """
         if self.__init_master:
 
             def flush_serial_input():
@@ -116,9 +157,25 @@ class MasterCommunicator(object):
             self.__serial.timeout = None
 
         self.__stop = False
-        self.__read_thread.start()
+        if self.__serial_reader is None:
+            self.__serial_reader = SerialReader()
+            self.__serial_reader.start()
+            self.__own_serial_reader = True
+        self.__serial_reader.add(self.__serial, self.__read)
         self.__watchdog_thread.start()
 
+    def stop(self):
+        """ Stop the MasterCommunicator: stops reading from the serial port and waits for the
+        watchdog thread. The SerialReader is stopped if it was created by start(). """
+        self.__stop = True
+        self.__stop_event.set()
+        if self.__serial_reader is not None:
+            self.__serial_reader.remove(self.__serial)
+            if self.__own_serial_reader:
+                self.__serial_reader.stop()
+        if self.__watchdog_thread.is_alive():
+            self.__watchdog_thread.join()
+
     def get_bytes_written(self):
         """ Get the number of bytes written to the Master. """
         return self.__serial_bytes_written
@@ -135,19 +192,41 @@ class MasterCommunicator(object):
             return time.time() - self.__last_success
 
     def __get_cid(self):
-        """ Get a communication id """
-        (ret, self.__cid) = (self.__cid, (self.__cid % 255) + 1)
-        return ret
+        """ Get a communication id that is not used by another command in flight. The cid has to
+        be released using __release_cid when the command is done. """
+        with self.__cid_lock:
+            while self.__cid in self.__cids_in_use:
+                self.__cid = (self.__cid % 255) + 1
+            (ret, self.__cid) = (self.__cid, (self.__cid % 255) + 1)
+            self.__cids_in_use.add(ret)
+            return ret
+
+    def __release_cid(self, cid):
+        """ Release a communication id, it can be used by a new command. """
+        with self.__cid_lock:
+            self.__cids_in_use.discard(cid)
+
+    def get_flight_records(self, since=None):
+        """ Get the recent traffic on the serial port, see :class`serial_utils.FlightRecorder`.
+
+        :param since: only return the traffic after this timestamp, all records if None.
+        :type since: float
+        :returns: list of tuples (timestamp, port, direction, cid, data).
+        """
+        return self.__flight_recorder.get_records(since)
 
-    def __write_to_serial(self, data):
+    def __write_to_serial(self, data, cid=None):
         """ Write data to the serial port.
 
         :param data: the data to write
         :type data: string
+        :param cid: the communication id of the command, None if the data is not a command.
+        :type cid: integer
         """
         with self.__serial_write_lock:
             if self.__verbose:
                 print "%.3f writing to serial: %s" % (time.time(), printable(data))
+            self.__flight_recorder.record(FlightRecorder.WRITE, data, cid)
             self.__serial.write(data)
             self.__serial_bytes_written += len(data)
 
@@ -159,59 +238,193 @@ class MasterCommunicator(object):
         :param consumer: The consumer to register.
         :type consumer: Consumer or BackgroundConsumer.
         """
-        self.__consumers.append(consumer)
+        prefix = consumer.get_prefix()
+        start_byte = ord(prefix[0])
+
+        with self.__consumers_lock:
+            self.__consumers.setdefault(prefix, []).append(consumer)
+            self.__start_bytes[start_byte] = self.__start_bytes.get(start_byte, 0) + 1
 
-    def do_command(self, cmd, fields=None, timeout=2):
+    def __unregister_consumer(self, consumer):
+        """ Remove a consumer from the communicator, if it is still registered.
+
+        :returns: whether the consumer was registered.
+        """
+        prefix = consumer.get_prefix()
+        start_byte = ord(prefix[0])
+
+        with self.__consumers_lock:
+            consumers = self.__consumers.get(prefix, [])
+            if consumer not in consumers:
+                return False
+
+            consumers.remove(consumer)
+            if len(consumers) == 0:
+                del self.__consumers[prefix]
+
+            self.__start_bytes[start_byte] -= 1
+            if self.__start_bytes[start_byte] == 0:
+                del self.__start_bytes[start_byte]
+            return True
+
+    def __expire_consumer(self, consumer):
+        """ Mark the consumer of a command that timed out as expired, if it is still registered.
+        The expired consumer discards the late reply, or is removed by the watchdog after
+        LATE_REPLY_TIMEOUT seconds. """
+        with self.__consumers_lock:
+            if consumer in self.__consumers.get(consumer.get_prefix(), []):
+                consumer.expire(time.time() + MasterCommunicator.LATE_REPLY_TIMEOUT)
+
+    def __sweep_consumers(self):
+        """ Remove the expired consumers that are past their deadline and release their cid. """
+        now = time.time()
+        with self.__consumers_lock:
+            swept = [consumer for consumers in self.__consumers.values() for consumer in consumers
+                     if isinstance(consumer, Consumer) and consumer.expired
+                     and consumer.deadline < now]
+
+        for consumer in swept:
+            if self.__unregister_consumer(consumer):
+                self.__release_cid(consumer.cid)
+                self.__swept_consumers += 1
+
+    def get_consumer_statistics(self):
+        """ Get the statistics of the registered consumers.
+
+        :returns: dict with the number of registered 'consumers', the number of registered \
+        consumers that are 'expired', the number of 'late_replies' that were discarded and the \
+        number of expired consumers that were 'swept' without receiving a reply.
+        """
+        with self.__consumers_lock:
+            consumers = [consumer for consumers in self.__consumers.values()
+                         for consumer in consumers]
+            return {'consumers': len(consumers),
+                    'expired': len([consumer for consumer in consumers
+                                    if isinstance(consumer, Consumer) and consumer.expired]),
+                    'late_replies': self.__late_replies,
+                    'swept': self.__swept_consumers}
+
+    def __find_consumer(self, prefix):
+        """ Get the first registered consumer for a prefix, None if there is no such consumer. """
+        with self.__consumers_lock:
+            consumers = self.__consumers.get(prefix)
+            return None if consumers is None else consumers[0]
+
+    def get_scheduler_statistics(self):
+        """ Get the queue depth and wait time statistics for each priority class, see
+        :class`CommandWindow`. """
+        return self.__command_window.get_statistics()
+
+    def get_commands_saved(self):
+        """ Get the number of read-only commands that were not sent because an identical command
+        was in flight. """
+        return self.__commands_saved
+
+    def get_last_duration(self):
+        """ Get the duration of the last do_command of the calling thread, from the moment the
+        command got a slot in the pipeline window until the answer was received: the time the
+        command waited for a slot is not included.
+
+        :returns: the duration in seconds, None if the last command failed or joined an \
+        identical command in flight.
+        """
+        return getattr(self.__local, 'duration', None)
+
+    def do_command(self, cmd, fields=None, timeout=2, priority=None):
         """ Send a command over the serial port and block until an answer is received.
         If the master does not respond within the timeout period, a CommunicationTimedOutException
         is raised
 
+        If an identical read-only command (same spec and input fields) with the same or a more
+        urgent priority class is in flight, the command is not sent: the caller gets the result
+        of the command in flight.
+
         :param cmd: specification of the command to execute
         :type cmd: :class`MasterCommand.MasterCommandSpec`
+        :param priority: the priority class of the command, None to use the priority of the spec.
+        :type priority: one of the priorities in MasterCommandSpec.PRIORITIES
         :raises: :class`CommunicationTimedOutException` if master did not respond in time
         :raises: :class`InMaintenanceModeException` if master is in maintenance mode
         :returns: dict containing the output fields of the command
         """
+        self.__local.duration = None
         if self.__maintenance_mode:
             raise InMaintenanceModeException()
 
         if fields is None:
             fields = dict()
 
-        cid = self.__get_cid()
-        consumer = Consumer(cmd, cid)
-        inp = cmd.create_input(cid, fields)
+        if priority is None:
+            priority = cmd.priority
+
+        if not cmd.read_only:
+            with self.__flights_lock:
+                # The reads in flight might have been sent before this command: they can't be
+                # joined anymore.
+                self.__flights.clear()
+            return self.__do_command(cmd, fields, timeout, priority)
+
+        key = cmd.create_input(0, fields)
+        with self.__flights_lock:
+            # Don't join a flight that waits behind more urgent commands than this one: send the
+            # command with its own priority, later callers join the more urgent flight.
+            leader = key not in self.__flights or self.__flights[key].priority > priority
+            if leader:
+                self.__flights[key] = Flight(priority)
+            else:
+                self.__commands_saved += 1
+            flight = self.__flights[key]
+
+        if not leader:
+            return flight.get(timeout)
 
-        with self.__command_lock:
-            self.__consumers.append(consumer)
-            self.__write_to_serial(inp)
+        try:
+            result = self.__do_command(cmd, fields, timeout, priority)
+        except Exception, exception:
+            self.__end_flight(key, flight)
+            flight.fail(exception)
+            raise
+        else:
+            self.__end_flight(key, flight)
+            flight.succeed(result)
+            return result
+
+    def __end_flight(self, key, flight):
+        """ Remove a flight, it can't be joined anymore. """
+        with self.__flights_lock:
+            if self.__flights.get(key) is flight:
+                del self.__flights[key]
+
+    def __do_command(self, cmd, fields, timeout, priority):
+        """ Send a command and wait for the answer, see do_command. """
+        self.__command_window.acquire(priority)
+        start = time.time()
+        try:
+            consumer = Consumer(cmd, self.__get_cid())
             try:
-                result = consumer.get(timeout).fields
-                if cmd.output_has_crc() and not self.__check_crc(cmd, result):
-                    raise CrcCheckFailedException()
-                else:
-                    self.__last_success = time.time()
-                    return result
-            except CommunicationTimedOutException:
-                self.__timeouts += 1
-                raise
-
-    def __check_crc(self, cmd, result):
-        """ Calculate the CRC of the data for a certain master command.
-
-        :param cmd: instance of MasterCommandSpec.
-        :param result: A dict containing the result of the master command.
-        :returns: boolean
-        """
-        crc = 0
-        for field in cmd.output_fields:
-            if Field.is_crc(field):
-                break
-            else:
-                for byte in field.encode(result[field.name]):
-                    crc += ord(byte)
+                inp = cmd.create_input(consumer.cid, fields)
 
-        return result['crc'] == [67, (crc / 256), (crc % 256)]
+                self.register_consumer(consumer)
+                self.__write_to_serial(inp, consumer.cid)
+                try:
+                    result = consumer.get(timeout)
+                    if cmd.output_has_crc() and not cmd.check_crc(result):
+                        raise CrcCheckFailedException()
+                    else:
+                        self.__last_success = time.time()
+                        self.__local.duration = self.__last_success - start
+                        return result.fields
+                except CommunicationTimedOutException:
+                    self.__timeouts += 1
+                    self.__expire_consumer(consumer)
+                    raise
+            finally:
+                # An expired consumer keeps its cid until the late reply arrives or it is swept.
+                if not consumer.expired:
+                    self.__unregister_consumer(consumer)
+                    self.__release_cid(consumer.cid)
+        finally:
+            self.__command_window.release()
 
     def __passthrough_wait(self):
         """ Waits until the passthrough is done or a timeout is reached. """
@@ -219,7 +432,7 @@ class MasterCommunicator(object):
             LOGGER.info("Timed out on passthrough message")
 
         self.__passthrough_mode = False
-        self.__command_lock.release()
+        self.__command_window.release_exclusive()
 
     def send_passthrough_data(self, data):
         """ Send raw data on the serial port.
@@ -231,7 +444,7 @@ class MasterCommunicator(object):
             raise InMaintenanceModeException()
 
         if not self.__passthrough_mode:
-            self.__command_lock.acquire()
+            self.__command_window.acquire_exclusive()
             self.__passthrough_done.clear()
             self.__passthrough_mode = True
             passthrough_thread = Thread(target=self.__passthrough_wait)
@@ -300,132 +513,298 @@ class MasterCommunicator(object):
         """ Returns whether the MasterCommunicator is in maintenance mode. """
         return self.__maintenance_mode
 
-    def __get_start_bytes(self):
-        """ Create a dict that maps the start byte to a list of consumers. """
-        start_bytes = {}
-        for consumer in self.__consumers:
-            start_byte = consumer.get_prefix()[0]
-            if start_byte in start_bytes:
-                start_bytes[start_byte].append(consumer)
-            else:
-                start_bytes[start_byte] = [consumer]
-        return start_bytes
-
     def __watchdog(self):
         """ Run in the background watchdog thread: checks the number of timeouts per minute. If the
-        number of timeouts is larger than 1, the watchdog callback is called. """
+        number of timeouts is larger than 1, the watchdog callback is called. Between the checks,
+        the expired consumers are swept every CONSUMER_SWEEP_PERIOD seconds. """
+        next_check = time.time()
         while not self.__stop:
-            (timeouts, self.__timeouts) = (self.__timeouts, 0)
-            if timeouts > 1:
-                sys.stderr.write("Watchdog detected problems in communication !\n")
-                self.__watchdog_callback()
-            time.sleep(self.__watchdog_period)
-
-    def __read(self):
-        """ Code for the background read thread: reads from the serial port, checks if
+            if time.time() >= next_check:
+                (timeouts, self.__timeouts) = (self.__timeouts, 0)
+                if timeouts > 1:
+                    sys.stderr.write("Watchdog detected problems in communication !\n")
+                    since = time.time() - MasterCommunicator.WATCHDOG_DUMP_SECONDS
+                    for line in format_records(self.__flight_recorder.get_records(since)):
+                        sys.stderr.write(line + "\n")
+                    self.__watchdog_callback()
+                next_check = time.time() + self.__watchdog_period
+
+            self.__sweep_consumers()
+            self.__stop_event.wait(max(0, min(MasterCommunicator.CONSUMER_SWEEP_PERIOD,
+                                              next_check - time.time())))
+
+    def __consumer_done(self, consumer):
+        """ Callback for when consumer is done. ReadState does not access parent directly.
+        Returns whether the output should be delivered to the consumer. """
+        if isinstance(consumer, Consumer):
+            if self.__unregister_consumer(consumer) and consumer.expired:
+                # A late reply: the command timed out, release the cid it kept.
+                self.__late_replies += 1
+                self.__release_cid(consumer.cid)
+            return not consumer.expired
+        elif isinstance(consumer, BackgroundConsumer) and consumer.send_to_passthrough:
+            self.__passthrough_queue.put(consumer.last_cmd_data)
+        return True
+
+    def __read(self, chunk):
+        """ Called by the serial reader with the bytes read from the serial port: checks if
         consumers for incoming bytes, if not: put in pass through buffer.
         """
-        def consumer_done(consumer):
-            """ Callback for when consumer is done. ReadState does not access parent directly. """
-            if isinstance(consumer, Consumer):
-                self.__consumers.remove(consumer)
-            elif isinstance(consumer, BackgroundConsumer) and consumer.send_to_passthrough:
-                self.__passthrough_queue.put(consumer.last_cmd_data)
-
-        class ReadState(object):
-            """" The read state keeps track of the current consumer and the partial result
-            for that consumer. """
-            def __init__(self):
+        read_state = self.__read_state
+        data = self.__read_data
+
+        data.extend(chunk)
+        self.__serial_bytes_read += len(chunk)
+        self.__flight_recorder.record(FlightRecorder.READ, chunk)
+
+        if self.__verbose:
+            print "%.3f read from serial: %s" % (time.time(), printable(str(data)))
+
+        offset = 0
+        leftovers = bytearray() # for unconsumed bytes; these will go to the passthrough.
+
+        while offset < len(data):
+            if read_state.should_resume():
+                offset = read_state.consume(data, offset)
+                continue
+
+            if data[offset] in self.__start_bytes:
+                # Prefixes are 3 bytes, make sure we have enough data to match
+                if len(data) - offset < 3:
+                    # All commands end with '\r\n', there are no prefixes that start
+                    # with \r\n so the last bytes of a command will not get stuck
+                    # waiting for the next read from the serial port
+                    break
+
+                consumer = self.__find_consumer(str(data[offset:offset + 3]))
+                if consumer is not None:
+                    read_state.set_consumer(consumer)
+                    offset = read_state.consume(data, offset + 3) # Strip off prefix
+                    continue
+
+            leftovers.append(data[offset])
+            offset += 1
+
+        del data[:offset]
+
+        if len(leftovers) > 0:
+            if not self.__maintenance_mode:
+                self.__passthrough_queue.put(str(leftovers))
+            else:
+                self.__maintenance_queue.put(str(leftovers))
+
+
+class ReadState(object):
+    """" The read state keeps track of the current consumer and the partial result
+    for that consumer. """
+    def __init__(self, consumer_done):
+        """ Create a ReadState.
+
+        :param consumer_done: called when a consumer is done, returns whether the output should \
+        be delivered to the consumer.
+        :type consumer_done: function
+        """
+        self.__consumer_done = consumer_done
+        self.current_consumer = None
+        self.partial_result = None
+
+    def should_resume(self):
+        """ Checks whether we should resume consuming data with the current_consumer. """
+        return self.current_consumer != None
+
+    def set_consumer(self, consumer):
+        """ Set a new consumer. """
+        self.current_consumer = consumer
+        self.partial_result = None
+
+    def consume(self, data, offset):
+        """ Consume the bytes in data, starting at offset, using the current_consumer.
+        The bytes are handed to the consumer in chunks, so a long burst of data is not
+        copied for every message. Returns the offset of the first byte that was not used.
+        """
+        while offset < len(data):
+            chunk = str(data[offset:offset + MasterCommunicator.CONSUME_CHUNK_SIZE])
+            try:
+                (bytes_consumed, result, done) = \
+                    self.current_consumer.consume(chunk, self.partial_result)
+            except ValueError, value_error:
+                sys.stderr.write("Got ValueError: " + str(value_error))
+                return len(data)
+
+            if done:
+                if self.__consumer_done(self.current_consumer):
+                    self.current_consumer.deliver(result)
+
                 self.current_consumer = None
                 self.partial_result = None
 
-            def should_resume(self):
-                """ Checks whether we should resume consuming data with the current_consumer. """
-                return self.current_consumer != None
+                return offset + bytes_consumed
+            else:
+                self.partial_result = result
+                offset += len(chunk)
 
-            def should_find_consumer(self):
-                """ Checks whether we should find a new consumer. """
-                return self.current_consumer == None
+        return offset
 
-            def set_consumer(self, consumer):
-                """ Set a new consumer. """
-                self.current_consumer = consumer
-                self.partial_result = None
 
-            def consume(self, data):
-                """ Consume the bytes in data using the current_consumer, and return the bytes
-                that were not used. """
-                try:
-                    (bytes_consumed, result, done) = \
-                        read_state.current_consumer.consume(data, read_state.partial_result)
-                except ValueError, value_error:
-                    sys.stderr.write("Got ValueError: " + str(value_error))
-                    return ""
-                else:
-                    if done:
-                        consumer_done(self.current_consumer)
-                        self.current_consumer.deliver(result)
-
-                        self.current_consumer = None
-                        self.partial_result = None
-
-                        return data[bytes_consumed:]
-                    else:
-                        self.partial_result = result
-                        return ""
+class CommandWindow(object):
+    """ Limits the number of commands that are in flight on the serial link. A command takes a
+    slot in the window while it waits for its answer. The passthrough needs the serial link for
+    itself: it waits until all commands in flight are done and blocks new commands until it is
+    released.
 
-        read_state = ReadState()
-        data = ""
+    Commands that wait for a slot are served by priority class (see MasterCommandSpec) and in
+    order of arrival within a class. To avoid starvation, a command that waited longer than the
+    starvation timeout is served before the commands of a higher class that arrived later.
+    """
 
-        while not self.__stop:
-            data += self.__serial.read(1)
-            num_bytes = self.__serial.inWaiting()
-            if num_bytes > 0:
-                data += self.__serial.read(num_bytes)
-            if data != None and len(data) > 0:
-                self.__serial_bytes_read += (1 + num_bytes)
-
-                if self.__verbose:
-                    print "%.3f read from serial: %s" % (time.time(), printable(data))
-
-                if read_state.should_resume():
-                    data = read_state.consume(data)
-
-                # No else here: data might not be empty when current_consumer is done
-                if read_state.should_find_consumer():
-                    start_bytes = self.__get_start_bytes()
-                    leftovers = "" # for unconsumed bytes; these will go to the passthrough.
-
-                    while len(data) > 0:
-                        if data[0] in start_bytes:
-                            # Prefixes are 3 bytes, make sure we have enough data to match
-                            if len(data) >= 3:
-                                match = False
-                                for consumer in start_bytes[data[0]]:
-                                    if data[:3] == consumer.get_prefix():
-                                        # Found matching consumer
-                                        read_state.set_consumer(consumer)
-                                        data = read_state.consume(data[3:]) # Strip off prefix
-                                        # Consumers might have changed, update start_bytes
-                                        start_bytes = self.__get_start_bytes()
-                                        match = True
-                                        break
-                                if match:
-                                    continue
-                            else:
-                                # All commands end with '\r\n', there are no prefixes that start
-                                # with \r\n so the last bytes of a command will not get stuck
-                                # waiting for the next serial.read()
-                                break
-
-                        leftovers += data[0]
-                        data = data[1:]
-
-                    if len(leftovers) > 0:
-                        if not self.__maintenance_mode:
-                            self.__passthrough_queue.put(leftovers)
-                        else:
-                            self.__maintenance_queue.put(leftovers)
+    def __init__(self, size, starvation_timeout=1.0):
+        """ Create a CommandWindow.
+
+        :param size: the maximum number of commands in flight.
+        :type size: integer >= 1.
+        :param starvation_timeout: the number of seconds after which a waiting command is served \
+        regardless of its priority class.
+        :type starvation_timeout: float
+        """
+        if size < 1:
+            raise ValueError("The size of the command window should be at least 1, got %d" % size)
+
+        self.__size = size
+        self.__starvation_timeout = starvation_timeout
+        self.__in_flight = 0
+        self.__exclusive = False
+        self.__condition = Condition()
+
+        # For each priority class: the tickets (a list with the arrival time) of the waiting
+        # commands and the statistics.
+        self.__waiting = dict([(priority, deque()) for priority in MasterCommandSpec.PRIORITIES])
+        self.__statistics = dict([(priority, {'commands': 0, 'max_queue_depth': 0,
+                                              'wait_time': 0.0, 'max_wait_time': 0.0,
+                                              'starved': 0})
+                                  for priority in MasterCommandSpec.PRIORITIES])
+
+    def __next(self):
+        """ Get the ticket of the command that should get the next slot. """
+        heads = [self.__waiting[priority][0] for priority in sorted(self.__waiting)
+                 if len(self.__waiting[priority]) > 0]
+        oldest = min(heads)
+        if time.time() - oldest[0] > self.__starvation_timeout:
+            return oldest
+        return heads[0]
+
+    def acquire(self, priority=MasterCommandSpec.INTERACTIVE):
+        """ Take a slot in the window, blocks until a slot is available and all commands that
+        should go first got their slot.
+
+        :param priority: the priority class of the command.
+        :type priority: one of the priorities in MasterCommandSpec.PRIORITIES
+        """
+        with self.__condition:
+            ticket = [time.time()]
+            waiting = self.__waiting[priority]
+            statistics = self.__statistics[priority]
+
+            waiting.append(ticket)
+            statistics['max_queue_depth'] = max(statistics['max_queue_depth'], len(waiting))
+
+            while self.__exclusive or self.__in_flight >= self.__size \
+                    or self.__next() is not ticket:
+                self.__condition.wait()
+
+            if any([len(self.__waiting[other]) > 0 for other in self.__waiting
+                    if other < priority]):
+                # A command of a higher class is waiting: this one starved.
+                statistics['starved'] += 1
+            waiting.popleft()
+            self.__in_flight += 1
+
+            wait_time = time.time() - ticket[0]
+            statistics['commands'] += 1
+            statistics['wait_time'] += wait_time
+            statistics['max_wait_time'] = max(statistics['max_wait_time'], wait_time)
+
+            if self.__in_flight < self.__size:
+                # The next waiting command might be able to take a slot as well.
+                self.__condition.notify_all()
+
+    def release(self):
+        """ Release a slot in the window. """
+        with self.__condition:
+            self.__in_flight -= 1
+            self.__condition.notify_all()
+
+    def acquire_exclusive(self):
+        """ Take the whole window, blocks until all commands in flight are done. """
+        with self.__condition:
+            while self.__exclusive:
+                self.__condition.wait()
+            self.__exclusive = True
+            while self.__in_flight > 0:
+                self.__condition.wait()
+
+    def release_exclusive(self):
+        """ Release the whole window. """
+        with self.__condition:
+            self.__exclusive = False
+            self.__condition.notify_all()
+
+    def get_statistics(self):
+        """ Get the statistics for each priority class.
+
+        :returns: dict that maps the name of the priority class to a dict with the current \
+        'queue_depth', the 'max_queue_depth', the number of 'commands' that got a slot, the \
+        total and maximum time they waited ('wait_time' and 'max_wait_time' in seconds) and the \
+        number of commands that were served by the starvation protection ('starved').
+        """
+        with self.__condition:
+            statistics = {}
+            for (priority, name) in MasterCommandSpec.PRIORITIES.items():
+                statistics[name] = dict(self.__statistics[priority])
+                statistics[name]['queue_depth'] = len(self.__waiting[priority])
+            return statistics
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *args):
+        self.release()
+
+
+class Flight(object):
+    """ A read-only command in flight. The callers that join the flight wait for the result of
+    the caller that sent the command. """
+
+    def __init__(self, priority):
+        """ Create a flight for a command that is sent with the given priority class. """
+        self.priority = priority
+        self.__done = Event()
+        self.__result = None
+        self.__exception = None
+
+    def succeed(self, result):
+        """ Set the result of the command and wake up the waiting callers. """
+        self.__result = result
+        self.__done.set()
+
+    def fail(self, exception):
+        """ Set the exception raised by the command and wake up the waiting callers. """
+        self.__exception = exception
+        self.__done.set()
+
+    def get(self, timeout):
+        """ Wait for the result of the command.
+
+        :param timeout: timeout in seconds
+        :raises: :class`CommunicationTimedOutException` if the command is not done in time, \
+        or the exception raised by the command.
+        :returns: a copy of the dict containing the output fields of the command
+        """
+        if not self.__done.wait(timeout):
+            raise CommunicationTimedOutException()
+        elif self.__exception is not None:
+            raise self.__exception
+        else:
+            return dict(self.__result)
 
 
 class InMaintenanceModeException(Exception):
@@ -445,8 +824,16 @@ class Consumer(object):
     def __init__(self, cmd, cid):
         self.cmd = cmd
         self.cid = cid
+        self.expired = False
+        self.deadline = None
         self.__queue = Queue()
 
+    def expire(self, deadline):
+        """ Mark the consumer as expired: nobody waits for the output anymore. The consumer
+        stays registered until the deadline to catch a late reply. """
+        self.expired = True
+        self.deadline = deadline
+
     def get_prefix(self):
         """ Get the prefix of the answer from the master. """
         return self.cmd.action + str(chr(self.cid))
@@ -20,6 +20,15 @@ the master.
 """
 
 import time
+import logging
+from threading import Lock
+
+import master_api
+from master_command import MasterCommandSpec
+from task_scheduler import TaskScheduler
+
+LOGGER = logging.getLogger("openmotics")
+
 
 class OutputStatus(object):
     """ Contains a cached version of the current output of the controller. """
@@ -61,3 +70,149 @@ class OutputStatus(object):
     def get_outputs(self):
         """ Return the list of Outputs. """
         return self.__outputs
+
+
+class OutputReader(object):
+    """ Reads the outputs from the master in a job of the TaskScheduler, every run of the job
+    reads one output. The ids of the outputs to read are requested by the gateway, the reads are
+    spread out: at most one output is read every interval, with background priority and only
+    when the master is idle. An id that is requested multiple times before it is read, is only
+    read once. When the reads fail, the reader backs off exponentially until a read succeeds
+    again.
+    """
+
+    def __init__(self, master_communicator, on_output, is_idle=None, interval=0.1, idle_wait=1.0,
+                 backoff=1.0, max_backoff=60.0, scheduler=None):
+        """ Create an OutputReader.
+
+        :param master_communicator: the MasterCommunicator that is used to read the outputs.
+        :param on_output: function that is called with the fields of master_api.read_output \
+        after an output was read.
+        :param is_idle: function without arguments that returns True if the master is idle, \
+        None if the master is always idle.
+        :param interval: the minimum number of seconds between two reads.
+        :type interval: float
+        :param idle_wait: the number of seconds to wait before checking again if the master \
+        is idle.
+        :type idle_wait: float
+        :param backoff: the number of seconds to wait after the first failed read, the wait is \
+        doubled after every consecutive failure.
+        :type backoff: float
+        :param max_backoff: the maximum number of seconds to wait after a failed read.
+        :type max_backoff: float
+        :param scheduler: runs the read job, a TaskScheduler is created by the first request if \
+        None.
+        :type scheduler: :class`task_scheduler.TaskScheduler`
+        """
+        self.__master_communicator = master_communicator
+        self.__on_output = on_output
+        self.__is_idle = is_idle
+        self.__interval = interval
+        self.__idle_wait = idle_wait
+        self.__backoff = backoff
+        self.__max_backoff = max_backoff
+
+        self.__scheduler = scheduler
+        self.__lock = Lock()
+        self.__job = None
+        self.__stopped = False
+        self.__pending = set()
+        self.__reads = 0
+        self.__failures = 0
+        self.__next_read = 0  # the earliest time of the next read
+
+    def request(self, output_ids):
+        """ Read a number of outputs in the background, the reader is started if it is not
+        running. """
+        with self.__lock:
+            self.__pending.update(output_ids)
+            self.__stopped = False
+            if self.__job is None:
+                if self.__scheduler is None:
+                    self.__scheduler = TaskScheduler(workers=1)
+                    self.__scheduler.start()
+                self.__job = self.__scheduler.schedule('output_reader', self.__run, delay=None)
+            # Wait for the interval or for the backoff after a failed read.
+            delay = max(0.0, self.__next_read - time.time())
+        self.__scheduler.reschedule(self.__job, delay)
+
+    def discard(self, output_ids):
+        """ Don't read a number of outputs that were requested, eg. because the state of the
+        outputs is known. """
+        with self.__lock:
+            self.__pending.difference_update(output_ids)
+
+    def stop(self):
+        """ Stop reading, the pending reads are kept. """
+        with self.__lock:
+            self.__stopped = True
+
+    def __next(self):
+        """ Get the id of the next output to read, None if there are no pending reads. """
+        with self.__lock:
+            if self.__stopped or len(self.__pending) == 0:
+                return None
+            output_id = min(self.__pending)
+            self.__pending.discard(output_id)
+            return output_id
+
+    def __run(self):
+        """ Read the next pending output, this runs in the reader job. """
+        with self.__lock:
+            if self.__stopped or len(self.__pending) == 0:
+                return
+
+        if self.__is_idle is not None and not self.__is_idle():
+            self.__job.run_after(self.__idle_wait)
+            return
+
+        output_id = self.__next()
+        if output_id is None:
+            return
+
+        try:
+            output = self.__master_communicator.do_command(
+                master_api.read_output(), {'id': output_id},
+                priority=MasterCommandSpec.BACKGROUND)
+        except Exception:
+            with self.__lock:
+                self.__failures += 1
+                failures = self.__failures
+                self.__pending.add(output_id)
+                delay = min(self.__backoff * 2 ** (failures - 1), self.__max_backoff)
+                self.__next_read = time.time() + delay
+            if failures == 1:
+                LOGGER.exception("Could not read output %d, backing off", output_id)
+            else:
+                LOGGER.debug("Could not read output %d (%d consecutive failures)",
+                             output_id, failures)
+            self.__job.run_after(delay)
+            return
+
+        with self.__lock:
+            failures = self.__failures
+            self.__failures = 0
+            self.__next_read = time.time() + self.__interval
+            self.__reads += 1
+        if failures > 0:
+            LOGGER.info("Reading outputs recovered after %d failures", failures)
+        try:
+            self.__on_output(output)
+        except Exception:
+            LOGGER.exception("Could not process output %d", output_id)
+
+        with self.__lock:
+            more = len(self.__pending) > 0
+        if more:
+            self.__job.run_after(self.__interval)
+
+    def get_statistics(self):
+        """ Get the statistics of the reader.
+
+        :returns: dict with 'running' (boolean), the number of 'pending' reads and the number \
+        of 'reads' that were done.
+        """
+        with self.__lock:
+            return {'running': self.__job is not None and not self.__stopped,
+                    'pending': len(self.__pending),
+                    'reads': self.__reads}
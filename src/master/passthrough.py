@@ -23,25 +23,39 @@ import logging
 LOGGER = logging.getLogger("openmotics")
 
 import threading
+from Queue import Queue
 from master_communicator import InMaintenanceModeException
 from master_command import printable
+from serial_utils import SerialReader
 
 class PassthroughService(object):
     """ The Passthrough service creates two threads: one for reading from and one for writing
-    to the master.
+    to the master. The passthrough serial is read by the serial reader, it queues the data for
+    the writer thread: writing to the master blocks until the commands in flight are done, and
+    their answers are read by the serial reader.
     """
 
-    def __init__(self, master_communicator, passthrough_serial, verbose=False):
+    def __init__(self, master_communicator, passthrough_serial, verbose=False,
+                 serial_reader=None):
+        """ Create a PassthroughService.
+
+        :param serial_reader: Reads from the passthrough serial, a SerialReader is created for \
+        the passthrough if None.
+        :type serial_reader: :class`serial_utils.SerialReader`
+        """
         self.__master_communicator = master_communicator
         self.__passthrough_serial = passthrough_serial
+        self.__serial_reader = serial_reader
         self.__verbose = verbose
 
         self.__stopped = False
         self.__reader_thread = None
         self.__writer_thread = None
+        self.__writer_queue = Queue()
 
     def start(self):
-        """ Start the Passthrough service, this launches the two threads. """
+        """ Start the Passthrough service, this launches the two threads and starts reading
+        from the passthrough serial. """
         self.__reader_thread = threading.Thread(target=self.__reader)
         self.__reader_thread.setName("Passthrough reader thread")
         self.__reader_thread.daemon = True
@@ -52,6 +66,11 @@ class PassthroughService(object):
         self.__writer_thread.daemon = True
         self.__writer_thread.start()
 
+        if self.__serial_reader is None:
+            self.__serial_reader = SerialReader()
+            self.__serial_reader.start()
+        self.__serial_reader.add(self.__passthrough_serial, self.__writer_queue.put)
+
 
     def __reader(self):
         """ Reads from the master and writes to the passthrough serial. """
@@ -63,20 +82,21 @@ class PassthroughService(object):
                 self.__passthrough_serial.write(data)
 
     def __writer(self):
-        """ Reads from the passthrough serial and writes to the master. """
+        """ Writes the data read from the passthrough serial to the master. """
         while not self.__stopped:
-            data = self.__passthrough_serial.read(1)
-            if data and len(data) > 0:
-                num_bytes = self.__passthrough_serial.inWaiting()
-                if num_bytes > 0:
-                    data += self.__passthrough_serial.read(num_bytes)
-                try:
-                    if self.__verbose:
-                        LOGGER.info("Data from passthrough: %s", printable(data))
-                    self.__master_communicator.send_passthrough_data(data)
-                except InMaintenanceModeException:
-                    LOGGER.info("Dropped passthrough communication in maintenance mode.")
+            data = self.__writer_queue.get()
+            # Send the data that was queued in the meantime at once.
+            while not self.__writer_queue.empty():
+                data += self.__writer_queue.get()
+            try:
+                if self.__verbose:
+                    LOGGER.info("Data from passthrough: %s", printable(data))
+                self.__master_communicator.send_passthrough_data(data)
+            except InMaintenanceModeException:
+                LOGGER.info("Dropped passthrough communication in maintenance mode.")
 
     def stop(self):
         """ Stop the Passthrough service. """
         self.__stopped = True
+        if self.__serial_reader is not None:
+            self.__serial_reader.remove(self.__passthrough_serial)
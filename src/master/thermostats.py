@@ -13,10 +13,19 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
+The thermostats module contains classes to track the current state of the thermostats on the
+master.
+
 @author: fryckbos
 """
 
 import time
+import logging
+from threading import Condition
+
+from task_scheduler import TaskScheduler
+
+LOGGER = logging.getLogger("openmotics")
 
 class ThermostatStatus(object):
     """ Contains a cached version of the current thermostat status. """
@@ -46,3 +55,186 @@ class ThermostatStatus(object):
     def get_thermostats(self):
         """ Return the list of thermostats. """
         return self.__thermostats
+
+
+class ThermostatStatusService(object):
+    """ Serves the status of the thermostats from a snapshot. The snapshot is refreshed by a job
+    of the TaskScheduler: every refresh_period seconds and right after a refresh was requested
+    (eg. after a setpoint or a mode was written). A refresh creates a new snapshot, a snapshot that
+    was handed out is never changed: callers should not modify it either.
+
+    Every snapshot has a version, the service keeps the version in which each thermostat last
+    changed: clients can get the thermostats that changed since the version they have.
+    """
+
+    GLOBAL_FIELDS = ['thermostats_on', 'automatic', 'setpoint', 'cooling']
+
+    def __init__(self, read_status, scheduler=None, refresh_period=30, refresh_timeout=5):
+        """ Create a ThermostatStatusService.
+
+        :param read_status: function without arguments that reads the status of the thermostats \
+        from the master: a dict with the GLOBAL_FIELDS and a list of thermostats ('status'), \
+        every thermostat is a dict with an 'id'.
+        :param scheduler: runs the refresh job, a TaskScheduler is created by start() if None.
+        :type scheduler: :class`task_scheduler.TaskScheduler`
+        :param refresh_period: the number of seconds between two refreshes.
+        :type refresh_period: float
+        :param refresh_timeout: the maximum number of seconds get_status waits for a requested \
+        refresh.
+        :type refresh_timeout: float
+        """
+        self.__read_status = read_status
+        self.__refresh_period = refresh_period
+        self.__refresh_timeout = refresh_timeout
+
+        self.__scheduler = scheduler
+        self.__condition = Condition()
+        self.__job = None
+        self.__running = False
+        self.__requests = 0  # the number of requested refreshes
+        self.__handled = 0  # the number of requested refreshes that were done
+
+        self.__snapshot = None
+        self.__version = 0
+        self.__global_version = 0
+        self.__versions = {}  # id -> version of the last change of the thermostat
+        self.__removed = {}  # id -> version in which the thermostat was removed
+
+    def start(self):
+        """ Start refreshing the snapshot in the background. """
+        with self.__condition:
+            if self.__running:
+                return
+            if self.__scheduler is None:
+                self.__scheduler = TaskScheduler(workers=1)
+                self.__scheduler.start()
+            self.__running = True
+            self.__job = self.__scheduler.schedule('thermostat_status', self.__run,
+                                                   self.__refresh_period)
+
+    def stop(self):
+        """ Stop refreshing the snapshot in the background. """
+        with self.__condition:
+            self.__running = False
+            if self.__job is not None:
+                self.__job.cancel()
+            self.__condition.notify_all()
+
+    def request_refresh(self):
+        """ Refresh the snapshot as soon as possible, the next call to get_status waits for the
+        refresh. """
+        with self.__condition:
+            self.__requests += 1
+            job = self.__job
+        if job is not None:
+            job.run_now()
+
+    def __run(self):
+        """ Refresh the snapshot, this runs in the refresh job. """
+        with self.__condition:
+            requests = self.__requests
+        try:
+            self.__refresh()
+        except Exception:
+            LOGGER.exception("Could not refresh the thermostat status")
+        with self.__condition:
+            self.__handled = max(self.__handled, requests)
+            self.__condition.notify_all()
+
+    def __refresh(self):
+        """ Read the status from the master and publish a new snapshot. """
+        status = self.__read_status()
+        thermostats = dict([(thermostat['id'], thermostat) for thermostat in status['status']])
+
+        with self.__condition:
+            old = self.__snapshot
+            old_thermostats = {} if old is None else \
+                dict([(thermostat['id'], thermostat) for thermostat in old['status']])
+            version = self.__version + 1
+
+            if old is None or any([old[field] != status[field]
+                                   for field in ThermostatStatusService.GLOBAL_FIELDS]):
+                self.__global_version = version
+            for (thermostat_id, thermostat) in thermostats.items():
+                if old_thermostats.get(thermostat_id) != thermostat:
+                    self.__versions[thermostat_id] = version
+                    self.__removed.pop(thermostat_id, None)
+            for thermostat_id in old_thermostats:
+                if thermostat_id not in thermostats:
+                    del self.__versions[thermostat_id]
+                    self.__removed[thermostat_id] = version
+
+            snapshot = dict(status)
+            snapshot['version'] = version
+            snapshot['timestamp'] = time.time()
+            self.__snapshot = snapshot
+            self.__version = version
+
+    def get_status(self):
+        """ Get the snapshot of the thermostat status. If the refresh job is running, the call
+        waits (at most refresh_timeout seconds) for the first snapshot and for the requested
+        refreshes, the status is only read by the refresh job. Otherwise the status is read in
+        the calling thread if there is no snapshot yet, if the snapshot is older than
+        refresh_period or if a refresh was requested.
+
+        :returns: the dict returned by read_status, with the 'version' and the 'timestamp' (the \
+        time of the read) of the snapshot.
+        :raises: :class`ThermostatStatusNotReadyException` if the refresh job is running and did \
+        not read the status within refresh_timeout seconds.
+        """
+        with self.__condition:
+            if self.__running:
+                end = time.time() + self.__refresh_timeout
+                requests = self.__requests
+                while self.__snapshot is None or self.__handled < requests:
+                    remaining = end - time.time()
+                    if remaining <= 0 or not self.__running:
+                        break
+                    self.__condition.wait(remaining)
+                if self.__snapshot is not None:
+                    return self.__snapshot
+                if self.__running:
+                    raise ThermostatStatusNotReadyException()
+
+            refresh = self.__snapshot is None or self.__handled < self.__requests or \
+                time.time() >= self.__snapshot['timestamp'] + self.__refresh_period
+            requests = self.__requests
+        if refresh:
+            self.__refresh()
+            with self.__condition:
+                self.__handled = max(self.__handled, requests)
+        return self.__snapshot
+
+    def get_changes(self, since=None):
+        """ Get the changes of the thermostat status since a version of the snapshot.
+
+        :param since: the version the client has, None (or a version that is unknown, eg. after a \
+        restart of the gateway) to get the full status.
+        :type since: Integer
+        :returns: dict with the 'version' and the 'timestamp' of the current snapshot, the \
+        GLOBAL_FIELDS if they changed, the thermostats that changed ('status') and the ids of the \
+        thermostats that are not active anymore ('removed').
+        :raises: :class`ThermostatStatusNotReadyException` if there is no snapshot yet, see \
+        get_status.
+        """
+        self.get_status()
+        with self.__condition:
+            snapshot = self.__snapshot
+            if since is None or since > snapshot['version']:
+                since = 0
+            changes = {'version': snapshot['version'],
+                       'timestamp': snapshot['timestamp'],
+                       'status': [thermostat for thermostat in snapshot['status']
+                                  if self.__versions.get(thermostat['id'], 0) > since],
+                       'removed': sorted([thermostat_id for (thermostat_id, version)
+                                          in self.__removed.items() if version > since])}
+            if self.__global_version > since:
+                for field in ThermostatStatusService.GLOBAL_FIELDS:
+                    changes[field] = snapshot[field]
+            return changes
+
+
+class ThermostatStatusNotReadyException(Exception):
+    """ Raised when the thermostat status is requested before the refresh job read it. """
+    def __init__(self):
+        Exception.__init__(self, "The thermostat status was not read yet")
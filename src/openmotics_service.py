@@ -21,8 +21,6 @@ The main module for the OpenMotics
 import logging
 import sys
 import os
-import time
-import threading
 
 os.environ['PYTHON_EGG_CACHE'] = '/tmp/.eggs-cache/'
 for egg in os.listdir('/opt/openmotics/python/eggs'):
@@ -35,7 +33,8 @@ from ConfigParser import ConfigParser
 
 import constants
 
-from serial_utils import RS485
+from serial_utils import RS485, SerialReader
+from task_scheduler import TaskScheduler
 
 from gateway.webservice import WebInterface, WebService
 from gateway.gateway_api import GatewayApi
@@ -69,11 +68,14 @@ def setup_logger():
 
 
 def led_driver(led_service, master_communicator, power_communicator):
-    """ Blink the serial leds if necessary. """
-    master = (0, 0)
-    power = (0, 0)
+    """ Create the job that blinks the serial leds if necessary. """
+    state = {'master': (0, 0), 'power': (0, 0)}
+
+    def blink():
+        """ Blink the serial leds if there was serial activity since the previous run. """
+        master = state['master']
+        power = state['power']
 
-    while True:
         if master[0] != master_communicator.get_bytes_read() \
                 or master[1] != master_communicator.get_bytes_written():
             led_service.serial_activity(5)
@@ -82,9 +84,12 @@ def led_driver(led_service, master_communicator, power_communicator):
                 or power[1] != power_communicator.get_bytes_written():
             led_service.serial_activity(4)
 
-        master = (master_communicator.get_bytes_read(), master_communicator.get_bytes_written())
-        power = (power_communicator.get_bytes_read(), power_communicator.get_bytes_written())
-        time.sleep(0.100)
+        state['master'] = (master_communicator.get_bytes_read(),
+                           master_communicator.get_bytes_written())
+        state['power'] = (power_communicator.get_bytes_read(),
+                          power_communicator.get_bytes_written())
+
+    return blink
 
 
 def main():
@@ -98,30 +103,46 @@ def main():
     passthrough_serial_port = config.get('OpenMotics', 'passthrough_serial')
     power_serial_port = config.get('OpenMotics', 'power_serial')
     gateway_uuid = config.get('OpenMotics', 'uuid')
+    eeprom_write_behind = config.has_option('OpenMotics', 'eeprom_write_behind') and \
+                          config.getboolean('OpenMotics', 'eeprom_write_behind')
+    eeprom_warmup = not config.has_option('OpenMotics', 'eeprom_warmup') or \
+                    config.getboolean('OpenMotics', 'eeprom_warmup')
 
     user_controller = UserController(constants.get_config_database_file(), defaults, 3600)
     config_controller = ConfigurationController(constants.get_config_database_file())
 
     led_service = LedService()
 
+    serial_reader = SerialReader()
+    serial_reader.start()
+
+    scheduler = TaskScheduler(workers=5)
+    scheduler.start()
+
     controller_serial = Serial(controller_serial_port, 115200)
     passthrough_serial = Serial(passthrough_serial_port, 115200)
-    power_serial = RS485(Serial(power_serial_port, 115200, timeout=None))
+    power_serial = RS485(Serial(power_serial_port, 115200, timeout=None), serial_reader)
 
-    master_communicator = MasterCommunicator(controller_serial)
+    master_communicator = MasterCommunicator(controller_serial, serial_reader=serial_reader)
     master_communicator.start()
 
     power_controller = PowerController(constants.get_power_database_file())
 
-    power_communicator = PowerCommunicator(power_serial, power_controller)
+    power_communicator = PowerCommunicator(power_serial, power_controller, scheduler=scheduler)
     power_communicator.start()
 
-    gateway_api = GatewayApi(master_communicator, power_communicator, power_controller)
+    gateway_api = GatewayApi(master_communicator, power_communicator, power_controller,
+                             eeprom_write_behind, scheduler)
+    if eeprom_warmup:
+        gateway_api.start_eeprom_warmup()
+    gateway_api.start_output_reader()
+    gateway_api.start_thermostat_service()
 
     maintenance_service = MaintenanceService(gateway_api, constants.get_ssl_private_key_file(),
                                              constants.get_ssl_certificate_file())
 
-    passthrough_service = PassthroughService(master_communicator, passthrough_serial)
+    passthrough_service = PassthroughService(master_communicator, passthrough_serial,
+                                             serial_reader=serial_reader)
     passthrough_service.start()
 
     web_interface = WebInterface(user_controller, gateway_api,
@@ -133,8 +154,8 @@ def main():
     web_interface.set_plugin_controller(plugin_controller)
     gateway_api.set_plugin_controller(plugin_controller)
 
-    metrics_collector = MetricsCollector(gateway_api)
-    metrics_controller = MetricsController(plugin_controller, metrics_collector, config_controller, gateway_uuid)
+    metrics_collector = MetricsCollector(gateway_api, scheduler)
+    metrics_controller = MetricsController(plugin_controller, metrics_collector, config_controller, gateway_uuid, scheduler)
 
     metrics_collector.set_controllers(metrics_controller, plugin_controller)
     metrics_collector.set_plugin_intervals(plugin_controller.metric_intervals)
@@ -149,8 +170,8 @@ def main():
     web_service = WebService(web_interface)
 
     def _on_output(*args, **kwargs):
+        gateway_api.on_outputs(*args, **kwargs)  # Updates the device state for the collector
         metrics_collector.on_output(*args, **kwargs)
-        gateway_api.on_outputs(*args, **kwargs)
     
     def _on_input(*args, **kwargs):
         metrics_collector.on_input(*args, **kwargs)
@@ -170,11 +191,8 @@ def main():
 
     led_service.set_led('stat2', True)
 
-    led_thread = threading.Thread(target=led_driver, args=(led_service,
-                                                           master_communicator, power_communicator))
-    led_thread.setName("Serial led driver thread")
-    led_thread.daemon = True
-    led_thread.start()
+    scheduler.schedule('led_driver', led_driver(led_service, master_communicator,
+                                                power_communicator), 0.1)
 
     def stop(signum, frame):
         """ This function is called on SIGTERM. """
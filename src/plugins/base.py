@@ -27,6 +27,7 @@ import traceback
 from collections import deque
 from datetime import datetime
 from plugins.decorators import *  # Import for backwards compatibility
+from task_scheduler import TaskScheduler
 
 try:
     import json
@@ -103,16 +104,25 @@ class PluginController(object):
     def __init__(self, webinterface):
         self.__webinterface = webinterface
 
-        self.__stopped = False
         self.__logs = {}
         self.__plugins = self._gather_plugins()
 
+        # The metric receivers are plugin code: they are delivered by a scheduler of their own
+        # (not the scheduler of the gateway), with a worker per plugin that receives metrics, so
+        # a slow plugin doesn't delay the gateway or the other plugins.
+        self.__delivery_scheduler = None
+        receiving = [plugin for plugin in self.__plugins
+                     if len(PluginController._get_special_methods(plugin, 'metric_receive')) > 0]
+        if len(receiving) > 0:
+            self.__delivery_scheduler = TaskScheduler(workers=len(receiving))
+            self.__delivery_scheduler.start()
+
         self.__input_status_receivers = []
         self.__output_status_receivers = []
         self.__event_receivers = []
         self.__metric_collectors = []
         self.__metric_receivers = []
-        self.__metric_receiver_threads = {}
+        self.__metric_receiver_jobs = {}
         self.__metrics_controller = None
         self.metric_receiver_queues = {}
         self.metric_intervals = []
@@ -138,14 +148,16 @@ class PluginController(object):
                     self.metric_intervals.append(metric_receive)
             if method_attribute == 'metric_receive':
                 self.metric_receiver_queues[plugin.name] = deque()
-                thread = threading.Thread(target=self.__deliver_metrics, args=(plugin.name,))
-                thread.setName('Metric delivery thread ({0})'.format(plugin.name))
-                thread.daemon = True
-                thread.start()
-                self.__metric_receiver_threads[plugin.name] = thread
+                if self.__delivery_scheduler is not None:
+                    # The delivery job only runs when metrics were put in the queue of the plugin
+                    job = self.__delivery_scheduler.schedule(
+                        'metric_delivery_{0}'.format(plugin.name),
+                        lambda name=plugin.name: self.__deliver_metrics(name), delay=None)
+                    self.__metric_receiver_jobs[plugin.name] = job
 
     def stop(self):
-        self.__stopped = True
+        if self.__delivery_scheduler is not None:
+            self.__delivery_scheduler.stop()
 
     def start_plugins(self):
         """ Start the background tasks for the plugins and expose them via the webinterface. """
@@ -497,6 +509,7 @@ else:
                 metric_types = self.__metrics_controller.get_filter('metric_type', metadata['metric_type'])
                 if metric['source'] in sources and metric['type'] in metric_types:
                     self.metric_receiver_queues[mr[0]].appendleft(metric)
+                    self.__metric_receiver_jobs[mr[0]].run_now()
                     delivery_count += 1
             except Exception as exception:
                 self.log(mr[0], "Exception while distributing metrics", exception, traceback.format_exc())
@@ -504,19 +517,19 @@ else:
 
     def __deliver_metrics(self, plugin):
         """ Delivers enqueued metrics to plugin listener(s) """
-        # Yield all metrics in the Queue
-        while self.__stopped is False:
+        # Deliver all metrics in the Queue
+        while True:
             try:
                 data = self.metric_receiver_queues[plugin].pop()
-                for mr in self.__metric_receivers:
-                    if mr[0] != plugin:
-                        continue
-                    try:
-                        mr[1](data)
-                    except Exception as exception:
-                        self.log(mr[0], "Exception while delivering metrics", exception, traceback.format_exc())
             except IndexError:
-                time.sleep(0.1)
+                return  # The queue is empty
+            for mr in self.__metric_receivers:
+                if mr[0] != plugin:
+                    continue
+                try:
+                    mr[1](data)
+                except Exception as exception:
+                    self.log(mr[0], "Exception while delivering metrics", exception, traceback.format_exc())
 
     def get_metric_definitions(self):
         """ Loads all metric definitions of all plugins """
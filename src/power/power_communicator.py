@@ -21,10 +21,9 @@ Module to communicate with the power modules.
 import logging
 import traceback
 import time
-import Queue
 import power.power_api as power_api
 from threading import Thread, RLock
-from serial_utils import printable, CommunicationTimedOutException
+from serial_utils import printable, CommunicationTimedOutException, FlightRecorder
 from power.power_command import crc7
 from power.time_keeper import TimeKeeper
 
@@ -35,18 +34,22 @@ class PowerCommunicator(object):
     """ Uses a serial port to communicate with the power modules. """
 
     def __init__(self, serial, power_controller, verbose=False, time_keeper_period=60,
-                 address_mode_timeout=300):
+                 address_mode_timeout=300, scheduler=None):
         """ Default constructor.
 
         :param serial: Serial port to communicate with
         :type serial: Instance of :class`RS485`
         :param verbose: Print all serial communication to stdout.
         :type verbose: boolean.
+        :param scheduler: runs the job of the TimeKeeper, the TimeKeeper creates a TaskScheduler \
+        if None.
+        :type scheduler: :class`task_scheduler.TaskScheduler`
         """
         self.__serial = serial
         self.__serial_lock = RLock()
         self.__serial_bytes_written = 0
         self.__serial_bytes_read = 0
+        self.__flight_recorder = FlightRecorder(FlightRecorder.POWER)
         self.__cid = 1
 
         self.__address_mode = False
@@ -58,7 +61,8 @@ class PowerCommunicator(object):
         self.__last_success = 0
 
         if time_keeper_period != 0:
-            self.__time_keeper = TimeKeeper(self, power_controller, time_keeper_period)
+            self.__time_keeper = TimeKeeper(self, power_controller, time_keeper_period,
+                                            scheduler)
         else:
             self.__time_keeper = None
 
@@ -93,14 +97,26 @@ class PowerCommunicator(object):
         if data is not None:
             LOGGER.info("%.3f %s power: %s" % (time.time(), action, printable(data)))
 
-    def __write_to_serial(self, data):
+    def get_flight_records(self, since=None):
+        """ Get the recent traffic on the serial port, see :class`serial_utils.FlightRecorder`.
+
+        :param since: only return the traffic after this timestamp, all records if None.
+        :type since: float
+        :returns: list of tuples (timestamp, port, direction, cid, data).
+        """
+        return self.__flight_recorder.get_records(since)
+
+    def __write_to_serial(self, data, cid=None):
         """ Write data to the serial port.
 
         :param data: the data to write
         :type data: string
+        :param cid: the communication id of the command, None if unknown.
+        :type cid: integer
         """
         if self.__verbose:
             self.__log('writing to', data)
+        self.__flight_recorder.record(FlightRecorder.WRITE, data, cid)
         self.__serial.write(data)
         self.__serial_bytes_written += len(data)
 
@@ -125,7 +141,7 @@ class PowerCommunicator(object):
             """ Send the command once. """
             cid = self.__get_cid()
             send_data = _cmd.create_input(_address, cid, *_data)
-            self.__write_to_serial(send_data)
+            self.__write_to_serial(send_data, cid)
 
             if _address == power_api.BROADCAST_ADDRESS:
                 return None  # No reply on broadcast messages !
@@ -268,77 +284,45 @@ class PowerCommunicator(object):
 
     def __read_from_serial(self):
         """ Read a PowerCommand from the serial port. """
-        phase = 0
-        index = 0
-
+        command = []
+        error = False
         header = ""
-        length = 0
-        data = ""
-        crc = 0
 
-        command = ""
-        error = False
+        def read(size):
+            """ Read size bytes, the bytes should arrive within 0.25 seconds of each other. """
+            data = ""
+            while len(data) < size:
+                chunk = self.__serial.read(size - len(data), 0.25)
+                if len(chunk) == 0:
+                    raise CommunicationTimedOutException()
+                data += chunk
+            command.append(data)
+            self.__serial_bytes_read += size
+            return data
 
         try:
-            while phase < 8:
-                byte = self.__serial.read_queue.get(True, 0.25)
-                command += byte
-                self.__serial_bytes_read += 1
-                if phase == 0:  # Skip non 'R' bytes
-                    if byte == 'R':
-                        phase = 1
-                    else:
-                        phase = 0
-                elif phase == 1:  # Expect 'T'
-                    if byte == 'T':
-                        phase = 2
-                    else:
-                        raise Exception("Unexpected character")
-                elif phase == 2:  # Expect 'R'
-                    if byte == 'R':
-                        phase = 3
-                        index = 0
-                    else:
-                        raise Exception("Unexpected character")
-                elif phase == 3:  # Read the header fields
-                    header += byte
-                    index += 1
-                    if index == 8:
-                        length = ord(byte)
-                        if length > 0:
-                            phase = 4
-                            index = 0
-                        else:
-                            phase = 5
-                elif phase == 4:  # Read the data
-                    data += byte
-                    index += 1
-                    if index == length:
-                        phase = 5
-                elif phase == 5:  # Read the CRC code
-                    crc = ord(byte)
-                    phase = 6
-                elif phase == 6:  # Expect '\r'
-                    if byte == '\r':
-                        phase = 7
-                    else:
-                        raise Exception("Unexpected character")
-                elif phase == 7:  # Expect '\n'
-                    if byte == '\n':
-                        phase = 8
-                    else:
-                        raise Exception("Unexpected character")
+            while read(1) != 'R':  # Skip non 'R' bytes
+                pass
+            if read(2) != 'TR':
+                raise Exception("Unexpected character")
+
+            header = read(8)
+            data = read(ord(header[-1]))
+            crc = ord(read(1))
+
+            if read(2) != '\r\n':
+                raise Exception("Unexpected character")
             if crc7(header + data) != crc:
                 raise Exception("CRC doesn't match")
-        except Queue.Empty:
-            error = True
-            raise CommunicationTimedOutException()
         except Exception:
             error = True
             raise
         finally:
+            if len(command) > 0:
+                self.__flight_recorder.record(FlightRecorder.READ, "".join(command),
+                                              ord(header[2]) if len(header) == 8 else None)
             if self.__verbose or error is True:
-                self.__log('reading from', command)
+                self.__log('reading from', "".join(command))
 
         return header, data
 
@@ -19,55 +19,50 @@
 import logging
 LOGGER = logging.getLogger("openmotics")
 
-import time
 from datetime import datetime
-from threading import Thread
 
 import power.power_api as power_api
+from task_scheduler import TaskScheduler
 
 class TimeKeeper(object):
     """ The TimeKeeper keeps track of time and sets the day or night mode on the power modules. """
 
-    def __init__(self, power_communicator, power_controller, period):
+    def __init__(self, power_communicator, power_controller, period, scheduler=None):
         self.__power_communicator = power_communicator
         self.__power_controller = power_controller
         self.__period = period
+        self.__scheduler = scheduler
 
         self.__mode = {}
 
-        self.__thread = None
-        self.__stop = False
+        self.__job = None
 
     def start(self):
-        """ Start the background thread of the TimeKeeper. """
-        if self.__thread == None:
+        """ Start the periodic job of the TimeKeeper. """
+        if self.__job == None:
             LOGGER.info("Starting TimeKeeper")
-            self.__stop = False
-            self.__thread = Thread(target=self.__run, name="TimeKeeper thread")
-            self.__thread.daemon = True
-            self.__thread.start()
+            if self.__scheduler is None:
+                self.__scheduler = TaskScheduler(workers=1)
+                self.__scheduler.start()
+            self.__job = self.__scheduler.schedule('time_keeper', self.__run, self.__period)
         else:
-            raise Exception("TimeKeeper thread already running.")
+            raise Exception("TimeKeeper already running.")
 
     def stop(self):
-        """ Stop the background thread in the TimeKeeper. """
-        if self.__thread != None:
-            self.__stop = True
+        """ Stop the periodic job of the TimeKeeper. """
+        if self.__job != None:
+            self.__job.cancel()
+            self.__job = None
+            LOGGER.info("Stopped TimeKeeper")
         else:
-            raise Exception("TimeKeeper thread not running.")
+            raise Exception("TimeKeeper not running.")
 
     def __run(self):
-        """ Code for the background thread. """
-        while not self.__stop:
-            try:
-                self.__run_once()
-            except:
-                LOGGER.exception("Exception in TimeKeeper")
-
-            time.sleep(self.__period)
-
-        LOGGER.info("Stopped TimeKeeper")
-        self.__thread = None
+        """ One run of the periodic job. """
+        try:
+            self.__run_once()
+        except:
+            LOGGER.exception("Exception in TimeKeeper")
 
     def __run_once(self):
         """ One run of the background thread. """
@@ -13,16 +13,20 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
-Serial tools contains the RS485 wrapper, printable and CommunicationTimedOutException.
+Serial tools contains the SerialReader, the RS485 wrapper, the FlightRecorder, printable and
+CommunicationTimedOutException.
 
 @author: fryckbos
 """
 
+import os
 import time
+import errno
+import select
 import struct
 import fcntl
-from threading import Thread
-from Queue import Queue
+import itertools
+from threading import Thread, Lock, Condition
 
 
 class CommunicationTimedOutException(Exception):
@@ -39,11 +43,271 @@ def printable(string):
     return hex_notation + "    " + readable
 
 
+class FlightRecorder(object):
+    """ Records the raw traffic on a serial port in a fixed-size ring buffer, so the last traffic
+    can be inspected after a problem. Recording does not format anything: it stores a tuple with
+    the time, direction, cid and the bytes. The records are exported with encode_records and
+    decoded with decode_records.
+    """
+
+    READ = 0
+    WRITE = 1
+
+    MASTER = 0
+    POWER = 1
+
+    def __init__(self, port, size=2048):
+        """ Create a FlightRecorder.
+
+        :param port: the port that is recorded (FlightRecorder.MASTER or FlightRecorder.POWER).
+        :type port: integer
+        :param size: the number of records that are kept.
+        :type size: integer
+        """
+        self.__port = port
+        self.__size = size
+        self.__records = [None] * size
+        self.__counter = itertools.count()  # next() is atomic, recording does not need a lock
+
+    def record(self, direction, data, cid=None):
+        """ Record data that was read from or written to the serial port.
+
+        :param direction: FlightRecorder.READ or FlightRecorder.WRITE
+        :param data: the bytes on the serial port.
+        :type data: string
+        :param cid: the communication id, None if unknown.
+        :type cid: integer
+        """
+        index = next(self.__counter)
+        self.__records[index % self.__size] = (time.time(), self.__port, direction, cid, data)
+
+    def get_records(self, since=None):
+        """ Get the records, the oldest first.
+
+        :param since: only return the records after this timestamp, all records if None.
+        :type since: float
+        :returns: list of tuples (timestamp, port, direction, cid, data).
+        """
+        records = sorted([record for record in self.__records if record is not None])
+        if since is not None:
+            records = [record for record in records if record[0] >= since]
+        return records
+
+
+FLIGHT_RECORDER_MAGIC = 'OMFR\x01'
+FLIGHT_RECORDER_HEADER = struct.Struct('<dBBhH')
+
+
+def encode_records(records):
+    """ Encode flight recorder records in a compact binary format: a magic string, followed by
+    a header (timestamp, port, direction, cid or -1, length) and the bytes for each record.
+    The bytes of a record are truncated to 64kB.
+
+    :param records: list of tuples (timestamp, port, direction, cid, data).
+    :returns: string of bytes.
+    """
+    output = [FLIGHT_RECORDER_MAGIC]
+    for (timestamp, port, direction, cid, data) in records:
+        data = data[:0xFFFF]
+        output.append(FLIGHT_RECORDER_HEADER.pack(timestamp, port, direction,
+                                                  -1 if cid is None else cid, len(data)))
+        output.append(data)
+    return "".join(output)
+
+
+def decode_records(dump):
+    """ Decode the output of encode_records.
+
+    :param dump: string of bytes.
+    :returns: list of tuples (timestamp, port, direction, cid, data).
+    :raises: ValueError if the dump is not valid.
+    """
+    if not dump.startswith(FLIGHT_RECORDER_MAGIC):
+        raise ValueError("Not a flight recorder dump")
+
+    records = []
+    offset = len(FLIGHT_RECORDER_MAGIC)
+    while offset < len(dump):
+        if offset + FLIGHT_RECORDER_HEADER.size > len(dump):
+            raise ValueError("Truncated flight recorder dump")
+        (timestamp, port, direction, cid, length) = \
+            FLIGHT_RECORDER_HEADER.unpack_from(dump, offset)
+        offset += FLIGHT_RECORDER_HEADER.size
+        if offset + length > len(dump):
+            raise ValueError("Truncated flight recorder dump")
+        records.append((timestamp, port, direction, None if cid == -1 else cid,
+                        dump[offset:offset + length]))
+        offset += length
+    return records
+
+
+def format_records(records):
+    """ Format flight recorder records as text, one line per record.
+
+    :param records: list of tuples (timestamp, port, direction, cid, data).
+    :returns: list of strings.
+    """
+    ports = {FlightRecorder.MASTER: 'master', FlightRecorder.POWER: 'power'}
+    directions = {FlightRecorder.READ: 'read from', FlightRecorder.WRITE: 'write to'}
+    return ["%.3f %-9s %-6s cid %3s: %s" % (timestamp, directions.get(direction, direction),
+                                            ports.get(port, port),
+                                            '-' if cid is None else cid, printable(data))
+            for (timestamp, port, direction, cid, data) in records]
+
+
+class SerialReader(object):
+    """ Reads from multiple serial ports in one thread. The thread waits on the file descriptors
+    of all ports using epoll (poll if epoll is not available) and reads the available bytes in
+    chunks of READ_SIZE. The data is handed to the callback of the port in the reader thread, so
+    the callbacks should not block.
+
+    A port without file descriptor (eg. a mock in the tests) can't be polled: it gets a thread
+    that blocks on read(1) and reads the bytes in waiting.
+    """
+
+    READ_SIZE = 4096
+
+    def __init__(self):
+        """ Create a SerialReader, the reader thread is started by start(). """
+        self.__lock = Lock()
+        self.__ports = {}  # maps the file descriptor to a tuple (serial, callback)
+        self.__blocking_ports = set()
+        self.__stop = False
+
+        self.__poller = select.epoll() if hasattr(select, 'epoll') else select.poll()
+        (self.__wakeup_read, self.__wakeup_write) = os.pipe()
+        self.__poller.register(self.__wakeup_read, select.POLLIN)
+
+        self.__reads = 0
+        self.__bytes_read = 0
+
+        self.__thread = Thread(target=self.__read, name="SerialReader thread")
+        self.__thread.daemon = True
+
+    def start(self):
+        """ Start the reader thread. """
+        self.__thread.start()
+
+    def stop(self):
+        """ Stop the reader thread and the threads of the ports without file descriptor. """
+        self.__stop = True
+        self.__wakeup()
+
+    def add(self, serial, callback):
+        """ Start reading from a serial port.
+
+        :param serial: the serial port
+        :type serial: :class`serial.Serial` or an object that replicates the pyserial interface.
+        :param callback: function that is called with the data read from the port.
+        :type callback: function
+        """
+        fileno = serial.fileno()
+        if fileno is None:
+            with self.__lock:
+                self.__blocking_ports.add(serial)
+            thread = Thread(target=self.__read_blocking, args=(serial, callback),
+                            name="SerialReader blocking thread")
+            thread.daemon = True
+            thread.start()
+        else:
+            with self.__lock:
+                self.__ports[fileno] = (serial, callback)
+            self.__poller.register(fileno, select.POLLIN)
+            self.__wakeup()
+
+    def remove(self, serial):
+        """ Stop reading from a serial port. A port without file descriptor stops reading after
+        its current read.
+
+        :param serial: the serial port
+        """
+        with self.__lock:
+            self.__blocking_ports.discard(serial)
+            for (fileno, (port, _)) in self.__ports.items():
+                if port is serial:
+                    del self.__ports[fileno]
+                    self.__poller.unregister(fileno)
+
+    def get_statistics(self):
+        """ Get the number of reads on the polled ports and the number of bytes read.
+
+        :returns: dict with 'reads' and 'bytes_read'.
+        """
+        return {'reads': self.__reads, 'bytes_read': self.__bytes_read}
+
+    def __wakeup(self):
+        """ Wake up the reader thread, so it polls the current set of ports. """
+        os.write(self.__wakeup_write, 'w')
+
+    def __read(self):
+        """ Code for the reader thread: wait until a port is readable and read its bytes. """
+        while not self.__stop:
+            try:
+                events = self.__poller.poll()
+            except (IOError, select.error), error:
+                if error.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            if self.__stop:
+                break
+
+            for (fileno, _) in events:
+                if fileno == self.__wakeup_read:
+                    os.read(self.__wakeup_read, SerialReader.READ_SIZE)
+                    continue
+
+                with self.__lock:
+                    port = self.__ports.get(fileno)
+                if port is None:
+                    continue
+
+                try:
+                    data = os.read(fileno, SerialReader.READ_SIZE)
+                except OSError, error:
+                    if error.errno in (errno.EAGAIN, errno.EINTR):
+                        continue
+                    data = ''
+
+                if len(data) == 0:
+                    # The port was closed or hung up, polling it would spin.
+                    print 'Error in reader: lost port {0}'.format(fileno)
+                    self.remove(port[0])
+                    continue
+
+                self.__reads += 1
+                self.__bytes_read += len(data)
+                try:
+                    port[1](data)
+                except Exception as ex:
+                    print 'Error in reader: {0}'.format(ex)
+
+    def __read_blocking(self, serial, callback):
+        """ Code for the thread of a port without file descriptor. """
+        while not self.__stop and serial in self.__blocking_ports:
+            try:
+                data = serial.read(1)
+                size = serial.inWaiting()
+                if size > 0:
+                    data += serial.read(size)
+                if len(data) > 0:
+                    callback(data)
+            except Exception as ex:
+                print 'Error in reader: {0}'.format(ex)
+
+
 class RS485(object):
     """ Replicates the pyserial interface. """
 
-    def __init__(self, serial):
-        """ Initialize a rs485 connection using the serial port. """
+    def __init__(self, serial, serial_reader=None):
+        """ Initialize a rs485 connection using the serial port.
+
+        :param serial: the serial port
+        :type serial: :class`serial.Serial`
+        :param serial_reader: reads from the serial port, a SerialReader is created and started \
+        for this port if None.
+        :type serial_reader: :class`SerialReader`
+        """
         self.__serial = serial
         fileno = serial.fileno()
         if fileno is not None:
@@ -51,24 +315,47 @@ class RS485(object):
             fcntl.ioctl(fileno, 0x542F, serial_rs485)
 
         serial.timeout = None
-        self.__thread = Thread(target=self._reader)
-        self.__thread.daemon = True
-        self.__thread.start()
-        self.read_queue = Queue()
+        self.__buffer = bytearray()
+        self.__condition = Condition()
+
+        if serial_reader is None:
+            serial_reader = SerialReader()
+            serial_reader.start()
+        serial_reader.add(serial, self.__received)
 
     def write(self, data):
         """ Write data to serial port """
         self.__serial.write(data)
 
-    def _reader(self):
-        try:
-            while True:
-                byte = self.__serial.read(1)
-                if len(byte) == 1:
-                    self.read_queue.put(byte)
-                size = self.__serial.inWaiting()
-                if size > 0:
-                    for byte in self.__serial.read(size):
-                        self.read_queue.put(byte)
-        except Exception as ex:
-            print 'Error in reader: {0}'.format(ex)
+    def read(self, size, timeout=None):
+        """ Read at most size bytes, blocks until at least one byte is available.
+
+        :param size: the maximum number of bytes to read
+        :type size: integer
+        :param timeout: the maximum number of seconds to wait, wait forever if None.
+        :type timeout: float
+        :returns: string with the bytes read, an empty string on timeout.
+        """
+        with self.__condition:
+            if len(self.__buffer) == 0:
+                end = None if timeout is None else time.time() + timeout
+                while len(self.__buffer) == 0:
+                    remaining = None if end is None else end - time.time()
+                    if remaining is not None and remaining <= 0:
+                        return ''
+                    self.__condition.wait(remaining)
+
+            data = str(self.__buffer[:size])
+            del self.__buffer[:size]
+            return data
+
+    def inWaiting(self): #pylint: disable=C0103
+        """ Get the number of bytes pending to be read """
+        with self.__condition:
+            return len(self.__buffer)
+
+    def __received(self, data):
+        """ Called by the SerialReader: add the data to the buffer. """
+        with self.__condition:
+            self.__buffer.extend(data)
+            self.__condition.notify_all()
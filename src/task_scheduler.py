@@ -0,0 +1,312 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+The task scheduler runs the periodic and one-shot jobs of the gateway on a small pool of worker
+threads, instead of a thread (or a Timer) per job.
+"""
+
+import os
+import heapq
+import logging
+import select
+import time
+from Queue import Queue
+from threading import Thread, Lock, current_thread
+
+LOGGER = logging.getLogger("openmotics")
+
+
+class Job(object):
+    """ A job of the TaskScheduler, created by :meth`TaskScheduler.schedule`. A job never runs
+    concurrently with itself: a job that is due while it is running, runs right after the
+    current run.
+    """
+
+    def __init__(self, scheduler, name, function, interval):
+        """ Create a Job, use TaskScheduler.schedule. """
+        self.__scheduler = scheduler
+        self.name = name
+        self.function = function
+        self.interval = interval
+
+        # The state below is protected by the lock of the scheduler.
+        self.due = None  # the time of the next run, None if the job is not scheduled
+        self.anchor = None  # the due time of the last run
+        self.running = False
+        self.again = None  # the time to run again after the current run, None if not requested
+        self.cancelled = False
+
+        self.runs = 0
+        self.errors = 0
+        self.overruns = 0
+        self.last_run_time = 0.0
+        self.max_run_time = 0.0
+        self.total_run_time = 0.0
+        self.last_lateness = 0.0
+        self.max_lateness = 0.0
+
+    def run_now(self):
+        """ Run the job as soon as possible, a periodic job keeps its interval after the run. """
+        self.__scheduler.reschedule(self, 0)
+
+    def run_after(self, delay):
+        """ Run the job after a delay (in seconds), a run that was due earlier is postponed: a
+        job that is run_after every change runs once the changes stopped for delay seconds. """
+        self.__scheduler.reschedule(self, delay, postpone=True)
+
+    def set_interval(self, interval):
+        """ Change the interval of a periodic job. The next run is moved forward if the last run
+        plus the new interval is earlier than the next run. """
+        self.__scheduler.set_interval(self, interval)
+
+    def cancel(self):
+        """ Don't run the job anymore, a running job finishes its current run. """
+        self.__scheduler.cancel(self)
+
+    def get_statistics(self):
+        """ Get the statistics of the job.
+
+        :returns: dict with the 'interval' (None for a one-shot job), the number of 'runs', the \
+        number of runs that raised an exception ('errors'), the number of runs that took longer \
+        than the interval ('overruns'), the 'last', 'max' and 'avg' 'run_time' and the 'last' \
+        and 'max' 'lateness' (the time between the due time and the start of a run) in seconds.
+        """
+        return {'interval': self.interval,
+                'runs': self.runs,
+                'errors': self.errors,
+                'overruns': self.overruns,
+                'last_run_time': self.last_run_time,
+                'max_run_time': self.max_run_time,
+                'avg_run_time': self.total_run_time / self.runs if self.runs > 0 else 0.0,
+                'last_lateness': self.last_lateness,
+                'max_lateness': self.max_lateness}
+
+
+class TaskScheduler(object):
+    """ Runs jobs at their due time. The due times are kept in a heap, a dispatcher thread sleeps
+    until the first job is due and hands the due jobs to a pool of worker threads. The dispatcher
+    waits in select on a pipe, that is written when a job gets an earlier due time: there are no
+    wakeups when no job is due (a Condition with a timeout polls in Python 2).
+
+    A periodic job runs every interval seconds (measured from the due time of the previous run,
+    so the runs don't drift). When a run takes longer than the interval, the overrun is counted
+    and the next run starts right after the current run: runs are not queued up.
+    """
+
+    def __init__(self, workers=3):
+        """ Create a TaskScheduler, the threads are started by start().
+
+        :param workers: the number of worker threads, the number of jobs that can run at the \
+        same time.
+        :type workers: Integer
+        """
+        self.__lock = Lock()
+        (self.__wakeup_read, self.__wakeup_write) = os.pipe()
+        self.__heap = []  # tuples (due, sequence number, job)
+        self.__sequence = 0
+        self.__jobs = []
+        self.__queue = Queue()
+        self.__started = False
+        self.__stopped = False
+        self.__closed = False
+
+        self.__dispatcher = Thread(target=self.__dispatch, name="TaskScheduler dispatcher")
+        self.__dispatcher.daemon = True
+        self.__workers = []
+        for i in range(workers):
+            worker = Thread(target=self.__work, name="TaskScheduler worker %d" % i)
+            worker.daemon = True
+            self.__workers.append(worker)
+
+    def start(self):
+        """ Start the dispatcher and the worker threads. """
+        self.__started = True
+        self.__dispatcher.start()
+        for worker in self.__workers:
+            worker.start()
+
+    def stop(self, timeout=5.0):
+        """ Stop the threads, the running jobs finish their current run. The threads are
+        joined and the wakeup pipe is closed once the dispatcher stopped.
+
+        :param timeout: the maximum number of seconds to wait for the threads.
+        :type timeout: float
+        """
+        with self.__lock:
+            if self.__stopped:
+                return
+            self.__stopped = True
+            self.__wakeup()
+        for _ in self.__workers:
+            self.__queue.put(None)
+
+        if self.__started:
+            end = time.time() + timeout
+            for thread in [self.__dispatcher] + self.__workers:
+                if thread is not current_thread():  # A job can stop the scheduler.
+                    thread.join(max(0.0, end - time.time()))
+            if self.__dispatcher.is_alive():
+                return
+
+        with self.__lock:
+            self.__closed = True
+            os.close(self.__wakeup_read)
+            os.close(self.__wakeup_write)
+
+    def schedule(self, name, function, interval=None, delay=0):
+        """ Add a job.
+
+        :param name: the name of the job, used in the statistics and the logs.
+        :type name: str
+        :param function: the function without arguments that is run.
+        :param interval: the number of seconds between two runs, None for a one-shot job: the \
+        job runs once after the delay and again each time run_now is called.
+        :type interval: float
+        :param delay: the number of seconds until the first run, None to only run the job when \
+        run_now is called.
+        :type delay: float
+        :returns: the :class`Job`.
+        """
+        job = Job(self, name, function, interval)
+        with self.__lock:
+            self.__jobs.append(job)
+            if delay is not None:
+                job.anchor = time.time() + delay
+                self.__push(job, job.anchor)
+        return job
+
+    def __push(self, job, due):
+        """ Set the due time of a job that is not running, the lock should be held. """
+        job.due = due
+        self.__sequence += 1
+        if len(self.__heap) == 0 or due < self.__heap[0][0]:
+            self.__wakeup()
+        heapq.heappush(self.__heap, (due, self.__sequence, job))
+
+    def __wakeup(self):
+        """ Wake up the dispatcher thread, the lock should be held. """
+        if not self.__closed:
+            os.write(self.__wakeup_write, 'x')
+
+    def reschedule(self, job, delay, postpone=False):
+        """ Run a job after a delay (in seconds), see :meth`Job.run_now` and
+        :meth`Job.run_after`. A run that was due earlier is only postponed if postpone is True.
+        """
+        with self.__lock:
+            if job.cancelled:
+                return
+            due = time.time() + delay
+            if job.running:
+                if job.again is None or due < job.again or postpone:
+                    job.again = due
+            elif job.due is None or due < job.due or postpone:
+                self.__push(job, due)
+
+    def set_interval(self, job, interval):
+        """ Change the interval of a job, see :meth`Job.set_interval`. """
+        with self.__lock:
+            job.interval = interval
+            if not job.running and not job.cancelled and job.anchor is not None:
+                due = job.anchor + interval
+                if job.due is None or due < job.due:
+                    self.__push(job, due)
+
+    def cancel(self, job):
+        """ Cancel a job, see :meth`Job.cancel`. """
+        with self.__lock:
+            job.cancelled = True
+            job.due = None
+            if job in self.__jobs:
+                self.__jobs.remove(job)
+
+    def __dispatch(self):
+        """ Hand the due jobs to the workers, this runs in the dispatcher thread. """
+        while True:
+            with self.__lock:
+                if self.__stopped:
+                    return
+                now = time.time()
+                while len(self.__heap) > 0 and self.__heap[0][0] <= now:
+                    (due, _, job) = heapq.heappop(self.__heap)
+                    if job.due != due or job.cancelled:
+                        continue  # The job was rescheduled or cancelled.
+                    job.due = None
+                    job.running = True
+                    self.__queue.put((job, due))
+                timeout = self.__heap[0][0] - now if len(self.__heap) > 0 else None
+
+            if timeout is None:
+                readable = select.select([self.__wakeup_read], [], [])[0]
+            else:
+                readable = select.select([self.__wakeup_read], [], [], timeout)[0]
+            if len(readable) > 0:
+                os.read(self.__wakeup_read, 1024)
+
+    def __work(self):
+        """ Run the jobs, this runs in the worker threads. """
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            (job, due) = item
+
+            start = time.time()
+            try:
+                job.function()
+            except Exception:
+                job.errors += 1
+                LOGGER.exception("Exception in job %s", job.name)
+            end = time.time()
+
+            with self.__lock:
+                run_time = end - start
+                job.runs += 1
+                job.last_run_time = run_time
+                job.max_run_time = max(job.max_run_time, run_time)
+                job.total_run_time += run_time
+                job.last_lateness = max(0.0, start - due)
+                job.max_lateness = max(job.max_lateness, job.last_lateness)
+
+                job.running = False
+                job.anchor = due
+                if job.cancelled:
+                    continue
+                again = None if job.again is None else max(end, job.again)
+                if job.interval is not None:
+                    next_due = due + job.interval
+                    if next_due < end:
+                        job.overruns += 1
+                        (job.anchor, next_due) = (end - job.interval, end)
+                    self.__push(job, next_due if again is None else min(again, next_due))
+                elif again is not None:
+                    self.__push(job, again)
+                job.again = None
+
+    def get_statistics(self):
+        """ Get the statistics of the jobs.
+
+        :returns: dict that maps the name of a job to the statistics of the job (see \
+        :meth`Job.get_statistics`), with the number of seconds until the 'next_run' (None if \
+        the job is not scheduled) and 'running' (boolean).
+        """
+        with self.__lock:
+            now = time.time()
+            statistics = {}
+            for job in self.__jobs:
+                job_statistics = job.get_statistics()
+                job_statistics['next_run'] = None if job.due is None else max(0.0, job.due - now)
+                job_statistics['running'] = job.running
+                statistics[job.name] = job_statistics
+            return statistics
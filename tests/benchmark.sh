@@ -0,0 +1,14 @@
+#!/bin/bash -e
+export PYTHONPATH=$PYTHONPATH:`pwd`/../src
+
+echo "Running master communicator benchmarks"
+python -m benchmarks.master_communicator_benchmarks
+
+echo "Running serial utils benchmarks"
+python -m benchmarks.serial_utils_benchmarks
+
+echo "Running eeprom controller benchmarks"
+python -m benchmarks.eeprom_controller_benchmarks
+
+echo "Running simulator benchmarks"
+python -m benchmarks.simulator_benchmarks
@@ -0,0 +1,102 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Benchmarks for the EepromController: the CPU time to read the models in eeprom_models when all
+banks are cached, so no time is spent on the serial link.
+"""
+
+import os
+import time
+import inspect
+import shutil
+import tempfile
+
+import master.master_api as master_api
+import master.eeprom_models as eeprom_models
+from master.eeprom_controller import EepromController, EepromFile, EepromModel
+from master.eeprom_extension import EepromExtension
+
+
+class CachedMaster(object):
+    """ Answers the eeprom commands from a fixed eeprom: 30 input, output and shutter modules,
+    all other bytes are 255. """
+
+    def __init__(self):
+        self.__banks = ["\xff" * 256 for _ in range(256)]
+        self.__banks[0] = "\xff\x1e\x1e\x1e" + "\xff" * 252
+
+    def get_last_duration(self):
+        """ The answers are immediate. """
+        return 0.0
+
+    def do_command(self, cmd, fields=None):
+        """ Answer the eeprom_list and read_eeprom commands. """
+        bank = self.__banks[fields['bank']]
+        if cmd == master_api.eeprom_list():
+            return {'bank': fields['bank'], 'data': bank}
+        elif cmd == master_api.read_eeprom():
+            return {'bank': fields['bank'], 'addr': fields['addr'],
+                    'data': bank[fields['addr']:fields['addr'] + fields['num']]}
+        raise ValueError("Unexpected command %s" % cmd.action)
+
+
+def get_models():
+    """ Get the EepromModels in eeprom_models, sorted by name. """
+    return [model for (_, model) in inspect.getmembers(eeprom_models, inspect.isclass)
+            if issubclass(model, EepromModel) and model != EepromModel]
+
+
+def read_duration(controller, model, iterations=5):
+    """ Measure the time to read all instances of a model (or the model if it has no id).
+
+    :returns: the duration of one read in seconds.
+    """
+    if model.has_id():
+        read = lambda: controller.read_all(model)
+    else:
+        read = lambda: controller.read(model)
+
+    read()  # Fill the bank cache
+    start = time.time()
+    for _ in range(iterations):
+        read()
+    return (time.time() - start) / iterations
+
+
+def main():
+    """ Run the EepromController benchmarks. """
+    directory = tempfile.mkdtemp()
+    try:
+        controller = EepromController(
+            EepromFile(CachedMaster()),
+            EepromExtension(os.path.join(directory, 'eeprom_ext.db')))
+
+        print "Reading the eeprom models with a warm bank cache:"
+        total = 0
+        for model in get_models():
+            try:
+                duration = read_duration(controller, model)
+            except (IndexError, TypeError) as error:
+                print "  %-34s failed: %s" % (model.get_name() + ":", error)
+                continue
+            total += duration
+            print "  %-34s %7.2f ms" % (model.get_name() + ":", duration * 1000)
+        print "  %-34s %7.2f ms" % ("total:", total * 1000)
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    main()
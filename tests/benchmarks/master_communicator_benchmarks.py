@@ -0,0 +1,213 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Benchmarks for the MasterCommunicator.
+"""
+
+import time
+import random
+from threading import Thread, Event
+
+from master.master_communicator import MasterCommunicator, BackgroundConsumer
+import master.master_api as master_api
+from master.master_command import MasterCommandSpec
+
+from master_simulator import MasterSimulator
+
+
+def basic_action_handlers():
+    """ Handlers for the MasterSimulator that answer basic actions. """
+    return {'BA': (master_api.basic_action(), lambda fields: {'resp': 'OK'})}
+
+
+def pipeline_throughput(window, num_commands=200, num_threads=8, turnaround=0.01):
+    """ Measure the number of commands per second for a pipeline window. The commands are sent
+    by num_threads threads at the same time.
+
+    :returns: commands per second (float).
+    """
+    master = MasterSimulator(basic_action_handlers(), turnaround=turnaround)
+    comm = MasterCommunicator(master, init_master=False, pipeline_window=window)
+    comm.start()
+
+    def run(count):
+        """ Send count basic actions. """
+        for _ in range(count):
+            comm.do_command(master_api.basic_action(), {'action_type': 1, 'action_number': 2})
+
+    threads = [Thread(target=run, args=(num_commands / num_threads,)) for _ in range(num_threads)]
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return master.commands / (time.time() - start)
+
+
+class BurstSerial(object):
+    """ Serial port that returns a burst of data in chunks and blocks afterwards. """
+
+    def __init__(self, data, chunk_size=4096):
+        self.__data = data
+        self.__chunk_size = chunk_size
+        self.__done = Event()
+
+    def read(self, size):
+        """ Read size bytes, blocks when the burst is consumed. """
+        if len(self.__data) == 0:
+            self.__done.wait()
+        (ret, self.__data) = (self.__data[:size], self.__data[size:])
+        return ret
+
+    def inWaiting(self): #pylint: disable=C0103
+        """ Get the number of bytes pending to be read, limited to the chunk size. """
+        return min(len(self.__data), self.__chunk_size)
+
+    def write(self, data):
+        pass
+
+    def fileno(self):
+        return None
+
+
+def async_burst(num_frames, seed=0):
+    """ Create a burst of OL, IL and EV frames, as sent by the master when a lot is going on.
+
+    :returns: the burst (string) and the number of frames per action (dict).
+    """
+    rand = random.Random(seed)
+    il = master_api.input_list()
+    ev = master_api.event_triggered()
+
+    frames = []
+    counts = {'OL': 0, 'IL': 0, 'EV': 0}
+    for _ in range(num_frames):
+        kind = rand.choice(['OL', 'IL', 'EV'])
+        counts[kind] += 1
+        if kind == 'OL':
+            outputs = [chr(rand.randint(0, 239)) + chr(rand.randint(0, 63))
+                       for _ in range(rand.randint(0, 8))]
+            frames.append("OL\x00" + chr(len(outputs)) + "".join(outputs) + "\r\n")
+        elif kind == 'IL':
+            frames.append(il.create_output(0, {'input': rand.randint(0, 239),
+                                               'output': rand.randint(0, 239)}))
+        else:
+            frames.append(ev.create_output(0, {'code': rand.randint(0, 255)}))
+
+    return "".join(frames), counts
+
+
+def async_decode(num_frames=10000, chunk_size=4096):
+    """ Measure the speed of the read thread on a burst of async messages. The serial port
+    returns the burst in reads of at most chunk_size bytes.
+
+    :returns: bytes per second (float).
+    """
+    (burst, counts) = async_burst(num_frames)
+    received = {'count': 0}
+    done = Event()
+
+    def callback(_):
+        """ Count the received frames. """
+        received['count'] += 1
+        if received['count'] == num_frames:
+            done.set()
+
+    comm = MasterCommunicator(BurstSerial(burst, chunk_size), init_master=False)
+    for spec in [master_api.output_list(), master_api.input_list(), master_api.event_triggered()]:
+        comm.register_consumer(BackgroundConsumer(spec, 0, callback))
+
+    start = time.time()
+    comm.start()
+    done.wait()
+    return len(burst) / (time.time() - start)
+
+
+def interactive_latency(use_priorities, num_pollers=4, num_actions=100, turnaround=0.01):
+    """ Measure the latency of basic actions while num_pollers threads poll the thermostat list
+    without pause. Without priorities, the basic actions are sent in the background class and
+    wait in line with the polling.
+
+    :returns: the median and 99th percentile latency in seconds (tuple of floats).
+    """
+    handlers = basic_action_handlers()
+    handlers['tl'] = (master_api.thermostat_list(), thermostat_list_handler)
+    master = MasterSimulator(handlers, turnaround=turnaround)
+    comm = MasterCommunicator(master, init_master=False)
+    comm.start()
+
+    stop = Event()
+
+    def poll():
+        """ Poll the thermostat list until stopped. """
+        while not stop.is_set():
+            comm.do_command(master_api.thermostat_list(), priority=MasterCommandSpec.BACKGROUND)
+
+    pollers = [Thread(target=poll) for _ in range(num_pollers)]
+    for poller in pollers:
+        poller.start()
+
+    priority = None if use_priorities else MasterCommandSpec.BACKGROUND
+    latencies = []
+    for _ in range(num_actions):
+        start = time.time()
+        comm.do_command(master_api.basic_action(), {'action_type': 1, 'action_number': 2},
+                        priority=priority)
+        latencies.append(time.time() - start)
+        time.sleep(0.01)
+
+    stop.set()
+    for poller in pollers:
+        poller.join()
+
+    latencies.sort()
+    return (latencies[len(latencies) / 2], latencies[int(len(latencies) * 0.99)])
+
+
+def thermostat_list_handler(_):
+    """ Answer a thermostat list with a valid crc. """
+    spec = master_api.thermostat_list()
+    fields = {'mode': 0, 'outside': master_api.Svt.temp(10.0), 'crc': [67, 0, 0]}
+    for i in range(32):
+        fields['tmp%d' % i] = master_api.Svt.temp(20.0)
+        fields['setp%d' % i] = master_api.Svt.temp(21.0)
+
+    crc = sum([ord(c) for c in spec.create_output(0, fields)[3:-5]])
+    fields['crc'] = [67, crc / 256, crc % 256]
+    return fields
+
+
+def main():
+    """ Run the MasterCommunicator benchmarks. """
+    print "Pipelined do_command against a simulated master (10 ms turnaround, 115200 baud):"
+    for window in [1, 2, 4, 8]:
+        print "  window %d: %6.1f commands/sec" % (window, pipeline_throughput(window))
+
+    print "Decoding a burst of 10k OL/IL/EV frames:"
+    for chunk_size in [4096, 65536]:
+        print "  reads of %5d bytes: %.0f bytes/sec" % (chunk_size, async_decode(chunk_size=chunk_size))
+
+    print "Basic action latency while 4 threads poll the thermostat list:"
+    for use_priorities in [False, True]:
+        (median, p99) = interactive_latency(use_priorities)
+        print "  %-17s median %5.1f ms, p99 %5.1f ms" % \
+            ("with priorities:" if use_priorities else "without priorities:", median * 1000,
+             p99 * 1000)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Benchmarks for the serial reading: the CPU used to read the master, passthrough and power ports
+with a thread per port, compared to the SerialReader. The ports are loopback ptys, the traffic
+is written by a child process so it does not count for the CPU usage.
+"""
+
+import os
+import tty
+import time
+import fcntl
+import struct
+import termios
+import resource
+from Queue import Queue
+from threading import Thread
+
+from serial_utils import SerialReader
+
+
+class PtyPort(object):
+    """ A port on a pseudo terminal that replicates the pyserial interface used by the readers.
+    The bytes written to the other end of the pty can be read from this port. """
+
+    def __init__(self):
+        (self.__master, self.other_end) = os.openpty()
+        tty.setraw(self.other_end)
+
+    def fileno(self):
+        """ Get the file descriptor of the port. """
+        return self.__master
+
+    def read(self, size):
+        """ Read at most size bytes, blocks until a byte is available. """
+        return os.read(self.__master, size)
+
+    def inWaiting(self): #pylint: disable=C0103
+        """ Get the number of bytes pending to be read. """
+        return struct.unpack('I', fcntl.ioctl(self.__master, termios.FIONREAD, '\0' * 4))[0]
+
+    def close(self):
+        """ Close both ends of the pty. """
+        os.close(self.__master)
+        os.close(self.other_end)
+
+
+def thread_per_port(port, callback):
+    """ Read a port like the read threads did before the SerialReader: block on read(1) and
+    read the bytes in waiting. """
+    def run():
+        """ Read until the port is closed. """
+        try:
+            while True:
+                data = port.read(1)
+                size = port.inWaiting()
+                if size > 0:
+                    data += port.read(size)
+                callback(data)
+        except (OSError, IOError):
+            pass
+
+    thread = Thread(target=run)
+    thread.daemon = True
+    thread.start()
+
+
+def cpu_usage(use_serial_reader, duration=5, interval=0.002):
+    """ Measure the CPU usage of reading the master, passthrough and power ports. Every interval
+    seconds, a frame is written to each of the ports. The power port is consumed through a queue
+    by another thread: per byte with a thread per port (like the old RS485), per chunk with the
+    SerialReader.
+
+    :returns: tuple with the CPU seconds per second and the context switches per second.
+    """
+    (master, passthrough, power) = ports = [PtyPort() for _ in range(3)]
+    frames = ["OL\x00\x02\x01\x00\x02\x00\r\n", "STRBA\x01\x01\x02" + "\x00" * 11 + "\r\n",
+              "RTR\x01\x02\x03\x04\x05\x06\x07\x04data\x2a\r\n"]
+    received = {'bytes': 0}
+    power_queue = Queue()
+
+    def count(data):
+        """ Count the bytes received. """
+        received['bytes'] += len(data)
+
+    def consume_power():
+        """ Consume the power queue. """
+        while True:
+            count(power_queue.get())
+
+    power_thread = Thread(target=consume_power)
+    power_thread.daemon = True
+    power_thread.start()
+
+    if use_serial_reader:
+        reader = SerialReader()
+        reader.start()
+        reader.add(master, count)
+        reader.add(passthrough, count)
+        reader.add(power, power_queue.put)
+    else:
+        def power_callback(data):
+            """ Put the bytes in the queue one by one. """
+            for byte in data:
+                power_queue.put(byte)
+
+        thread_per_port(master, count)
+        thread_per_port(passthrough, count)
+        thread_per_port(power, power_callback)
+
+    before = (os.times(), resource.getrusage(resource.RUSAGE_SELF), time.time())
+
+    pid = os.fork()
+    if pid == 0:
+        end = time.time() + duration
+        while time.time() < end:
+            for (port, frame) in zip(ports, frames):
+                os.write(port.other_end, frame)
+            time.sleep(interval)
+        os._exit(0)
+    os.waitpid(pid, 0)
+    time.sleep(0.1)
+
+    after = (os.times(), resource.getrusage(resource.RUSAGE_SELF), time.time())
+
+    if use_serial_reader:
+        reader.stop()
+    for port in ports:
+        port.close()
+
+    wall = after[2] - before[2]
+    cpu = (after[0][0] + after[0][1]) - (before[0][0] + before[0][1])
+    switches = (after[1].ru_nvcsw + after[1].ru_nivcsw) - \
+               (before[1].ru_nvcsw + before[1].ru_nivcsw)
+    return (cpu / wall, switches / wall)
+
+
+def main():
+    """ Run the serial benchmarks. """
+    print "Reading 3 loopback ptys, a frame per port every 2 ms:"
+    for use_serial_reader in [False, True]:
+        (cpu, switches) = cpu_usage(use_serial_reader)
+        print "  %-17s %5.1f %% CPU, %6.0f context switches/sec" % \
+            ("serial reader:" if use_serial_reader else "thread per port:", cpu * 100, switches)
+
+
+if __name__ == "__main__":
+    main()
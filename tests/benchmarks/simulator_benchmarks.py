@@ -0,0 +1,447 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Benchmarks against the simulated master and power bus: do_command throughput with faults on the
+serial link, EepromController.read_all and the latency of the GatewayApi calls.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import tempfile
+from threading import Thread
+
+import constants
+import master.master_api as master_api
+from master.master_communicator import MasterCommunicator
+from master.eeprom_controller import EepromController, EepromFile
+from master.eeprom_extension import EepromExtension
+from master.eeprom_shadow import EepromShadow
+from master.eeprom_warmup import EepromWarmup
+from master.eeprom_models import OutputConfiguration, InputConfiguration, \
+    ThermostatConfiguration, ThermostatSetpointConfiguration
+import power.power_api as power_api
+from power.power_controller import PowerController
+from power.power_communicator import PowerCommunicator
+from serial_utils import CommunicationTimedOutException
+
+from serial_simulator import random_faults
+from master_simulator import VirtualMaster
+from power_simulator import PowerSimulator
+
+
+def faulty_throughput(fault_rate, num_commands=400, num_threads=8):
+    """ Measure the number of basic actions per second when a fraction of the commands is
+    dropped and the same fraction is answered late. The faults are seeded, every run drops the
+    same commands.
+
+    :returns: tuple with the commands per second and the number of timeouts.
+    """
+    master = VirtualMaster(faults=random_faults(42, drop_rate=fault_rate, delay_rate=fault_rate,
+                                                delay=0.2))
+    comm = MasterCommunicator(master, init_master=False)
+    comm.start()
+    timeouts = {'count': 0}
+
+    def run(count):
+        """ Send count basic actions. """
+        for i in range(count):
+            try:
+                comm.do_command(master_api.basic_action(),
+                                {'action_type': master_api.BA_LIGHT_TOGGLE,
+                                 'action_number': i % 16}, timeout=0.25)
+            except CommunicationTimedOutException:
+                timeouts['count'] += 1
+
+    threads = [Thread(target=run, args=(num_commands / num_threads,)) for _ in range(num_threads)]
+
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return (num_commands / (time.time() - start), timeouts['count'])
+
+
+def read_all_duration(directory, eeprom_model):
+    """ Measure the time to read all instances of an eeprom model from a master with 8 input
+    and 8 output modules, with an empty and a filled bank cache.
+
+    :returns: tuple with the cold and the warm duration in seconds and the statistics of the \
+    read planner.
+    """
+    master = VirtualMaster(input_modules=8, output_modules=8)
+    comm = MasterCommunicator(master, init_master=False)
+    comm.start()
+    controller = EepromController(EepromFile(comm),
+                                  EepromExtension(os.path.join(directory, 'read_all.db')))
+
+    durations = []
+    for _ in range(2):
+        start = time.time()
+        controller.read_all(eeprom_model)
+        durations.append(time.time() - start)
+    return (durations[0], durations[1], controller.get_read_statistics())
+
+
+def restart_duration(directory, use_shadow):
+    """ Measure the time to read the input, output and thermostat setpoint configurations after
+    a restart of the gateway, when the same configurations were read before the restart.
+
+    :returns: the duration in seconds.
+    """
+    master = VirtualMaster(input_modules=8, output_modules=8)
+    comm = MasterCommunicator(master, init_master=False)
+    comm.start()
+    models = [InputConfiguration, OutputConfiguration, ThermostatSetpointConfiguration]
+    shadow_file = os.path.join(directory, 'restart_shadow.bin')
+    if os.path.exists(shadow_file):
+        os.remove(shadow_file)
+
+    for restart in [False, True]:
+        shadow = EepromShadow(shadow_file) if use_shadow else None
+        controller = EepromController(EepromFile(comm, shadow),
+                                      EepromExtension(os.path.join(directory, 'restart.db')))
+        start = time.time()
+        for model in models:
+            controller.read_all(model)
+        if restart:
+            return time.time() - start
+
+
+def warmup_duration(directory, warmup):
+    """ Measure the time to read the input and output configurations the first time after a
+    restart (master with 8 input and 8 output modules, no shadow), with or without an eeprom
+    warmup of the models of the GatewayApi.
+
+    :returns: tuple with the duration of the warmup and of the first reads in seconds.
+    """
+    from gateway.gateway_api import GatewayApi
+
+    master = VirtualMaster(input_modules=8, output_modules=8)
+    comm = MasterCommunicator(master, init_master=False)
+    comm.start()
+    controller = EepromController(EepromFile(comm),
+                                  EepromExtension(os.path.join(directory, 'warmup.db')))
+
+    start = time.time()
+    if warmup:
+        eeprom_warmup = EepromWarmup(controller, GatewayApi.WARMUP_MODELS)
+        eeprom_warmup.start()
+        while eeprom_warmup.is_running():
+            time.sleep(0.01)
+    warmup_time = time.time() - start
+
+    start = time.time()
+    for model in [InputConfiguration, OutputConfiguration]:
+        controller.read_all(model)
+    return (warmup_time, time.time() - start)
+
+
+def small_write_duration(directory, mode):
+    """ Measure the time to change the floor of an output with an empty bank cache. The mode is
+    'banks' to diff the full banks (the EepromFile has no base), 'new' to write a new model
+    (the written fields are read as the base) or 'read' to write a model that was read before.
+
+    :returns: the duration in seconds.
+    """
+    master = VirtualMaster(input_modules=8, output_modules=8)
+    comm = MasterCommunicator(master, init_master=False)
+    comm.start()
+    extension = EepromExtension(os.path.join(directory, 'small_write.db'))
+    model = EepromController(EepromFile(comm), extension).read(OutputConfiguration, 3)
+    model.floor = 7
+
+    eeprom_file = EepromFile(comm)
+    controller = EepromController(eeprom_file, extension)
+    start = time.time()
+    if mode == 'banks':
+        eeprom_file.write(model.to_eeprom_data(['floor']))
+        eeprom_file.activate()
+    elif mode == 'new':
+        controller.write(OutputConfiguration(id=3, floor=7))
+    else:
+        controller.write(model)
+    return time.time() - start
+
+
+def export_duration(directory, bulk):
+    """ Measure the time to read all configurations of a master with 8 input and 8 output
+    modules with an empty bank cache, with one read_all per model or in one pass.
+
+    :returns: the duration in seconds.
+    """
+    from gateway.gateway_api import GatewayApi
+
+    master = VirtualMaster(input_modules=8, output_modules=8)
+    comm = MasterCommunicator(master, init_master=False)
+    comm.start()
+    controller = EepromController(EepromFile(comm),
+                                  EepromExtension(os.path.join(directory, 'export.db')))
+    eeprom_models = [eeprom_model for (_, eeprom_model) in GatewayApi.CONFIGURATION_MODELS]
+
+    start = time.time()
+    if bulk:
+        controller.read_models(eeprom_models)
+    else:
+        for eeprom_model in eeprom_models:
+            if eeprom_model.has_id():
+                controller.read_all(eeprom_model)
+            else:
+                controller.read(eeprom_model)
+    return time.time() - start
+
+
+def import_duration(directory, bulk):
+    """ Measure the time to write all configurations of a master with 8 input and 8 output
+    modules (with a warm bank cache) when the name of every output changed, with one
+    write_batch per model or all models at once.
+
+    :returns: the duration in seconds.
+    """
+    from gateway.gateway_api import GatewayApi
+
+    master = VirtualMaster(input_modules=8, output_modules=8)
+    comm = MasterCommunicator(master, init_master=False)
+    comm.start()
+    controller = EepromController(EepromFile(comm),
+                                  EepromExtension(os.path.join(directory, 'import.db')))
+    eeprom_models = [eeprom_model for (_, eeprom_model) in GatewayApi.CONFIGURATION_MODELS]
+    batches = [models if isinstance(models, list) else [models]
+               for models in controller.read_models(eeprom_models)]
+    batches = [[eeprom_model.from_dict(model.to_dict()) for model in models]
+               for (eeprom_model, models) in zip(eeprom_models, batches)]
+    for output in batches[0]:
+        output.name = "output %d" % output.id
+
+    start = time.time()
+    if bulk:
+        controller.write_batch(sum(batches, []))
+    else:
+        for models in batches:
+            controller.write_batch(models)
+    return time.time() - start
+
+
+def query_duration(directory, server_side):
+    """ Measure the time to get the names of the outputs on floor 2 with a non-empty name (a
+    master with 8 output modules, 16 outputs match) with an empty and with a warm bank cache, by
+    reading all output configurations (the client filters them) or with a query.
+
+    :returns: tuple with the cold and warm duration in seconds and the size of the json result \
+    in bytes.
+    """
+    master = VirtualMaster(output_modules=8)
+    comm = MasterCommunicator(master, init_master=False)
+    comm.start()
+    controller = EepromController(EepromFile(comm),
+                                  EepromExtension(os.path.join(directory, 'query.db')))
+    controller.write_batch([OutputConfiguration(id=i, floor=i % 4, name=('output %d' % i)
+                                                if i % 8 < 4 else '') for i in range(64)])
+    controller.invalidate_cache()
+
+    durations = []
+    for _ in range(2):
+        start = time.time()
+        if server_side:
+            (_, models) = controller.query(OutputConfiguration,
+                                           {'floor': 2, 'name': {'ne': ''}}, ['name'])
+        else:
+            models = controller.read_all(OutputConfiguration)
+        result = json.dumps([m.to_dict() for m in models])
+        durations.append(time.time() - start)
+    return (durations[0], durations[1], len(result))
+
+
+def create_gateway_api(directory, master):
+    """ Create a GatewayApi against a VirtualMaster and two simulated power modules, the files
+    of the GatewayApi are stored in the directory. """
+    from gateway.gateway_api import GatewayApi
+
+    constants.get_eeprom_extension_database_file = \
+        lambda: os.path.join(directory, 'eeprom_ext.db')
+    constants.get_eeprom_shadow_file = lambda: os.path.join(directory, 'eeprom_shadow.bin')
+    if os.path.exists(os.path.join(directory, 'eeprom_shadow.bin')):
+        os.remove(os.path.join(directory, 'eeprom_shadow.bin'))
+
+    master_communicator = MasterCommunicator(master, init_master=False)
+    master_communicator.start()
+
+    power_controller = PowerController(os.path.join(directory, 'power.db'))
+    power_controller.register_power_module(1, power_api.POWER_API_8_PORTS)
+    power_controller.register_power_module(2, power_api.POWER_API_12_PORTS)
+    bus = PowerSimulator({1: power_api.POWER_API_8_PORTS, 2: power_api.POWER_API_12_PORTS})
+    power_communicator = PowerCommunicator(bus, power_controller, time_keeper_period=0)
+
+    return GatewayApi(master_communicator, power_communicator, power_controller)
+
+
+def output_status_duration(directory, mode):
+    """ Measure the time of the first get_output_status call (a master with 8 output modules)
+    after the eeprom warmup: without anything else ('cold'), after the background output reads
+    that are started with the gateway ('reader') or after an OL message ('ol').
+
+    :returns: the duration in seconds.
+    """
+    gateway_api = create_gateway_api(directory, VirtualMaster(output_modules=8))
+    gateway_api.start_eeprom_warmup()
+    while gateway_api.get_status()['eeprom_warmup']['running']:
+        time.sleep(0.01)
+    if mode == 'reader':
+        gateway_api.start_output_reader()
+        while gateway_api.get_status()['output_reader']['reads'] < 64:
+            time.sleep(0.01)
+    elif mode == 'ol':
+        gateway_api.on_outputs({'outputs': [(3, 50), (12, 100)]})
+
+    start = time.time()
+    gateway_api.get_output_status()
+    return time.time() - start
+
+
+def backup_durations(directory):
+    """ Measure the time to take a full and an incremental backup of the master eeprom and to
+    restore a backup with one changed bank.
+
+    :returns: tuple with the full backup, incremental backup and restore duration in seconds.
+    """
+    gateway_api = create_gateway_api(directory, VirtualMaster(input_modules=8,
+                                                              output_modules=8))
+    durations = []
+
+    start = time.time()
+    backup = gateway_api.get_master_backup(full=True)
+    durations.append(time.time() - start)
+
+    start = time.time()
+    gateway_api.get_master_backup()
+    durations.append(time.time() - start)
+
+    start = time.time()
+    gateway_api.master_restore(backup[:256 * 33 + 20] + "changed" + backup[256 * 33 + 27:])
+    durations.append(time.time() - start)
+
+    return tuple(durations)
+
+
+def api_latency(directory, num_calls=50):
+    """ Measure the latency of GatewayApi calls against a VirtualMaster and two simulated power
+    modules.
+
+    :returns: list of tuples with the name of the call, the median and the p99 latency.
+    """
+    gateway_api = create_gateway_api(directory, VirtualMaster(input_modules=4,
+                                                              output_modules=4))
+    gateway_api.set_room_configurations([{'id': i, 'name': 'Room %d' % i, 'floor': i % 3}
+                                         for i in range(100)])
+
+    calls = [('get_status', gateway_api.get_status),
+             ('get_output_status', gateway_api.get_output_status),
+             ('get_thermostat_status', gateway_api.get_thermostat_status),
+             ('set_output', lambda: gateway_api.set_output(3, True, 50)),
+             ('get_sensor_temperature_status', gateway_api.get_sensor_temperature_status),
+             ('get_realtime_power', gateway_api.get_realtime_power),
+             ('get_output_configurations', gateway_api.get_output_configurations),
+             ('get_room_configurations', gateway_api.get_room_configurations)]
+
+    results = []
+    for (name, call) in calls:
+        latencies = []
+        for _ in range(num_calls):
+            start = time.time()
+            call()
+            latencies.append(time.time() - start)
+        latencies.sort()
+        results.append((name, latencies[len(latencies) / 2],
+                        latencies[int(len(latencies) * 0.99)]))
+    return results
+
+
+def main():
+    """ Run the benchmarks against the simulated master and power bus. """
+    directory = tempfile.mkdtemp()
+    try:
+        print "Basic actions with dropped and late answers (8 threads, 250 ms timeout):"
+        for fault_rate in [0.0, 0.01, 0.05]:
+            (throughput, timeouts) = faulty_throughput(fault_rate)
+            print "  %2d %% faults: %6.1f commands/sec, %3d timeouts" % \
+                (fault_rate * 100, throughput, timeouts)
+
+        print "EepromController.read_all (10 ms turnaround, 115200 baud):"
+        for eeprom_model in [OutputConfiguration, InputConfiguration, ThermostatConfiguration]:
+            (cold, warm, statistics) = read_all_duration(directory, eeprom_model)
+            print "  %-24s cold %6.1f ms, warm %6.1f ms, planner saved %6.1f ms" % \
+                (eeprom_model.__name__ + ":", cold * 1000, warm * 1000,
+                 statistics['saved'] * 1000)
+
+        print "Reading the input, output and setpoint configurations after a restart:"
+        for use_shadow in [False, True]:
+            print "  %-17s %6.1f ms" % ("with shadow:" if use_shadow else "without shadow:",
+                                        restart_duration(directory, use_shadow) * 1000)
+
+        print "Reading the input and output configurations for the first time:"
+        for warmup in [False, True]:
+            (warmup_time, duration) = warmup_duration(directory, warmup)
+            print "  %-16s %6.1f ms (warmup %6.1f ms)" % \
+                ("after warmup:" if warmup else "without warmup:", duration * 1000,
+                 warmup_time * 1000)
+
+        print "Changing the floor of an output with an empty bank cache:"
+        for (mode, name) in [('banks', 'full banks:'), ('new', 'new model:'),
+                             ('read', 'read model:')]:
+            print "  %-12s %6.1f ms" % (name, small_write_duration(directory, mode) * 1000)
+
+        print "Reading all configurations with an empty bank cache:"
+        for bulk in [False, True]:
+            print "  %-13s %6.1f ms" % ("in one pass:" if bulk else "per model:",
+                                        export_duration(directory, bulk) * 1000)
+
+        print "Writing all configurations, the output names changed:"
+        for bulk in [False, True]:
+            print "  %-13s %6.1f ms" % ("at once:" if bulk else "per model:",
+                                        import_duration(directory, bulk) * 1000)
+
+        print "Named outputs on floor 2 with an empty bank cache:"
+        for server_side in [False, True]:
+            (cold, warm, size) = query_duration(directory, server_side)
+            print "  %-10s cold %6.1f ms, warm %6.1f ms, %6d bytes of json" % \
+                ("query:" if server_side else "read_all:", cold * 1000, warm * 1000, size)
+
+        print "First get_output_status call (64 outputs):"
+        for (mode, name) in [('cold', 'cold:'), ('reader', 'after the reads:'),
+                             ('ol', 'after an OL:')]:
+            print "  %-17s %6.1f ms" % (name, output_status_duration(directory, mode) * 1000)
+
+        print "Master eeprom backup and restore:"
+        (full, incremental, restore) = backup_durations(directory)
+        print "  full backup: %6.1f ms, incremental backup: %6.1f ms, restore: %6.1f ms" % \
+            (full * 1000, incremental * 1000, restore * 1000)
+
+        print "GatewayApi latency (10 ms turnaround, 115200 baud):"
+        for (name, median, p99) in api_latency(directory):
+            print "  %-30s median %6.1f ms, p99 %6.1f ms" % (name + ":", median * 1000, p99 * 1000)
+    finally:
+        shutil.rmtree(directory)
+
+    # Don't wait for the background threads of the GatewayApis that were created.
+    sys.stdout.flush()
+    os._exit(0)
+
+
+if __name__ == "__main__":
+    main()
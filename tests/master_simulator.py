@@ -0,0 +1,425 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Contains the simulated masters: the MasterSimulator answers master commands using handler
+functions, the VirtualMaster keeps the state of a master (eeprom, outputs, sensors) and the
+ReplayMaster replays the traffic recorded by the FlightRecorder.
+"""
+
+import time
+import inspect
+import datetime
+from collections import deque
+from threading import Lock, Thread
+
+import master.master_api as master_api
+from master.master_api import Svt
+from master.master_command import MasterCommandSpec, Field, FieldType, BytesFieldType, \
+    SvtFieldType, VarStringFieldType, DimmerFieldType, ErrorListFieldType
+from serial_utils import FlightRecorder
+
+from serial_simulator import SerialSimulator
+
+
+def master_specs():
+    """ Get the specs of the commands in master_api.
+
+    :returns: dict that maps the action to the MasterCommandSpec.
+    """
+    specs = {}
+    for (_, function) in inspect.getmembers(master_api, inspect.isfunction):
+        try:
+            spec = function()
+        except TypeError:
+            continue  # Not a spec function, it requires arguments
+        if isinstance(spec, MasterCommandSpec) and spec.output_fields is not None:
+            specs[spec.action] = spec
+    return specs
+
+
+def default_output(spec, fields):
+    """ Create the output fields for a command: the fields that are also input fields get the
+    input value, the other fields get a default value for their type. The crc is calculated.
+
+    :param spec: the spec of the command.
+    :type spec: :class`master.master_command.MasterCommandSpec`
+    :param fields: the input fields and the output fields that are already known.
+    :type fields: dict
+    :returns: dict with the output fields.
+    """
+    output = {}
+    for field in spec.output_fields:
+        field_type = field.field_type
+        if field.name in fields:
+            output[field.name] = fields[field.name]
+        elif field.name == 'resp':
+            output[field.name] = 'OK'
+        elif isinstance(field_type, FieldType):
+            output[field.name] = 0 if field_type.python_type == int else ' ' * field_type.length
+        elif isinstance(field_type, BytesFieldType):
+            output[field.name] = [0] * field_type.length
+        elif isinstance(field_type, SvtFieldType):
+            output[field.name] = Svt(Svt.RAW, 255)
+        elif isinstance(field_type, VarStringFieldType):
+            output[field.name] = ''
+        elif isinstance(field_type, DimmerFieldType):
+            output[field.name] = 0
+        elif isinstance(field_type, ErrorListFieldType):
+            output[field.name] = []
+
+    if spec.output_has_crc():
+        crc = 0
+        for field in spec.output_fields:
+            if Field.is_crc(field):
+                break
+            crc += sum(bytearray(field.encode(output.get(field.name))))
+        output['crc'] = [67, crc / 256, crc % 256]
+
+    return output
+
+
+class MasterSimulator(SerialSimulator):
+    """ Replicates the pyserial interface and answers the master commands written to it. Unlike
+    the SerialMock, the order of the commands is not fixed: every command is answered with the
+    cid it was sent with, so multiple commands can be in flight. See SerialSimulator for the
+    timing and the fault injection.
+    """
+
+    def __init__(self, handlers, turnaround=0.01, baudrate=115200, faults=None):
+        """ Create a MasterSimulator.
+
+        :param handlers: maps the action of a command to a tuple (spec, function). The function \
+        takes the dict with the input fields and returns the dict with the output fields, or \
+        None if the command is not answered.
+        :type handlers: dict
+        :param turnaround: the number of seconds the master needs to process a command.
+        :type turnaround: float
+        :param baudrate: the speed of the serial link.
+        :type baudrate: integer
+        :param faults: function that takes the action of a command and returns the extra delay \
+        of the answer in seconds, or None to drop the command.
+        :type faults: function
+        """
+        SerialSimulator.__init__(self, turnaround, baudrate, faults)
+        self.__handlers = handlers
+        self.__input_specs = {}
+
+    def _consume(self, data):
+        """ Parse a command and answer it. """
+        start = data.find("STR")
+        if start == -1 or len(data) < start + 6:
+            return 0
+
+        (spec, handler) = self.__handlers[data[start + 3:start + 5]]
+        cid = ord(data[start + 5])
+        if spec.action not in self.__input_specs:
+            self.__input_specs[spec.action] = MasterCommandSpec(
+                spec.action, [], spec.input_fields + [Field.lit("\r\n")])
+        (consumed, result, done) = \
+            self.__input_specs[spec.action].consume_output(data[start + 6:])
+        if not done:
+            return 0
+
+        output = handler(result.fields)
+        if output is not None:
+            self.answer(spec.action, spec.create_output(cid, output))
+        return start + 6 + consumed
+
+
+class VirtualMaster(MasterSimulator):
+    """ A simulated master that keeps its state: the eeprom, the outputs, the sensors and the
+    pulse counters. Every command in master_api is answered: the commands that don't change or
+    read the state get a default answer (see default_output). Changing an output sends an OL
+    message, like the master does when the async OL messages are enabled.
+    """
+
+    def __init__(self, input_modules=2, output_modules=2, shutter_modules=0, turnaround=0.01,
+                 baudrate=115200, faults=None):
+        """ Create a VirtualMaster. The eeprom is empty, except for the number of modules and
+        the settings in bank 0 that the gateway expects.
+
+        :param input_modules: the number of input modules (8 inputs per module).
+        :param output_modules: the number of output modules (8 outputs per module).
+        :param shutter_modules: the number of shutter modules (4 shutters per module).
+        :param turnaround: see MasterSimulator
+        :param baudrate: see MasterSimulator
+        :param faults: see MasterSimulator
+        """
+        self.lock = Lock()
+        self.eeprom = bytearray('\xff' * (256 * 256))
+        for (address, value) in [(1, input_modules), (2, output_modules), (3, shutter_modules),
+                                 (11, 255), (14, 64), (18, 0), (20, 0), (28, 0), (59, 32)]:
+            self.eeprom[address] = value
+
+        self.outputs = dict([(i, {'status': 0, 'dimmer': 100, 'ctimer': 0})
+                             for i in range(output_modules * 8)])
+        self.temperatures = [None] * 32
+        self.humidities = [None] * 32
+        self.brightnesses = [None] * 32
+        self.pulses = [0] * 24
+        self.activations = 0
+
+        handlers = {}
+        for (action, spec) in master_specs().items():
+            handlers[action] = (spec, self.__default_handler(spec))
+        for (spec, handler) in [(master_api.status(), self.__status),
+                                (master_api.number_of_io_modules(), self.__number_of_io_modules),
+                                (master_api.eeprom_list(), self.__eeprom_list),
+                                (master_api.read_eeprom(), self.__read_eeprom),
+                                (master_api.write_eeprom(), self.__write_eeprom),
+                                (master_api.activate_eeprom(), self.__activate_eeprom),
+                                (master_api.basic_action(), self.__basic_action),
+                                (master_api.read_output(), self.__read_output),
+                                (master_api.sensor_temperature_list(), self.__temperature_list),
+                                (master_api.sensor_humidity_list(), self.__humidity_list),
+                                (master_api.sensor_brightness_list(), self.__brightness_list),
+                                (master_api.set_virtual_sensor(), self.__set_virtual_sensor),
+                                (master_api.pulse_list(), self.__pulse_list)]:
+            handlers[spec.action] = (spec, self.__with_default(spec, handler))
+
+        MasterSimulator.__init__(self, handlers, turnaround, baudrate, faults)
+
+    @staticmethod
+    def __default_handler(spec):
+        """ Create a handler that gives the default answer. """
+        return lambda fields: default_output(spec, fields)
+
+    def __with_default(self, spec, handler):
+        """ Create a handler that completes the answer of handler with the default answer. """
+        def run(fields):
+            """ Run the handler under the lock. """
+            with self.lock:
+                output = dict(fields)
+                output.update(handler(fields))
+            return default_output(spec, output)
+        return run
+
+    def __status(self, _):
+        """ Get the time and the version. """
+        now = datetime.datetime.now()
+        return {'seconds': now.second, 'minutes': now.minute, 'hours': now.hour,
+                'weekday': now.isoweekday(), 'day': now.day, 'month': now.month,
+                'year': now.year % 100, 'mode': 76, 'f1': 3, 'f2': 143, 'f3': 88, 'h': 1}
+
+    def __number_of_io_modules(self, _):
+        """ Get the number of modules from the eeprom. """
+        return {'in': self.eeprom[1], 'out': self.eeprom[2], 'shutter': self.eeprom[3]}
+
+    def __eeprom_list(self, fields):
+        """ Read a bank. """
+        start = fields['bank'] * 256
+        return {'data': str(self.eeprom[start:start + 256])}
+
+    def __read_eeprom(self, fields):
+        """ Read at most 10 bytes from a bank. """
+        (start, num) = (fields['bank'] * 256 + fields['addr'], min(fields['num'], 10))
+        return {'data': str(self.eeprom[start:start + num])}
+
+    def __write_eeprom(self, fields):
+        """ Write at most 10 bytes to a bank. """
+        start = fields['bank'] * 256 + fields['address']
+        self.eeprom[start:start + len(fields['data'])] = fields['data']
+        return {}
+
+    def __activate_eeprom(self, _):
+        """ Activate the eeprom. """
+        self.activations += 1
+        return {}
+
+    def __basic_action(self, fields):
+        """ Execute the basic actions on outputs, the other basic actions are ignored. """
+        (action_type, number) = (fields['action_type'], fields['action_number'])
+        before = dict([(i, output['status']) for (i, output) in self.outputs.items()])
+
+        if action_type in [master_api.BA_ALL_LIGHTS_OFF, master_api.BA_ALL_OUTPUTS_OFF]:
+            for output in self.outputs.values():
+                output['status'] = 0
+        elif number in self.outputs:
+            output = self.outputs[number]
+            if action_type == master_api.BA_LIGHT_OFF:
+                output['status'] = 0
+            elif action_type == master_api.BA_LIGHT_ON:
+                output['status'] = 1
+            elif action_type == master_api.BA_LIGHT_TOGGLE:
+                output['status'] = 1 - output['status']
+            elif master_api.BA_LIGHT_ON_DIMMER_10 <= action_type <= \
+                    master_api.BA_LIGHT_ON_DIMMER_90:
+                output['status'] = 1
+                output['dimmer'] = (action_type - master_api.BA_LIGHT_ON_DIMMER_10 + 1) * 10
+            elif action_type == master_api.BA_LIGHT_ON_DIMMER_MAX:
+                output['status'] = 1
+                output['dimmer'] = 100
+
+        if before != dict([(i, output['status']) for (i, output) in self.outputs.items()]):
+            self.__emit_output_list()
+        return {'resp': 'OK'}
+
+    def __emit_output_list(self):
+        """ Send an OL message with the outputs that are on. """
+        on_outputs = [(i, output['dimmer']) for (i, output) in sorted(self.outputs.items())
+                      if output['status'] == 1]
+        dimmer = DimmerFieldType()
+        self.emit("OL\x00" + chr(len(on_outputs)) +
+                  "".join([chr(i) + dimmer.encode(value) for (i, value) in on_outputs]) +
+                  "\r\n")
+
+    def __read_output(self, fields):
+        """ Read the status of an output. """
+        output = self.outputs.get(fields['id'], {'status': 0, 'dimmer': 0, 'ctimer': 0})
+        return {'type': 'D', 'light': 1, 'status': output['status'],
+                'dimmer': output['dimmer'], 'ctimer': output['ctimer'],
+                'controller_out': 255, 'max_power': 255, 'floor_level': 255,
+                'name': ('Output %d' % fields['id']).ljust(16)}
+
+    @staticmethod
+    def __svt_list(prefix, values, svt_type):
+        """ Create the output fields for a sensor list. """
+        return dict([('%s%d' % (prefix, i), Svt(svt_type, value))
+                     for (i, value) in enumerate(values)])
+
+    def __temperature_list(self, _):
+        """ List the temperatures of the sensors. """
+        return self.__svt_list('tmp', self.temperatures, Svt.TEMPERATURE)
+
+    def __humidity_list(self, _):
+        """ List the humidities of the sensors. """
+        return self.__svt_list('hum', self.humidities, Svt.HUMIDITY)
+
+    def __brightness_list(self, _):
+        """ List the brightness of the sensors. """
+        return self.__svt_list('bri', self.brightnesses, Svt.BRIGHTNESS)
+
+    def __set_virtual_sensor(self, fields):
+        """ Set the values of a virtual sensor. """
+        sensor = fields['sensor']
+        self.temperatures[sensor] = fields['tmp'].get_temperature()
+        self.humidities[sensor] = fields['hum'].get_humidity()
+        self.brightnesses[sensor] = fields['bri'].get_brightness()
+        return {}
+
+    def __pulse_list(self, _):
+        """ List the pulse counters. """
+        return dict([('pv%d' % i, value) for (i, value) in enumerate(self.pulses)])
+
+    def set_sensor(self, sensor, temperature=None, humidity=None, brightness=None):
+        """ Set the values that a sensor measures. """
+        with self.lock:
+            self.temperatures[sensor] = temperature
+            self.humidities[sensor] = humidity
+            self.brightnesses[sensor] = brightness
+
+    def press_input(self, input_id, output_id=255):
+        """ Send an IL message for a pressed input. """
+        self.emit(master_api.input_list().create_output(0, {'input': input_id,
+                                                            'output': output_id}))
+
+    def trigger_event(self, code):
+        """ Send an EV message. """
+        self.emit(master_api.event_triggered().create_output(0, {'code': code}))
+
+
+class ReplayMaster(MasterSimulator):
+    """ Replays the traffic recorded by a FlightRecorder on the master. A command gets the
+    answer that was recorded for the same command (the cid of the answer is replaced), in the
+    recorded order. A command without recorded answer is not answered. The recorded async
+    messages are sent again by replay_async().
+    """
+
+    def __init__(self, records, turnaround=0.01, baudrate=115200, faults=None):
+        """ Create a ReplayMaster.
+
+        :param records: the records of the FlightRecorder, the records of other ports are \
+        ignored.
+        :type records: list of tuples (timestamp, port, direction, cid, data).
+        :param turnaround: see MasterSimulator
+        :param baudrate: see MasterSimulator
+        :param faults: see MasterSimulator
+        """
+        specs = master_specs()
+        self.__answers = {}  # maps (action, input without cid) to a deque of answers
+        self.__async = []  # list of tuples (timestamp, data)
+        self.__parse(records, specs)
+
+        handlers = dict([(action, (spec, self.__replay_handler(spec)))
+                         for (action, spec) in specs.items()])
+        MasterSimulator.__init__(self, handlers, turnaround, baudrate, faults)
+
+    def __parse(self, records, specs):
+        """ Match the recorded commands and answers. """
+        in_flight = {}  # maps (action, cid) to the key of the command waiting for the answer
+        data = ""
+        for (timestamp, port, direction, _, chunk) in sorted(records):
+            if port != FlightRecorder.MASTER:
+                continue
+            if direction == FlightRecorder.WRITE:
+                if chunk.startswith("STR") and len(chunk) >= 6:
+                    in_flight[(chunk[3:5], ord(chunk[5]))] = (chunk[3:5], chunk[6:])
+                continue
+
+            data += chunk
+            offset = 0
+            while len(data) - offset >= 3:
+                spec = specs.get(data[offset:offset + 2])
+                if spec is None:
+                    offset += 1
+                    continue
+                try:
+                    (consumed, result, done) = spec.consume_output(data[offset + 3:])
+                except ValueError:
+                    offset += 1
+                    continue
+                if not done:
+                    break
+
+                cid = ord(data[offset + 2])
+                key = in_flight.pop((spec.action, cid), None)
+                if key is not None:
+                    self.__answers.setdefault(key, deque()).append(result.fields)
+                elif cid == 0:
+                    self.__async.append((timestamp, data[offset:offset + 3 + consumed]))
+                offset += 3 + consumed
+            data = data[offset:]
+
+    def __replay_handler(self, spec):
+        """ Create a handler that returns the recorded answers. """
+        def run(fields):
+            """ Get the next recorded answer for the command. """
+            answers = self.__answers.get((spec.action, spec.create_input(0, fields)[6:]))
+            if answers is None or len(answers) == 0:
+                return None
+            return answers.popleft()
+        return run
+
+    def replay_async(self, speed=1.0):
+        """ Send the recorded async messages in a background thread, with the recorded time
+        between the messages.
+
+        :param speed: the speed of the replay, 2.0 sends the messages twice as fast.
+        :type speed: float
+        :returns: the thread, it is done when all messages are sent.
+        """
+        def run():
+            """ Send the messages. """
+            if len(self.__async) == 0:
+                return
+            (first, start) = (self.__async[0][0], time.time())
+            for (timestamp, data) in self.__async:
+                time.sleep(max(0, start + (timestamp - first) / speed - time.time()))
+                self.emit(data)
+
+        thread = Thread(target=run, name="ReplayMaster async thread")
+        thread.daemon = True
+        thread.start()
+        return thread
@@ -0,0 +1,128 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the command cache module.
+"""
+
+import unittest
+import threading
+import time
+
+import master.master_api as master_api
+from master.master_communicator import MasterCommunicator
+from master.command_cache import CommandCache
+
+from master_simulator import MasterSimulator
+
+
+class CommandCacheTest(unittest.TestCase):
+    """ Tests for CommandCache. """
+
+    def setUp(self):
+        """ Start a MasterCommunicator on a simulated master that answers pulse lists and basic
+        actions. The pulse counters count the number of pulse lists that were answered. """
+        self.counter = {'value': 0}
+
+        def pulse_list(_):
+            """ Answer the pulse list, all counters contain the number of pulse lists. """
+            self.counter['value'] += 1
+            fields = dict([('pv%d' % i, self.counter['value']) for i in range(24)])
+            spec = master_api.pulse_list()
+            fields['crc'] = [67, 0, 0]
+            crc = sum([ord(c) for c in spec.create_output(0, fields)[3:-5]])
+            fields['crc'] = [67, crc / 256, crc % 256]
+            return fields
+
+        self.master = MasterSimulator({'PL': (master_api.pulse_list(), pulse_list),
+                                       'BA': (master_api.basic_action(),
+                                              lambda _: {'resp': 'OK'})},
+                                      turnaround=0)
+        self.comm = MasterCommunicator(self.master, init_master=False)
+        self.comm.start()
+
+    def test_max_age(self):
+        """ Test that the output is cached for the maximum age of the command. """
+        cache = CommandCache(self.comm, {'PL': 0.2})
+
+        self.assertEquals(1, cache.do_command(master_api.pulse_list())['pv0'])
+        self.assertEquals(1, cache.do_command(master_api.pulse_list())['pv0'])
+        self.assertEquals(1, self.master.commands)
+
+        time.sleep(0.25)
+        self.assertEquals(2, cache.do_command(master_api.pulse_list())['pv0'])
+        self.assertEquals(2, self.master.commands)
+        self.assertEquals({'hits': 1, 'misses': 2}, cache.get_statistics())
+
+    def test_not_cached(self):
+        """ Test that commands without a maximum age are not cached. """
+        cache = CommandCache(self.comm, {'PL': 10})
+
+        for _ in range(3):
+            cache.do_command(master_api.basic_action(), {'action_type': 1, 'action_number': 2})
+        self.assertEquals(3, self.master.commands)
+        self.assertEquals({'hits': 0, 'misses': 0}, cache.get_statistics())
+
+    def test_invalidate(self):
+        """ Test that an invalidated command is sent to the master again. """
+        cache = CommandCache(self.comm, {'PL': 10})
+
+        self.assertEquals(1, cache.do_command(master_api.pulse_list())['pv0'])
+        cache.invalidate(master_api.basic_action())
+        self.assertEquals(1, cache.do_command(master_api.pulse_list())['pv0'])
+
+        cache.invalidate(master_api.pulse_list())
+        self.assertEquals(2, cache.do_command(master_api.pulse_list())['pv0'])
+
+        cache.invalidate()
+        self.assertEquals(3, cache.do_command(master_api.pulse_list())['pv0'])
+
+    def test_invalidate_in_flight(self):
+        """ Test that output is not cached if the command was invalidated while it was in
+        flight. """
+        slow_master = MasterSimulator({'PL': (master_api.pulse_list(),
+                                              lambda _: self.__pulse_fields())},
+                                      turnaround=0.1)
+        comm = MasterCommunicator(slow_master, init_master=False)
+        comm.start()
+        cache = CommandCache(comm, {'PL': 10})
+
+        thread = threading.Thread(target=cache.do_command, args=(master_api.pulse_list(),))
+        thread.start()
+        time.sleep(0.05)
+        cache.invalidate(master_api.pulse_list())
+        thread.join()
+
+        cache.do_command(master_api.pulse_list())
+        self.assertEquals(2, slow_master.commands)
+
+    def test_output_is_copied(self):
+        """ Test that changing the output does not change the cached output. """
+        cache = CommandCache(self.comm, {'PL': 10})
+
+        cache.do_command(master_api.pulse_list())['pv0'] = 100
+        output = cache.do_command(master_api.pulse_list())
+        output['pv0'] = 200
+        self.assertEquals(1, cache.do_command(master_api.pulse_list())['pv0'])
+
+    @staticmethod
+    def __pulse_fields():
+        """ Get the output fields for a pulse list with all counters on 0. """
+        fields = dict([('pv%d' % i, 0) for i in range(24)])
+        fields['crc'] = [67, 0, 0]
+        return fields
+
+
+if __name__ == "__main__":
+    unittest.main()
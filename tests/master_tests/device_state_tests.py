@@ -0,0 +1,115 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the device state module.
+"""
+
+import unittest
+
+from master.device_state import DeviceStateStore
+
+
+class DeviceStateStoreTest(unittest.TestCase):
+    """ Tests for DeviceStateStore. """
+
+    def test_update(self):
+        """ Test that the records are updated and only changes increment the version. """
+        store = DeviceStateStore()
+        store.register('output', [('status', 'B'), ('dimmer', 'B')], 2)
+        self.assertEquals([{'id': 0, 'status': 0, 'dimmer': 0},
+                           {'id': 1, 'status': 0, 'dimmer': 0}], store.get_all('output'))
+        self.assertEquals(0, store.get_version())
+
+        self.assertTrue(store.update('output', 1, status=1, dimmer=50))
+        self.assertFalse(store.update('output', 1, status=1))
+        self.assertEquals(1, store.get_version())
+        self.assertEquals({'id': 1, 'status': 1, 'dimmer': 50}, store.get('output', 1))
+
+        self.assertTrue(store.update('output', 3, status=1))
+        self.assertEquals(4, store.get_size('output'))
+        self.assertEquals(2, store.get_version())
+
+    def test_update_all(self):
+        """ Test that the records changed by update_all get one version. """
+        store = DeviceStateStore()
+        store.register('output', [('status', 'B'), ('dimmer', 'B')], 3)
+
+        self.assertEquals([0, 2], store.update_all('output', {0: {'status': 1},
+                                                              1: {'status': 0},
+                                                              2: {'dimmer': 10}}))
+        self.assertEquals(1, store.get_version())
+        self.assertEquals([], store.update_all('output', {0: {'status': 1}}))
+        self.assertEquals(1, store.get_version())
+
+    def test_changes(self):
+        """ Test the changes since a version. """
+        store = DeviceStateStore()
+        store.register('output', [('status', 'B')], 3)
+        store.register('shutter', [('state', ['stopped', 'going_up'])], 1)
+
+        store.update('output', 1, status=1)
+        version = store.get_version()
+        store.update('output', 2, status=1)
+        store.update('shutter', 0, state='going_up')
+
+        self.assertEquals({'version': 3,
+                           'changes': {'output': [{'id': 2, 'status': 1}],
+                                       'shutter': [{'id': 0, 'state': 'going_up'}]}},
+                          store.get_changes(version))
+        self.assertEquals({'version': 3, 'changes': {'output': [{'id': 2, 'status': 1}]}},
+                          store.get_changes(version, ['output']))
+        self.assertEquals(3, len(store.get_changes()['changes']['output']))
+        self.assertEquals({'version': 3, 'changes': {'output': [], 'shutter': []}},
+                          store.get_changes(3))
+        self.assertRaises(ValueError, store.get_changes, None, ['output', 'light'])
+        self.assertRaises(ValueError, store.get_changes, None, 'output')
+
+    def test_increment(self):
+        """ Test incrementing a counter with other fields. """
+        store = DeviceStateStore()
+        store.register('input', [('presses', 'L'), ('last_press', 'd')])
+
+        store.increment('input', 2, 'presses', last_press=10.5)
+        store.increment('input', 2, 'presses', last_press=12.0)
+        self.assertEquals({'id': 2, 'presses': 2, 'last_press': 12.0}, store.get('input', 2))
+        self.assertEquals({'id': 0, 'presses': 0, 'last_press': 0.0}, store.get('input', 0))
+
+    def test_resize(self):
+        """ Test growing and shrinking a kind. """
+        store = DeviceStateStore()
+        store.register('shutter', [('state', ['stopped', 'going_up'])], 2)
+        store.update('shutter', 1, state='going_up')
+
+        store.resize('shutter', 1)
+        self.assertEquals([{'id': 0, 'state': 'stopped'}], store.get_all('shutter'))
+        store.resize('shutter', 2)
+        self.assertEquals({'id': 1, 'state': 'stopped'}, store.get('shutter', 1))
+        self.assertEquals([{'id': 1, 'state': 'stopped'}],
+                          store.get_changes(1)['changes']['shutter'])
+
+    def test_reconcile(self):
+        """ Test the reconciliation period. """
+        store = DeviceStateStore()
+        store.register('output', [('status', 'B')])
+        self.assertTrue(store.should_reconcile('output', 600))
+        store.reconciled('output')
+        self.assertFalse(store.should_reconcile('output', 600))
+        self.assertTrue(store.should_reconcile('output', 0))
+        store.invalidate('output')
+        self.assertTrue(store.should_reconcile('output', 600))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -20,6 +20,7 @@ Tests for the eeprom_controller module.
 
 import unittest
 import os
+import time
 
 from master.eeprom_controller import EepromController, EepromFile, EepromModel, EepromAddress, \
                                      EepromData, EepromId, EepromString, EepromByte, EepromWord, \
@@ -27,7 +28,10 @@ from master.eeprom_controller import EepromController, EepromFile, EepromModel,
                                      EepromIBool, EextByte, EextString
 
 from master.eeprom_extension import EepromExtension
+from master.eeprom_shadow import EepromShadow
+from master.eeprom_journal import EepromJournal
 import master.master_api as master_api
+from master.master_command import MasterCommandSpec
 
 
 class Model1(EepromModel):
@@ -313,6 +317,62 @@ class EepromControllerTest(unittest.TestCase):
         self.assertEquals(1, model.link)
         self.assertEquals(0, model.out)
 
+    def test_read_models(self):
+        """ Test reading all instances of several models in one pass. """
+        controller = get_eeprom_controller_dummy(
+                        ["\x02" + "\x00" * 255, "\x00" * 2 + "hello" + "\x00" * 249, "",
+                         "\x00" * 4 + "helloworld\x01\x00\x02" + "\x00" * 239])
+        (models4, model3) = controller.read_models([Model4, Model3])
+
+        self.assertEquals([0, 1, 2, 3], [m.id for m in models4])
+        self.assertEquals(["hello" + "\x00" * 5] + ["\x00" * 10] * 3,
+                          [m.name for m in models4])
+        self.assertEquals(("helloworld", 1, 512), (model3.name, model3.link, model3.out))
+        self.assertEquals([], model3.get_dirty_fields())
+
+    def test_write_dirty_fields(self):
+        """ Test that only the dirty fields are written, without listing the banks. """
+        banks = ["\x00" * 256] * 4 + ["\x00" * 4 + "helloworld\x01\x00\x02" + "\x00" * 239]
+        commands = []
+
+        def list(data):
+            """ Dummy for listing a bank. """
+            return {"data" : banks[data["bank"]]}
+
+        def write(data):
+            """ Dummy for writing bytes to a bank. """
+            commands.append((data["bank"], data["address"], data["data"]))
+            bank = banks[data["bank"]]
+            banks[data["bank"]] = bank[:data["address"]] + data["data"] + \
+                                  bank[data["address"] + len(data["data"]):]
+
+        class Communicator(MasterCommunicatorDummy):
+            """ Dummy that records the eeprom_list commands. """
+            def do_command(self, cmd, data):
+                """ Execute a command on the master dummy. """
+                if cmd == master_api.eeprom_list():
+                    commands.append("list")
+                return MasterCommunicatorDummy.do_command(self, cmd, data)
+
+        def get_controller():
+            """ Get a controller with a cold cache. """
+            return EepromController(EepromFile(Communicator(list, write)),
+                                    EepromExtension(EEPROM_DB_FILE))
+
+        ## A model that was read only writes the changed field
+        model = get_controller().read(Model5, 1)
+        del commands[:]
+        model.link = 3
+        self.assertEquals(["link"], model.get_dirty_fields())
+        get_controller().write(model)
+        self.assertEquals([(4, 14, "\x03")], commands)
+        self.assertEquals([], model.get_dirty_fields())
+
+        ## A new model only reads the addresses of its fields
+        del commands[:]
+        get_controller().write(Model5(id=1, name="helloWorld", link=3))
+        self.assertEquals([(4, 9, "W")], commands)
+
     def test_write_batch_one(self):
         """ Test write_batch with one model. """
         controller = get_eeprom_controller_dummy(
@@ -415,6 +475,38 @@ class EepromControllerTest(unittest.TestCase):
             self.assertEquals('Room %d'%i, models[i].name)
             self.assertEquals(i/2, models[i].floor)
 
+    def test_query(self):
+        """ Test filtering, projection and paging, and the index after a write. """
+        controller = get_eeprom_controller_dummy(["\xff" * 256, "\xff" * 256, "\xff" * 256])
+        controller.write_batch([Model7(id=0, name='hall', link=1, room=1),
+                                Model7(id=1, name='', link=2, room=1),
+                                Model7(id=2, name='kitchen', link=3, room=2)])
+
+        (total, models) = controller.query(Model7, {'room': 1})
+        self.assertEquals(2, total)
+        self.assertEquals([{'id': 0, 'name': 'hall', 'link': 1, 'room': 1},
+                           {'id': 1, 'name': '', 'link': 2, 'room': 1}],
+                          [m.to_dict() for m in models])
+
+        (total, models) = controller.query(Model7, {'name': {'ne': ''}}, ['name'], 1, 1)
+        self.assertEquals(2, total)
+        self.assertEquals([{'id': 2, 'name': 'kitchen'}], [m.to_dict() for m in models])
+
+        model = controller.read(Model7, 1)
+        model.room = 2
+        controller.write(model)
+
+        (total, models) = controller.query(Model7, {'room': {'in': [2]}}, ['link'])
+        self.assertEquals(2, total)
+        self.assertEquals([{'id': 1, 'link': 2}, {'id': 2, 'link': 3}],
+                          [m.to_dict() for m in models])
+
+        self.assertRaises(ValueError, controller.query, Model7, {'floor': 1})
+        self.assertRaises(ValueError, controller.query, Model7, {'room': {'like': 1}})
+        self.assertRaises(ValueError, controller.query, Model7, ['room'])
+        self.assertRaises(ValueError, controller.query, Model7, None, ['floor'])
+        self.assertRaises(ValueError, controller.query, Model7, None, 'name')
+
 
 class MasterCommunicatorDummy(object):
     """ Dummy for the MasterCommunicator. """
@@ -423,9 +515,16 @@ class MasterCommunicatorDummy(object):
         """ Default constructor. """
         self.__list_function = list_function
         self.__write_function = write_function
+        self.priorities = []
+        self.duration = None
 
-    def do_command(self, cmd, data):
+    def get_last_duration(self):
+        """ Get the duration of the last command, without the wait for a window slot. """
+        return self.duration
+
+    def do_command(self, cmd, data, priority=None):
         """ Execute a command on the master dummy. """
+        self.priorities.append(priority)
         if cmd == master_api.eeprom_list():
             return self.__list_function(data)
         elif cmd == master_api.read_eeprom():
@@ -442,6 +541,31 @@ class MasterCommunicatorDummy(object):
 class EepromFileTest(unittest.TestCase):
     """ Tests for EepromFile. """
 
+    SHADOW_FILE = "test_shadow.bin"
+    JOURNAL_FILE = "test_journal.bin"
+
+    def test_read_costs(self):
+        """ Test that the planner learns the durations of the commands without the wait for a
+        slot in the pipeline window, as reported by the communicator. """
+        communicator = MasterCommunicatorDummy(lambda data: {"data": "\xff" * 256})
+        eeprom_file = EepromFile(communicator)
+        costs = eeprom_file.get_read_statistics()
+
+        communicator.duration = 0.5
+        eeprom_file.read([EepromAddress(1, 0, 10)])  # One window: read_eeprom
+        eeprom_file.read([EepromAddress(2, 0, 256)])  # Full bank: eeprom_list
+
+        statistics = eeprom_file.get_read_statistics()
+        self.assertAlmostEquals(costs['read_cost'] + 0.2 * (0.5 - costs['read_cost']),
+                                statistics['read_cost'])
+        self.assertAlmostEquals(costs['list_cost'] + 0.2 * (0.5 - costs['list_cost']),
+                                statistics['list_cost'])
+
+        # A command that joined an identical command in flight has no duration.
+        communicator.duration = None
+        eeprom_file.read([EepromAddress(3, 0, 256)])
+        self.assertEquals(statistics['list_cost'], eeprom_file.get_read_statistics()['list_cost'])
+
     def test_read_one_bank_one_address(self):
         """ Test read from one bank with one address """
         def read(data):
@@ -777,10 +901,342 @@ class EepromFileTest(unittest.TestCase):
         eeprom_file.write([EepromData(EepromAddress(117, 248, 8), "test\xff\xff\xff\xff")])
         self.assertTrue(done['done'])
 
+    def test_shadow(self):
+        """ Test that the banks in the shadow are not read again after a restart. """
+        banks = ["\x00" * 256, "\x01" * 256, "\x02" * 256, "\x03" * 256]
+        reads = []
+
+        def read(data):
+            """ Read dummy. """
+            reads.append(data["bank"])
+            return {"data" : banks[data["bank"]]}
+
+        addresses = [EepromAddress(bank, 5, 2) for bank in range(4)]
+        try:
+            eeprom_file = EepromFile(MasterCommunicatorDummy(read),
+                                     EepromShadow(EepromFileTest.SHADOW_FILE))
+            eeprom_file.read_banks(range(4))
+            self.assertEquals([0, 1, 2, 3], reads)
+
+            ## After a restart, only the sampled banks are read
+            del reads[:]
+            eeprom_file = EepromFile(MasterCommunicatorDummy(read),
+                                     EepromShadow(EepromFileTest.SHADOW_FILE))
+            data = eeprom_file.read(addresses)
+            self.assertEquals(["\x03\x03"], [d.bytes for d in data[3:]])
+            self.assertEquals(EepromFile.SHADOW_SAMPLES, len(reads))
+            self.assertEquals(0, reads[0])
+
+            ## A bank that changed while the gateway was not running drops the shadow
+            banks[0] = "\xff" * 256
+            del reads[:]
+            eeprom_file = EepromFile(MasterCommunicatorDummy(read),
+                                     EepromShadow(EepromFileTest.SHADOW_FILE))
+            data = eeprom_file.read(addresses)
+            self.assertEquals(["\xff\xff", "\x01\x01"], [d.bytes for d in data[:2]])
+            self.assertEquals([0, 1, 2, 3], sorted(reads))
+
+            ## Invalidating the cache clears the shadow
+            eeprom_file.invalidate_cache()
+            self.assertEquals([], EepromShadow(EepromFileTest.SHADOW_FILE).get_banks())
+        finally:
+            os.remove(EepromFileTest.SHADOW_FILE)
+
+    def test_read_banks_refresh(self):
+        """ Test that refreshed banks are read from the master. """
+        banks = ["\x00" * 256]
+        eeprom_file = EepromFile(MasterCommunicatorDummy(lambda data: {"data" : banks[0]}))
+
+        self.assertEquals({0: "\x00" * 256}, eeprom_file.read_banks([0]))
+        banks[0] = "\x01" * 256
+        self.assertEquals({0: "\x00" * 256}, eeprom_file.read_banks([0]))
+        self.assertEquals({0: "\x01" * 256}, eeprom_file.read_banks([0], refresh=True))
+
+    def test_verify_cache(self):
+        """ Test that the cache is invalidated if a sampled bank changed on the master. """
+        banks = ["\x00" * 256, "\x01" * 256]
+        reads = []
+
+        def read(data):
+            """ Read dummy. """
+            reads.append(data["bank"])
+            return {"data" : banks[data["bank"]]}
+
+        eeprom_file = EepromFile(MasterCommunicatorDummy(read))
+        eeprom_file.read_banks([0, 1])
+        self.assertTrue(eeprom_file.verify_cache())
+
+        banks[1] = "\x02" * 256
+        self.assertFalse(eeprom_file.verify_cache())
+        del reads[:]
+        self.assertEquals({0: "\x00" * 256, 1: "\x02" * 256}, eeprom_file.read_banks([0, 1]))
+        self.assertEquals([0], reads)
+
+    def test_mark_stale(self):
+        """ Test that the stale banks are revalidated and only the changed banks differ. """
+        banks = ["\x00" * 256, "\x01" * 256, "\x02" * 256]
+        reads = []
+
+        def read(data):
+            """ Read dummy. """
+            reads.append(data["bank"])
+            return {"data" : banks[data["bank"]]}
+
+        communicator = MasterCommunicatorDummy(read)
+        eeprom_file = EepromFile(communicator)
+        eeprom_file.read_banks([0, 1, 2])
+        eeprom_file.read_banks([0])
+
+        eeprom_file.mark_stale()
+        banks[1] = "\x03" * 256
+
+        del reads[:]
+        self.assertEquals({0: "\x00" * 256}, eeprom_file.read_banks([0]))
+        self.assertEquals([0], reads)
+
+        del reads[:]
+        del communicator.priorities[:]
+        self.assertEquals(1, eeprom_file.revalidate_cache())
+        self.assertEquals([1, 2], reads)
+        self.assertEquals([MasterCommandSpec.BACKGROUND] * 2, communicator.priorities)
+
+        del reads[:]
+        self.assertEquals({0: "\x00" * 256, 1: "\x03" * 256, 2: "\x02" * 256},
+                          eeprom_file.read_banks([0, 1, 2]))
+        self.assertEquals([], reads)
+
+        statistics = eeprom_file.get_read_statistics()
+        self.assertEquals(3, statistics['revalidated'])
+        self.assertEquals(1, statistics['changed'])
+        self.assertEquals(0, statistics['stale'])
+        self.assertEquals(3, statistics['misses'])
+        self.assertEquals(4, statistics['hits'])
+
+    def test_prefetch_during_write(self):
+        """ Test that a listed bank is not cached if the bank was written while the eeprom_list
+        was in flight. """
+        banks = ["\x00" * 256]
+        state = {'write': True}
+
+        def read(data):
+            """ Read dummy, the first read is answered after a write. """
+            old = banks[data["bank"]]
+            if state['write']:
+                state['write'] = False
+                eeprom_file.write([EepromData(EepromAddress(0, 2, 2), "ab")])
+            return {"data" : old}
+
+        def write(data):
+            """ Write dummy. """
+            bank = banks[data["bank"]]
+            banks[data["bank"]] = bank[:data["address"]] + data["data"] + \
+                                  bank[data["address"] + len(data["data"]):]
+            return {"bank" : data["bank"], "address" : data["address"], "data" : data["data"]}
+
+        eeprom_file = EepromFile(MasterCommunicatorDummy(read, write))
+        self.assertTrue(eeprom_file.prefetch(0))
+        self.assertEquals("\x00\x00ab" + "\x00" * 252, eeprom_file.read_banks([0])[0])
+
+    def test_failed_write(self):
+        """ Test that a failed write only invalidates the written bank. """
+        banks = ["\x00" * 256, "\x01" * 256]
+        reads = []
+
+        def read(data):
+            """ Read dummy. """
+            reads.append(data["bank"])
+            return {"data" : banks[data["bank"]]}
+
+        def write(data):
+            """ Write dummy. """
+            raise Exception("write failed")
+
+        eeprom_file = EepromFile(MasterCommunicatorDummy(read, write))
+        eeprom_file.read_banks([0, 1])
+
+        try:
+            eeprom_file.write([EepromData(EepromAddress(0, 2, 2), "ab")])
+            self.fail("Expected an exception")
+        except Exception as exception:
+            self.assertEquals("write failed", str(exception))
+
+        del reads[:]
+        eeprom_file.read_banks([0, 1])
+        self.assertEquals([0], reads)
+
+    def test_write_bank(self):
+        """ Test that a full bank only writes the changed windows. """
+        banks = ["\x00" * 256]
+        controller = get_eeprom_controller_dummy(banks)
+
+        try:
+            self.assertEquals([5, 100], controller.write_bank(0, "\x00" * 5 + "\x01" * 3 +
+                                                              "\x00" * 92 + "\x02" +
+                                                              "\x00" * 155))
+            self.assertEquals("\x00" * 5 + "\x01" * 3 + "\x00" * 92 + "\x02" + "\x00" * 155,
+                              banks[0])
+            self.assertEquals([], controller.write_bank(0, banks[0]))
+        finally:
+            if os.path.exists(EEPROM_DB_FILE):
+                os.remove(EEPROM_DB_FILE)
+
+    def test_write_behind(self):
+        """ Test that the writes are journaled, read back and flushed in coalesced windows. """
+        banks = ["\x00" * 256, "\x00" * 256]
+        writes = []
+
+        def write(data):
+            """ Write dummy. """
+            writes.append((data["bank"], data["address"], data["data"]))
+            bank = banks[data["bank"]]
+            banks[data["bank"]] = bank[:data["address"]] + data["data"] + \
+                                  bank[data["address"] + len(data["data"]):]
+            return {"bank" : data["bank"], "address" : data["address"], "data" : data["data"]}
+
+        communicator = MasterCommunicatorDummy(lambda data: {"data" : banks[data["bank"]]}, write)
+        try:
+            eeprom_file = EepromFile(communicator,
+                                     journal=EepromJournal(EepromFileTest.JOURNAL_FILE),
+                                     quiet_period=60)
+            eeprom_file.write([EepromData(EepromAddress(0, 2, 2), "ab")])
+            eeprom_file.write([EepromData(EepromAddress(0, 6, 2), "cd")])
+            eeprom_file.write([EepromData(EepromAddress(1, 0, 1), "e")])
+            eeprom_file.activate()
+
+            ## Nothing is written to the master, but the reads see the writes
+            self.assertEquals([], writes)
+            self.assertTrue(eeprom_file.has_pending_writes())
+            self.assertEquals(["ab", "cd"], [d.bytes for d in eeprom_file.read(
+                [EepromAddress(0, 2, 2), EepromAddress(0, 6, 2)])])
+
+            ## The flush coalesces the writes in one window per bank
+            self.assertEquals(2, eeprom_file.flush())
+            self.assertEquals([(0, 2, "ab\x00\x00cd"), (1, 0, "e")], writes)
+            self.assertFalse(eeprom_file.has_pending_writes())
+            self.assertEquals([], EepromJournal(EepromFileTest.JOURNAL_FILE).get_writes())
+            self.assertEquals(0, eeprom_file.flush())
+
+            ## After a restart, the journal is replayed
+            EepromJournal(EepromFileTest.JOURNAL_FILE).append([(1, 4, "fg")])
+            del writes[:]
+            eeprom_file = EepromFile(communicator,
+                                     journal=EepromJournal(EepromFileTest.JOURNAL_FILE),
+                                     quiet_period=60)
+            self.assertTrue(eeprom_file.has_pending_writes())
+            self.assertEquals(["e\x00\x00\x00fg"],
+                              [d.bytes for d in eeprom_file.read([EepromAddress(1, 0, 6)])])
+            self.assertEquals(1, eeprom_file.flush())
+            self.assertEquals([(1, 4, "fg")], writes)
+        finally:
+            os.remove(EepromFileTest.JOURNAL_FILE)
+
+
+    def test_write_behind_shadow(self):
+        """ Test that a bank with pending writes is only put in the shadow when it is flushed. """
+        banks = ["\x00" * 256, "\x01" * 256]
+
+        def write(data):
+            """ Write dummy. """
+            bank = banks[data["bank"]]
+            banks[data["bank"]] = bank[:data["address"]] + data["data"] + \
+                                  bank[data["address"] + len(data["data"]):]
+            return {"bank" : data["bank"], "address" : data["address"], "data" : data["data"]}
+
+        communicator = MasterCommunicatorDummy(lambda data: {"data" : banks[data["bank"]]}, write)
+        try:
+            eeprom_file = EepromFile(communicator, EepromShadow(EepromFileTest.SHADOW_FILE),
+                                     EepromJournal(EepromFileTest.JOURNAL_FILE), quiet_period=60)
+            eeprom_file.read_banks([0, 1])
+            eeprom_file.write([EepromData(EepromAddress(0, 2, 2), "ab")])
+            self.assertEquals([1], EepromShadow(EepromFileTest.SHADOW_FILE).get_banks())
+
+            ## Without the journal, the pending writes are lost: the shadow has the master data
+            eeprom_file = EepromFile(communicator, EepromShadow(EepromFileTest.SHADOW_FILE))
+            self.assertEquals({0: "\x00" * 256, 1: "\x01" * 256}, eeprom_file.read_banks([0, 1]))
+
+            ## With the journal, the pending writes are applied to the shadow data
+            eeprom_file = EepromFile(communicator, EepromShadow(EepromFileTest.SHADOW_FILE),
+                                     EepromJournal(EepromFileTest.JOURNAL_FILE), quiet_period=60)
+            self.assertEquals("\x00\x00ab" + "\x00" * 252, eeprom_file.read_banks([0])[0])
+
+            eeprom_file.flush()
+            self.assertEquals("\x00\x00ab" + "\x00" * 252,
+                              EepromShadow(EepromFileTest.SHADOW_FILE).get(0))
+        finally:
+            os.remove(EepromFileTest.SHADOW_FILE)
+            os.remove(EepromFileTest.JOURNAL_FILE)
+
+    def test_write_behind_quiet_period(self):
+        """ Test that the pending writes are flushed once no writes were done for the quiet
+        period. """
+        banks = ["\x00" * 256]
+        writes = []
+
+        def write(data):
+            """ Write dummy. """
+            writes.append((data["bank"], data["address"], data["data"]))
+            return {"bank" : data["bank"], "address" : data["address"], "data" : data["data"]}
+
+        communicator = MasterCommunicatorDummy(lambda data: {"data" : banks[data["bank"]]}, write)
+        try:
+            eeprom_file = EepromFile(communicator,
+                                     journal=EepromJournal(EepromFileTest.JOURNAL_FILE),
+                                     quiet_period=0.1)
+            eeprom_file.write([EepromData(EepromAddress(0, 2, 2), "ab")])
+            time.sleep(0.05)
+            eeprom_file.write([EepromData(EepromAddress(0, 6, 2), "cd")])
+            time.sleep(0.05)
+            self.assertEquals([], writes)
+
+            end = time.time() + 2
+            while eeprom_file.has_pending_writes() and time.time() < end:
+                time.sleep(0.01)
+            self.assertEquals([(0, 2, "ab\x00\x00cd")], writes)
+        finally:
+            os.remove(EepromFileTest.JOURNAL_FILE)
+
 
 class EepromModelTest(unittest.TestCase):
     """ Tests for EepromModel. """
 
+    def test_dirty_fields(self):
+        """ Test the dirty fields of a model. """
+        model = Model5(id=1, name="hello", link=2)
+        self.assertEquals(["link", "name"], model.get_dirty_fields())
+        self.assertEquals(None, model.get_base())
+
+        model.mark_clean()
+        self.assertEquals([], model.get_dirty_fields())
+
+        model.link = 3
+        model.out = 4
+        self.assertEquals(["link", "out"], model.get_dirty_fields())
+        self.assertEquals({"id" : 1, "name" : "hello", "link" : 2}, model.get_base().to_dict())
+        self.assertEquals([EepromAddress(4, 14, 1)],
+                          [d.address for d in model.to_eeprom_data(["link"])])
+
+    def test_fields_per_class(self):
+        """ Test that the cached fields of a model are not shared with its subclasses. """
+        class ParentModel(EepromModel):
+            """ Dummy model with an id. """
+            id = EepromId(10)
+            name = EepromString(10, lambda id: (1, id * 10))
+
+        self.assertEquals(["name"], [f[0] for f in ParentModel.get_fields(include_eeprom=True)])
+
+        class ChildModel(ParentModel):
+            """ Dummy model with an extra field. """
+            link = EepromByte(lambda id: (2, id))
+
+        self.assertEquals(["link", "name"],
+                          [f[0] for f in ChildModel.get_fields(include_eeprom=True)])
+        self.assertEquals(["name"], [f[0] for f in ParentModel.get_fields(include_eeprom=True)])
+
+        addresses = ChildModel.get_addresses(3)
+        self.assertEquals([EepromAddress(2, 3, 1), EepromAddress(1, 30, 10)], addresses)
+        addresses.append(EepromAddress(0, 0, 1))
+        self.assertEquals(2, len(ChildModel.get_addresses(3)))
+
     def test_get_fields(self):
         """ Test get_fields. """
         fields = Model1.get_fields(include_eeprom=True)
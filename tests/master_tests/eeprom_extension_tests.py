@@ -105,6 +105,24 @@ class EepromExtensionTest(unittest.TestCase):
         field_dict = ext.read_model(TestModel, 1)
         self.assertEquals({'int_field':7, 'str_field':'hello'}, field_dict)
 
+    def test_write_read_models(self):
+        """ Test writing and reading a batch of models, with a new EepromExtension. """
+        class TestModel(EepromModel):
+            id = EepromId(102)
+            int_field = EextByte()
+            str_field = EextString()
+
+        ext = self.__get_extension()
+        self.assertEquals([{'int_field':255}], ext.read_models(TestModel, [3], ['int_field']))
+        ext.write_models([TestModel(id=1, int_field=7, str_field='hello'),
+                          TestModel(id=2, str_field='world')])
+
+        for ext in [ext, self.__get_extension()]:
+            self.assertEquals([{'int_field':7, 'str_field':'hello'},
+                               {'int_field':255, 'str_field':'world'},
+                               {'int_field':255, 'str_field':''}],
+                              ext.read_models(TestModel, [1, 2, 3]))
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
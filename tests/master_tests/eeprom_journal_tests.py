@@ -0,0 +1,90 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the eeprom journal module.
+"""
+
+import os
+import unittest
+
+from master.eeprom_journal import EepromJournal
+
+
+class EepromJournalTest(unittest.TestCase):
+    """ Tests for EepromJournal. """
+
+    FILE = "test_journal.bin"
+
+    def setUp(self): #pylint: disable=C0103
+        """ Run before each test. """
+        if os.path.exists(EepromJournalTest.FILE):
+            os.remove(EepromJournalTest.FILE)
+
+    def tearDown(self): #pylint: disable=C0103
+        """ Run after each test. """
+        if os.path.exists(EepromJournalTest.FILE):
+            os.remove(EepromJournalTest.FILE)
+
+    def test_append_reopen(self):
+        """ Test appending writes and opening the journal again. """
+        journal = EepromJournal(EepromJournalTest.FILE)
+        self.assertEquals([], journal.get_writes())
+
+        journal.append([(1, 10, "abc"), (2, 250, "\x00" * 6)])
+        journal.append([(1, 11, "x")])
+        journal.append([])
+        journal.close()
+
+        journal = EepromJournal(EepromJournalTest.FILE)
+        self.assertEquals([(1, 10, "abc"), (2, 250, "\x00" * 6), (1, 11, "x")],
+                          journal.get_writes())
+
+        journal.clear()
+        self.assertEquals([], journal.get_writes())
+        journal.append([(3, 0, "y")])
+        journal.close()
+
+        journal = EepromJournal(EepromJournalTest.FILE)
+        self.assertEquals([(3, 0, "y")], journal.get_writes())
+        journal.close()
+
+    def test_incomplete_batch(self):
+        """ Test that an incomplete or corrupt batch is dropped with everything after it. """
+        journal = EepromJournal(EepromJournalTest.FILE)
+        journal.append([(1, 10, "abc")])
+        journal.append([(1, 20, "def")])
+        journal.close()
+
+        size = os.path.getsize(EepromJournalTest.FILE)
+        with open(EepromJournalTest.FILE, "r+b") as journal_file:
+            journal_file.truncate(size - 1)
+
+        journal = EepromJournal(EepromJournalTest.FILE)
+        self.assertEquals([(1, 10, "abc")], journal.get_writes())
+        journal.append([(1, 30, "ghi")])
+        journal.close()
+
+        with open(EepromJournalTest.FILE, "r+b") as journal_file:
+            journal_file.seek(EepromJournal.BATCH_HEADER.size + 1)
+            journal_file.write("\xff")
+
+        journal = EepromJournal(EepromJournalTest.FILE)
+        self.assertEquals([], journal.get_writes())
+        self.assertEquals(0, os.path.getsize(EepromJournalTest.FILE))
+        journal.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
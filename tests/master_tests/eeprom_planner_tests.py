@@ -0,0 +1,65 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the eeprom planner module.
+"""
+
+import unittest
+
+from master.eeprom_controller import EepromAddress
+from master.eeprom_planner import EepromReadPlanner
+
+
+class EepromReadPlannerTest(unittest.TestCase):
+    """ Tests for EepromReadPlanner. """
+
+    def test_get_windows(self):
+        """ Test that overlapping addresses are merged in the windows. """
+        windows = EepromReadPlanner.get_windows([EepromAddress(1, 0, 4), EepromAddress(1, 2, 6),
+                                                 EepromAddress(1, 9, 3), EepromAddress(1, 250, 6)])
+        self.assertEquals([0, 10, 246], windows)
+        self.assertEquals([], EepromReadPlanner.get_windows([]))
+
+    def test_plan(self):
+        """ Test the plan for cached banks, banks with a few reads and banks with many reads. """
+        planner = EepromReadPlanner(read_cost=0.02, list_cost=0.1)
+
+        few = [EepromAddress(1, 0, 4), EepromAddress(1, 100, 4)]
+        many = [EepromAddress(2, offset, 1) for offset in range(0, 256, 20)]
+        cached = [EepromAddress(3, 0, 1), EepromAddress(3, 200, 1)]
+
+        plan = planner.plan(few + many + cached, set([3]))
+        self.assertEquals({1: [0, 100], 2: EepromReadPlanner.LIST, 3: EepromReadPlanner.CACHED},
+                          plan)
+
+        statistics = planner.get_statistics()
+        self.assertEquals((1, 1, 1, 2), (statistics['cached'], statistics['read'],
+                                         statistics['list'], statistics['windows']))
+        # The fixed plan reads the 2 windows of the cached bank
+        self.assertAlmostEquals(0.04, statistics['saved'])
+
+    def test_measured(self):
+        """ Test that the plan follows the measured costs. """
+        planner = EepromReadPlanner(read_cost=0.02, list_cost=0.1, smoothing=0.5)
+        addresses = [EepromAddress(1, offset, 1) for offset in range(0, 100, 20)]
+        self.assertEquals({1: EepromReadPlanner.LIST}, planner.plan(addresses, set()))
+
+        planner.measured(EepromReadPlanner.LIST, 0.2)
+        self.assertAlmostEquals(0.15, planner.get_statistics()['list_cost'])
+        self.assertEquals({1: [0, 20, 40, 60, 80]}, planner.plan(addresses, set()))
+
+
+if __name__ == "__main__":
+    unittest.main()
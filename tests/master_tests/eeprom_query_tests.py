@@ -0,0 +1,105 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the eeprom query module.
+"""
+
+import unittest
+
+from master.eeprom_controller import EepromModel, EepromId, EepromString, EepromByte, EextByte
+from master.eeprom_query import EepromQuery, EepromIndex
+
+
+class QueryModel(EepromModel):
+    """ Dummy model with an id, eeprom fields and an eext field. """
+    id = EepromId(10)
+    name = EepromString(10, lambda id: (1, id * 10))
+    floor = EepromByte(lambda id: (2, id))
+    room = EextByte()
+
+
+class EepromQueryTest(unittest.TestCase):
+    """ Tests for EepromQuery. """
+
+    def test_matches(self):
+        """ Test the conditions with and without an operator. """
+        query = EepromQuery(QueryModel, {'floor': 2, 'name': {'ne': ''}, 'room': {'in': [1, 3]}})
+        self.assertEquals(['floor', 'name', 'room'], query.get_fields())
+
+        self.assertTrue(query.matches(QueryModel(id=1, name='hall', floor=2, room=3)))
+        self.assertFalse(query.matches(QueryModel(id=1, name='', floor=2, room=3)))
+        self.assertFalse(query.matches(QueryModel(id=1, name='hall', floor=1, room=3)))
+        self.assertFalse(query.matches(QueryModel(id=1, name='hall', floor=2, room=2)))
+        self.assertTrue(query.matches(QueryModel(id=1, name='', floor=2), ['floor']))
+
+        query = EepromQuery(QueryModel, {'floor': {'ge': 2}, 'name': {'contains': 'ki'}})
+        self.assertTrue(query.matches(QueryModel(id=1, name='kitchen', floor=3)))
+        self.assertFalse(query.matches(QueryModel(id=1, name='kitchen', floor=1)))
+        self.assertFalse(query.matches(QueryModel(id=1, name='hall', floor=3)))
+
+        self.assertTrue(EepromQuery(QueryModel).matches(QueryModel(id=1)))
+
+    def test_invalid_values(self):
+        """ Test that the values that don't fit the operator or the field are refused. """
+        for filters in [{'floor': [1, 2]}, {'floor': {'in': [[1]]}}, {'floor': {'in': 1}},
+                        {'floor': {'lt': {'a': 1}}}, {'floor': {'contains': 2}},
+                        {'name': {'contains': 5}}]:
+            self.assertRaises(ValueError, EepromQuery, QueryModel, filters)
+
+        query = EepromQuery(QueryModel, {'name': {'contains': u'al'}, 'floor': {'in': [1, None]}})
+        self.assertTrue(query.matches(QueryModel(id=1, name='hall', floor=1)))
+
+    def test_index_values(self):
+        """ Test the values and the residual fields for an index. """
+        query = EepromQuery(QueryModel, {'floor': {'in': [1, 2]}, 'name': {'ne': ''},
+                                         'room': {'lt': 5}})
+        self.assertEquals(set([1, 2]), query.get_index_values('floor'))
+        self.assertEquals(None, query.get_index_values('room'))
+        self.assertEquals(None, query.get_index_values('name'))
+        self.assertEquals(['name', 'room'], query.get_residual_fields(['floor', 'room']))
+
+    def test_invalid(self):
+        """ Test that unknown fields and operators are refused. """
+        self.assertRaises(ValueError, EepromQuery, QueryModel, {'color': 1})
+        self.assertRaises(ValueError, EepromQuery, QueryModel, {'floor': {'like': 1}})
+        self.assertRaises(ValueError, EepromQuery, QueryModel, {'floor': {'eq': 1, 'ne': 2}})
+        self.assertRaises(ValueError, EepromQuery, QueryModel, {'floor': {'in': 1}})
+
+
+class EepromIndexTest(unittest.TestCase):
+    """ Tests for EepromIndex. """
+
+    def test_index(self):
+        """ Test that the index is built and updated. """
+        index = EepromIndex(['floor', 'room'], [QueryModel(id=0, floor=1, room=1),
+                                                QueryModel(id=1, floor=2, room=1),
+                                                QueryModel(id=2, floor=2, room=3)])
+        self.assertEquals(['floor', 'room'], index.get_fields())
+        self.assertEquals(set([1, 2]), index.get_ids('floor', [2]))
+        self.assertEquals(set([0, 1, 2]), index.get_ids('room', [1, 3]))
+        self.assertEquals(set(), index.get_ids('room', [4]))
+
+        index.update(QueryModel(id=1, floor=3, room=4), ['floor'])
+        self.assertEquals(set([2]), index.get_ids('floor', [2]))
+        self.assertEquals(set([1]), index.get_ids('floor', [3]))
+        self.assertEquals(set([0, 1]), index.get_ids('room', [1]))
+
+        index.update(QueryModel(id=2, room=1))
+        self.assertEquals(set([0, 1, 2]), index.get_ids('room', [1]))
+        self.assertEquals(set([2]), index.get_ids('floor', [2]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the eeprom shadow module.
+"""
+
+import os
+import unittest
+
+from master.eeprom_shadow import EepromShadow
+
+
+class EepromShadowTest(unittest.TestCase):
+    """ Tests for EepromShadow. """
+
+    FILE = "test_shadow.bin"
+
+    def setUp(self): #pylint: disable=C0103
+        """ Run before each test. """
+        if os.path.exists(EepromShadowTest.FILE):
+            os.remove(EepromShadowTest.FILE)
+
+    def tearDown(self): #pylint: disable=C0103
+        """ Run after each test. """
+        if os.path.exists(EepromShadowTest.FILE):
+            os.remove(EepromShadowTest.FILE)
+
+    def test_put_get(self):
+        """ Test storing banks and opening the shadow again. """
+        shadow = EepromShadow(EepromShadowTest.FILE)
+        self.assertEquals(None, shadow.get(3))
+        self.assertEquals([], shadow.get_banks())
+
+        shadow.put(3, "a" * 256)
+        shadow.put(255, "b" * 256)
+        self.assertEquals("a" * 256, shadow.get(3))
+        self.assertRaises(ValueError, shadow.put, 4, "too short")
+        shadow.close()
+
+        shadow = EepromShadow(EepromShadowTest.FILE)
+        self.assertEquals([3, 255], shadow.get_banks())
+        self.assertEquals("b" * 256, shadow.get(255))
+        shadow.close()
+
+    def test_invalidate(self):
+        """ Test removing banks from the shadow. """
+        shadow = EepromShadow(EepromShadowTest.FILE)
+        for bank in range(3):
+            shadow.put(bank, chr(bank) * 256)
+
+        shadow.invalidate(1)
+        self.assertEquals([0, 2], shadow.get_banks())
+        shadow.invalidate()
+        self.assertEquals([], shadow.get_banks())
+        shadow.close()
+
+    def test_corrupt(self):
+        """ Test that a bank with a wrong checksum and a file with a wrong header are not used. """
+        shadow = EepromShadow(EepromShadowTest.FILE)
+        shadow.put(0, "a" * 256)
+        shadow.put(1, "b" * 256)
+        shadow.close()
+
+        with open(EepromShadowTest.FILE, "r+b") as shadow_file:
+            shadow_file.seek(EepromShadow.DATA_OFFSET + 256 + 10)
+            shadow_file.write("x")
+
+        shadow = EepromShadow(EepromShadowTest.FILE)
+        self.assertEquals("a" * 256, shadow.get(0))
+        self.assertEquals(None, shadow.get(1))
+        shadow.close()
+
+        with open(EepromShadowTest.FILE, "r+b") as shadow_file:
+            shadow_file.write("XXXX")
+
+        shadow = EepromShadow(EepromShadowTest.FILE)
+        self.assertEquals([], shadow.get_banks())
+        shadow.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the eeprom warmup module.
+"""
+
+import os
+import time
+import unittest
+
+from master.eeprom_controller import EepromController, EepromFile, EepromModel, EepromId, \
+                                     EepromString, EepromByte
+from master.eeprom_extension import EepromExtension
+from master.eeprom_warmup import EepromWarmup
+from master.master_command import MasterCommandSpec
+from master_tests.eeprom_controller_tests import MasterCommunicatorDummy
+from task_scheduler import TaskScheduler
+
+
+class WarmupModel(EepromModel):
+    """ Dummy model with an id, every id is in a different bank. """
+    id = EepromId(3)
+    name = EepromString(10, lambda id: (id + 1, 4))
+    link = EepromByte(lambda id: (id + 1, 14))
+
+
+class EepromWarmupTest(unittest.TestCase):
+    """ Tests for EepromWarmup. """
+
+    DB_FILE = 'warmup_test.db'
+
+    def setUp(self): #pylint: disable=C0103
+        """ Run before each test. """
+        if os.path.exists(EepromWarmupTest.DB_FILE):
+            os.remove(EepromWarmupTest.DB_FILE)
+
+        self.reads = []
+
+        def read(data):
+            """ Read dummy. """
+            self.reads.append(data["bank"])
+            return {"data" : "\xff" * 256}
+
+        self.communicator = MasterCommunicatorDummy(read)
+        self.controller = EepromController(EepromFile(self.communicator),
+                                           EepromExtension(EepromWarmupTest.DB_FILE))
+        self.scheduler = TaskScheduler(workers=1)
+        self.scheduler.start()
+
+    def tearDown(self): #pylint: disable=C0103
+        """ Run after each test. """
+        self.scheduler.stop()
+        if os.path.exists(EepromWarmupTest.DB_FILE):
+            os.remove(EepromWarmupTest.DB_FILE)
+
+    @staticmethod
+    def wait(warmup):
+        """ Wait until the warmup stopped. """
+        end = time.time() + 5
+        while warmup.is_running() and time.time() < end:
+            time.sleep(0.01)
+
+    def test_warmup(self):
+        """ Test that the banks that are not cached are prefetched with background priority. """
+        self.controller.read_banks([2])
+        del self.reads[:]
+        del self.communicator.priorities[:]
+
+        warmup = EepromWarmup(self.controller, [WarmupModel], interval=0,
+                              scheduler=self.scheduler)
+        self.assertEquals({'running': False, 'banks': 0, 'prefetched': 0, 'total': None,
+                           'coverage': None}, warmup.get_progress())
+
+        warmup.start()
+        EepromWarmupTest.wait(warmup)
+
+        self.assertEquals([1, 3], self.reads)
+        self.assertEquals([MasterCommandSpec.BACKGROUND] * 2, self.communicator.priorities)
+        self.assertEquals({'running': False, 'banks': 3, 'prefetched': 2, 'total': 3,
+                           'coverage': 1.0}, warmup.get_progress())
+        self.assertEquals(3, self.scheduler.get_statistics()['eeprom_warmup']['runs'])
+
+        del self.reads[:]
+        self.controller.read_all(WarmupModel)
+        self.assertEquals([], self.reads)
+
+    def test_idle_and_stop(self):
+        """ Test that nothing is prefetched while the master is busy and that the warmup can be
+        stopped. """
+        idle = {'idle': False}
+        warmup = EepromWarmup(self.controller, [WarmupModel], lambda: idle['idle'],
+                              interval=10, idle_wait=0.01, scheduler=self.scheduler)
+        warmup.start()
+        time.sleep(0.1)
+        self.assertEquals([], self.reads)
+        self.assertTrue(warmup.is_running())
+
+        idle['idle'] = True
+        end = time.time() + 5
+        while len(self.reads) == 0 and time.time() < end:
+            time.sleep(0.01)
+
+        warmup.stop()
+        EepromWarmupTest.wait(warmup)
+        self.assertFalse(warmup.is_running())
+        self.assertEquals([1], self.reads)
+
+        progress = warmup.get_progress()
+        self.assertEquals(1, progress['prefetched'])
+        self.assertAlmostEquals(1.0 / 3, progress['coverage'])
+
+
+if __name__ == "__main__":
+    unittest.main()
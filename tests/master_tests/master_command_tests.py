@@ -19,10 +19,11 @@ Tests for MasterCommand module.
 """
 
 import unittest
+import time
 
 import master.master_api as master_api
 from master.master_command import MasterCommandSpec, Field, OutputFieldType, DimmerFieldType, \
-                                  ErrorListFieldType
+                                  ErrorListFieldType, FixedLayout
 
 class MasterCommandSpecTest(unittest.TestCase):
     """ Tests for :class`MasterCommandSpec` """
@@ -322,6 +323,88 @@ class MasterCommandSpecTest(unittest.TestCase):
         self.assertFalse(master_api.basic_action().output_has_crc())
         self.assertTrue(master_api.read_output().output_has_crc())
 
+    def test_cached_spec(self):
+        """ Test that the specs in master_api are only built once. """
+        self.assertTrue(master_api.read_output() is master_api.read_output())
+        self.assertEquals("read_output", master_api.read_output.__name__)
+
+    def test_fixed_layout(self):
+        """ Test that FixedLayout decodes the same values as the field types. """
+        fields = [Field.byte("byte"), Field.int("int"), Field.str("str", 3), Field.padding(2),
+                  Field.bytes("bytes", 2), Field.lit("T"), Field.svt("svt"),
+                  Field.varstr("varstr", 4), Field.dimmer("dimmer"),
+                  Field("outputs", OutputFieldType())]
+        byte_str = "\x05\x01\x02abc\x00\x00\x03\x04T\x42\x02hi  \x37\x00"
+
+        layout = FixedLayout.compile(fields)
+        self.assertEquals(9, layout.num_fields)
+        self.assertEquals(18, layout.length)
+
+        decoded = {}
+        layout.decode(byte_str, decoded)
+
+        index = 0
+        for field in fields[:9]:
+            length = field.get_min_decode_bytes()
+            expected = field.decode(byte_str[index:index + length])
+            if field.name == "svt":
+                self.assertEquals(expected.get_byte(), decoded[field.name].get_byte())
+            else:
+                self.assertEquals(expected, decoded[field.name])
+            index += length
+
+        self.assertEquals(None, FixedLayout.compile(fields[9:]))
+
+        try:
+            FixedLayout.compile([Field.lit("T")]).decode("X", {})
+            self.assertTrue(False)
+        except ValueError:
+            pass
+
+    def test_consume_output_actual_bytes(self):
+        """ Test that actual_bytes contains all bytes when the output is split in pieces. """
+        spec = master_api.read_output()
+        fields = {'id': 5, 'type': 'D', 'light': 1, 'timer': 300, 'ctimer': 200, 'status': 1,
+                  'dimmer': 50, 'controller_out': 0, 'max_power': 5, 'floor_level': 2,
+                  'menu_position': [1, 2, 3], 'name': 'hello world 1234', 'crc': [0, 0, 0]}
+        output = spec.create_output(1, fields)[3:]
+        crc = sum([ord(c) for c in output[:-5]])
+        fields['crc'] = [67, crc / 256, crc % 256]
+        output = spec.create_output(1, fields)[3:]
+
+        for split in range(len(output)):
+            (_, result, done) = spec.consume_output(output[:split], None)
+            self.assertFalse(done)
+            (_, result, done) = spec.consume_output(output[split:], result)
+            self.assertTrue(done)
+
+            self.assertEquals(output, result.actual_bytes)
+            self.assertEquals('hello world 1234', result['name'])
+            self.assertEquals(300, result['timer'])
+            self.assertTrue(spec.check_crc(result))
+
+        fields['crc'] = [67, 0, 0]
+        (_, result, _) = spec.consume_output(spec.create_output(1, fields)[3:], None)
+        self.assertFalse(spec.check_crc(result))
+
+    def test_decode_time(self):
+        """ Measure the time to decode a thermostat list, the largest fixed-size reply. """
+        spec = master_api.thermostat_list()
+        fields = {'mode': 1, 'outside': master_api.Svt.temp(10.0), 'crc': [67, 0, 0]}
+        for i in range(32):
+            fields['tmp%d' % i] = master_api.Svt.temp(20.0 + i / 2.0)
+            fields['setp%d' % i] = master_api.Svt.temp(21.0)
+        output = spec.create_output(1, fields)[3:]
+
+        start = time.time()
+        for _ in range(1000):
+            (_, result, done) = spec.consume_output(output, None)
+        decode_time = (time.time() - start) / 1000
+
+        self.assertTrue(done)
+        self.assertEquals(25.5, result['tmp11'].get_temperature())
+        self.assertTrue(decode_time < 0.001, "Decode took %.6f s per reply" % decode_time)
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
@@ -23,11 +23,14 @@ import threading
 import time
 
 from master.master_communicator import MasterCommunicator, InMaintenanceModeException, \
-                                       BackgroundConsumer, CrcCheckFailedException
+                                       BackgroundConsumer, CrcCheckFailedException, \
+                                       CommandWindow
 import master.master_api as master_api
+from master.master_command import MasterCommandSpec
 
 from serial_tests import SerialMock, sin, sout
-from serial_utils import CommunicationTimedOutException
+from master_simulator import MasterSimulator
+from serial_utils import CommunicationTimedOutException, FlightRecorder
 
 class MasterCommunicatorTest(unittest.TestCase):
     """ Tests for MasterCommunicator class """
@@ -138,6 +141,27 @@ class MasterCommunicatorTest(unittest.TestCase):
         for i in range(1, 18):
             self.assertEquals("OK", comm.do_command(action, in_fields)["resp"])
 
+    def test_do_command_consume_in_chunks(self):
+        """ Test MasterCommunicator.do_command when the answer is longer than the chunks that are
+        handed to the consumer. """
+        action = master_api.eeprom_list()
+        out_fields = {"bank": 1, "data": "".join([chr(i) for i in range(256)])}
+
+        serial_mock = SerialMock(
+                        [sin(action.create_input(1, {"bank": 1})),
+                         sout("hello" + action.create_output(1, out_fields) + "world")])
+
+        chunk_size = MasterCommunicator.CONSUME_CHUNK_SIZE
+        MasterCommunicator.CONSUME_CHUNK_SIZE = 16
+        try:
+            comm = MasterCommunicator(serial_mock, init_master=False)
+            comm.start()
+
+            self.assertEquals(out_fields["data"], comm.do_command(action, {"bank": 1})["data"])
+            self.assertEquals("helloworld", comm.get_passthrough_data())
+        finally:
+            MasterCommunicator.CONSUME_CHUNK_SIZE = chunk_size
+
     def test_send_passthrough_data(self):
         """ Test the passthrough if no other communications are going on. """
         pt_input = "data from passthrough"
@@ -362,6 +386,421 @@ class MasterCommunicatorTest(unittest.TestCase):
 
         self.assertRaises(CrcCheckFailedException, lambda: comm.do_command(action))
 
+    def test_pipelined_do_command(self):
+        """ Test multiple commands in flight, the answers are matched using the cid. """
+        def handler(fields):
+            """ Answer with the action number, answers for low numbers take longer. """
+            time.sleep(0.05 if fields['action_number'] == 0 else 0)
+            return {'resp': '%02d' % fields['action_number']}
+
+        master = MasterSimulator({'BA': (master_api.basic_action(), handler)}, turnaround=0)
+        comm = MasterCommunicator(master, init_master=False, pipeline_window=4)
+        comm.start()
+
+        results = {}
+
+        def send(number):
+            """ Send a basic action and store the answer. """
+            results[number] = comm.do_command(master_api.basic_action(),
+                                              {'action_type': 1, 'action_number': number})['resp']
+
+        threads = [threading.Thread(target=send, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(dict([(i, '%02d' % i) for i in range(8)]), results)
+
+    def test_command_window(self):
+        """ Test the CommandWindow: slots and exclusive access. """
+        window = CommandWindow(2)
+        window.acquire()
+        window.acquire()
+
+        phase = {'acquired': False, 'exclusive': False}
+
+        def acquire():
+            """ Acquire a slot in the background. """
+            window.acquire()
+            phase['acquired'] = True
+
+        def acquire_exclusive():
+            """ Acquire the whole window in the background. """
+            window.acquire_exclusive()
+            phase['exclusive'] = True
+
+        thread = threading.Thread(target=acquire)
+        thread.start()
+        time.sleep(0.05)
+        self.assertFalse(phase['acquired'])
+
+        window.release()
+        thread.join()
+        self.assertTrue(phase['acquired'])
+
+        thread = threading.Thread(target=acquire_exclusive)
+        thread.start()
+        window.release()
+        time.sleep(0.05)
+        self.assertFalse(phase['exclusive'])
+
+        window.release()
+        thread.join()
+        self.assertTrue(phase['exclusive'])
+
+        thread = threading.Thread(target=acquire)
+        phase['acquired'] = False
+        thread.start()
+        time.sleep(0.05)
+        self.assertFalse(phase['acquired'])
+
+        window.release_exclusive()
+        thread.join()
+        self.assertTrue(phase['acquired'])
+
+        self.assertRaises(ValueError, lambda: CommandWindow(0))
+
+    def test_command_window_priorities(self):
+        """ Test that the CommandWindow serves the waiting commands by priority class. """
+        window = CommandWindow(1, starvation_timeout=10)
+        window.acquire(MasterCommandSpec.BACKGROUND)
+
+        order = []
+
+        def acquire(priority):
+            """ Acquire a slot in the background and release it again. """
+            window.acquire(priority)
+            order.append(priority)
+            window.release()
+
+        threads = []
+        for priority in [MasterCommandSpec.BACKGROUND, MasterCommandSpec.CONFIGURATION,
+                         MasterCommandSpec.INTERACTIVE, MasterCommandSpec.BACKGROUND]:
+            threads.append(threading.Thread(target=acquire, args=(priority,)))
+            threads[-1].start()
+            time.sleep(0.02)
+
+        statistics = window.get_statistics()
+        self.assertEquals(2, statistics['background']['queue_depth'])
+        self.assertEquals(1, statistics['interactive']['queue_depth'])
+
+        window.release()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals([MasterCommandSpec.INTERACTIVE, MasterCommandSpec.CONFIGURATION,
+                           MasterCommandSpec.BACKGROUND, MasterCommandSpec.BACKGROUND], order)
+
+        statistics = window.get_statistics()
+        self.assertEquals(3, statistics['background']['commands'])
+        self.assertEquals(2, statistics['background']['max_queue_depth'])
+        self.assertEquals(0, statistics['background']['queue_depth'])
+        self.assertTrue(statistics['background']['max_wait_time'] >= 0.06)
+        self.assertEquals(1, statistics['interactive']['commands'])
+        self.assertEquals(0, statistics['interactive']['starved'])
+
+    def test_command_window_starvation(self):
+        """ Test that a command that waited too long goes before commands of a higher class. """
+        window = CommandWindow(1, starvation_timeout=0.05)
+        window.acquire(MasterCommandSpec.INTERACTIVE)
+
+        order = []
+
+        def acquire(priority):
+            """ Acquire a slot in the background and release it again. """
+            window.acquire(priority)
+            order.append(priority)
+            window.release()
+
+        threads = []
+        for priority in [MasterCommandSpec.BACKGROUND, MasterCommandSpec.INTERACTIVE]:
+            threads.append(threading.Thread(target=acquire, args=(priority,)))
+            threads[-1].start()
+            time.sleep(0.1)
+
+        window.release()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals([MasterCommandSpec.BACKGROUND, MasterCommandSpec.INTERACTIVE], order)
+        self.assertEquals(1, window.get_statistics()['background']['starved'])
+
+    def test_do_command_priority(self):
+        """ Test that do_command uses the priority of the spec, unless it is overruled. """
+        master = MasterSimulator({'BA': (master_api.basic_action(), lambda _: {'resp': 'OK'}),
+                                  'ST': (master_api.status(), lambda _: {})}, turnaround=0)
+        comm = MasterCommunicator(master, init_master=False)
+        comm.start()
+
+        comm.do_command(master_api.basic_action(), {'action_type': 1, 'action_number': 2})
+        comm.do_command(master_api.basic_action(), {'action_type': 1, 'action_number': 2},
+                        priority=MasterCommandSpec.CONFIGURATION)
+
+        statistics = comm.get_scheduler_statistics()
+        self.assertEquals(1, statistics['interactive']['commands'])
+        self.assertEquals(1, statistics['configuration']['commands'])
+        self.assertEquals(MasterCommandSpec.INTERACTIVE, master_api.status().priority)
+
+    def test_do_command_single_flight(self):
+        """ Test that identical read-only commands in flight are only sent once. """
+        status = {'seconds': 1, 'minutes': 2, 'hours': 3, 'weekday': 4, 'day': 5, 'month': 6,
+                  'year': 7, 'mode': 76, 'f1': 3, 'f2': 143, 'f3': 88, 'h': 1}
+        master = MasterSimulator({'ST': (master_api.status(), lambda _: status),
+                                  'SO': (master_api.shutter_status(),
+                                         lambda fields: {'module_nr': fields['module_nr'],
+                                                         'status': 0})},
+                                 turnaround=0.1)
+        comm = MasterCommunicator(master, init_master=False)
+        comm.start()
+
+        results = []
+
+        def run(cmd, fields):
+            """ Execute a command and store the result. """
+            results.append(comm.do_command(cmd, fields))
+
+        threads = [threading.Thread(target=run, args=(master_api.status(), None))
+                   for _ in range(5)]
+        threads += [threading.Thread(target=run, args=(master_api.shutter_status(),
+                                                       {'module_nr': i}))
+                    for i in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(3, master.commands)
+        self.assertEquals(4, comm.get_commands_saved())
+        self.assertEquals(5, len([result for result in results if result.get('mode') == 76]))
+
+        # Once the command is done, the next identical command is sent again.
+        comm.do_command(master_api.status())
+        self.assertEquals(4, master.commands)
+
+    def test_get_last_duration(self):
+        """ Test that the duration of a command doesn't include the wait for a window slot and
+        that a command that joined a flight has no duration. """
+        master = MasterSimulator({'rn': (master_api.number_of_io_modules(),
+                                         lambda _: {'in': 1, 'out': 2, 'shutter': 0}),
+                                  'BA': (master_api.basic_action(), lambda _: {'resp': 'OK'})},
+                                 turnaround=0.1)
+        comm = MasterCommunicator(master, init_master=False, pipeline_window=1)
+        comm.start()
+
+        durations = {}
+
+        def run(name, cmd, fields):
+            """ Execute a command and store the duration and the time it took. """
+            start = time.time()
+            comm.do_command(cmd, fields)
+            durations[name] = (comm.get_last_duration(), time.time() - start)
+
+        basic_action = (master_api.basic_action(), {'action_type': 1, 'action_number': 2})
+        threads = [threading.Thread(target=run, args=('first',) + basic_action),
+                   threading.Thread(target=run, args=('read',
+                                                      master_api.number_of_io_modules(), None)),
+                   threading.Thread(target=run, args=('joined',
+                                                      master_api.number_of_io_modules(), None))]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join()
+
+        (duration, elapsed) = durations['read']
+        self.assertTrue(elapsed >= 0.15)  # The read waited for the basic action.
+        self.assertTrue(0.08 <= duration < 0.15)
+        self.assertEquals(None, durations['joined'][0])
+        self.assertEquals(1, comm.get_commands_saved())
+
+    def test_do_command_single_flight_priority(self):
+        """ Test that a read doesn't join an identical read of a lower priority class. """
+        master = MasterSimulator({'rn': (master_api.number_of_io_modules(),
+                                         lambda _: {'in': 1, 'out': 2, 'shutter': 0})},
+                                 turnaround=0.1)
+        comm = MasterCommunicator(master, init_master=False)
+        comm.start()
+
+        threads = [threading.Thread(target=comm.do_command,
+                                    args=(master_api.number_of_io_modules(),),
+                                    kwargs={'priority': priority})
+                   for priority in [MasterCommandSpec.BACKGROUND, MasterCommandSpec.INTERACTIVE,
+                                    MasterCommandSpec.BACKGROUND, MasterCommandSpec.INTERACTIVE]]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join()
+
+        # The second background read joins the interactive read, the second interactive read
+        # joins the first one.
+        self.assertEquals(2, master.commands)
+        self.assertEquals(2, comm.get_commands_saved())
+        statistics = comm.get_scheduler_statistics()
+        self.assertEquals(1, statistics['background']['commands'])
+        self.assertEquals(1, statistics['interactive']['commands'])
+
+    def test_do_command_single_flight_write(self):
+        """ Test that a read can't join a read that was sent before a write. """
+        master = MasterSimulator({'BA': (master_api.basic_action(), lambda _: {'resp': 'OK'}),
+                                  'rn': (master_api.number_of_io_modules(),
+                                         lambda _: {'in': 1, 'out': 2, 'shutter': 0})},
+                                 turnaround=0.1)
+        comm = MasterCommunicator(master, init_master=False)
+        comm.start()
+
+        threads = [threading.Thread(target=comm.do_command,
+                                    args=(master_api.number_of_io_modules(),)),
+                   threading.Thread(target=comm.do_command,
+                                    args=(master_api.basic_action(),
+                                          {'action_type': 1, 'action_number': 2})),
+                   threading.Thread(target=comm.do_command,
+                                    args=(master_api.number_of_io_modules(),))]
+        for thread in threads:
+            thread.start()
+            time.sleep(0.02)
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(3, master.commands)
+        self.assertEquals(0, comm.get_commands_saved())
+
+    def test_do_command_single_flight_timeout(self):
+        """ Test that the callers that joined a flight get the timeout of the command. """
+        action = master_api.number_of_io_modules()
+        serial_mock = SerialMock([sin(action.create_input(1, {}))])
+
+        comm = MasterCommunicator(serial_mock, init_master=False)
+        comm.start()
+
+        errors = []
+
+        def run():
+            """ Execute the command and store the exception. """
+            try:
+                comm.do_command(action, timeout=0.1)
+            except CommunicationTimedOutException, exception:
+                errors.append(exception)
+
+        threads = [threading.Thread(target=run) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEquals(3, len(errors))
+        self.assertEquals(2, comm.get_commands_saved())
+
+    def test_late_reply(self):
+        """ Test that a late reply is consumed by the expired consumer and not delivered. """
+        action = master_api.basic_action()
+        master = MasterSimulator({'BA': (action, lambda _: {'resp': 'OK'})}, turnaround=0,
+                                 faults=lambda _: 0.2 if master.commands == 0 else 0)
+        comm = MasterCommunicator(master, init_master=False)
+        comm.start()
+
+        try:
+            comm.do_command(action, {'action_type': 1, 'action_number': 2}, timeout=0.1)
+            self.fail('Expected CommunicationTimedOutException')
+        except CommunicationTimedOutException:
+            pass
+
+        self.assertEquals({'consumers': 1, 'expired': 1, 'late_replies': 0, 'swept': 0},
+                          comm.get_consumer_statistics())
+
+        # The cid of the expired consumer is not reused.
+        self.assertEquals('OK', comm.do_command(action, {'action_type': 1,
+                                                         'action_number': 2})['resp'])
+
+        time.sleep(0.2)
+        self.assertEquals({'consumers': 0, 'expired': 0, 'late_replies': 1, 'swept': 0},
+                          comm.get_consumer_statistics())
+
+    def test_consumer_soak(self):
+        """ Test that the consumer registry stays bounded when many commands time out, because
+        the answers are dropped or arrive too late. """
+        (late_reply_timeout, sweep_period) = (MasterCommunicator.LATE_REPLY_TIMEOUT,
+                                              MasterCommunicator.CONSUMER_SWEEP_PERIOD)
+        MasterCommunicator.LATE_REPLY_TIMEOUT = 0.5
+        MasterCommunicator.CONSUMER_SWEEP_PERIOD = 0.1
+        try:
+            counter = {'value': 0}
+            lock = threading.Lock()
+
+            def faults(_):
+                """ Drop every 5th command, delay every 7th command past the timeout. """
+                with lock:
+                    counter['value'] += 1
+                    if counter['value'] % 5 == 0:
+                        return None
+                    elif counter['value'] % 7 == 0:
+                        return 0.2
+                    return 0
+
+            action = master_api.basic_action()
+            master = MasterSimulator({'BA': (action, lambda _: {'resp': 'OK'})}, turnaround=0.001,
+                                     faults=faults)
+            comm = MasterCommunicator(master, init_master=False, pipeline_window=4)
+            comm.start()
+
+            stats = {'ok': 0, 'timeouts': 0, 'max_consumers': 0}
+            end = time.time() + 2
+
+            def run():
+                """ Execute commands until the end of the test. """
+                while time.time() < end:
+                    try:
+                        comm.do_command(action, {'action_type': 1, 'action_number': 2},
+                                        timeout=0.1)
+                        stats['ok'] += 1
+                    except CommunicationTimedOutException:
+                        stats['timeouts'] += 1
+                    stats['max_consumers'] = max(stats['max_consumers'],
+                                                 comm.get_consumer_statistics()['consumers'])
+
+            threads = [threading.Thread(target=run) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+            self.assertTrue(stats['ok'] > 100)
+            self.assertEquals(master.dropped + master.delayed, stats['timeouts'])
+            # One consumer per slot in the window, plus the expired consumers of the timeouts
+            # in the last LATE_REPLY_TIMEOUT and sweep period.
+            self.assertTrue(stats['max_consumers'] < 4 + stats['timeouts'] / 2)
+
+            time.sleep(0.8)
+            consumer_stats = comm.get_consumer_statistics()
+            self.assertEquals(0, consumer_stats['consumers'])
+            self.assertEquals(master.delayed, consumer_stats['late_replies'])
+            self.assertEquals(master.dropped, consumer_stats['swept'])
+        finally:
+            MasterCommunicator.LATE_REPLY_TIMEOUT = late_reply_timeout
+            MasterCommunicator.CONSUMER_SWEEP_PERIOD = sweep_period
+
+    def test_flight_recorder(self):
+        """ Test that the traffic on the serial port is recorded. """
+        action = master_api.basic_action()
+        in_fields = {"action_type": 1, "action_number": 2}
+        out_fields = {"resp": "OK"}
+
+        serial_mock = SerialMock([sin(action.create_input(1, in_fields)),
+                                  sout(action.create_output(1, out_fields))])
+
+        comm = MasterCommunicator(serial_mock, init_master=False)
+        comm.start()
+        comm.do_command(action, in_fields)
+
+        records = comm.get_flight_records()
+        self.assertEquals([(FlightRecorder.MASTER, FlightRecorder.WRITE, 1,
+                            action.create_input(1, in_fields)),
+                           (FlightRecorder.MASTER, FlightRecorder.READ, None,
+                            action.create_output(1, out_fields))],
+                          [record[1:] for record in records])
+        self.assertEquals([], comm.get_flight_records(since=time.time() + 1))
+
 
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
@@ -20,8 +20,13 @@ Tests for the outputs module.
 
 import unittest
 import time
+from threading import Lock
 
-from master.outputs import OutputStatus
+import master.master_api as master_api
+from master.master_command import MasterCommandSpec
+import master.outputs as outputs_module
+from master.outputs import OutputStatus, OutputReader
+from task_scheduler import TaskScheduler
 
 class OutputStatusTest(unittest.TestCase):
     """ Tests for OutputStatus. """
@@ -87,6 +92,119 @@ class OutputStatusTest(unittest.TestCase):
         time.sleep(0.01)
         self.assertTrue(status.should_refresh())
 
+
+class MasterCommunicatorDummy(object):
+    """ Dummy for the MasterCommunicator that answers read_output. """
+
+    def __init__(self):
+        """ Default constructor. """
+        self.lock = Lock()
+        self.reads = []
+        self.priorities = []
+        self.failures = 0
+
+    def do_command(self, cmd, data, priority=None):
+        """ Execute a command on the master dummy. """
+        if cmd != master_api.read_output():
+            raise Exception("Command %s not found" % cmd)
+        with self.lock:
+            self.reads.append(data['id'])
+            if self.failures > 0:
+                self.failures -= 1
+                raise Exception("Communication timeout")
+            self.priorities.append(priority)
+        return {'id': data['id'], 'status': data['id'] % 2, 'dimmer': 100, 'ctimer': 0}
+
+
+class OutputReaderTest(unittest.TestCase):
+    """ Tests for OutputReader. """
+
+    def setUp(self): #pylint: disable=C0103
+        """ Run before each test. """
+        self.scheduler = TaskScheduler(workers=1)
+        self.scheduler.start()
+
+    def tearDown(self): #pylint: disable=C0103
+        """ Run after each test. """
+        self.scheduler.stop()
+
+    @staticmethod
+    def wait(reader):
+        """ Wait until the reader has no pending reads. """
+        end = time.time() + 5
+        while reader.get_statistics()['pending'] > 0 and time.time() < end:
+            time.sleep(0.01)
+        time.sleep(0.05)
+
+    def test_request(self):
+        """ Test that the requested outputs are read once, with background priority. """
+        communicator = MasterCommunicatorDummy()
+        outputs = []
+        reader = OutputReader(communicator, outputs.append, interval=0,
+                              scheduler=self.scheduler)
+        self.assertEquals({'running': False, 'pending': 0, 'reads': 0},
+                          reader.get_statistics())
+
+        reader.request([3, 1, 2, 1])
+        OutputReaderTest.wait(reader)
+        self.assertEquals([1, 2, 3], communicator.reads)
+        self.assertEquals([MasterCommandSpec.BACKGROUND] * 3, communicator.priorities)
+        self.assertEquals([1, 0, 1], [output['status'] for output in outputs])
+
+        reader.request([4])
+        OutputReaderTest.wait(reader)
+        self.assertEquals([1, 2, 3, 4], communicator.reads)
+        self.assertEquals({'running': True, 'pending': 0, 'reads': 4}, reader.get_statistics())
+        self.assertEquals(4, self.scheduler.get_statistics()['output_reader']['runs'])
+        reader.stop()
+
+    def test_idle_and_discard(self):
+        """ Test that nothing is read while the master is busy and that the discarded outputs
+        are not read. """
+        communicator = MasterCommunicatorDummy()
+        idle = {'idle': False}
+        reader = OutputReader(communicator, lambda output: None, lambda: idle['idle'],
+                              interval=0, idle_wait=0.01, scheduler=self.scheduler)
+
+        reader.request(range(8))
+        time.sleep(0.1)
+        self.assertEquals([], communicator.reads)
+        self.assertEquals(8, reader.get_statistics()['pending'])
+
+        reader.discard([0, 2, 4, 6])
+        idle['idle'] = True
+        OutputReaderTest.wait(reader)
+        self.assertEquals([1, 3, 5, 7], communicator.reads)
+        reader.stop()
+
+    def test_backoff(self):
+        """ Test that the reader backs off when the reads fail and that the error is only logged
+        once per streak of failures. """
+        communicator = MasterCommunicatorDummy()
+        communicator.failures = 4
+        outputs = []
+        reader = OutputReader(communicator, outputs.append, interval=0, backoff=0.05,
+                              max_backoff=0.1, scheduler=self.scheduler)
+
+        logged = []
+        original = outputs_module.LOGGER.exception
+        outputs_module.LOGGER.exception = lambda *args: logged.append(args)
+        try:
+            start = time.time()
+            reader.request([1])
+            OutputReaderTest.wait(reader)
+            # The reader waits 0.05 + 0.1 + 0.1 + 0.1 seconds before the successful read.
+            self.assertTrue(time.time() - start >= 0.35)
+        finally:
+            outputs_module.LOGGER.exception = original
+
+        self.assertEquals([1] * 5, communicator.reads)
+        self.assertEquals([1], [output['id'] for output in outputs])
+        self.assertEquals(1, len(logged))
+        self.assertEquals({'running': True, 'pending': 0, 'reads': 1}, reader.get_statistics())
+        reader.stop()
+
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
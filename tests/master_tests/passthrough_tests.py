@@ -24,7 +24,7 @@ import time
 from master.master_communicator import MasterCommunicator
 from master.passthrough import PassthroughService
 
-from serial_tests import SerialMock, sout, sin
+from serial_tests import SerialMock, sout, sin, join_reader_threads
 
 class PassthroughServiceTest(unittest.TestCase):
     """ Tests for :class`PassthroughService`. """
@@ -57,6 +57,10 @@ class PassthroughServiceTest(unittest.TestCase):
         self.assertEquals(33, passthrough_mock.bytes_written)
 
         passthrough.stop()
+        master_communicator.stop()
+        passthrough_mock.close()
+        master_mock.close()
+        join_reader_threads()
 
 
 if __name__ == "__main__":
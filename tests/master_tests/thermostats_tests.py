@@ -18,8 +18,11 @@
 
 import unittest
 import time
+import threading
 
-from master.thermostats import ThermostatStatus
+from master.thermostats import ThermostatStatus, ThermostatStatusService, \
+    ThermostatStatusNotReadyException
+from task_scheduler import TaskScheduler
 
 class ThermostatStatusTest(unittest.TestCase):
     """ Tests for ThermostatStatus. """
@@ -37,6 +40,132 @@ class ThermostatStatusTest(unittest.TestCase):
         self.assertTrue(status.should_refresh())
 
 
+class ThermostatStatusServiceTest(unittest.TestCase):
+    """ Tests for ThermostatStatusService. """
+
+    def setUp(self): #pylint: disable=C0103
+        """ Run before each test. """
+        self.reads = 0
+        self.readers = set()
+        self.broken = False
+        self.status = {'thermostats_on': True, 'automatic': True, 'setpoint': 0,
+                       'cooling': False,
+                       'status': [{'id': 0, 'act': 20.0, 'csetp': 21.0},
+                                  {'id': 1, 'act': 19.0, 'csetp': 21.0}]}
+
+    def read_status(self):
+        """ Read the status dummy: returns a copy of self.status, raises if broken. """
+        self.readers.add(threading.current_thread().name)
+        if self.broken:
+            raise Exception("Master is not answering")
+        self.reads += 1
+        status = dict(self.status)
+        status['status'] = [dict(thermostat) for thermostat in self.status['status']]
+        return status
+
+    def test_get_status(self):
+        """ Test that the snapshot is only read when it is too old or a refresh was requested,
+        without the background thread. """
+        service = ThermostatStatusService(self.read_status, refresh_period=100)
+        snapshot = service.get_status()
+        self.assertEquals(1, self.reads)
+        self.assertEquals(1, snapshot['version'])
+        self.assertTrue(time.time() - snapshot['timestamp'] < 1)
+        self.assertEquals(20.0, snapshot['status'][0]['act'])
+
+        self.assertTrue(snapshot is service.get_status())
+        self.assertEquals(1, self.reads)
+
+        self.status['status'][0]['act'] = 22.0
+        service.request_refresh()
+        new_snapshot = service.get_status()
+        self.assertEquals(2, self.reads)
+        self.assertEquals(2, new_snapshot['version'])
+        self.assertEquals(22.0, new_snapshot['status'][0]['act'])
+        self.assertEquals(20.0, snapshot['status'][0]['act'])
+
+        service = ThermostatStatusService(self.read_status, refresh_period=0.001)
+        service.get_status()
+        time.sleep(0.01)
+        self.assertEquals(2, service.get_status()['version'])
+
+    def test_get_changes(self):
+        """ Test the changes since a version. """
+        service = ThermostatStatusService(self.read_status, refresh_period=100)
+        changes = service.get_changes()
+        self.assertEquals(1, changes['version'])
+        self.assertEquals([0, 1], [thermostat['id'] for thermostat in changes['status']])
+        self.assertEquals([], changes['removed'])
+        self.assertEquals(True, changes['thermostats_on'])
+
+        service.request_refresh()
+        changes = service.get_changes(1)
+        self.assertEquals(2, changes['version'])
+        self.assertEquals([], changes['status'])
+        self.assertFalse('thermostats_on' in changes)
+
+        self.status['status'][1]['csetp'] = 22.0
+        service.request_refresh()
+        changes = service.get_changes(2)
+        self.assertEquals(3, changes['version'])
+        self.assertEquals([{'id': 1, 'act': 19.0, 'csetp': 22.0}], changes['status'])
+
+        self.status['status'] = self.status['status'][1:]
+        self.status['cooling'] = True
+        service.request_refresh()
+        changes = service.get_changes(3)
+        self.assertEquals([], changes['status'])
+        self.assertEquals([0], changes['removed'])
+        self.assertEquals(True, changes['cooling'])
+
+        self.assertEquals(4, service.get_changes(2)['version'])
+        self.assertEquals([1], [thermostat['id'] for thermostat in service.get_changes(2)['status']])
+        self.assertEquals([1], [thermostat['id'] for thermostat in service.get_changes(10)['status']])
+
+    def test_background(self):
+        """ Test that the refresh job refreshes the snapshot and that get_status waits for a
+        requested refresh. """
+        scheduler = TaskScheduler(workers=1)
+        scheduler.start()
+        service = ThermostatStatusService(self.read_status, scheduler, refresh_period=100)
+        service.start()
+        try:
+            self.assertEquals(1, service.get_status()['version'])
+            self.assertEquals(1, service.get_status()['version'])
+
+            self.status['status'][0]['csetp'] = 18.0
+            service.request_refresh()
+            snapshot = service.get_status()
+            self.assertEquals(2, snapshot['version'])
+            self.assertEquals(18.0, snapshot['status'][0]['csetp'])
+            self.assertEquals(2, self.reads)
+        finally:
+            service.stop()
+            scheduler.stop()
+
+    def test_not_ready(self):
+        """ Test that get_status does not read the status itself when the refresh job is running
+        but has no snapshot yet. """
+        scheduler = TaskScheduler(workers=1)
+        scheduler.start()
+        service = ThermostatStatusService(self.read_status, scheduler, refresh_period=100,
+                                          refresh_timeout=0.1)
+        self.broken = True
+        service.start()
+        try:
+            self.assertRaises(ThermostatStatusNotReadyException, service.get_status)
+            self.assertRaises(ThermostatStatusNotReadyException, service.get_changes)
+            self.assertFalse(threading.current_thread().name in self.readers)
+
+            self.broken = False
+            service.request_refresh()
+            self.assertEquals(1, service.get_status()['version'])
+            self.assertFalse(threading.current_thread().name in self.readers)
+        finally:
+            service.stop()
+            scheduler.stop()
+
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
@@ -0,0 +1,109 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Contains the PowerSimulator: a simulated RS485 bus with power modules.
+"""
+
+import struct
+import inspect
+
+import power.power_api as power_api
+from power.power_command import PowerCommand
+
+from serial_simulator import SerialSimulator
+
+
+def power_commands(version):
+    """ Get the commands in power_api for a version of the power modules.
+
+    :param version: power api version (POWER_API_8_PORTS or POWER_API_12_PORTS).
+    :returns: dict that maps (mode, type) to the PowerCommand.
+    """
+    commands = {}
+    for (_, function) in inspect.getmembers(power_api, inspect.isfunction):
+        try:
+            command = function(version)
+        except TypeError:
+            try:
+                command = function()
+            except TypeError:
+                continue  # The function requires other arguments
+        except ValueError:
+            continue  # Not applicable for this version
+        if isinstance(command, PowerCommand):
+            commands[(command.mode, command.type)] = command
+    return commands
+
+
+class PowerSimulator(SerialSimulator):
+    """ Replicates the RS485 interface of the power bus and answers the commands for the
+    simulated power modules. A get command is answered with the values that were set using
+    set_values, or with zeros. A set command is stored and answered without data. Commands for
+    unknown modules and broadcasts are not answered. See SerialSimulator for the timing and the
+    fault injection.
+    """
+
+    def __init__(self, modules, turnaround=0.01, baudrate=115200, faults=None):
+        """ Create a PowerSimulator.
+
+        :param modules: maps the address of a power module to its version.
+        :type modules: dict
+        :param turnaround: the number of seconds a module needs to process a command.
+        :type turnaround: float
+        :param baudrate: the speed of the serial link.
+        :type baudrate: integer
+        :param faults: function that takes the type of a command and returns the extra delay \
+        of the answer in seconds, or None to drop the command.
+        :type faults: function
+        """
+        SerialSimulator.__init__(self, turnaround, baudrate, faults)
+        self.__modules = modules
+        self.__commands = dict([(version, power_commands(version))
+                                for version in set(modules.values())])
+        self.__values = {}
+        self.received = []
+
+    def set_values(self, address, command, *values):
+        """ Set the values that a module returns for a get command.
+
+        :param address: the address of the module.
+        :param command: the command.
+        :type command: :class`power.power_command.PowerCommand`
+        :param values: the values, according to the output format of the command.
+        """
+        self.__values[(address, command.mode, command.type)] = values
+
+    def _consume(self, data):
+        """ Parse a command and answer it. """
+        start = data.find("STR")
+        if start == -1 or len(data) < start + 11:
+            return 0
+        end = start + 11 + ord(data[start + 10]) + 3
+        if len(data) < end:
+            return 0
+
+        (address, cid) = (ord(data[start + 4]), ord(data[start + 5]))
+        (mode, command_type) = (data[start + 6], data[start + 7:start + 10])
+        self.received.append((address, mode, command_type, data[start + 11:end - 3]))
+
+        version = self.__modules.get(address)
+        command = None if version is None else self.__commands[version].get((mode, command_type))
+        if command is not None:
+            values = self.__values.get((address, mode, command_type))
+            if values is None:
+                values = struct.unpack(command.output_format,
+                                       '\x00' * struct.calcsize(command.output_format))
+            self.answer(command_type, command.create_output(address, cid, *values))
+        return end
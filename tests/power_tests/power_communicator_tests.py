@@ -26,8 +26,8 @@ import power.power_api as power_api
 from power.power_controller import PowerController
 from power.power_communicator import PowerCommunicator, InAddressModeException
 
-from serial_tests import SerialMock, sin, sout
-from serial_utils import CommunicationTimedOutException, RS485
+from serial_tests import SerialMock, sin, sout, join_reader_threads
+from serial_utils import CommunicationTimedOutException, RS485, SerialReader
 
 class PowerCommunicatorTest(unittest.TestCase):
     """ Tests for PowerCommunicator class """
@@ -38,11 +38,23 @@ class PowerCommunicatorTest(unittest.TestCase):
         """ Run before each test. """
         if os.path.exists(PowerCommunicatorTest.FILE):
             os.remove(PowerCommunicatorTest.FILE)
+        self.__serial_reader = SerialReader()
+        self.__serial_reader.start()
+        self.__serial_mocks = []
 
     def tearDown(self): #pylint: disable=C0103
         """ Run after each test. """
         if os.path.exists(PowerCommunicatorTest.FILE):
             os.remove(PowerCommunicatorTest.FILE)
+        self.__serial_reader.stop()
+        for serial_mock in self.__serial_mocks:
+            serial_mock.close()
+        join_reader_threads()
+
+    def __get_rs485(self, serial_mock):
+        """ Get a RS485 on a SerialMock, the mock is closed after the test. """
+        self.__serial_mocks.append(serial_mock)
+        return RS485(serial_mock, self.__serial_reader)
 
     def __get_communicator(self, serial_mock, time_keeper_period=0, address_mode_timeout=60,
                            power_controller=None):
@@ -58,7 +70,7 @@ class PowerCommunicatorTest(unittest.TestCase):
         """ Test for standard behavior PowerCommunicator.do_command. """
         action = power_api.get_voltage(power_api.POWER_API_8_PORTS)
 
-        serial_mock = RS485(SerialMock(
+        serial_mock = self.__get_rs485(SerialMock(
                         [sin(action.create_input(1, 1)),
                          sout(action.create_output(1, 1, 49.5))]))
 
@@ -76,7 +88,7 @@ class PowerCommunicatorTest(unittest.TestCase):
         """ Test for timeout in PowerCommunicator.do_command. """
         action = power_api.get_voltage(power_api.POWER_API_8_PORTS)
 
-        serial_mock = RS485(SerialMock([sin(action.create_input(1, 1)), sout(''),
+        serial_mock = self.__get_rs485(SerialMock([sin(action.create_input(1, 1)), sout(''),
                                   sin(action.create_input(1, 2)),
                                   sout(action.create_output(1, 2, 49.5))]))
 
@@ -90,7 +102,7 @@ class PowerCommunicatorTest(unittest.TestCase):
         """ Test for timeout in PowerCommunicator.do_command. """
         action = power_api.get_voltage(power_api.POWER_API_8_PORTS)
 
-        serial_mock = RS485(SerialMock([sin(action.create_input(1, 1)), sout(''),
+        serial_mock = self.__get_rs485(SerialMock([sin(action.create_input(1, 1)), sout(''),
                                   sin(action.create_input(1, 2)),
                                   sout('')]))
 
@@ -108,7 +120,7 @@ class PowerCommunicatorTest(unittest.TestCase):
         action = power_api.get_voltage(power_api.POWER_API_8_PORTS)
         out = action.create_output(1, 1, 49.5)
 
-        serial_mock = RS485(SerialMock(
+        serial_mock = self.__get_rs485(SerialMock(
                         [sin(action.create_input(1, 1)),
                          sout(out[:5]), sout(out[5:])]))
 
@@ -124,7 +136,7 @@ class PowerCommunicatorTest(unittest.TestCase):
         action_1 = power_api.get_voltage(power_api.POWER_API_8_PORTS)
         action_2 = power_api.get_frequency(power_api.POWER_API_8_PORTS)
 
-        serial_mock = RS485(SerialMock([sin(action_1.create_input(1, 1)),
+        serial_mock = self.__get_rs485(SerialMock([sin(action_1.create_input(1, 1)),
                                   sout(action_2.create_output(3, 2, 49.5))]))
 
         comm = self.__get_communicator(serial_mock)
@@ -139,7 +151,7 @@ class PowerCommunicatorTest(unittest.TestCase):
     def test_address_mode(self):
         """ Test the address mode. """
         sad = power_api.set_addressmode()
-        serial_mock = RS485(SerialMock(
+        serial_mock = self.__get_rs485(SerialMock(
             [sin(sad.create_input(power_api.BROADCAST_ADDRESS, 1, power_api.ADDRESS_MODE)),
              sout(power_api.want_an_address(power_api.POWER_API_8_PORTS).create_output(0, 0)),
              sin(power_api.set_address().create_input(0, 0, 1)),
@@ -168,7 +180,7 @@ class PowerCommunicatorTest(unittest.TestCase):
         action = power_api.get_voltage(power_api.POWER_API_8_PORTS)
         sad = power_api.set_addressmode()
 
-        serial_mock = RS485(SerialMock(
+        serial_mock = self.__get_rs485(SerialMock(
             [sin(sad.create_input(power_api.BROADCAST_ADDRESS, 1, power_api.ADDRESS_MODE)),
              sout(''), ## Timeout read after 1 second
              sin(sad.create_input(power_api.BROADCAST_ADDRESS, 2, power_api.NORMAL_MODE)),
@@ -196,7 +208,7 @@ class PowerCommunicatorTest(unittest.TestCase):
         action = power_api.get_voltage(power_api.POWER_API_8_PORTS)
         sad = power_api.set_addressmode()
 
-        serial_mock = RS485(SerialMock(
+        serial_mock = self.__get_rs485(SerialMock(
             [sin(sad.create_input(power_api.BROADCAST_ADDRESS, 1, power_api.ADDRESS_MODE)),
              sout(''), ## Timeout read after 1 second
              sin(sad.create_input(power_api.BROADCAST_ADDRESS, 2, power_api.NORMAL_MODE)),
@@ -221,7 +233,7 @@ class PowerCommunicatorTest(unittest.TestCase):
         times = [power_api.NIGHT for _ in range(8)]
         action = power_api.get_voltage(power_api.POWER_API_8_PORTS)
 
-        serial_mock = RS485(SerialMock(
+        serial_mock = self.__get_rs485(SerialMock(
             [sin(time_action.create_input(1, 1, *times)),
              sout(time_action.create_output(1, 1)),
              sin(action.create_input(1, 2)),
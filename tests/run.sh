@@ -1,6 +1,15 @@
 #!/bin/bash -e
 export PYTHONPATH=$PYTHONPATH:`pwd`/../src
 
+echo "Running serial utils tests"
+python -m serial_utils_tests
+
+echo "Running task scheduler tests"
+python -m task_scheduler_tests
+
+echo "Running simulator tests"
+python -m simulator_tests
+
 echo "Running master api tests"
 python -m master_tests.master_api_tests
 
@@ -10,9 +19,15 @@ python -m master_tests.master_command_tests
 echo "Running master communicator tests"
 python -m master_tests.master_communicator_tests
 
+echo "Running command cache tests"
+python -m master_tests.command_cache_tests
+
 echo "Running outputs tests"
 python -m master_tests.outputs_tests
 
+echo "Running device state tests"
+python -m master_tests.device_state_tests
+
 echo "Running inputs tests"
 python -m master_tests.inputs_tests
 
@@ -25,6 +40,21 @@ python -m master_tests.thermostats_tests
 echo "Running eeprom controller tests"
 python -m master_tests.eeprom_controller_tests
 
+echo "Running eeprom planner tests"
+python -m master_tests.eeprom_planner_tests
+
+echo "Running eeprom query tests"
+python -m master_tests.eeprom_query_tests
+
+echo "Running eeprom shadow tests"
+python -m master_tests.eeprom_shadow_tests
+
+echo "Running eeprom warmup tests"
+python -m master_tests.eeprom_warmup_tests
+
+echo "Running eeprom journal tests"
+python -m master_tests.eeprom_journal_tests
+
 echo "Running eeprom extension tests"
 python -m master_tests.eeprom_extension_tests
 
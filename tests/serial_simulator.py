@@ -0,0 +1,189 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Contains the SerialSimulator: the base class for the simulated master and power bus, it takes
+care of the timing on the serial link and the fault injection.
+"""
+
+import time
+import random
+import bisect
+from threading import Condition
+
+
+def random_faults(seed, drop_rate=0.0, delay_rate=0.0, delay=0.5):
+    """ Create a faults function for a SerialSimulator that drops and delays commands at random.
+    The random generator is seeded, so a run with the same commands gets the same faults.
+
+    :param seed: the seed for the random generator.
+    :param drop_rate: the fraction of the commands that is dropped.
+    :type drop_rate: float
+    :param delay_rate: the fraction of the commands that is answered late.
+    :type delay_rate: float
+    :param delay: the number of seconds a late answer is delayed.
+    :type delay: float
+    :returns: function that takes the action of a command.
+    """
+    rand = random.Random(seed)
+
+    def faults(_):
+        """ Drop or delay the answer. """
+        value = rand.random()
+        if value < drop_rate:
+            return None
+        elif value < drop_rate + delay_rate:
+            return delay
+        return 0
+
+    return faults
+
+
+class SerialSimulator(object):
+    """ Replicates the pyserial interface for a simulated device. The subclasses parse the data
+    written to the serial port and answer it using answer().
+
+    The simulator takes the time on the serial link into account: writing and reading takes
+    10 bits per byte at the given baudrate. The device needs `turnaround` seconds to process a
+    command, the processing of multiple commands can overlap.
+
+    Faults can be injected with the `faults` function: it gets the action of every command and
+    returns the number of seconds to delay the answer, or None to drop the command.
+    """
+
+    def __init__(self, turnaround=0.01, baudrate=115200, faults=None):
+        """ Create a SerialSimulator.
+
+        :param turnaround: the number of seconds the device needs to process a command.
+        :type turnaround: float
+        :param baudrate: the speed of the serial link.
+        :type baudrate: integer
+        :param faults: function that takes the action of a command and returns the extra delay \
+        of the answer in seconds, or None to drop the command.
+        :type faults: function
+        """
+        self.__turnaround = turnaround
+        self.__byte_time = 10.0 / baudrate
+        self.__faults = faults
+
+        self.__condition = Condition()
+        self.__pending = []  # list of tuples (time the data is available, data)
+        self.__link_free = 0
+        self.__input = ""
+        self.__closed = False
+
+        self.timeout = None
+        self.commands = 0
+        self.dropped = 0
+        self.delayed = 0
+
+    def write(self, data):
+        """ Write data to the simulated device. """
+        time.sleep(len(data) * self.__byte_time)
+
+        self.__input += data
+        while True:
+            consumed = self._consume(self.__input)
+            if consumed == 0:
+                break
+            self.__input = self.__input[consumed:]
+
+    def _consume(self, data):
+        """ Parse the data written to the device and answer the commands. Implemented by the
+        subclasses.
+
+        :returns: the number of bytes that were used, 0 if more data is required.
+        """
+        raise NotImplementedError()
+
+    def answer(self, action, data):
+        """ Answer a command, unless the faults function drops the answer.
+
+        :param action: the action of the command, passed to the faults function.
+        :param data: the answer.
+        :type data: string
+        """
+        delay = 0 if self.__faults is None else self.__faults(action)
+        if delay is None:
+            with self.__condition:
+                self.dropped += 1
+        else:
+            self.__schedule(data, delay, True)
+
+    def emit(self, data):
+        """ Send data that is not an answer to a command (eg. an async message). """
+        self.__schedule(data, 0, False)
+
+    def __schedule(self, data, delay, is_answer):
+        """ Schedule data: it arrives after the turnaround time, when the link is free. Delayed
+        data arrives `delay` seconds later and does not hold up the other data. """
+        with self.__condition:
+            if is_answer:
+                self.commands += 1
+            if delay > 0:
+                self.delayed += 1
+                available = time.time() + self.__turnaround + delay + len(data) * self.__byte_time
+            else:
+                start = max(time.time() + (self.__turnaround if is_answer else 0),
+                            self.__link_free)
+                self.__link_free = available = start + len(data) * self.__byte_time
+            bisect.insort(self.__pending, (available, data))
+            self.__condition.notify_all()
+
+    def __available(self):
+        """ Get the number of bytes that are available for reading. """
+        now = time.time()
+        return sum([len(data) for (at, data) in self.__pending if at <= now])
+
+    def read(self, size, timeout=None):
+        """ Read at most size bytes, blocks until at least one byte is available. A timeout can
+        be provided to replicate the RS485 interface, an empty string is returned on timeout. """
+        end = None if timeout is None else time.time() + timeout
+        with self.__condition:
+            while self.__available() == 0:
+                if self.__closed:
+                    return ""
+                now = time.time()
+                if end is not None and now >= end:
+                    return ""
+                wait = 0.1 if len(self.__pending) == 0 else \
+                    max(0.0001, self.__pending[0][0] - now)
+                self.__condition.wait(wait if end is None else min(wait, end - now))
+
+            ret = ""
+            while len(ret) < size and len(self.__pending) > 0 \
+                    and self.__pending[0][0] <= time.time():
+                (at, data) = self.__pending[0]
+                take = size - len(ret)
+                ret += data[:take]
+                if take < len(data):
+                    self.__pending[0] = (at, data[take:])
+                else:
+                    self.__pending.pop(0)
+            return ret
+
+    def close(self):
+        """ Close the simulated port: a read that is waiting for data returns an empty
+        string. """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+
+    def inWaiting(self): #pylint: disable=C0103
+        """ Get the number of bytes pending to be read """
+        with self.__condition:
+            return self.__available()
+
+    def fileno(self):
+        return None
@@ -32,6 +32,14 @@ def sout(data):
     """ Output from the SerialMock """
     return ('o', data)
 
+def join_reader_threads(timeout=1.0):
+    """ Wait until the SerialReader threads stopped. Stop the readers and close the
+    SerialMocks first: a thread that reads from a SerialMock stops after its current read. """
+    end = time.time() + timeout
+    for thread in threading.enumerate():
+        if thread.name.startswith("SerialReader"):
+            thread.join(max(0, end - time.time()))
+
 class SerialMock(object):
     """ Mockup for :class`serial.Serial`.
     TODO Serial timeout is not implemented here
@@ -46,6 +54,8 @@ class SerialMock(object):
         self.__sequence = sequence
         self.__timeout = timeout
 
+        self.__closed = False
+
         self.bytes_written = 0
         self.bytes_read = 0
 
@@ -63,6 +73,8 @@ class SerialMock(object):
     def read(self, size):
         """ Read size bytes from serial port """
         while len(self.__sequence) == 0 or self.__sequence[0][0] == 'i':
+            if self.__closed:
+                return ''
             time.sleep(0.01)
 
         if self.__timeout != 0 and self.__sequence[0][1] == '':
@@ -92,6 +104,10 @@ class SerialMock(object):
             raise Exception("Can only interrupt read at end of stream")
         self.__sequence.append(sout("\x00"))
 
+    def close(self):
+        """ Close the port: a read that is waiting for data returns an empty string. """
+        self.__closed = True
+
     def fileno(self):
         return None
 
@@ -0,0 +1,183 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the serial utils module.
+"""
+
+import os
+import tty
+import time
+import threading
+import unittest
+
+from serial_utils import SerialReader, RS485, FlightRecorder, encode_records, \
+    decode_records, format_records
+
+from serial_tests import SerialMock, sout, join_reader_threads
+
+
+class PtySerial(object):
+    """ A serial port on a pseudo terminal: the bytes written to the other end of the pty can be
+    read from this port. """
+
+    def __init__(self):
+        (self.__master, self.other_end) = os.openpty()
+        tty.setraw(self.other_end)
+
+    def fileno(self):
+        """ Get the file descriptor of the port. """
+        return self.__master
+
+    def write(self, data):
+        """ Write data to the port. """
+        os.write(self.__master, data)
+
+    def close(self):
+        """ Close both ends of the pty. """
+        os.close(self.__master)
+        os.close(self.other_end)
+
+
+class SerialReaderTest(unittest.TestCase):
+    """ Tests for SerialReader. """
+
+    def test_read_ptys(self):
+        """ Test that one reader reads the data of multiple ports. """
+        ports = [PtySerial(), PtySerial()]
+        received = [[], []]
+
+        reader = SerialReader()
+        reader.start()
+        for i in range(2):
+            reader.add(ports[i], received[i].append)
+
+        os.write(ports[0].other_end, "first")
+        os.write(ports[1].other_end, "second")
+        os.write(ports[0].other_end, "third")
+        time.sleep(0.1)
+
+        self.assertEquals("firstthird", "".join(received[0]))
+        self.assertEquals("second", "".join(received[1]))
+        self.assertEquals(16, reader.get_statistics()['bytes_read'])
+
+        reader.remove(ports[0])
+        os.write(ports[0].other_end, "fourth")
+        time.sleep(0.1)
+        self.assertEquals("firstthird", "".join(received[0]))
+
+        reader.stop()
+        for port in ports:
+            port.close()
+
+    def test_read_chunks(self):
+        """ Test that a burst of data is read in chunks instead of per byte. """
+        port = PtySerial()
+        received = []
+
+        reader = SerialReader()
+        reader.add(port, received.append)
+        os.write(port.other_end, "x" * 1000)
+        time.sleep(0.05)
+        reader.start()
+        time.sleep(0.1)
+
+        self.assertEquals(["x" * 1000], received)
+        self.assertEquals({'reads': 1, 'bytes_read': 1000}, reader.get_statistics())
+
+        reader.stop()
+        port.close()
+
+    def test_read_without_fileno(self):
+        """ Test that a port without file descriptor is read in its own thread. """
+        received = []
+
+        reader = SerialReader()
+        reader.start()
+        port = SerialMock([sout("hello"), sout(" world")])
+        reader.add(port, received.append)
+        time.sleep(0.1)
+
+        self.assertEquals("hello world", "".join(received))
+        self.assertEquals({'reads': 0, 'bytes_read': 0}, reader.get_statistics())
+
+        reader.stop()
+        port.close()
+        join_reader_threads()
+        self.assertEquals([], [thread for thread in threading.enumerate()
+                               if thread.name.startswith("SerialReader")])
+
+
+class RS485Test(unittest.TestCase):
+    """ Tests for RS485. """
+
+    def test_read(self):
+        """ Test reading from the RS485 port. """
+        reader = SerialReader()
+        reader.start()
+        port = SerialMock([sout("hello world")])
+        rs485 = RS485(port, reader)
+        time.sleep(0.05)
+
+        self.assertEquals(11, rs485.inWaiting())
+        self.assertEquals("hello", rs485.read(5))
+        self.assertEquals(" world", rs485.read(100))
+
+        start = time.time()
+        self.assertEquals("", rs485.read(1, 0.1))
+        self.assertTrue(time.time() - start >= 0.1)
+
+        reader.stop()
+        port.close()
+        join_reader_threads()
+
+
+class FlightRecorderTest(unittest.TestCase):
+    """ Tests for FlightRecorder. """
+
+    def test_ring_buffer(self):
+        """ Test that the recorder only keeps the last records. """
+        recorder = FlightRecorder(FlightRecorder.MASTER, size=3)
+        for i in range(4):
+            recorder.record(FlightRecorder.WRITE, "data%d" % i, i)
+        time.sleep(0.01)
+        recorder.record(FlightRecorder.WRITE, "data4", 4)
+
+        records = recorder.get_records()
+        self.assertEquals(["data2", "data3", "data4"], [record[4] for record in records])
+        self.assertEquals([2, 3, 4], [record[3] for record in records])
+
+        self.assertEquals(["data4"], [record[4] for record in
+                                      recorder.get_records(since=records[2][0])])
+
+    def test_encode_decode(self):
+        """ Test that the decoded records are equal to the encoded records. """
+        records = [(1000.5, FlightRecorder.MASTER, FlightRecorder.WRITE, 3, "STRBA\x03\r\n"),
+                   (1000.75, FlightRecorder.MASTER, FlightRecorder.READ, None, "BA\x03OK\r\n"),
+                   (1001.0, FlightRecorder.POWER, FlightRecorder.READ, 255, "")]
+        dump = encode_records(records)
+
+        self.assertEquals(records, decode_records(dump))
+        self.assertRaises(ValueError, decode_records, dump[:-3])
+        self.assertRaises(ValueError, decode_records, "garbage")
+        self.assertEquals([], decode_records(encode_records([])))
+
+    def test_format(self):
+        """ Test formatting the records as text. """
+        lines = format_records([(1000.5, FlightRecorder.POWER, FlightRecorder.WRITE, 3, "ab")])
+        self.assertEquals(["1000.500 write to  power  cid   3:  97  98    ab"], lines)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,241 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the simulated master and power bus.
+"""
+
+import os
+import time
+import unittest
+
+import master.master_api as master_api
+from master.master_communicator import MasterCommunicator, BackgroundConsumer
+from master.eeprom_controller import EepromFile, EepromAddress, EepromData
+import power.power_api as power_api
+from power.power_controller import PowerController
+from power.power_communicator import PowerCommunicator
+from serial_utils import CommunicationTimedOutException
+
+from serial_tests import join_reader_threads
+from serial_simulator import random_faults
+from master_simulator import VirtualMaster, ReplayMaster
+from power_simulator import PowerSimulator
+
+
+def check_crc(spec, output):
+    """ Check the crc in the output of a command. """
+    return spec.check_crc(spec.consume_output(spec.create_output(0, output)[3:])[1])
+
+
+class MasterSimulatorTestCase(unittest.TestCase):
+    """ Base class for the tests that run MasterCommunicators on simulated masters: the
+    communicators are stopped and the simulated ports are closed after each test. """
+
+    def setUp(self): #pylint: disable=C0103
+        """ Run before each test. """
+        self.communicators = []
+
+    def tearDown(self): #pylint: disable=C0103
+        """ Stop the MasterCommunicators and close the simulated ports. """
+        for (master, comm) in self.communicators:
+            comm.stop()
+            master.close()
+        join_reader_threads()
+
+    def create_communicator(self, master):
+        """ Create a MasterCommunicator on a simulated master, it is stopped by tearDown. """
+        comm = MasterCommunicator(master, init_master=False)
+        self.communicators.append((master, comm))
+        return comm
+
+
+class VirtualMasterTest(MasterSimulatorTestCase):
+    """ Tests for VirtualMaster. """
+
+    def setUp(self): #pylint: disable=C0103
+        """ Start a MasterCommunicator on a VirtualMaster. """
+        MasterSimulatorTestCase.setUp(self)
+        self.master = VirtualMaster(input_modules=3, output_modules=2, turnaround=0)
+        self.comm = self.create_communicator(self.master)
+
+    def test_eeprom(self):
+        """ Test that the eeprom is written, read and activated. """
+        self.comm.start()
+        eeprom_file = EepromFile(self.comm)
+
+        eeprom_file.write([EepromData(EepromAddress(1, 4, 5), "hello")])
+        eeprom_file.activate()
+        eeprom_file.invalidate_cache()
+
+        data = eeprom_file.read([EepromAddress(1, 4, 5), EepromAddress(0, 1, 2)])
+        self.assertEquals("hello", data[0].bytes)
+        self.assertEquals("\x03\x02", data[1].bytes)
+        self.assertEquals(1, self.master.activations)
+
+        output = self.comm.do_command(master_api.read_eeprom(), {'bank': 1, 'addr': 2, 'num': 4})
+        self.assertEquals("\xff\xffhe", output['data'])
+
+    def test_outputs(self):
+        """ Test that the basic actions change the outputs and send an OL message. """
+        received = []
+        self.comm.register_consumer(BackgroundConsumer(master_api.output_list(), 0,
+                                                       lambda output: received.append(output)))
+        self.comm.start()
+
+        self.comm.do_command(master_api.basic_action(),
+                             {'action_type': master_api.BA_LIGHT_ON, 'action_number': 3})
+        self.comm.do_command(master_api.basic_action(),
+                             {'action_type': master_api.BA_LIGHT_ON_DIMMER_50,
+                              'action_number': 12})
+        time.sleep(0.05)
+
+        self.assertEquals([[(3, 100)], [(3, 100), (12, 50)]],
+                          [output['outputs'] for output in received])
+
+        output = self.comm.do_command(master_api.read_output(), {'id': 12})
+        self.assertEquals((1, 50), (output['status'], output['dimmer']))
+        self.assertTrue(check_crc(master_api.read_output(), output))
+
+    def test_sensors(self):
+        """ Test the sensor lists and the default answers. """
+        self.comm.start()
+        self.master.set_sensor(2, temperature=21.5, humidity=40)
+
+        temperatures = self.comm.do_command(master_api.sensor_temperature_list())
+        self.assertEquals(21.5, temperatures['tmp2'].get_temperature())
+        self.assertEquals(None, temperatures['tmp3'].get_temperature())
+        humidities = self.comm.do_command(master_api.sensor_humidity_list())
+        self.assertEquals(40, humidities['hum2'].get_humidity())
+
+        modules = self.comm.do_command(master_api.number_of_io_modules())
+        self.assertEquals((3, 2, 0), (modules['in'], modules['out'], modules['shutter']))
+
+        self.assertEquals(0, self.comm.do_command(master_api.pulse_list())['pv5'])
+        errors = self.comm.do_command(master_api.error_list())
+        self.assertEquals([], errors['errors'])
+        self.assertTrue(check_crc(master_api.error_list(), errors))
+
+    def test_events(self):
+        """ Test the IL and EV messages. """
+        received = []
+        self.comm.register_consumer(BackgroundConsumer(master_api.input_list(), 0,
+                                                       lambda output: received.append(output)))
+        self.comm.register_consumer(BackgroundConsumer(master_api.event_triggered(), 0,
+                                                       lambda output: received.append(output)))
+        self.comm.start()
+
+        self.master.press_input(5)
+        self.master.trigger_event(7)
+        time.sleep(0.05)
+
+        self.assertEquals((5, 255), (received[0]['input'], received[0]['output']))
+        self.assertEquals(7, received[1]['code'])
+
+    def test_faults(self):
+        """ Test that dropped commands time out. """
+        master = VirtualMaster(turnaround=0, faults=random_faults(1, drop_rate=1.0))
+        comm = self.create_communicator(master)
+        comm.start()
+
+        self.assertRaises(CommunicationTimedOutException, comm.do_command,
+                          master_api.pulse_list(), timeout=0.1)
+        self.assertEquals((0, 1), (master.commands, master.dropped))
+
+    def test_baudrate(self):
+        """ Test that the time on the serial link is simulated. """
+        master = VirtualMaster(turnaround=0, baudrate=9600)
+        comm = self.create_communicator(master)
+        comm.start()
+
+        start = time.time()
+        comm.do_command(master_api.eeprom_list(), {'bank': 0})
+        self.assertTrue(time.time() - start > 0.27)  # 260 bytes, 1 ms per byte
+
+
+class ReplayMasterTest(MasterSimulatorTestCase):
+    """ Tests for ReplayMaster. """
+
+    def test_replay(self):
+        """ Test that the recorded traffic is replayed. """
+        master = VirtualMaster(turnaround=0)
+        comm = self.create_communicator(master)
+        comm.start()
+
+        master.set_sensor(0, temperature=20.0)
+        comm.do_command(master_api.sensor_temperature_list())
+        master.set_sensor(0, temperature=21.0)
+        comm.do_command(master_api.sensor_temperature_list())
+        comm.do_command(master_api.basic_action(),
+                        {'action_type': master_api.BA_LIGHT_ON, 'action_number': 1})
+        master.press_input(4)
+        time.sleep(0.05)
+
+        replay = ReplayMaster(comm.get_flight_records(), turnaround=0)
+        received = []
+        replay_comm = self.create_communicator(replay)
+        replay_comm.register_consumer(BackgroundConsumer(master_api.input_list(), 0,
+                                                         lambda output: received.append(output)))
+        replay_comm.start()
+
+        temperatures = [replay_comm.do_command(master_api.sensor_temperature_list())['tmp0']
+                        for _ in range(2)]
+        self.assertEquals([20.0, 21.0], [svt.get_temperature() for svt in temperatures])
+        self.assertEquals("OK", replay_comm.do_command(
+            master_api.basic_action(),
+            {'action_type': master_api.BA_LIGHT_ON, 'action_number': 1})['resp'])
+
+        self.assertRaises(CommunicationTimedOutException, replay_comm.do_command,
+                          master_api.basic_action(),
+                          {'action_type': master_api.BA_LIGHT_ON, 'action_number': 2},
+                          timeout=0.1)
+
+        replay.replay_async(speed=10).join()
+        time.sleep(0.05)
+        self.assertEquals([4], [output['input'] for output in received])
+
+
+class PowerSimulatorTest(unittest.TestCase):
+    """ Tests for PowerSimulator. """
+
+    FILE = "test.db"
+
+    def tearDown(self): #pylint: disable=C0103
+        """ Run after each test. """
+        if os.path.exists(PowerSimulatorTest.FILE):
+            os.remove(PowerSimulatorTest.FILE)
+
+    def test_do_command(self):
+        """ Test the power commands on the simulated modules. """
+        bus = PowerSimulator({1: power_api.POWER_API_8_PORTS, 2: power_api.POWER_API_12_PORTS},
+                             turnaround=0)
+        comm = PowerCommunicator(bus, PowerController(PowerSimulatorTest.FILE),
+                                 time_keeper_period=0)
+
+        voltage = power_api.get_voltage(power_api.POWER_API_12_PORTS)
+        bus.set_values(2, voltage, *([230.0] * 12))
+        self.assertEquals((230.0,) * 12, comm.do_command(2, voltage))
+        self.assertEquals((0,) * 8, comm.do_command(
+            1, power_api.get_normal_energy(power_api.POWER_API_8_PORTS)))
+
+        comm.do_command(1, power_api.set_day_night(power_api.POWER_API_8_PORTS), *([0] * 8))
+        self.assertEquals((1, 'S', 'SDN', '\x00' * 8), bus.received[-1])
+
+        comm.do_command(power_api.BROADCAST_ADDRESS, power_api.set_addressmode(),
+                        power_api.NORMAL_MODE)
+        self.assertEquals(3, bus.commands)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+# Copyright (C) 2016 OpenMotics BVBA
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Tests for the task scheduler module.
+"""
+
+import time
+import unittest
+import threading
+from threading import Lock
+
+from task_scheduler import TaskScheduler
+
+
+class TaskSchedulerTest(unittest.TestCase):
+    """ Tests for TaskScheduler. """
+
+    def setUp(self): #pylint: disable=C0103
+        """ Run before each test. """
+        self.scheduler = TaskScheduler(workers=2)
+        self.scheduler.start()
+
+    def tearDown(self): #pylint: disable=C0103
+        """ Run after each test. """
+        self.scheduler.stop()
+
+    @staticmethod
+    def wait(condition, timeout=5):
+        """ Wait until a condition is True. """
+        end = time.time() + timeout
+        while not condition() and time.time() < end:
+            time.sleep(0.01)
+
+    def test_periodic(self):
+        """ Test that a periodic job runs every interval. """
+        runs = []
+        self.scheduler.schedule('periodic', lambda: runs.append(time.time()), 0.05)
+        TaskSchedulerTest.wait(lambda: len(runs) >= 5)
+
+        self.assertTrue(len(runs) >= 5)
+        self.assertTrue(0.04 < (runs[-1] - runs[0]) / (len(runs) - 1) < 0.08)
+
+        statistics = self.scheduler.get_statistics()['periodic']
+        self.assertEquals(0.05, statistics['interval'])
+        self.assertTrue(statistics['runs'] >= 5)
+        self.assertEquals(0, statistics['errors'])
+        self.assertEquals(0, statistics['overruns'])
+        self.assertTrue(statistics['max_lateness'] < 0.1)
+        self.assertTrue(statistics['next_run'] <= 0.05)
+
+    def test_one_shot(self):
+        """ Test that a one-shot job runs once after the delay and again after run_now. """
+        runs = []
+        job = self.scheduler.schedule('one shot', lambda: runs.append(time.time()), delay=0.05)
+        start = time.time()
+        TaskSchedulerTest.wait(lambda: len(runs) == 1)
+        self.assertTrue(runs[0] - start >= 0.04)
+        time.sleep(0.1)
+        self.assertEquals(1, len(runs))
+        self.assertEquals(None, self.scheduler.get_statistics()['one shot']['next_run'])
+
+        job.run_now()
+        TaskSchedulerTest.wait(lambda: len(runs) == 2)
+        self.assertEquals(2, len(runs))
+
+        runs = []
+        job = self.scheduler.schedule('on demand', lambda: runs.append(time.time()), delay=None)
+        time.sleep(0.1)
+        self.assertEquals([], runs)
+        job.run_now()
+        TaskSchedulerTest.wait(lambda: len(runs) == 1)
+        self.assertEquals(1, len(runs))
+
+    def test_run_after(self):
+        """ Test that run_after postpones a run that was due earlier. """
+        runs = []
+        job = self.scheduler.schedule('debounce', lambda: runs.append(time.time()), delay=None)
+        start = time.time()
+        job.run_after(0.1)
+        time.sleep(0.05)
+        job.run_after(0.1)
+        TaskSchedulerTest.wait(lambda: len(runs) == 1)
+        self.assertEquals(1, len(runs))
+        self.assertTrue(runs[0] - start >= 0.14)
+        time.sleep(0.15)
+        self.assertEquals(1, len(runs))
+
+        ## A run_after while the job runs, runs after the current run
+        job = self.scheduler.schedule('slow', lambda: (runs.append(time.time()), time.sleep(0.1)),
+                                      delay=None)
+        del runs[:]
+        job.run_now()
+        TaskSchedulerTest.wait(lambda: len(runs) == 1)
+        job.run_after(0.15)
+        TaskSchedulerTest.wait(lambda: len(runs) == 2)
+        self.assertEquals(2, len(runs))
+        self.assertTrue(runs[1] - runs[0] >= 0.14)
+
+    def test_overrun(self):
+        """ Test that a job that takes longer than its interval doesn't run concurrently with
+        itself and that the overruns are counted. """
+        lock = Lock()
+        state = {'running': 0, 'max_running': 0, 'runs': 0}
+
+        def run():
+            """ A run that takes twice the interval. """
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'], state['running'])
+            time.sleep(0.1)
+            with lock:
+                state['running'] -= 1
+                state['runs'] += 1
+
+        self.scheduler.schedule('slow', run, 0.05)
+        TaskSchedulerTest.wait(lambda: state['runs'] >= 3)
+
+        self.assertEquals(1, state['max_running'])
+        statistics = self.scheduler.get_statistics()['slow']
+        self.assertTrue(statistics['overruns'] >= 2)
+        self.assertTrue(statistics['avg_run_time'] >= 0.09)
+
+    def test_set_interval_and_cancel(self):
+        """ Test that a shorter interval moves the next run forward and that a cancelled job
+        doesn't run anymore. """
+        runs = []
+        job = self.scheduler.schedule('job', lambda: runs.append(time.time()), 10)
+        TaskSchedulerTest.wait(lambda: len(runs) == 1)
+        self.assertTrue(self.scheduler.get_statistics()['job']['next_run'] > 9)
+
+        job.set_interval(0.05)
+        TaskSchedulerTest.wait(lambda: len(runs) == 3)
+        self.assertEquals(3, len(runs))
+
+        job.cancel()
+        time.sleep(0.1)
+        count = len(runs)
+        time.sleep(0.15)
+        self.assertEquals(count, len(runs))
+        self.assertFalse('job' in self.scheduler.get_statistics())
+
+    def test_error(self):
+        """ Test that an exception in a job is counted and that the job keeps running. """
+        runs = []
+
+        def run():
+            """ A run that fails. """
+            runs.append(time.time())
+            raise Exception("failed")
+
+        self.scheduler.schedule('error', run, 0.02)
+        TaskSchedulerTest.wait(lambda: len(runs) >= 3)
+        time.sleep(0.01)
+        self.assertTrue(self.scheduler.get_statistics()['error']['errors'] >= 3)
+
+    def test_stop(self):
+        """ Test that stop waits for the running job and the threads, and that the scheduler
+        can be stopped more than once. """
+        before = set(threading.enumerate())
+        scheduler = TaskScheduler(workers=2)
+        scheduler.start()
+        threads = set(threading.enumerate()) - before
+        self.assertEquals(3, len(threads))
+
+        runs = []
+        scheduler.schedule('slow', lambda: (time.sleep(0.1), runs.append(time.time())), delay=0)
+        time.sleep(0.05)
+
+        scheduler.stop()
+        self.assertEquals(1, len(runs))
+        self.assertEquals([], [thread for thread in threads if thread.is_alive()])
+
+        scheduler.stop()
+        scheduler.schedule('after stop', lambda: None, delay=0).run_now()
+
+if __name__ == "__main__":
+    unittest.main()